@@ -0,0 +1,224 @@
+"""Route-table microbenchmark: route matching cost of the registry-built table vs the baseline doubled table.
+
+Run from the backend directory (no database needed, modules are only imported):
+    python benchmark_routing.py            # full run
+    python benchmark_routing.py --quick    # fewer repetitions
+Exit code is non-zero if the current route table has duplicate or shadowed routes.
+"""
+import os
+import sys
+import time
+
+os.environ.setdefault('DB_HOST', '127.0.0.1')
+
+from fastapi.routing import APIRoute, APIWebSocketRoute
+from starlette.routing import Match
+
+import main
+from modules.module_registry import find_route_conflicts
+
+# Representative request mix: early modules, manufacturing workflow (mounted last) and a miss
+REQUESTS = [
+    ('GET', '/health'),
+    ('GET', '/modules/s11/status'),
+    ('GET', '/modules/housing_inspection/inspections'),
+    ('GET', '/api/modulator/status'),
+    ('GET', '/api/manufacturing/manufacturing-orders'),
+    ('GET', '/api/manufacturing/devices/LNA2322-0001'),
+    ('POST', '/api/manufacturing/devices/LNA2322-0001/tests/s11/complete'),
+    ('GET', '/api/manufacturing/devices/by-type/LNA2322'),
+    ('GET', '/not/a/route'),
+]
+
+# Route table of the baseline app (before the module registry), in registration order: analytics, the
+# station modules from load_modules() (chip inspection never registered, its router name did not import),
+# the workflow router under /api/manufacturing, the OPTIONS catch-all, main.py's own routes and the
+# workflow router again without a prefix. The workflow module declared /devices/create twice.
+BASELINE_ROUTES = [
+    ('GET', '/openapi.json'),
+    ('GET', '/docs'),
+    ('GET', '/docs/oauth2-redirect'),
+    ('GET', '/redoc'),
+    ('GET', '/api/analytics/debug'),
+    ('GET', '/api/analytics/overview'),
+    ('GET', '/api/analytics/stages'),
+    ('GET', '/api/analytics/dashboard'),
+    ('GET', '/api/analytics/system-status'),
+    ('GET', '/api/analytics/test-db'),
+    ('GET', '/api/analytics/debug-data'),
+    ('GET', '/modules/s11/status'),
+    ('GET', '/modules/s11/vna/status'),
+    ('POST', '/modules/s11/vna/connect'),
+    ('GET', '/modules/s11/limits/{device_type}'),
+    ('POST', '/modules/s11/test/start'),
+    ('POST', '/modules/s11/test/save'),
+    ('GET', '/modules/s11/plot/{test_id}'),
+    ('POST', '/modules/s11/pdf/generate'),
+    ('GET', '/modules/s11/test/history'),
+    ('GET', '/modules/s11/statistics'),
+    ('POST', '/modules/s11/vna/disconnect'),
+    ('GET', '/modules/housing_inspection/status'),
+    ('POST', '/modules/housing_inspection/save'),
+    ('GET', '/modules/housing_inspection/inspections'),
+    ('PUT', '/modules/housing_inspection/update-status'),
+    ('GET', '/modules/housing_inspection/image/{inspection_id}'),
+    ('POST', '/modules/housing_inspection/generate-report'),
+    ('GET', '/modules/housing_inspection/statistics'),
+    ('GET', '/admin/product-lines'),
+    ('GET', '/admin/device-types'),
+    ('POST', '/admin/validate-device-types'),
+    ('POST', '/admin/manufacturing-orders'),
+    ('GET', '/admin/manufacturing-orders'),
+    ('GET', '/admin/manufacturing-orders/{mo_number}/file'),
+    ('PUT', '/admin/manufacturing-orders/{mo_number}/status'),
+    ('GET', '/admin/analytics/summary'),
+    ('GET', '/admin/manufacturing-orders/{mo_number}/details'),
+    ('GET', '/modules/twotone/status'),
+    ('GET', '/modules/twotone/device-types'),
+    ('POST', '/modules/twotone/initialize'),
+    ('POST', '/modules/twotone/run-test'),
+    ('GET', '/modules/twotone/history'),
+    ('GET', '/modules/twotone/graph/{filename}'),
+    ('POST', '/modules/twotone/generate-report'),
+    ('GET', '/modules/s21/status'),
+    ('GET', '/modules/s21/device-types'),
+    ('POST', '/modules/s21/run-sparam-test'),
+    ('POST', '/modules/s21/run-ripple-test'),
+    ('GET', '/modules/s21/history'),
+    ('GET', '/modules/s21/graph/{filename}'),
+    ('POST', '/modules/s21/generate-report'),
+    ('GET', '/api/modulator/status'),
+    ('GET', '/api/modulator/device-types'),
+    ('POST', '/api/modulator/run-test'),
+    ('GET', '/api/modulator/history'),
+    ('GET', '/api/modulator/graph/{filename}'),
+    ('POST', '/api/modulator/generate-report'),
+    ('GET', '/api/manufacturing/manufacturing-orders'),
+    ('GET', '/api/manufacturing/manufacturing-orders/{manufacturing_order_number}'),
+    ('GET', '/api/manufacturing/device-types/{device_type}/test-sequences'),
+    ('GET', '/api/manufacturing/device-types/{device_type}/tests-preview'),
+    ('GET', '/api/manufacturing/test-definitions'),
+    ('GET', '/api/manufacturing/devices/{serial_number}'),
+    ('POST', '/api/manufacturing/devices/create'),
+    ('POST', '/api/manufacturing/devices/register'),
+    ('POST', '/api/manufacturing/devices/{serial_number}/tests/{test_id}/start'),
+    ('GET', '/api/manufacturing/devices/{serial_number}/tests/{test_id}/status'),
+    ('POST', '/api/manufacturing/devices/{serial_number}/tests/{test_id}/complete'),
+    ('GET', '/api/manufacturing/devices'),
+    ('GET', '/api/manufacturing/pdf/{filename}'),
+    ('GET', '/api/manufacturing/devices/{serial_number}/next-step'),
+    ('POST', '/api/manufacturing/devices/{serial_number}/continue'),
+    ('GET', '/api/manufacturing/manufacturing-orders/{mo_number}/device-types/{device_type}/summary'),
+    ('GET', '/api/manufacturing/devices/search'),
+    ('GET', '/api/manufacturing/debug/devices'),
+    ('GET', '/api/manufacturing/debug/device-types/{device_type}'),
+    ('GET', '/api/manufacturing/debug/table-structure/{table_name}'),
+    ('GET', '/api/manufacturing/device-types/{device_type}/test-sequence-with-instructions'),
+    ('GET', '/api/manufacturing/devices/by-type/{device_type}'),
+    ('POST', '/api/manufacturing/devices/create'),
+    ('OPTIONS', '/{path:path}'),
+    ('GET', '/'),
+    ('POST', '/auth/login'),
+    ('GET', '/auth/verify'),
+    ('POST', '/auth/refresh'),
+    ('GET', '/system/status'),
+    ('GET', '/system/active-users'),
+    ('GET', '/system/module-usage/{module}'),
+    ('POST', '/system/status/{component}'),
+    ('GET', '/users'),
+    ('GET', '/logs'),
+    ('WEBSOCKET', '/ws/notifications'),
+    ('GET', '/manufacturing-orders'),
+    ('GET', '/manufacturing-orders/{manufacturing_order_number}'),
+    ('GET', '/device-types/{device_type}/test-sequences'),
+    ('GET', '/device-types/{device_type}/tests-preview'),
+    ('GET', '/test-definitions'),
+    ('GET', '/devices/{serial_number}'),
+    ('POST', '/devices/create'),
+    ('POST', '/devices/register'),
+    ('POST', '/devices/{serial_number}/tests/{test_id}/start'),
+    ('GET', '/devices/{serial_number}/tests/{test_id}/status'),
+    ('POST', '/devices/{serial_number}/tests/{test_id}/complete'),
+    ('GET', '/devices'),
+    ('GET', '/pdf/{filename}'),
+    ('GET', '/devices/{serial_number}/next-step'),
+    ('POST', '/devices/{serial_number}/continue'),
+    ('GET', '/manufacturing-orders/{mo_number}/device-types/{device_type}/summary'),
+    ('GET', '/devices/search'),
+    ('GET', '/debug/devices'),
+    ('GET', '/debug/device-types/{device_type}'),
+    ('GET', '/debug/table-structure/{table_name}'),
+    ('GET', '/device-types/{device_type}/test-sequence-with-instructions'),
+    ('GET', '/devices/by-type/{device_type}'),
+    ('POST', '/devices/create'),
+    ('GET', '/health'),
+    ('POST', '/admin/users'),
+    ('PUT', '/admin/users/{user_id}'),
+    ('DELETE', '/admin/users/{user_id}'),
+    ('POST', '/auth/change-password'),
+    ('GET', '/admin/users/check-availability'),
+]
+
+async def _baseline_endpoint():
+    """Stand-in handler: only route matching is measured"""
+
+def legacy_route_table():
+    """The baseline table rebuilt from BASELINE_ROUTES, using the same route classes as the current app"""
+    routes = []
+    for method, path in BASELINE_ROUTES:
+        if method == 'WEBSOCKET':
+            routes.append(APIWebSocketRoute(path, _baseline_endpoint))
+        else:
+            routes.append(APIRoute(path, _baseline_endpoint, methods=[method]))
+    return routes
+
+def match(routes, method, path):
+    """Starlette's resolution loop: first full match wins, a partial match is kept as a 405 candidate"""
+    scope = {'type': 'http', 'method': method, 'path': path, 'root_path': '', 'query_string': b'', 'headers': []}
+    partial = None
+    for route in routes:
+        matched, _ = route.matches(scope)
+        if matched == Match.FULL:
+            return route
+        if matched == Match.PARTIAL and partial is None:
+            partial = route
+    return partial
+
+def time_table(routes, requests, repeat, rounds=5):
+    """Best-of-rounds mean microseconds per request"""
+    best = float('inf')
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            for method, path in requests:
+                match(routes, method, path)
+        best = min(best, (time.perf_counter() - started) / (repeat * len(requests)) * 1e6)
+    return best
+
+if __name__ == "__main__":
+    quick = "--quick" in sys.argv
+    repeat = 200 if quick else 2000
+
+    current = list(main.app.routes)
+    legacy = legacy_route_table()
+
+    conflicts = find_route_conflicts(current)
+    legacy_conflicts = find_route_conflicts(legacy)
+    print(f"📋 Current table: {len(current)} routes, {len(conflicts)} conflicts")
+    print(f"📋 Legacy table:  {len(legacy)} routes, {len(legacy_conflicts)} conflicts")
+    for conflict in legacy_conflicts:
+        print(f"   Legacy {conflict['kind']} {','.join(conflict['methods'])} {conflict['path']} "
+              f"hidden by {conflict['hidden_by']}")
+
+    miss = match(legacy, 'GET', '/not/a/route')
+    print(f"   Legacy GET /not/a/route resolves to {getattr(miss, 'path', None)} (405 instead of 404)")
+
+    print(f"\n⏱️ Route matching (best of 5 rounds, {repeat} repetitions)")
+    for label, requests in (("request mix", REQUESTS), ("unknown path", REQUESTS[-1:])):
+        legacy_us = time_table(legacy, requests, repeat)
+        current_us = time_table(current, requests, repeat)
+        print(f"  {label:13s} legacy {legacy_us:7.2f} µs | current {current_us:7.2f} µs | x{legacy_us / current_us:4.2f}")
+
+    for conflict in conflicts:
+        print(f"❌ {conflict['kind']} {conflict['path']} hidden by {conflict['hidden_by']}")
+    sys.exit(1 if conflicts else 0)
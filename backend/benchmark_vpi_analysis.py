@@ -0,0 +1,53 @@
+"""Synthetic-waveform benchmark for the DC Vπ extraction engine.
+
+Run from the backend directory:
+    python benchmark_vpi_analysis.py            # benchmark
+    python benchmark_vpi_analysis.py --quick    # fewer repetitions
+The accuracy cases run under pytest (tests/test_vpi_analysis.py) on the same synthetic captures (tests/vpi_waveforms.py).
+"""
+import sys
+import time
+from scipy import stats
+from scipy.signal import find_peaks
+
+from modules.vpi_analysis import extract_vpi
+from tests.vpi_waveforms import synth_capture
+
+def legacy_extract(t, ramp, power, samples_per_period, min_vpi, max_vpi):
+    """Period loop as previously done in the controller (with aligned indices), for timing"""
+    values = []
+    start, end = 0, samples_per_period
+    while end <= len(ramp):
+        ramp_segment = ramp[start:end]
+        stats.linregress(t[start:end], ramp_segment)
+        peak_indices, _ = find_peaks(power[start:end], distance=30)
+        null_indices, _ = find_peaks(-power[start:end], distance=30)
+        for peak, null in zip(ramp_segment[peak_indices], ramp_segment[null_indices]):
+            vpi = abs(peak - null)
+            if min_vpi <= vpi <= max_vpi:
+                values.append(vpi)
+        start, end = end, end + samples_per_period
+    return values
+
+def run_benchmark(repeat):
+    """Time the vectorized engine against the period loop"""
+    print(f"\n⏱️ Benchmark ({repeat} runs each)")
+    for n_periods in (4, 16, 64):
+        t, ramp, power, spp = synth_capture(3.5, n_periods=n_periods)
+
+        started = time.perf_counter()
+        for _ in range(repeat):
+            legacy_extract(t, ramp, power, spp, 2.0, 8.0)
+        legacy_ms = (time.perf_counter() - started) / repeat * 1000
+
+        started = time.perf_counter()
+        for _ in range(repeat):
+            extract_vpi(t, ramp, power, spp, 2.0, 8.0)
+        vector_ms = (time.perf_counter() - started) / repeat * 1000
+
+        print(f"  {n_periods:3d} periods ({len(t):6d} samples): loop {legacy_ms:7.2f} ms | "
+              f"vectorized {vector_ms:7.2f} ms | x{legacy_ms / vector_ms:5.1f}")
+
+if __name__ == "__main__":
+    quick = "--quick" in sys.argv
+    run_benchmark(5 if quick else 50)
@@ -0,0 +1,98 @@
+"""WebSocket fan-out benchmark: the old sequential broadcast vs the pub/sub hub, with one stalled client.
+
+Run from the backend directory (no database or network needed, clients are in-process):
+    python benchmark_ws_fanout.py            # 200 clients
+    python benchmark_ws_fanout.py --quick    # 50 clients
+"""
+import sys
+import json
+import time
+import asyncio
+import datetime
+
+from modules.ws_hub import WebSocketHub, SYSTEM_TOPIC
+
+STALL_SECONDS = 3.0
+SEND_LATENCY = 0.002  # a tablet on the shop-floor wifi
+
+class FloorClient:
+    """Stand-in for a Starlette WebSocket: records when each message arrived"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.received_at = []
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, payload: str):
+        await asyncio.sleep(self.latency)
+        self.received_at.append(time.perf_counter())
+
+    async def close(self, code: int = 1000):
+        pass
+
+def stats_message() -> dict:
+    return {
+        "type": "system_stats_update",
+        "data": {"active_users": 42, "modules": {name: {"status": "online"} for name in ("s11", "s21", "twotone", "dcvpi")}},
+        "timestamp": datetime.datetime.utcnow().isoformat()
+    }
+
+async def legacy_broadcast(clients: dict, message: dict):
+    """The old ConcurrentConnectionManager.broadcast_system_message"""
+    disconnected_users = []
+    for user_id, websocket in clients.items():
+        try:
+            await websocket.send_text(json.dumps(message))
+        except:
+            disconnected_users.append(user_id)
+    for user_id in disconnected_users:
+        clients.pop(user_id, None)
+
+def delivery_ms(clients, started) -> float:
+    """When the last healthy client had the message"""
+    return max(client.received_at[0] for client in clients if client.received_at) * 1000 - started * 1000
+
+async def run_legacy(count: int) -> dict:
+    clients = {i: FloorClient(SEND_LATENCY) for i in range(count)}
+    clients[0].latency = STALL_SECONDS
+    started = time.perf_counter()
+    await legacy_broadcast(clients, stats_message())
+    returned = (time.perf_counter() - started) * 1000
+    healthy = [c for i, c in clients.items() if i != 0]
+    return {"publish_ms": returned, "healthy_delivered_ms": delivery_ms(healthy, started)}
+
+async def run_hub(count: int) -> dict:
+    hub = WebSocketHub(max_queue=100, send_timeout=STALL_SECONDS / 2)
+    clients = [FloorClient(SEND_LATENCY) for _ in range(count)]
+    clients[0].latency = STALL_SECONDS
+    for user_id, client in enumerate(clients):
+        await hub.connect(client, user_id)
+
+    started = time.perf_counter()
+    hub.publish(SYSTEM_TOPIC, stats_message())
+    returned = (time.perf_counter() - started) * 1000
+    healthy = clients[1:]
+    while sum(1 for c in healthy if c.received_at) < len(healthy):
+        await asyncio.sleep(0.001)
+    result = {"publish_ms": returned, "healthy_delivered_ms": delivery_ms(healthy, started)}
+
+    await asyncio.sleep(STALL_SECONDS / 2 + 0.1)  # let the stalled client hit the send timeout
+    result["stats"] = hub.stats()
+    await hub.close_all()
+    return result
+
+async def main(count: int):
+    print(f"📡 Broadcasting one system-stats message to {count} clients, one stalled for {STALL_SECONDS}s\n")
+    legacy = await run_legacy(count)
+    current = await run_hub(count)
+    for label, result in (("legacy", legacy), ("hub", current)):
+        print(f"  {label:7s} publish returns after {result['publish_ms']:8.2f} ms | "
+              f"healthy clients have it after {result['healthy_delivered_ms']:8.2f} ms")
+    stats = current["stats"]
+    print(f"\n  hub: {stats['evicted']} evicted, {stats['connections']} still connected, "
+          f"max fan-out {stats['max_fanout_ms']} ms, max lag {stats['max_lag_ms']} ms")
+
+if __name__ == "__main__":
+    asyncio.run(main(50 if "--quick" in sys.argv else 200))
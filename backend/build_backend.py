@@ -2,6 +2,7 @@ import subprocess
 import os
 import sys
 import shutil
+from modules.lazy_imports import LAZY_HIDDEN_IMPORTS
 
 def build_backend():
     """Build the FastAPI backend into a standalone executable"""
@@ -47,7 +48,11 @@ def build_backend():
     
     for import_name in uvicorn_imports:
         cmd.append(f"--hidden-import={import_name}")
-    
+
+    # Stacks the modules import lazily on first use (the lazy loader's own list, so they cannot drift)
+    for import_name in LAZY_HIDDEN_IMPORTS:
+        cmd.append(f"--hidden-import={import_name}")
+
     # Add modules if they exist (try different approach)
     if os.path.exists("modules") and os.path.isdir("modules"):
         print("✅ modules directory found")
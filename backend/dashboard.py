@@ -3,7 +3,9 @@ from fastapi import APIRouter
 from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 import json
+import asyncio
 import traceback
+from modules.grouped_stats import grouped_stats, stats_memo
 
 def create_analytics_router(get_db_connection):
     router = APIRouter()
@@ -86,7 +88,7 @@ def create_analytics_router(get_db_connection):
                             COUNT(*) AS total,
                             SUM(CASE WHEN result = 'PASS' THEN 1 ELSE 0 END) AS passed,
                             SUM(CASE WHEN result = 'FAIL' THEN 1 ELSE 0 END) AS failed,
-                            AVG(COALESCE(metric_1, 0)) AS avgTime
+                            AVG(metric_1) AS avgTime
                         FROM analytics.fact_test_results
                         GROUP BY test_type;
                     """)
@@ -100,6 +102,7 @@ def create_analytics_router(get_db_connection):
                         "s11": "S11 Testing",
                         "sparameter": "S-Parameter Testing",
                         "gh21_vpi": "GH21 VPI Testing",
+                        "twotone": "Two-Tone RF VPI Testing",
                         "dc_vpi": "DC VPI Testing",
                         "Unknown": "Unknown/Other"
                     }
@@ -146,7 +149,8 @@ def create_analytics_router(get_db_connection):
                             COUNT(*) AS total,
                             SUM(CASE WHEN result = 'PASS' THEN 1 ELSE 0 END) AS passed,
                             SUM(CASE WHEN result = 'FAIL' THEN 1 ELSE 0 END) AS failed,
-                            AVG(COALESCE(metric_1, 0)) AS avgTime
+                            AVG(metric_1) AS avgTime,
+                            COUNT(metric_1) AS timed
                         FROM analytics.fact_test_results
                         GROUP BY test_type;
                     """)
@@ -173,7 +177,7 @@ def create_analytics_router(get_db_connection):
                                 COUNT(*) AS total,
                                 SUM(CASE WHEN result = 'PASS' THEN 1 ELSE 0 END) AS passed,
                                 SUM(CASE WHEN result = 'FAIL' THEN 1 ELSE 0 END) AS failed,
-                                AVG(COALESCE(metric_1, 0)) AS avgTime
+                                AVG(metric_1) AS avgTime
                             FROM analytics.fact_test_results;
                         """)
                         overall_row = cur.fetchone()
@@ -198,31 +202,45 @@ def create_analytics_router(get_db_connection):
                             "s11": "s11Testing",
                             "sparameter": "s11Testing",  # Group with s11 testing
                             "gh21_vpi": "dcpiTesting",
+                            "twotone": "dcpiTesting",
                             "dc_vpi": "dcpiTesting",
                             None: "chipInspection"  # Handle null test_type
                         }
                         
-                        # Fill in the actual data
+                        # Fill in the actual data; several test types share a frontend stage, so sum them first
+                        stage_totals = {}
                         for row in stage_rows:
                             stage_name = row[0]
                             total = int(row[1] or 0)
                             passed = int(row[2] or 0)
                             failed = int(row[3] or 0)
                             avg_time = float(row[4] or 0)
+                            timed = int(row[5] or 0)
                             
                             print(f"Processing stage: {stage_name}, total: {total}, passed: {passed}, failed: {failed}")
                             
                             # Map to frontend key
                             frontend_key = stage_mapping.get(stage_name, None)
                             if frontend_key and frontend_key in response_data:
-                                response_data[frontend_key] = {
-                                    "totalProcessed": total,
-                                    "passed": passed,
-                                    "failed": failed,
-                                    "successRate": round(passed / total * 100, 1) if total > 0 else 0,
-                                    "avgProcessingTime": round(avg_time, 2),
-                                    "recentActivity": []
-                                }
+                                totals = stage_totals.setdefault(frontend_key, {"total": 0, "passed": 0, "failed": 0,
+                                                                                "time_sum": 0.0, "timed": 0})
+                                totals["total"] += total
+                                totals["passed"] += passed
+                                totals["failed"] += failed
+                                # Average time weighted by the rows that carry one (metric_1 is NULL for loaded results)
+                                totals["time_sum"] += avg_time * timed
+                                totals["timed"] += timed
+                        
+                        for frontend_key, totals in stage_totals.items():
+                            total, passed = totals["total"], totals["passed"]
+                            response_data[frontend_key] = {
+                                "totalProcessed": total,
+                                "passed": passed,
+                                "failed": totals["failed"],
+                                "successRate": round(passed / total * 100, 1) if total > 0 else 0,
+                                "avgProcessingTime": round(totals["time_sum"] / totals["timed"], 2) if totals["timed"] else 0,
+                                "recentActivity": []
+                            }
                     
                     print(f"Dashboard response: {response_data}")
                     return JSONResponse(content=response_data)
@@ -232,65 +250,48 @@ def create_analytics_router(get_db_connection):
             traceback.print_exc()
             raise HTTPException(status_code=500, detail=str(e))
     
+    def compute_system_status():
+        """Totals, success rate, today's tests and active operators in one scan of the fact table"""
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                stats = grouped_stats(cur, "analytics.fact_test_results", aggregates={
+                    "total_tests": "COUNT(*)",
+                    "success_rate": "AVG(CASE WHEN result = 'PASS' THEN 1.0 ELSE 0.0 END) * 100",
+                    "tests_today": "COUNT(*) FILTER (WHERE test_timestamp >= CURRENT_DATE "
+                                   "AND test_timestamp < CURRENT_DATE + INTERVAL '1 day')",
+                    "active_users": "COUNT(DISTINCT operator_name) "
+                                    "FILTER (WHERE test_timestamp >= NOW() - INTERVAL '24 hours')"
+                })
+        return stats["totals"]
+    
     @router.get("/analytics/system-status")
     async def analytics_system_status():
         """
         Return system status information - integrated with main system
         """
         try:
-            with get_db_connection() as conn:
-                with conn.cursor() as cur:
-                    # Check if we can query the database
-                    cur.execute("SELECT 1")
-                    db_status = "healthy"
-                    
-                    # Get basic stats first (without date filtering to test)
-                    cur.execute("""
-                        SELECT 
-                            COUNT(*) as total_tests,
-                            AVG(CASE WHEN result = 'PASS' THEN 1.0 ELSE 0.0 END) * 100 as success_rate
-                        FROM analytics.fact_test_results
-                    """)
-                    stats = cur.fetchone()
-                    
-                    # Get tests from today (with better date handling)
-                    cur.execute("""
-                        SELECT COUNT(*) as tests_today
-                        FROM analytics.fact_test_results
-                        WHERE test_timestamp::date = CURRENT_DATE
-                    """)
-                    today_stats = cur.fetchone()
-                    
-                    # Get active users from recent activity (last 24 hours)
-                    cur.execute("""
-                        SELECT COUNT(DISTINCT operator_name) as active_users
-                        FROM analytics.fact_test_results
-                        WHERE test_timestamp >= NOW() - INTERVAL '24 hours'
-                        AND operator_name IS NOT NULL
-                    """)
-                    active_users_result = cur.fetchone()
-                    
-                    total_tests = int(stats[0] or 0)
-                    success_rate = float(stats[1] or 0)
-                    tests_today = int(today_stats[0] or 0)
-                    active_users = int(active_users_result[0] or 0)
-                    
-                    # Debug logging
-                    print(f"System Status Debug: total_tests={total_tests}, success_rate={success_rate}, tests_today={tests_today}, active_users={active_users}")
-                    
-                    return JSONResponse(content={
-                        "overall": "healthy" if db_status == "healthy" and total_tests > 0 else "issues",
-                        "vna": "healthy",
-                        "database": db_status,
-                        "storage": "healthy",
-                        "tests_today": tests_today,
-                        "success_rate": round(success_rate, 1),
-                        "active_users": active_users,
-                        "debug": {
-                            "total_tests": total_tests,
-                            "db_status": db_status
-                        }
-                    })
+            stats = await asyncio.to_thread(stats_memo.get, "analytics_system_status", compute_system_status)
+            # The statistics query succeeding is the database check
+            db_status = "healthy"
+            
+            total_tests = int(stats["total_tests"] or 0)
+            success_rate = float(stats["success_rate"] or 0)
+            tests_today = int(stats["tests_today"] or 0)
+            active_users = int(stats["active_users"] or 0)
+            
+            return JSONResponse(content={
+                "overall": "healthy" if db_status == "healthy" and total_tests > 0 else "issues",
+                "vna": "healthy",
+                "database": db_status,
+                "storage": "healthy",
+                "tests_today": tests_today,
+                "success_rate": round(success_rate, 1),
+                "active_users": active_users,
+                "debug": {
+                    "total_tests": total_tests,
+                    "db_status": db_status
+                }
+            })
                     
         except Exception as e:
             print(f"Error in system status endpoint: {str(e)}")
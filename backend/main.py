@@ -15,31 +15,74 @@ import psycopg2.extras
 import psycopg2.pool
 import os
 import uuid
+import time
+import heapq
 import threading
-from contextlib import contextmanager
+from contextlib import contextmanager, asynccontextmanager
 from dotenv import load_dotenv
-from collections import defaultdict
-from modules.manufacturing_workflow_module import router as manufacturing_router
+from collections import defaultdict, OrderedDict
 # from apps import app as analytics_app
 # import os
 # from fastapi import FastAPI, HTTPException
 # from fastapi.middleware.cors import CORSMiddleware
-import databases
 # from apps import router as analytics_router
 from dashboard import create_analytics_router
+from modules.lazy_imports import loaded_stacks
+from modules.migrations import apply_migrations, check_schema_version, pending_migrations
+from modules.module_registry import ModuleRegistry, report_route_conflicts
+from modules.audit_log import audit, audit_logger
+from modules.log_store import maintain_log_partitions, query_logs
+from modules.ws_hub import hub, module_topic, SYSTEM_TOPIC
+from modules.event_bus import event_bus, notify_module, is_subscribable
+from modules.pg_listener import pg_listener
+from modules.fact_loader import FactLoader
+from modules.grouped_stats import stats_memo
+from modules.cluster import (CLUSTER_MODE, WORKER_ID, WORKER_URL, SessionStore, EventRelay, InstrumentRoutingMiddleware,
+                             instrument_router, leader, session_key, merge_session)
 # from apps import app
 # Load environment variables
 load_dotenv()
 
-app = FastAPI(title="MAQ Lab Manager API", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Run the startup pipeline before serving and clean up on exit"""
+    await startup_event()
+    yield
+    await shutdown_event()
+
+app = FastAPI(title="MAQ Lab Manager API", version="1.0.0", lifespan=lifespan)
+
+# Module routers are loaded after app initialization to avoid circular imports.
+# Each module declares a MODULE_MANIFEST (prefix, router, lifecycle hooks, health probe).
+module_registry = ModuleRegistry()
+MODULE_IMPORT_PATHS = [
+    'modules.s11_module',
+    'modules.chip_inspection_module',
+    'modules.housing_inspection_module',
+    'modules.manufacturing_orders_module',
+    'modules.twotone_module',
+    'modules.S21_module',
+    'modules.dcvpitestmodule',
+    'modules.artifact_manager',
+    'modules.upload_storage',  # after the modules that register upload targets
+    'modules.manufacturing_workflow_module',
+    'modules.traveler_module',
+    'modules.export_module',
+    'modules.spc_module',
+    'modules.yield_module',
+]
+# Fail startup on duplicate or shadowed routes instead of only logging them
+STRICT_ROUTES = os.getenv('STRICT_ROUTES', 'false').lower() == 'true'
 
-# Module routers will be loaded after app initialization to avoid circular imports
-s11_router = None
-chip_inspection_router = None
-housing_inspection_router = None
-mo_router = None  # Add Purchase Order & Manufacturing Order router
+# Per-phase startup timings in seconds
+startup_timings = {}
+# Schema version found at startup (see modules/migrations.py)
+schema_state = {}
 # app.mount("/analytics", analytics_app)
 
+# Instrument routes are served by the worker owning the instrument (cluster mode); added first so CORS wraps its replies
+app.add_middleware(InstrumentRoutingMiddleware, instruments=instrument_router)
+
 # Enhanced CORS middleware for multiple concurrent users
 app.add_middleware(
     CORSMiddleware,
@@ -60,9 +103,13 @@ DATABASE_CONFIG = {
     'port': int(os.getenv('DB_PORT', '5432')),
     'database': os.getenv('DB_NAME', 'postgres'),
     'user': os.getenv('DB_USER', 'postgres'),
-    'password': os.getenv('DB_PASSWORD', 'karthi')
+    'password': os.getenv('DB_PASSWORD', 'karthi'),
+    'connect_timeout': int(os.getenv('DB_CONNECT_TIMEOUT', '5'))
 }
 
+# Development convenience: apply pending migrations at startup instead of at deploy time
+SCHEMA_AUTO_MIGRATE = os.getenv('SCHEMA_AUTO_MIGRATE', 'false').lower() == 'true'
+
 # Global connection pool for concurrent access
 db_pool = None
 
@@ -106,39 +153,138 @@ def get_db_connection():
 # app.include_router(analytics_router)
 analytics_router = create_analytics_router(get_db_connection)
 app.include_router(analytics_router, prefix="/api", tags=["Analytics"])
+# Keeps analytics.fact_test_results (read by the dashboard) loaded from the result tables
+fact_loader = FactLoader(get_db_connection)
 # User Session Management for Concurrent Access
+SESSION_IDLE_TIMEOUT = datetime.timedelta(minutes=30)
+
 class UserSessionManager:
     def __init__(self):
         self.active_sessions: Dict[str, dict] = {}  # token -> session_info
         self.user_activities: Dict[int, dict] = {}  # user_id -> activity_info
         self.module_usage: Dict[str, Set[int]] = defaultdict(set)  # module -> set of user_ids
         self.lock = threading.Lock()
+        # token -> last request time; written without the lock, merged by flush_activity()
+        self.pending_activity: Dict[str, datetime.datetime] = {}
+        # (last_activity, token) min-heap; entries older than the session's last_activity are stale
+        self.expiry_heap: List[tuple] = []
+        # Cluster mode: api_sessions store, tokens to write/delete on the next sync, other workers' sessions by key
+        self.store: Optional[SessionStore] = None
+        self.dirty: Set[str] = set()
+        self.ended: Set[str] = set()
+        self.shared: Optional[Dict[str, dict]] = None
+        # Cluster-wide counters, rebuilt on each sync and kept current as local sessions change:
+        # other workers' session keys / module users, and those of them this worker does not already count
+        self.shared_keys: Set[str] = set()
+        self.shared_only: Set[str] = set()
+        self.shared_module_users: Dict[str, Dict[int, dict]] = {}
+        self.shared_module_only: Dict[str, Set[int]] = defaultdict(set)
     
     def create_session(self, user_id: int, username: str, token: str):
         """Create new user session"""
         with self.lock:
+            now = datetime.datetime.utcnow()
             session_info = {
+                'key': session_key(token),
                 'user_id': user_id,
                 'username': username,
-                'login_time': datetime.datetime.utcnow(),
-                'last_activity': datetime.datetime.utcnow(),
+                'login_time': now,
+                'last_activity': now,
                 'active_modules': set(),
                 'current_operations': {}
             }
             self.active_sessions[token] = session_info
             self.user_activities[user_id] = session_info
+            self.shared_only.discard(session_info['key'])
+            self._schedule_expiry(token, now)
+            self._mark(token)
             print(f"👤 Session created for {username} (ID: {user_id})")
     
+    def _module_left(self, module: str, user_id: int):
+        """A local user left a module; still counted if another worker has them in it (caller holds the lock)"""
+        self.module_usage[module].discard(user_id)
+        if user_id in self.shared_module_users.get(module, ()):
+            self.shared_module_only[module].add(user_id)
+    
+    def _mark(self, token: str):
+        """Queue a changed session for the next shared-store sync (caller holds the lock)"""
+        if self.store is not None:
+            self.dirty.add(token)
+    
+    def _schedule_expiry(self, token: str, last_activity: datetime.datetime):
+        """Queue a session for the expiry sweep (caller holds the lock)"""
+        heapq.heappush(self.expiry_heap, (last_activity, token))
+        # Compact once stale entries dominate, so the heap stays O(sessions)
+        if len(self.expiry_heap) > 4 * len(self.active_sessions) + 64:
+            self.expiry_heap = [(session['last_activity'], tok) for tok, session in self.active_sessions.items()]
+            heapq.heapify(self.expiry_heap)
+    
+    def _expire_idle_sessions(self) -> List[str]:
+        """Pop sessions idle past the timeout in expiry order (caller holds the lock)"""
+        cutoff_time = datetime.datetime.utcnow() - SESSION_IDLE_TIMEOUT
+        expired = []
+        expired_tokens = []
+        while self.expiry_heap and self.expiry_heap[0][0] <= cutoff_time:
+            last_activity, token = heapq.heappop(self.expiry_heap)
+            session = self.active_sessions.get(token)
+            if session is None or session['last_activity'] != last_activity:
+                continue  # stale entry: session ended or was active again since
+            del self.active_sessions[token]
+            user_id = session['user_id']
+            if self.user_activities.get(user_id) is session:
+                self.user_activities.pop(user_id, None)
+            for module in session['active_modules']:
+                self._module_left(module, user_id)
+            if session['key'] in self.shared_keys:
+                self.shared_only.add(session['key'])
+            if self.store is not None:
+                self.ended.add(session['key'])
+            expired.append(session['username'])
+            expired_tokens.append(token)
+        if expired_tokens:
+            token_cache.discard(expired_tokens)
+        return expired
+    
+    def touch(self, token: str):
+        """Record a request for this token (hot path: one dict store, no lock)"""
+        self.pending_activity[token] = datetime.datetime.utcnow()
+    
+    def flush_activity(self) -> int:
+        """Merge batched request times into the sessions"""
+        if not self.pending_activity:
+            return 0
+        # Swap the buffer so concurrent touches land in the new one
+        pending, self.pending_activity = self.pending_activity, {}
+        with self.lock:
+            for token, seen in pending.copy().items():
+                session = self.active_sessions.get(token)
+                if session and seen > session['last_activity']:
+                    session['last_activity'] = seen
+                    self._schedule_expiry(token, seen)
+                    self._mark(token)
+        return len(pending)
+    
+    def ensure_session(self, user_id: int, username: str, token: str):
+        """Create the session on first sight of a token (lock only taken when missing)"""
+        if token not in self.active_sessions:
+            self.create_session(user_id, username, token)
+    
     def update_activity(self, token: str, module: str = None, operation: str = None):
         """Update user activity"""
+        if not module and not operation:
+            self.touch(token)
+            return
         with self.lock:
             if token in self.active_sessions:
                 session = self.active_sessions[token]
                 session['last_activity'] = datetime.datetime.utcnow()
+                self._schedule_expiry(token, session['last_activity'])
+                self._mark(token)
                 
                 if module:
                     session['active_modules'].add(module)
                     self.module_usage[module].add(session['user_id'])
+                    self.shared_module_only[module].discard(session['user_id'])
                 
                 if operation:
                     session['current_operations'][module] = operation
@@ -149,120 +295,209 @@ class UserSessionManager:
             if token in self.active_sessions:
                 session = self.active_sessions[token]
                 session['active_modules'].discard(module)
-                self.module_usage[module].discard(session['user_id'])
+                self._module_left(module, session['user_id'])
                 session['current_operations'].pop(module, None)
+                self._mark(token)
+    
+    def sync_shared(self) -> int:
+        """Write this worker's changed sessions to api_sessions and refresh the other workers' sessions"""
+        if self.store is None:
+            return 0
+        with self.lock:
+            self._expire_idle_sessions()
+            tokens, self.dirty = self.dirty, set()
+            ended, self.ended = self.ended, set()
+            changed = [{**self.active_sessions[token],
+                        'active_modules': set(self.active_sessions[token]['active_modules']),
+                        'current_operations': dict(self.active_sessions[token]['current_operations'])}
+                       for token in tokens if token in self.active_sessions]
+        try:
+            shared = self.store.sync(changed, list(ended), datetime.datetime.utcnow() - SESSION_IDLE_TIMEOUT)
+        except Exception:
+            self.store.metrics['errors'] += 1
+            with self.lock:
+                self.dirty |= tokens
+                self.ended |= ended
+            raise
+        with self.lock:
+            self.shared = shared
+            self._count_shared()
+        return len(changed)
+    
+    def _count_shared(self):
+        """Rebuild the cluster-wide counters from the synced sessions (caller holds the lock; once per sync)"""
+        local_keys = {session['key'] for session in self.active_sessions.values()}
+        self.shared_keys = set(self.shared)
+        self.shared_only = self.shared_keys - local_keys
+        module_users = defaultdict(dict)
+        for session in self.shared.values():
+            for module in session['active_modules']:
+                module_users[module][session['user_id']] = {
+                    'user_id': session['user_id'],
+                    'username': session['username'],
+                    'operation': session['current_operations'].get(module, 'active')
+                }
+        self.shared_module_users = dict(module_users)
+        self.shared_module_only = defaultdict(set, {
+            module: set(users) - self.module_usage.get(module, set()) for module, users in module_users.items()})
+    
+    def _cluster_sessions(self) -> List[dict]:
+        """Sessions across all workers, this worker's own merged in fresh (caller holds the lock)"""
+        cutoff_time = datetime.datetime.utcnow() - SESSION_IDLE_TIMEOUT
+        sessions = {key: {**session, 'active_modules': set(session['active_modules']),
+                          'current_operations': dict(session['current_operations'])}
+                    for key, session in self.shared.items() if session['last_activity'] > cutoff_time}
+        for session in self.active_sessions.values():
+            merge_session(sessions, session['key'], session)
+        return list(sessions.values())
+    
+    def active_user_count(self) -> int:
+        """Number of sessions active within the idle timeout"""
+        self.flush_activity()
+        with self.lock:
+            self._expire_idle_sessions()
+            return self._active_count()
+    
+    def module_user_count(self, module: str) -> int:
+        """Number of users currently using a module"""
+        self.flush_activity()
+        with self.lock:
+            self._expire_idle_sessions()
+            return self._module_count(module)
+    
+    def user_counts(self, module: str) -> tuple:
+        """(active users, users of ``module``) from one flush and one lock, for per-action audit context"""
+        self.flush_activity()
+        with self.lock:
+            self._expire_idle_sessions()
+            return self._active_count(), self._module_count(module)
+    
+    def usage_snapshot(self, modules: List[str]) -> tuple:
+        """(active users, module -> its users) from one flush and one lock"""
+        self.flush_activity()
+        with self.lock:
+            self._expire_idle_sessions()
+            return self._active_count(), {module: self._module_users(module) for module in modules}
+    
+    def _active_count(self) -> int:
+        return len(self.active_sessions) + len(self.shared_only)
+    
+    def _module_count(self, module: str) -> int:
+        return len(self.module_usage.get(module, ())) + len(self.shared_module_only.get(module, ()))
     
     def get_active_users(self) -> List[dict]:
         """Get list of currently active users"""
+        self.flush_activity()
         with self.lock:
-            active_users = []
-            cutoff_time = datetime.datetime.utcnow() - datetime.timedelta(minutes=30)
-            
-            for session in self.active_sessions.values():
-                if session['last_activity'] > cutoff_time:
-                    active_users.append({
-                        'user_id': session['user_id'],
-                        'username': session['username'],
-                        'login_time': session['login_time'].isoformat(),
-                        'last_activity': session['last_activity'].isoformat(),
-                        'active_modules': list(session['active_modules']),
-                        'current_operations': session['current_operations']
-                    })
-            
-            return active_users
+            self._expire_idle_sessions()
+            sessions = self._cluster_sessions() if self.shared is not None else self.active_sessions.values()
+            return [
+                {
+                    'user_id': session['user_id'],
+                    'username': session['username'],
+                    'login_time': session['login_time'].isoformat(),
+                    'last_activity': session['last_activity'].isoformat(),
+                    'active_modules': list(session['active_modules']),
+                    'current_operations': session['current_operations']
+                }
+                for session in sessions
+            ]
     
     def get_module_users(self, module: str) -> List[dict]:
         """Get users currently using a specific module"""
+        self.flush_activity()
         with self.lock:
-            users = []
-            for user_id in self.module_usage[module]:
-                if user_id in self.user_activities:
-                    session = self.user_activities[user_id]
-                    users.append({
-                        'user_id': user_id,
-                        'username': session['username'],
-                        'operation': session['current_operations'].get(module, 'active')
-                    })
-            return users
+            self._expire_idle_sessions()
+            return self._module_users(module)
+    
+    def _module_users(self, module: str) -> List[dict]:
+        """This worker's users of a module plus those only other workers have (caller holds the lock)"""
+        users = []
+        shared = self.shared_module_users.get(module, {})
+        for user_id in self.module_usage.get(module, ()):
+            if user_id in self.user_activities:
+                session = self.user_activities[user_id]
+                users.append({
+                    'user_id': user_id,
+                    'username': session['username'],
+                    'operation': session['current_operations'].get(module, 'active')
+                })
+            elif user_id in shared:
+                users.append(shared[user_id])
+        users.extend(shared[user_id] for user_id in self.shared_module_only.get(module, ()))
+        return users
     
     def cleanup_inactive_sessions(self):
         """Remove inactive sessions (older than 30 minutes)"""
+        self.flush_activity()
         with self.lock:
-            cutoff_time = datetime.datetime.utcnow() - datetime.timedelta(minutes=30)
-            
-            inactive_tokens = []
-            for token, session in self.active_sessions.items():
-                if session['last_activity'] < cutoff_time:
-                    inactive_tokens.append(token)
-            
-            for token in inactive_tokens:
-                session = self.active_sessions.pop(token, None)
-                if session:
-                    user_id = session['user_id']
-                    username = session['username']
-                    self.user_activities.pop(user_id, None)
-                    for module_users in self.module_usage.values():
-                        module_users.discard(user_id)
-                    print(f"🧹 Cleaned up inactive session for {username}")
+            expired = self._expire_idle_sessions()
+        for username in expired:
+            print(f"🧹 Cleaned up inactive session for {username}")
 
 # Global session manager
 session_manager = UserSessionManager()
+# Cluster mode: sessions shared through api_sessions and websocket events relayed between workers over NOTIFY
+event_relay = EventRelay(event_bus, get_db_connection)
+if CLUSTER_MODE:
+    session_manager.store = SessionStore(get_db_connection)
+
+# Verified-token cache: skips JWT decoding for tokens already seen
+class TokenCache:
+    """Bounded LRU cache of verified token payloads, valid until each token's exp claim"""
+
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max_size
+        self.entries: OrderedDict = OrderedDict()  # token -> payload, least recently used first
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
 
-# Enhanced WebSocket Connection Manager
-class ConcurrentConnectionManager:
-    def __init__(self):
-        self.active_connections: Dict[str, WebSocket] = {}  # token -> websocket
-        self.user_connections: Dict[int, WebSocket] = {}    # user_id -> websocket
-        self.module_subscribers: Dict[str, Set[int]] = defaultdict(set)  # module -> user_ids
-
-    async def connect(self, websocket: WebSocket, user_id: int, token: str):
-        await websocket.accept()
-        self.active_connections[token] = websocket
-        self.user_connections[user_id] = websocket
-        print(f"🔌 WebSocket connected for user {user_id}")
-
-    def disconnect(self, websocket: WebSocket, user_id: int, token: str):
-        self.active_connections.pop(token, None)
-        self.user_connections.pop(user_id, None)
-        for subscribers in self.module_subscribers.values():
-            subscribers.discard(user_id)
-        print(f"🔌 WebSocket disconnected for user {user_id}")
-
-    async def send_personal_message(self, message: dict, user_id: int):
-        """Send message to specific user"""
-        if user_id in self.user_connections:
-            try:
-                await self.user_connections[user_id].send_text(json.dumps(message))
-            except:
-                self.user_connections.pop(user_id, None)
-
-    async def broadcast_to_module_users(self, message: dict, module: str):
-        """Send message to all users of a specific module"""
-        users = list(self.module_subscribers[module])
-        for user_id in users:
-            await self.send_personal_message(message, user_id)
-
-    async def broadcast_system_message(self, message: dict):
-        """Send message to all connected users"""
-        disconnected_users = []
-        for user_id, websocket in self.user_connections.items():
-            try:
-                await websocket.send_text(json.dumps(message))
-            except:
-                disconnected_users.append(user_id)
-        
-        for user_id in disconnected_users:
-            self.user_connections.pop(user_id, None)
+    def get(self, token: str) -> Optional[dict]:
+        """Cached payload, or None if unknown or expired"""
+        with self.lock:
+            payload = self.entries.get(token)
+            if payload is None:
+                self.misses += 1
+                return None
+            if payload['exp'] <= time.time():
+                del self.entries[token]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(token)
+            self.hits += 1
+            return payload
+
+    def put(self, token: str, payload: dict):
+        """Insert a verified payload, evicting the least recently used entries past max_size"""
+        with self.lock:
+            self.entries[token] = payload
+            self.entries.move_to_end(token)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
 
-    def subscribe_to_module(self, user_id: int, module: str):
-        """Subscribe user to module notifications"""
-        self.module_subscribers[module].add(user_id)
+    def discard(self, tokens: List[str]):
+        """Drop tokens (e.g. every session expired in one sweep) under one lock"""
+        with self.lock:
+            for token in tokens:
+                self.entries.pop(token, None)
 
-    def unsubscribe_from_module(self, user_id: int, module: str):
-        """Unsubscribe user from module notifications"""
-        self.module_subscribers[module].discard(user_id)
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else None
+        }
 
-manager = ConcurrentConnectionManager()
+token_cache = TokenCache(int(os.getenv('JWT_CACHE_SIZE', '1024')))
+ACTIVITY_FLUSH_INTERVAL = int(os.getenv('ACTIVITY_FLUSH_INTERVAL', '5'))
+# uvicorn worker processes on one socket; more than one needs CLUSTER_MODE=true and no instrument modules
+API_WORKERS = int(os.getenv('API_WORKERS', '1'))
+# Port this process listens on (one port per worker when instrument modules are loaded, see modules/cluster.py)
+API_PORT = int(os.getenv('API_PORT', '8000'))
 
 # Pydantic models
 class LoginRequest(BaseModel):
@@ -305,10 +540,15 @@ def create_jwt_token(user_data: dict) -> str:
 
 def verify_jwt_token(token: str) -> dict:
     """Verify JWT token and update session activity"""
+    payload = token_cache.get(token)
+    if payload is not None:
+        session_manager.touch(token)
+        return payload
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
+        token_cache.put(token, payload)
         # Update session activity
-        session_manager.update_activity(token)
+        session_manager.touch(token)
         return payload
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired. Please login again.")
@@ -321,12 +561,7 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     user_data = verify_jwt_token(token)
     
     # Ensure session exists
-    if token not in session_manager.active_sessions:
-        session_manager.create_session(
-            user_data['user_id'], 
-            user_data['username'], 
-            token
-        )
+    session_manager.ensure_session(user_data['user_id'], user_data['username'], token)
     
     return user_data
 
@@ -360,22 +595,13 @@ def update_last_login(user_id: int):
         print(f"Error updating last login: {e}")
 
 def log_action(user_id: int, action: str, module: str, details: str):
-    """Enhanced logging with concurrent access tracking"""
+    """Enhanced logging with concurrent access tracking (queued; written to system_logs in batches)"""
     try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            
-            # Get current active users for context
-            active_users = len(session_manager.get_active_users())
-            module_users = len(session_manager.get_module_users(module))
-            
-            enhanced_details = f"{details} | Active users: {active_users} | Module users: {module_users}"
-            
-            cursor.execute("""
-                INSERT INTO system_logs (user_id, action, module, details)
-                VALUES (%s, %s, %s, %s)
-            """, (user_id, action, module, enhanced_details))
-            conn.commit()
+        # Get current active users for context
+        active_users, module_users = session_manager.user_counts(module)
+        
+        audit(user_id, action, module, details,
+              {"active_users": active_users, "module_users": module_users})
     except Exception as e:
         print(f"Error logging action: {e}")
 
@@ -389,13 +615,11 @@ def get_system_status() -> dict:
             cursor.execute("SELECT component, status FROM system_status")
             statuses = dict(cursor.fetchall())
             
-            # Get active users count
-            active_users = len(session_manager.get_active_users())
-            
-            # Get module usage statistics - Updated to include mo
+            # Active users and module usage (updated to include mo) from one session snapshot
+            active_users, users_by_module = session_manager.usage_snapshot(
+                ['s11', 'chip_inspection', 'housing_inspection', 'rf', 'power', 'mo'])
             modules_status = {}
-            for module in ['s11', 'chip_inspection', 'housing_inspection', 'rf', 'power', 'mo']:
-                module_users = session_manager.get_module_users(module)
+            for module, module_users in users_by_module.items():
                 modules_status[module] = {
                     'active_users': len(module_users),
                     'users': [user['username'] for user in module_users],
@@ -442,59 +666,11 @@ def update_component_status(component: str, status: str, message: str):
         print(f"Error updating component status: {e}")
 
 def init_database():
-    """Initialize PostgreSQL database with required tables"""
+    """Seed default users and system status (tables come from modules/migrations.py)"""
     try:
         with get_db_connection() as conn:
             cursor = conn.cursor()
             
-            # Users table
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS users (
-                    id SERIAL PRIMARY KEY,
-                    username VARCHAR(50) UNIQUE NOT NULL,
-                    password_hash VARCHAR(255) NOT NULL,
-                    email VARCHAR(100),
-                    role VARCHAR(20) NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    last_login TIMESTAMP,
-                    is_active BOOLEAN DEFAULT TRUE
-                )
-            """)
-            
-            # Sessions table
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS sessions (
-                    id SERIAL PRIMARY KEY,
-                    user_id INTEGER REFERENCES users(id),
-                    session_token VARCHAR(255),
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    expires_at TIMESTAMP
-                )
-            """)
-            
-            # Enhanced system logs table
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS system_logs (
-                    id SERIAL PRIMARY KEY,
-                    user_id INTEGER REFERENCES users(id),
-                    action VARCHAR(100),
-                    module VARCHAR(50),
-                    details TEXT,
-                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            # Enhanced system status table
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS system_status (
-                    id SERIAL PRIMARY KEY,
-                    component VARCHAR(50) UNIQUE,
-                    status VARCHAR(20),
-                    message TEXT,
-                    last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
             # Check if users exist, if not create default users
             cursor.execute("SELECT COUNT(*) FROM users")
             user_count = cursor.fetchone()[0]
@@ -543,107 +719,24 @@ def init_database():
 # Include module routers
 def load_modules():
     """Load test station modules after app initialization"""
-    global s11_router, chip_inspection_router, housing_inspection_router, mo_router
-    
-    # Load S11 module
-    try:
-        from modules.s11_module import s11_router as s11_module_router
-        s11_router = s11_module_router
-        app.include_router(s11_router, prefix="/modules/s11", tags=["S11 Testing"])
-        print("✅ S11 module loaded and registered")
-    except ImportError as e:
-        print(f"⚠️  S11 module not found: {e}")
-    
-    # Load Chip Inspection module
-    try:
-        from modules.chip_inspection_module import chip_inspection_router as chip_module_router
-        chip_inspection_router = chip_module_router
-        app.include_router(chip_inspection_router, prefix="/modules/chip-inspection", tags=["Chip Inspection"])
-        print("✅ Chip Inspection module loaded and registered")
-    except ImportError as e:
-        print(f"⚠️  Chip Inspection module not found: {e}")
-    
-    # Load housing_inspection module (future)
-    try:
-        from modules.housing_inspection_module import housing_inspection_router as housing_inspection_module_router
-        housing_inspection_router = housing_inspection_module_router
-        app.include_router(housing_inspection_router, prefix="/modules/housing_inspection", tags=["housing_inspection Testing"])
-        print("✅ housing_inspection module loaded and registered")
-    except ImportError as e:
-        print(f"⚠️  housing_inspection module not found: {e}")
-    
-    # Load Purchase Order & Manufacturing Order module - UPDATED
-    try:
-        from modules.manufacturing_orders_module import mo_router as mo_module_router
-        mo_router = mo_module_router
-        app.include_router(mo_router, prefix="/admin", tags=["Purchase Orders & Manufacturing Orders"])
-        print("✅ Purchase Order & Manufacturing Order module loaded and registered")
-    except ImportError as e:
-        print(f"⚠️  Purchase Order & Manufacturing Order module not found: {e}")
-    # Load Two-Tone Testing module
-    try:
-        from modules.twotone_module import twotone_router
-        app.include_router(twotone_router, prefix="/modules/twotone", tags=["Two-Tone Testing"])
-        print("✅ Two-tone testing module loaded and registered")
-    except ImportError as e:
-        print(f"⚠️  Two-tone testing module not found: {e}")
-    # Load S21 Testing module
-    try:
-        from modules.S21_module import s21_router
-        app.include_router(s21_router, prefix="/modules/s21", tags=["S-Parameter Testing"])
-        print("✅ S21 testing module loaded and registered")
-    except ImportError as e:
-        print(f"⚠️  S21 testing module not found: {e}")
-    
-    try:
-        from modules.dcvpitestmodule import modulator_router
-        app.include_router(modulator_router, prefix="/api/modulator", tags=["Modulator Testing"])
-        print("✅ Dc Vpi test module loaded and registered")
-    except ImportError as e:
-        print(f"⚠️  Dc Vpi test module not found: {e}")
-    # In load_modules() function, update the PO/MO section:
-    # try:
-    #     from modules.manufacturing_workflow_module import po_mo_router as manufacturing_workflow_router
-    #     manufacturing_workflow_router = manufacturing_workflow_router
-    #     app.include_router(manufacturing_workflow_router, prefix="/api/manufacturing", tags=["Manufacturing Workflow"])
-    #     print("✅ Manufacturing Workflow module loaded and registered")
-    # except ImportError as e:
-    #     print(f"⚠️  Manufacturing Workflow module not found: {e}")
-            # Load Manufacturing Workflow module
-   # Load Manufacturing Workflow module
-    # Load Manufacturing Workflow module
-    # Load Manufacturing Workflow module
-    try:
-        from modules.manufacturing_workflow_module import router as manufacturing_router, set_db_connection
-        # Pass the database connection function to the module
-        set_db_connection(get_db_connection)
-        app.include_router(manufacturing_router, prefix="/api/manufacturing", tags=["Manufacturing Workflow"])
-        print("✅ Manufacturing Workflow module loaded and registered")
-    except ImportError as e:
-        print(f"⚠️  Manufacturing Workflow module not found: {e}")
+    services = {
+        'get_db_connection': get_db_connection,
+        'track_module_activity': session_manager.update_activity,
+        'end_module_activity': session_manager.end_module_usage
+    }
+    for import_path in MODULE_IMPORT_PATHS:
+        module_registry.load(app, import_path, services)
 # Load modules after app and utilities are defined
 load_modules()
 
 # Core API Endpoints
-@app.options("/{path:path}")
-async def options_handler(path: str):
-    """Handle OPTIONS requests for CORS preflight"""
-    return {"message": "OK"}
-
 @app.get("/")
 async def root():
     return {
         "message": "MAQ Lab Manager API", 
         "version": "1.0.0",
         "features": ["Multi-user support", "Modular test stations", "Real-time notifications", "Purchase Order Management"],
-        "active_modules": [
-            module for module, router in [
-                ("s11", s11_router), 
-                ("chip_inspection", chip_inspection_router), 
-                ("housing_inspection", housing_inspection_router),
-                ("purchase_manufacturing_orders", mo_router)
-            ] if router
-        ]
+        "active_modules": list(module_registry.manifests)
     }
 
 @app.post("/auth/login")
@@ -678,7 +771,7 @@ async def login(request: LoginRequest):
     update_last_login(user['id'])
     
     # Log login with concurrent user info
-    active_count = len(session_manager.get_active_users())
+    active_count = session_manager.active_user_count()
     log_action(user['id'], 'login', 'auth', f"User logged in (Total active: {active_count})")
     
     return {
@@ -759,7 +852,7 @@ async def get_active_users(current_user: dict = Depends(get_current_user)):
     
     return {
         "active_users": session_manager.get_active_users(),
-        "total_count": len(session_manager.get_active_users())
+        "total_count": session_manager.active_user_count()
     }
 
 @app.get("/system/module-usage/{module}")
@@ -768,9 +861,57 @@ async def get_module_usage(module: str, current_user: dict = Depends(get_current
     return {
         "module": module,
         "users": session_manager.get_module_users(module),
-        "user_count": len(session_manager.get_module_users(module))
+        "user_count": session_manager.module_user_count(module)
+    }
+
+@app.get("/system/websockets")
+async def get_websocket_stats(current_user: dict = Depends(get_current_user)):
+    """WebSocket fan-out metrics with per-connection queue depth and send lag (admin only)"""
+    if current_user['role'] != 'admin':
+        raise HTTPException(status_code=403, detail="Admin access required")
+
+    return hub.stats(per_connection=True)
+
+@app.get("/system/cluster")
+async def get_cluster_status(current_user: dict = Depends(get_current_user)):
+    """This worker's identity, the instrument routing table and event relay metrics (admin only)"""
+    if current_user['role'] != 'admin':
+        raise HTTPException(status_code=403, detail="Admin access required")
+
+    return {
+        "cluster_mode": CLUSTER_MODE,
+        "worker_id": WORKER_ID,
+        "leader": leader.stats(),
+        "instruments": instrument_router.stats(),
+        "instrument_paths": instrument_router.paths,
+        "event_relay": event_relay.stats(),
+        "sessions": session_manager.store.stats() if session_manager.store else None
     }
 
+@app.get("/system/etl")
+async def get_etl_status(current_user: dict = Depends(get_current_user)):
+    """Analytics loader metrics and per-table watermarks (admin only)"""
+    if current_user['role'] != 'admin':
+        raise HTTPException(status_code=403, detail="Admin access required")
+
+    watermarks = await asyncio.to_thread(fact_loader.watermarks)
+    return {**fact_loader.stats(), "watermarks": watermarks}
+
+@app.post("/system/etl/backfill")
+async def backfill_analytics(
+    table: Optional[str] = None,
+    workers: int = 4,
+    current_user: dict = Depends(get_current_user)
+):
+    """Reload result table history into analytics.fact_test_results in parallel chunks (admin only)"""
+    if current_user['role'] != 'admin':
+        raise HTTPException(status_code=403, detail="Admin access required")
+
+    result = await asyncio.to_thread(fact_loader.backfill, [table] if table else None, workers=min(max(workers, 1), 8))
+    log_action(current_user['user_id'], 'etl_backfill', 'analytics',
+               f"Backfilled {result['rows_written']} fact rows in {result['chunks']} chunks")
+    return result
+
 @app.post("/system/status/{component}")
 async def update_status(
     component: str, 
@@ -786,7 +927,7 @@ async def update_status(
     log_action(current_user['user_id'], 'update_status', 'system', f"Updated {component} status to {status}")
     
     # Broadcast status update to all connected clients
-    await manager.broadcast_system_message({
+    event_bus.broadcast(SYSTEM_TOPIC, {
         "type": "status_update",
         "component": component,
         "status": status,
@@ -827,37 +968,28 @@ async def get_users(current_user: dict = Depends(get_current_user)):
 @app.get("/logs")
 async def get_logs(
     limit: int = 50,
+    cursor: Optional[str] = None,
+    module: Optional[str] = None,
+    action: Optional[str] = None,
+    user_id: Optional[int] = None,
+    username: Optional[str] = None,
+    since: Optional[datetime.datetime] = None,
+    until: Optional[datetime.datetime] = None,
     current_user: dict = Depends(get_current_user)
 ):
-    """Get system logs"""
+    """Get system logs, newest first; pass next_cursor back as cursor for the next page"""
     if current_user['role'] not in ['admin', 'operator']:
         raise HTTPException(status_code=403, detail="Insufficient permissions")
     
-    try:
+    def fetch_page():
         with get_db_connection() as conn:
-            cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-            cursor.execute("""
-                SELECT sl.*, u.username 
-                FROM system_logs sl
-                LEFT JOIN users u ON sl.user_id = u.id
-                ORDER BY sl.timestamp DESC
-                LIMIT %s
-            """, (limit,))
-            rows = cursor.fetchall()
-        
-        logs = []
-        for row in rows:
-            logs.append({
-                "id": row['id'],
-                "user_id": row['user_id'],
-                "action": row['action'],
-                "module": row['module'],
-                "details": row['details'],
-                "timestamp": str(row['timestamp']),
-                "username": row['username']
-            })
-        
-        return {"logs": logs}
+            return query_logs(conn, limit=limit, cursor=cursor, module=module, action=action,
+                              user_id=user_id, username=username, since=since, until=until)
+    
+    try:
+        return await asyncio.to_thread(fetch_page)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         print(f"Error getting logs: {e}")
         raise HTTPException(status_code=500, detail="Failed to retrieve logs")
@@ -865,26 +997,27 @@ async def get_logs(
 @app.websocket("/ws/notifications")
 async def websocket_endpoint(websocket: WebSocket, token: str):
     """Enhanced WebSocket with module subscriptions"""
+    conn = None
     try:
         user_data = verify_jwt_token(token)
         user_id = user_data['user_id']
         
-        await manager.connect(websocket, user_id, token)
+        conn = await hub.connect(websocket, user_id)
         
         # Send welcome message with current system status
-        active_users = session_manager.get_active_users()
-        await websocket.send_text(json.dumps({
+        hub.send(conn, {
             "type": "welcome",
             "message": f"Connected to lab system",
-            "active_users_count": len(active_users),
+            "active_users_count": session_manager.active_user_count(),
             "your_session": {
                 "user_id": user_id,
                 "username": user_data['username']
             },
             "available_modules": ["s11", "chip_inspection", "housing_inspection", "purchase_manufacturing_orders"]
-        }))
+        })
         
         # Listen for module subscriptions and keep connection alive
+        # Replies go through the connection's send queue so they never interleave with broadcasts
         while True:
             try:
                 # Wait for message with timeout
@@ -893,49 +1026,82 @@ async def websocket_endpoint(websocket: WebSocket, token: str):
                 
                 if data.get("type") == "subscribe_module":
                     module = data.get("module")
-                    manager.subscribe_to_module(user_id, module)
-                    await websocket.send_text(json.dumps({
+                    hub.subscribe(conn, module_topic(module))
+                    hub.send(conn, {
                         "type": "subscribed",
                         "module": module,
                         "message": f"Subscribed to {module} notifications"
-                    }))
+                    })
+                    event_bus.replay(conn, module_topic(module))
+                
+                elif data.get("type") == "subscribe":
+                    # Topic subscription: module:<name>, device:<serial>, mo:<number>, cure:<chip serial>
+                    topic = str(data.get("topic", ""))
+                    if not is_subscribable(topic, user_id):
+                        hub.send(conn, {"type": "error", "message": f"Unknown topic: {topic}"})
+                        continue
+                    hub.subscribe(conn, topic)
+                    hub.send(conn, {"type": "subscribed", "topic": topic})
+                    event_bus.replay(conn, topic)
+                
+                elif data.get("type") == "unsubscribe":
+                    topic = str(data.get("topic", ""))
+                    hub.unsubscribe(conn, topic)
+                    hub.send(conn, {"type": "unsubscribed", "topic": topic})
                 
                 elif data.get("type") == "unsubscribe_module":
                     module = data.get("module")
-                    manager.unsubscribe_from_module(user_id, module)
-                    await websocket.send_text(json.dumps({
+                    hub.unsubscribe(conn, module_topic(module))
+                    hub.send(conn, {
                         "type": "unsubscribed",
                         "module": module,
                         "message": f"Unsubscribed from {module} notifications"
-                    }))
+                    })
                 
                 elif data.get("type") == "get_system_status":
                     status = get_system_status()
-                    await websocket.send_text(json.dumps({
+                    hub.send(conn, {
                         "type": "system_status",
                         "data": status
-                    }))
+                    })
                     
             except asyncio.TimeoutError:
                 # Send keepalive ping
-                await websocket.send_text(json.dumps({
+                hub.send(conn, {
                     "type": "ping",
                     "timestamp": datetime.datetime.utcnow().isoformat(),
-                    "active_users": len(session_manager.get_active_users())
-                }))
+                    "active_users": session_manager.active_user_count()
+                })
                 
             except json.JSONDecodeError:
-                await websocket.send_text(json.dumps({
+                hub.send(conn, {
                     "type": "error",
                     "message": "Invalid JSON format"
-                }))
+                })
+            
+            if conn.closed:
+                # Evicted as a slow consumer
+                break
                 
     except WebSocketDisconnect:
-        manager.disconnect(websocket, user_id, token)
-        print(f"🔌 WebSocket disconnected for user {user_id}")
+        pass
     except Exception as e:
         print(f"WebSocket error: {e}")
-        manager.disconnect(websocket, user_id, token)
+    finally:
+        if conn is not None:
+            await hub.disconnect(conn)
+
+# Background task to merge batched session activity
+async def flush_activity_periodically():
+    """Background task to apply batched request timestamps to sessions"""
+    while True:
+        await asyncio.sleep(ACTIVITY_FLUSH_INTERVAL)
+        try:
+            session_manager.flush_activity()
+            if session_manager.store:
+                await asyncio.to_thread(session_manager.sync_shared)
+        except Exception as e:
+            print(f"Activity flush error: {e}")
 
 # Background task to clean up inactive sessions
 async def cleanup_sessions_periodically():
@@ -944,11 +1110,35 @@ async def cleanup_sessions_periodically():
         await asyncio.sleep(300)  # 5 minutes
         try:
             session_manager.cleanup_inactive_sessions()
-            active_count = len(session_manager.get_active_users())
+            active_count = session_manager.active_user_count()
             print(f"🧹 Session cleanup complete: {active_count} active users")
         except Exception as e:
             print(f"Session cleanup error: {e}")
 
+        try:
+            from modules.upload_storage import cleanup_stale_sessions
+            await asyncio.to_thread(cleanup_stale_sessions)
+        except Exception as e:
+            print(f"Upload session cleanup error: {e}")
+
+# Background task to keep system_logs partitions ahead and expire old months
+async def log_partitions_periodically():
+    """Background task to maintain monthly system_logs partitions once a day (on the cluster leader)"""
+    def maintain():
+        with get_db_connection() as conn:
+            return maintain_log_partitions(conn)
+    
+    last_run = None
+    while True:
+        # Checked hourly so a worker that takes over the leader lock does not wait a day
+        if leader.is_leader and (last_run is None or time.monotonic() - last_run >= 24 * 3600):
+            try:
+                await asyncio.to_thread(maintain)
+                last_run = time.monotonic()
+            except Exception as e:
+                print(f"Log partition maintenance error: {e}")
+        await asyncio.sleep(3600)
+
 # Background task to broadcast system stats
 async def broadcast_system_stats():
     """Background task to broadcast system statistics every minute"""
@@ -956,7 +1146,7 @@ async def broadcast_system_stats():
         await asyncio.sleep(60)  # 1 minute
         try:
             status = get_system_status()
-            await manager.broadcast_system_message({
+            hub.publish(SYSTEM_TOPIC, {
                 "type": "system_stats_update",
                 "data": status,
                 "timestamp": datetime.datetime.utcnow().isoformat()
@@ -967,13 +1157,7 @@ async def broadcast_system_stats():
 # Module utility functions for shared access
 async def notify_module_users(module: str, message_type: str, data: dict):
     """Utility function for modules to notify their users"""
-    message = {
-        "type": message_type,
-        "module": module,
-        "data": data,
-        "timestamp": datetime.datetime.utcnow().isoformat()
-    }
-    await manager.broadcast_to_module_users(message, module)
+    notify_module(module, message_type, data)
 
 def track_module_activity(token: str, module: str, operation: str):
     """Utility function for modules to track user activity"""
@@ -984,66 +1168,109 @@ def end_module_activity(token: str, module: str):
     session_manager.end_module_usage(token, module)
 
 # Startup and shutdown events
-@app.on_event("startup")
+async def timed_phase(name: str, func, *args):
+    """Run a blocking startup step in a worker thread and record how long it took"""
+    started = time.perf_counter()
+    try:
+        return await asyncio.to_thread(func, *args)
+    finally:
+        startup_timings[name] = round(time.perf_counter() - started, 3)
+
+def check_database_version():
+    """Return the PostgreSQL server version string"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT version();")
+        return cursor.fetchone()[0]
+
+def check_schema():
+    """Schema version state; applies pending migrations only when SCHEMA_AUTO_MIGRATE is set"""
+    with get_db_connection() as conn:
+        if SCHEMA_AUTO_MIGRATE and pending_migrations(conn):
+            apply_migrations(conn)
+        return check_schema_version(conn)
+
+def get_active_accounts():
+    """Return (username, role) of active accounts"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT username, role FROM users WHERE is_active = TRUE")
+        return cursor.fetchall()
+
 async def startup_event():
     """Initialize systems on startup"""
+    startup_started = time.perf_counter()
     print("🚀 Starting  MAQ Lab Manager API ")
     print("=" * 60)
     
     # Initialize database pool
-    if not init_db_pool():
+    if not await timed_phase('db_pool', init_db_pool):
         print("❌ Failed to initialize database pool")
         return
     
     # Test database connection
     try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT version();")
-            version = cursor.fetchone()
-            print(f"✅ PostgreSQL version: {version[0]}")
+        version = await timed_phase('db_check', check_database_version)
+        print(f"✅ PostgreSQL version: {version}")
     except Exception as e:
         print(f"❌ Database connection test failed: {e}")
         return
     
-    # Initialize database tables
+    # Schema is migrated at deploy time; startup only checks the version (optionally auto-applies)
+    try:
+        schema_state.update(await timed_phase('schema_check', check_schema))
+        if schema_state['up_to_date']:
+            print(f"✅ Database schema at version {schema_state['current']}")
+        else:
+            print(f"⚠️ Database schema at version {schema_state['current']}, expected {schema_state['expected']} "
+                  f"(pending: {schema_state['pending']}) - run 'python -m modules.migrations upgrade'")
+    except Exception as e:
+        print(f"❌ Schema version check failed: {e}")
+        return
+    
     try:
-        init_database()
-        print("✅ Database tables initialized")
+        await timed_phase('seed_defaults', init_database)
+        print("✅ Database defaults initialized")
     except Exception as e:
         print(f"❌ Database initialization failed: {e}")
         return
     
     # Test user accounts
     try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT username, role FROM users WHERE is_active = TRUE")
-            users = cursor.fetchall()
-        
+        users = await timed_phase('user_check', get_active_accounts)
         print(f"✅ Found {len(users)} active users:")
         for username, role in users:
             print(f"  - {username} ({role})")
     except Exception as e:
         print(f"❌ User check failed: {e}")
     
+    # Cluster-wide jobs (cure timers, traveler/yield/analytics loads, log partitions) run on one elected worker
+    if CLUSTER_MODE:
+        leader.start()
+    
     # Start background tasks
     print("🔄 Starting background tasks...")
     asyncio.create_task(cleanup_sessions_periodically())
+    asyncio.create_task(flush_activity_periodically())
+    asyncio.create_task(log_partitions_periodically())
     asyncio.create_task(broadcast_system_stats())
-    
-    # Module status check
-    loaded_modules = []
-    if s11_router:
-        loaded_modules.append("S11 Testing")
-    if chip_inspection_router:
-        loaded_modules.append("Chip Inspection Module")
-    if housing_inspection_router:
-        loaded_modules.append("Housing Inspection Testing")
-    if mo_router:
-        loaded_modules.append("Purchase Order & Manufacturing Order Management")
-    
-    print(f"📋 Loaded modules: {', '.join(loaded_modules) if loaded_modules else 'None'}")
+    await event_bus.start()
+    await fact_loader.start()
+    
+    # Module lifecycle hooks and route table check
+    startup_timings['modules'] = await module_registry.startup()
+    report_route_conflicts(app, strict=STRICT_ROUTES)
+    print(f"📋 Loaded modules: {', '.join(module_registry.manifests) or 'None'}")
+    
+    # Shared state for running several workers
+    if CLUSTER_MODE:
+        event_relay.start()
+        instrument_router.start(module_registry.instrument_paths(), module_registry.instrument_resources())
+        print(f"🖧 Cluster mode: worker {WORKER_ID} (shared sessions, event relay, instrument routing, leader jobs)")
+        if instrument_router.paths and not WORKER_URL:
+            print("⚠️ WORKER_URL is not set: instruments this worker owns cannot be reached through the other workers")
+    elif API_WORKERS > 1:
+        print(f"⚠️ {API_WORKERS} workers without CLUSTER_MODE=true: sessions, websocket events and instruments are per worker")
     
     # Print configuration
     print("\n🔧 System Configuration:")
@@ -1056,38 +1283,43 @@ async def startup_event():
     print("  📊 System:      http://localhost:8000/system/status")
     print("  👥 Users:       http://localhost:8000/users")
     print("  📝 Logs:        http://localhost:8000/logs")
-    if loaded_modules:
+    if module_registry.manifests:
         print("  🔬 Modules:")
-        if s11_router:
-            print("    - S11:       http://localhost:8000/modules/s11/")
-        if chip_inspection_router:
-            print("    - Chip Inspection: http://localhost:8000/modules/chip-inspection/")
-        if housing_inspection_router:
-            print("    - Housing Inspection: http://localhost:8000/modules/housing_inspection/")
-        if mo_router:
-            print("    - PO & MO:   http://localhost:8000/admin/")
+        for name, manifest in module_registry.manifests.items():
+            print(f"    - {name}: http://localhost:8000{manifest.prefix}/")
+    
+    startup_timings['total'] = round(time.perf_counter() - startup_started, 3)
+    print("\n⏱️ Startup timings: " + " | ".join(f"{phase} {seconds}s" for phase, seconds in startup_timings.items()))
     
     print("\n✅ System startup complete!")
     print("🎉 Ready for multi-user concurrent access!")
 
-@app.on_event("shutdown")
 async def shutdown_event():
     """Clean shutdown"""
     print("\n🛑 Shutting down MAQ Lab Manager API...")
     
-    # Close database connections
+    # Send coalesced events, then disconnect all WebSocket connections
+    await event_bus.stop()
+    await hub.close_all()
+
+    # Release instrument ownership to another worker and send relayed events still queued
+    await asyncio.to_thread(instrument_router.stop)
+    await asyncio.to_thread(event_relay.stop)
+    await asyncio.to_thread(leader.stop)
+
+    # Module shutdown hooks (instrument disconnects, pending writes, worker pools)
+    await module_registry.shutdown()
+
+    # Stop the analytics loader and the LISTEN connection modules subscribed to, then write queued audit records
+    await fact_loader.stop()
+    await asyncio.to_thread(pg_listener.stop)
+    await asyncio.to_thread(audit_logger.stop)
+
+    # Close database connections (after the hooks above have written their pending data)
     if db_pool:
         db_pool.closeall()
         print("💾 Database connection pool closed")
-    
-    # Disconnect all WebSocket connections
-    for user_id, websocket in manager.user_connections.items():
-        try:
-            await websocket.close()
-        except:
-            pass
-    print("🔌 All WebSocket connections closed")
-    
+
     # Clear session data
     session_manager.active_sessions.clear()
     session_manager.user_activities.clear()
@@ -1095,7 +1327,7 @@ async def shutdown_event():
     print("🧹 Session data cleared")
     
     print("✅ Shutdown complete")
-app.include_router(manufacturing_router)
+
 # Health check endpoint
 @app.get("/health")
 async def health_check():
@@ -1111,13 +1343,26 @@ async def health_check():
             "status": "healthy",
             "timestamp": datetime.datetime.utcnow().isoformat(),
             "database": "connected",
-            "active_users": len(session_manager.get_active_users()),
-            "modules": {
-                "s11": "loaded" if s11_router else "not_loaded",
-                "chip_inspection": "loaded" if chip_inspection_router else "not_loaded",
-                "housing_inspection": "loaded" if housing_inspection_router else "not_loaded",
-                "purchase_manufacturing_orders": "loaded" if mo_router else "not_loaded"
-            }
+            "active_users": session_manager.active_user_count(),
+            "modules": module_registry.health(),
+            "auth_cache": token_cache.stats(),
+            "audit_log": audit_logger.stats(),
+            "websockets": hub.stats(),
+            "events": event_bus.stats(),
+            "notifications": pg_listener.stats(),
+            "cluster": {
+                "enabled": CLUSTER_MODE,
+                "worker_id": WORKER_ID,
+                "sessions": session_manager.store.stats() if session_manager.store else None,
+                "event_relay": event_relay.stats(),
+                "leader": leader.stats(),
+                "instruments": instrument_router.stats()
+            },
+            "analytics_etl": fact_loader.stats(),
+            "stats_cache": stats_memo.stats(),
+            "schema": schema_state,
+            "startup_timings": startup_timings,
+            "lazy_stacks_loaded": loaded_stacks
         }
     except Exception as e:
         return {
@@ -1281,7 +1526,7 @@ async def create_user(
             )
             
             # Notify all admins about new user creation
-            await manager.broadcast_system_message({
+            event_bus.broadcast(SYSTEM_TOPIC, {
                 "type": "user_created",
                 "message": f"New user '{request.username}' created by {current_user['username']}",
                 "data": {
@@ -1385,7 +1630,7 @@ async def update_user(
             )
             
             # Notify about user update
-            await manager.broadcast_system_message({
+            event_bus.broadcast(SYSTEM_TOPIC, {
                 "type": "user_updated",
                 "message": f"User '{user['username']}' updated by {current_user['username']}",
                 "data": {
@@ -1451,7 +1696,7 @@ async def delete_user(
             )
             
             # Notify about user deletion
-            await manager.broadcast_system_message({
+            event_bus.broadcast(SYSTEM_TOPIC, {
                 "type": "user_deleted",
                 "message": f"User '{user['username']}' deactivated by {current_user['username']}",
                 "data": {
@@ -1559,12 +1804,20 @@ __all__ = [
 # app.mount("/analytics", analytics_app)
 
 if __name__ == "__main__":
+    import sys
     import uvicorn
+    instrument_modules = sorted(set(module_registry.instrument_paths().values()))
+    if API_WORKERS > 1 and instrument_modules:
+        # Workers sharing a socket are picked at random, so most instrument requests would land on a non-owner (421)
+        print(f"❌ API_WORKERS={API_WORKERS} with instrument modules loaded ({', '.join(instrument_modules)}): "
+              "run one worker per port instead (API_WORKERS=1, API_PORT, WORKER_URL, CLUSTER_MODE=true) "
+              "behind a proxy that follows 421, see modules/cluster.py")
+        sys.exit(1)
     print("🚀 Starting server...")
     uvicorn.run(
-        app, 
+        "main:app" if API_WORKERS > 1 else app,
         host="0.0.0.0", 
-        port=8000,
-        workers=1,  # Use 1 worker for WebSocket support
+        port=API_PORT,
+        workers=API_WORKERS,  # several workers need CLUSTER_MODE=true for shared sessions and websocket events
         log_level="info"
     )
\ No newline at end of file
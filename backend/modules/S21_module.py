@@ -7,6 +7,7 @@ from pydantic import BaseModel
 from typing import List, Optional
 import os
 import json
+import asyncio
 import datetime
 import jwt
 import psycopg2
@@ -14,13 +15,21 @@ import psycopg2.extras
 from contextlib import contextmanager
 from dotenv import load_dotenv
 import numpy as np
-import pandas as pd
-import matplotlib.pyplot as plt
 import time
 import csv
 from fpdf import FPDF
 from pathlib import Path
 import uuid
+from .artifact_manager import register_artifact, touch_artifact
+from .lazy_imports import lazy_module
+from .module_registry import ModuleManifest
+from .audit_log import audit
+from .event_bus import notify_test
+from .spc import record_result as record_spc_result
+
+# Plotting and data stacks are imported on first use
+pd = lazy_module('pandas')
+plt = lazy_module('matplotlib.pyplot')
 
 # Load environment variables
 load_dotenv()
@@ -53,8 +62,8 @@ DATABASE_CONFIG = {
     'password': os.getenv('DB_PASSWORD', 'maq001')
 }
 
-# VNA configuration
-VNA_ADDRESS = 'TCPIP0::127.0.0.1::5025::SOCKET'
+# VNA configuration (the same analyzer as the S11 station)
+VNA_ADDRESS = os.getenv('VNA_ADDRESS', 'TCPIP0::127.0.0.1::5025::SOCKET')
 
 # Database connection
 @contextmanager
@@ -89,17 +98,8 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
 
 # Utility functions
 def log_action(user_id: int, action: str, module: str, details: str):
-    """Log user action"""
-    try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                INSERT INTO system_logs (user_id, action, module, details)
-                VALUES (%s, %s, %s, %s)
-            """, (user_id, action, module, details))
-            conn.commit()
-    except Exception as e:
-        print(f"Error logging action: {e}")
+    """Log user action (queued; written to system_logs in batches)"""
+    audit(user_id, action, module, details)
 
 # Pydantic models
 class SParamTestRequest(BaseModel):
@@ -222,6 +222,7 @@ class SParamVNAController:
                 writer.writerow(['Frequency (GHz)', 'Magnitude (dB)'])
                 for freq, mag in zip(freqs21_ghz, mags21):
                     writer.writerow([freq, mag])
+            register_artifact(filename, 's21', serial_number)
             
             print("✅ S21 measurement completed")
             return freqs21, mags21
@@ -344,6 +345,7 @@ def create_sparam_plot(freq, normalized_mag, frequency_3db, device_type, serial_
         plot_path = GRAPHS_DIR / f'Sparam_plot_{device_type}_{serial_number}_{current_date}.png'
         plt.savefig(plot_path, dpi=300, bbox_inches='tight')
         plt.close()
+        register_artifact(plot_path, 's21', serial_number)
         
         return str(plot_path)
     except Exception as e:
@@ -451,6 +453,7 @@ def create_ripple_plot(freq, ripple_data, start_freq, end_freq, fit_py, fit_ny,
         plot_path = GRAPHS_DIR / f'Ripple_plot_{device_type}_{serial_number}_{current_date}.png'
         plt.savefig(plot_path, dpi=300, bbox_inches='tight')
         plt.close()
+        register_artifact(plot_path, 's21', serial_number)
         
         return str(plot_path)
     except Exception as e:
@@ -487,6 +490,9 @@ def save_test_result(test_data: dict):
             test_id = cursor.fetchone()[0]
             conn.commit()
             print(f"✅ Test result saved with ID: {test_id}")
+            # Update the SPC charts for this device type (never fails the save)
+            record_spc_result(conn, 's21', test_id, test_data['device_type'], test_data['serial_number'],
+                              {'frequency_3db': test_data['frequency_3db']})
             return test_id
     except Exception as e:
         print(f"❌ Error saving test result: {e}")
@@ -544,6 +550,12 @@ async def run_sparam_test(
     if current_user['role'] not in ['admin', 'operator']:
         raise HTTPException(status_code=403, detail="Insufficient permissions")
     
+    notify_test('s21', 'test_started', test_config.serial_number, {
+        "user": current_user['username'],
+        "device_type": test_config.device_type,
+        "test": "sparam"
+    })
+    
     try:
         # Ensure VNA is connected
         if not vna_controller.connected:
@@ -566,6 +578,11 @@ async def run_sparam_test(
         
         log_action(current_user['user_id'], 'run_sparam_test', 's21',
                   f"S-Parameter test: {test_config.device_type} {test_config.serial_number}")
+        notify_test('s21', 'test_completed', test_config.serial_number, {
+            "device_type": test_config.device_type,
+            "test": "sparam",
+            "frequency_3db": frequency_3db
+        })
         
         return {
             "s11_data": {"frequencies": freqs11, "magnitudes": mags11},
@@ -578,6 +595,7 @@ async def run_sparam_test(
         
     except Exception as e:
         print(f"❌ S-Parameter test failed: {e}")
+        notify_test('s21', 'test_error', test_config.serial_number, {"test": "sparam", "error": str(e)})
         raise HTTPException(status_code=500, detail=str(e))
 
 @s21_router.post("/run-ripple-test")
@@ -589,6 +607,12 @@ async def run_ripple_test_endpoint(
     if current_user['role'] not in ['admin', 'operator']:
         raise HTTPException(status_code=403, detail="Insufficient permissions")
     
+    notify_test('s21', 'test_started', ripple_config.serial_number, {
+        "user": current_user['username'],
+        "device_type": ripple_config.device_type,
+        "test": "ripple"
+    })
+    
     try:
         # Run ripple test
         ripple_result, ripple_plot_path = run_ripple_test(
@@ -623,10 +647,17 @@ async def run_ripple_test_endpoint(
             'ripple_plot_path': ripple_plot_path
         }
         
-        test_id = save_test_result(test_data)
+        # Off the event loop: the SPC update can wait on chart row locks
+        test_id = await asyncio.to_thread(save_test_result, test_data)
         
         log_action(current_user['user_id'], 'run_ripple_test', 's21',
                   f"Ripple test: {ripple_config.device_type} {ripple_config.serial_number} - {ripple_result}")
+        notify_test('s21', 'test_completed', ripple_config.serial_number, {
+            "test_id": test_id,
+            "device_type": ripple_config.device_type,
+            "test": "ripple",
+            "result": overall_result
+        })
         
         return {
             "test_id": test_id,
@@ -637,6 +668,7 @@ async def run_ripple_test_endpoint(
         
     except Exception as e:
         print(f"❌ Ripple test failed: {e}")
+        notify_test('s21', 'test_error', ripple_config.serial_number, {"test": "ripple", "error": str(e)})
         raise HTTPException(status_code=500, detail=str(e))
 
 @s21_router.get("/history")
@@ -695,6 +727,7 @@ async def get_graph_image(filename: str):
     try:
         file_path = GRAPHS_DIR / filename
         if file_path.exists():
+            touch_artifact(file_path)
             return FileResponse(file_path)
         else:
             raise HTTPException(status_code=404, detail="Graph image not found")
@@ -769,6 +802,7 @@ async def generate_pdf_report(
         pdf_filename = f"SParam_Test_Report_{report_data.device_type}_{report_data.serial_number}_{timestamp}.pdf"
         pdf_path = REPORTS_DIR / pdf_filename
         pdf.output(str(pdf_path))
+        register_artifact(pdf_path, 's21', report_data.serial_number)
         
         log_action(current_user['user_id'], 'generate_report', 's21',
                   f"Generated report for {report_data.device_type} {report_data.serial_number}")
@@ -783,36 +817,17 @@ async def generate_pdf_report(
         print(f"❌ Report generation failed: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to generate report: {str(e)}")
 
-# Initialize database tables
-def init_s21_tables():
-    """Initialize S21 testing tables"""
-    try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            
-            # Create indexes
-            cursor.execute("""
-                CREATE INDEX IF NOT EXISTS idx_s21_results_device_type 
-                ON s21_test_results(device_type)
-            """)
-            
-            cursor.execute("""
-                CREATE INDEX IF NOT EXISTS idx_s21_results_test_date 
-                ON s21_test_results(test_date)
-            """)
-            
-            conn.commit()
-            print("✅ S21 testing tables initialized")
-            
-    except Exception as e:
-        print(f"❌ S21 table initialization error: {e}")
-
-
-init_s21_tables()
-
-
+MODULE_MANIFEST = ModuleManifest(
+    name='s21',
+    router=s21_router,
+    prefix='/modules/s21',
+    tags=['S-Parameter Testing'],
+    health_probe=lambda: {"vna_connected": vna_controller.connected},
+    instrument_routes=['/status', '/run-sparam-test', '/run-ripple-test'],
+    instruments=[VNA_ADDRESS]
+)
 
 # Export router
-__all__ = ['s21_router']
+__all__ = ['MODULE_MANIFEST', 's21_router']
 
 print("✅ S21 testing module loaded successfully")
\ No newline at end of file
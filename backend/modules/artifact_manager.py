@@ -0,0 +1,471 @@
+# modules/artifact_manager.py - Test artifact index, retention and tiered storage
+
+from fastapi import APIRouter, HTTPException, Depends
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from pathlib import Path
+import os
+import io
+import time
+import asyncio
+import datetime
+import threading
+import numpy as np
+import jwt
+import psycopg2
+import psycopg2.extras
+from contextlib import contextmanager
+from dotenv import load_dotenv
+from .module_registry import ModuleManifest
+
+# Load environment variables
+load_dotenv()
+
+# Router for storage administration
+artifact_router = APIRouter()
+
+# Security
+security = HTTPBearer()
+SECRET_KEY = os.getenv('SECRET_KEY', 'default-dev-key-change-in-production')
+
+# Database configuration
+DATABASE_CONFIG = {
+    'host': os.getenv('DB_HOST', 'localhost'),
+    'port': int(os.getenv('DB_PORT', '5432')),
+    'database': os.getenv('DB_NAME', 'MAQ_Lab_Manager'),
+    'user': os.getenv('DB_USER', 'karthi'),
+    'password': os.getenv('DB_PASSWORD', 'maq001')
+}
+
+# Directories holding test artifacts: root -> owner module
+ARTIFACT_ROOTS = {
+    'test_results/s21': 's21',
+    'test_results/twotone': 'twotone',
+    'test_results/modulator': 'dcvpi',
+    'results': 's11',
+    'reports': None,  # shared by the inspection modules; owner from the file name
+    'uploads': 'uploads',
+}
+
+# Owner of files in shared roots, by file name prefix
+SHARED_ROOT_OWNERS = {
+    'reports': {
+        'housing_inspection_report_': 'housing_inspection',
+        'chip_preparation_report_': 'chip_inspection',
+    },
+}
+
+# Retention per artifact type, in days since last access (None = keep forever)
+RETENTION_POLICIES = {
+    'raw_data': {'compress_after_days': int(os.getenv('ARTIFACT_RAW_COMPRESS_DAYS', '7')),
+                 'delete_after_days': None},
+    'raw_archive': {'compress_after_days': None,
+                    'delete_after_days': int(os.getenv('ARTIFACT_RAW_ARCHIVE_DAYS', '0')) or None},
+    'plot': {'compress_after_days': None,
+             'delete_after_days': int(os.getenv('ARTIFACT_PLOT_DAYS', '0')) or None},
+    # Quality records built from the submitted test data; they cannot be regenerated server-side
+    'report': {'compress_after_days': None, 'delete_after_days': None},
+    'upload': {'compress_after_days': None, 'delete_after_days': None},
+    'other': {'compress_after_days': None, 'delete_after_days': None},
+}
+
+# zstd is optional; NPZ deflate is always available
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ARCHIVE_SUFFIX = '.npz.zst' if zstandard else '.npz'
+
+# Pending last-access updates (path -> timestamp), flushed in batches
+_access_times = {}
+_access_lock = threading.Lock()
+
+# Index writes run off the request path, one at a time
+_index_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='artifact-index')
+
+# Database connection
+@contextmanager
+def get_db_connection():
+    """Get PostgreSQL database connection"""
+    conn = None
+    try:
+        conn = psycopg2.connect(**DATABASE_CONFIG)
+        yield conn
+    except psycopg2.Error as e:
+        if conn:
+            conn.rollback()
+        raise HTTPException(status_code=500, detail=f"Database connection failed: {str(e)}")
+    finally:
+        if conn:
+            conn.close()
+
+# Authentication functions
+def verify_jwt_token(token: str) -> dict:
+    """Verify JWT token and return user data"""
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
+        return payload
+    except jwt.ExpiredSignatureError:
+        raise HTTPException(status_code=401, detail="Token expired. Please login again.")
+    except jwt.InvalidTokenError:
+        raise HTTPException(status_code=401, detail="Invalid token. Please login again.")
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
+    """Get current user from JWT token"""
+    return verify_jwt_token(credentials.credentials)
+
+
+# Utility functions
+def normalize_path(path) -> str:
+    """Canonical path key (relative to the working directory, forward slashes)"""
+    return Path(os.path.relpath(os.path.abspath(str(path)))).as_posix()
+
+def classify_artifact(path: str) -> str:
+    """Artifact type from file name"""
+    name = path.lower()
+    if name.startswith('uploads/'):
+        return 'upload'
+    if name.endswith('.npz') or name.endswith('.npz.zst'):
+        return 'raw_archive'
+    if name.endswith('.csv'):
+        return 'raw_data'
+    if name.endswith('.png') or name.endswith('.jpg') or name.endswith('.webp'):
+        return 'plot'
+    if name.endswith('.pdf'):
+        return 'report'
+    return 'other'
+
+def owner_module_for(path: str) -> Optional[str]:
+    """Owner module from the artifact root"""
+    for root, module in ARTIFACT_ROOTS.items():
+        if path == root or path.startswith(root + '/'):
+            if module is None:
+                name = os.path.basename(path)
+                return next((owner for prefix, owner in SHARED_ROOT_OWNERS.get(root, {}).items()
+                             if name.startswith(prefix)), None)
+            return module
+    return None
+
+def register_artifact(path, owner_module: Optional[str] = None, owner_ref: Optional[str] = None,
+                      artifact_type: Optional[str] = None):
+    """Queue indexing (or re-indexing) of an artifact right after it is written; never blocks on the database"""
+    key = normalize_path(path)
+    try:
+        size = os.path.getsize(key)
+    except OSError:
+        return
+
+    try:
+        _index_executor.submit(_write_artifact_row, key, artifact_type or classify_artifact(key),
+                               owner_module or owner_module_for(key), owner_ref, size)
+    except RuntimeError:
+        print(f"⚠️ Artifact index stopped; {key} will be indexed by the next sweep")
+
+def _write_artifact_row(key: str, artifact_type: str, owner_module: Optional[str], owner_ref: Optional[str],
+                        size: int):
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                INSERT INTO artifacts (path, artifact_type, owner_module, owner_ref, size_bytes)
+                VALUES (%s, %s, %s, %s, %s)
+                ON CONFLICT (path) DO UPDATE SET
+                    size_bytes = EXCLUDED.size_bytes,
+                    owner_ref = COALESCE(EXCLUDED.owner_ref, artifacts.owner_ref),
+                    storage_tier = 'hot',
+                    last_accessed = CURRENT_TIMESTAMP,
+                    deleted_at = NULL
+            """, (key, artifact_type, owner_module, owner_ref, size))
+            conn.commit()
+    except Exception as e:
+        print(f"⚠️ Could not index artifact {key}: {e}")
+
+def touch_artifact(path):
+    """Record an access; written to the index on the next flush"""
+    with _access_lock:
+        _access_times[normalize_path(path)] = datetime.datetime.now()
+
+def flush_access_times(cursor) -> int:
+    """Write pending last-access timestamps in one batch"""
+    with _access_lock:
+        pending = list(_access_times.items())
+        _access_times.clear()
+
+    if pending:
+        psycopg2.extras.execute_values(cursor, """
+            UPDATE artifacts AS a SET last_accessed = v.accessed
+            FROM (VALUES %s) AS v(path, accessed)
+            WHERE a.path = v.path AND v.accessed > a.last_accessed
+        """, pending)
+    return len(pending)
+
+def scan_artifact_roots(cursor) -> int:
+    """Index files that were written without registration (and legacy files)"""
+    rows = []
+    for root in ARTIFACT_ROOTS:
+        if not os.path.isdir(root):
+            continue
+        for dirpath, dirnames, filenames in os.walk(root):
+            # Skip in-flight upload data
+            dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+            for filename in filenames:
+                if filename.endswith('.tmp') or filename.endswith('.part'):
+                    continue
+                full_path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(full_path)
+                except OSError:
+                    continue
+                key = normalize_path(full_path)
+                modified = datetime.datetime.fromtimestamp(stat.st_mtime)
+                rows.append((key, classify_artifact(key), owner_module_for(key), stat.st_size, modified, modified))
+
+    if rows:
+        psycopg2.extras.execute_values(cursor, """
+            INSERT INTO artifacts (path, artifact_type, owner_module, size_bytes, created_at, last_accessed)
+            VALUES %s
+            ON CONFLICT (path) DO UPDATE SET size_bytes = EXCLUDED.size_bytes
+        """, rows, page_size=1000)
+    return len(rows)
+
+def archive_path_for(path: str) -> str:
+    """Archive location for a raw data file"""
+    return str(Path(path).with_suffix('')) + ARCHIVE_SUFFIX
+
+def compress_raw_file(path: str) -> Optional[str]:
+    """Pack a numeric CSV into a compressed NPZ (zstd-wrapped when available)"""
+    import pandas as pd
+
+    df = pd.read_csv(path)
+    numeric = df.select_dtypes(include=[np.number])
+    if numeric.shape[1] != df.shape[1]:
+        return None
+
+    arrays = {f"col{i}": numeric.iloc[:, i].to_numpy() for i in range(numeric.shape[1])}
+    arrays['columns'] = np.array(list(df.columns))
+
+    target = archive_path_for(path)
+    tmp_path = target + '.tmp'
+    if zstandard:
+        buffer = io.BytesIO()
+        np.savez(buffer, **arrays)
+        with open(tmp_path, 'wb') as f:
+            f.write(zstandard.ZstdCompressor(level=10).compress(buffer.getvalue()))
+    else:
+        with open(tmp_path, 'wb') as f:
+            np.savez_compressed(f, **arrays)
+    os.replace(tmp_path, target)
+    os.remove(path)
+    return target
+
+def load_raw_archive(path: str):
+    """Load a raw data archive back into a DataFrame"""
+    import pandas as pd
+
+    if path.endswith('.zst'):
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read .npz.zst archives")
+        with open(path, 'rb') as f:
+            data = zstandard.ZstdDecompressor().decompress(f.read())
+        archive = np.load(io.BytesIO(data))
+    else:
+        archive = np.load(path)
+
+    columns = list(archive['columns'])
+    return pd.DataFrame({name: archive[f"col{i}"] for i, name in enumerate(columns)})
+
+def apply_retention_policies(dry_run: bool = False) -> dict:
+    """Index, compress cold raw data and expire artifacts per policy"""
+    started = time.time()
+    summary = {'indexed': 0, 'compressed': 0, 'deleted': 0, 'bytes_freed': 0, 'errors': 0, 'dry_run': dry_run}
+
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        flush_access_times(cursor)
+        summary['indexed'] = scan_artifact_roots(cursor)
+        conn.commit()
+
+        for artifact_type, policy in RETENTION_POLICIES.items():
+            compress_days = policy.get('compress_after_days')
+            if compress_days:
+                cursor.execute("""
+                    SELECT id, path, size_bytes FROM artifacts
+                    WHERE artifact_type = %s AND storage_tier = 'hot'
+                      AND last_accessed < CURRENT_TIMESTAMP - make_interval(days => %s)
+                    ORDER BY last_accessed
+                """, (artifact_type, compress_days))
+                for artifact_id, path, size_bytes in cursor.fetchall():
+                    if dry_run:
+                        summary['compressed'] += 1
+                        continue
+                    try:
+                        archived = compress_raw_file(path) if os.path.exists(path) else None
+                        if not archived:
+                            continue
+                        archived_key = normalize_path(archived)
+                        archived_size = os.path.getsize(archived)
+                        cursor.execute("""
+                            UPDATE artifacts SET path = %s, storage_tier = 'cold', size_bytes = %s,
+                                   compressed_at = CURRENT_TIMESTAMP
+                            WHERE id = %s
+                        """, (archived_key, archived_size, artifact_id))
+                        conn.commit()
+                        summary['compressed'] += 1
+                        summary['bytes_freed'] += max(size_bytes - archived_size, 0)
+                    except Exception as e:
+                        conn.rollback()
+                        summary['errors'] += 1
+                        print(f"⚠️ Could not compress {path}: {e}")
+
+            delete_days = policy.get('delete_after_days')
+            if delete_days:
+                cursor.execute("""
+                    SELECT id, path, size_bytes FROM artifacts
+                    WHERE artifact_type = %s AND storage_tier <> 'deleted'
+                      AND last_accessed < CURRENT_TIMESTAMP - make_interval(days => %s)
+                """, (artifact_type, delete_days))
+                expired = cursor.fetchall()
+                if dry_run:
+                    summary['deleted'] += len(expired)
+                    continue
+                deleted_ids = []
+                for artifact_id, path, size_bytes in expired:
+                    try:
+                        if os.path.exists(path):
+                            os.remove(path)
+                        deleted_ids.append(artifact_id)
+                        summary['bytes_freed'] += size_bytes or 0
+                    except OSError as e:
+                        summary['errors'] += 1
+                        print(f"⚠️ Could not delete {path}: {e}")
+                if deleted_ids:
+                    cursor.execute("""
+                        UPDATE artifacts SET storage_tier = 'deleted', size_bytes = 0,
+                               deleted_at = CURRENT_TIMESTAMP
+                        WHERE id = ANY(%s)
+                    """, (deleted_ids,))
+                    conn.commit()
+                summary['deleted'] += len(deleted_ids)
+
+    summary['duration_seconds'] = round(time.time() - started, 2)
+    print(f"🧹 Artifact retention: {summary}")
+    return summary
+
+def get_storage_usage() -> dict:
+    """Storage usage by module, type and tier"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        flush_access_times(cursor)
+        conn.commit()
+        cursor.execute("""
+            SELECT owner_module, artifact_type, storage_tier,
+                   COUNT(*) AS files, COALESCE(SUM(size_bytes), 0) AS bytes,
+                   MIN(created_at) AS oldest, MAX(created_at) AS newest
+            FROM artifacts
+            WHERE storage_tier <> 'deleted'
+            GROUP BY owner_module, artifact_type, storage_tier
+            ORDER BY bytes DESC
+        """)
+        rows = cursor.fetchall()
+
+    breakdown = []
+    total_bytes = 0
+    total_files = 0
+    for row in rows:
+        total_bytes += row['bytes']
+        total_files += row['files']
+        breakdown.append({
+            "owner_module": row['owner_module'],
+            "artifact_type": row['artifact_type'],
+            "storage_tier": row['storage_tier'],
+            "files": row['files'],
+            "bytes": int(row['bytes']),
+            "oldest": row['oldest'].isoformat() if row['oldest'] else None,
+            "newest": row['newest'].isoformat() if row['newest'] else None
+        })
+
+    return {"total_files": total_files, "total_bytes": int(total_bytes), "breakdown": breakdown}
+
+# Lifecycle
+ARTIFACT_SWEEP_INTERVAL = int(os.getenv('ARTIFACT_SWEEP_INTERVAL', str(24 * 3600)))
+_sweep_task = None
+
+async def retention_sweep_periodically():
+    """Background task to index, compress and expire test artifacts once a day"""
+    while True:
+        await asyncio.sleep(ARTIFACT_SWEEP_INTERVAL)
+        try:
+            await asyncio.to_thread(apply_retention_policies)
+        except Exception as e:
+            print(f"Artifact retention error: {e}")
+
+def start_retention_sweeps():
+    """Start the periodic retention sweep"""
+    global _sweep_task
+    _sweep_task = asyncio.create_task(retention_sweep_periodically())
+
+async def stop_retention_sweeps():
+    """Stop the sweep, finish queued index writes and persist pending access times"""
+    if _sweep_task:
+        _sweep_task.cancel()
+    await asyncio.to_thread(_index_executor.shutdown, True)
+
+    def save_access_times():
+        with get_db_connection() as conn:
+            saved = flush_access_times(conn.cursor())
+            conn.commit()
+            return saved
+
+    try:
+        saved = await asyncio.to_thread(save_access_times)
+        print(f"💾 Saved {saved} pending artifact access times")
+    except Exception as e:
+        print(f"⚠️ Could not save artifact access times: {e}")
+
+# API Endpoints
+@artifact_router.get("/usage")
+async def storage_usage(current_user: dict = Depends(get_current_user)):
+    """Get artifact storage usage metrics"""
+    try:
+        return get_storage_usage()
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get storage usage: {str(e)}")
+
+@artifact_router.get("/policies")
+async def retention_policies(current_user: dict = Depends(get_current_user)):
+    """Get configured retention policies"""
+    return {"policies": RETENTION_POLICIES, "archive_format": ARCHIVE_SUFFIX, "roots": ARTIFACT_ROOTS}
+
+@artifact_router.post("/sweep")
+async def run_retention_sweep(dry_run: bool = True, current_user: dict = Depends(get_current_user)):
+    """Run the retention sweep now (admin only)"""
+    if current_user['role'] != 'admin':
+        raise HTTPException(status_code=403, detail="Admin access required")
+    try:
+        return await asyncio.to_thread(apply_retention_policies, dry_run)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Retention sweep failed: {str(e)}")
+
+MODULE_MANIFEST = ModuleManifest(
+    name='artifacts',
+    router=artifact_router,
+    prefix='/admin/storage',
+    tags=['Artifact Storage'],
+    on_startup=start_retention_sweeps,
+    on_shutdown=stop_retention_sweeps,
+    health_probe=lambda: {"pending_access_times": len(_access_times)}
+)
+
+# Export router and helpers
+__all__ = [
+    'MODULE_MANIFEST', 'artifact_router', 'register_artifact', 'touch_artifact', 'apply_retention_policies',
+    'get_storage_usage', 'load_raw_archive'
+]
+
+print("✅ Artifact manager module loaded successfully")
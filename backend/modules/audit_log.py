@@ -0,0 +1,242 @@
+# modules/audit_log.py - Batched, asynchronous writer for system_logs
+
+import os
+import time
+import datetime
+import threading
+from collections import deque
+from typing import Optional
+import psycopg2
+import psycopg2.extras
+from psycopg2.extras import Json
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Database configuration (same defaults as the API server)
+DATABASE_CONFIG = {
+    'host': os.getenv('DB_HOST', '192.168.99.121'),
+    'port': int(os.getenv('DB_PORT', '5432')),
+    'database': os.getenv('DB_NAME', 'postgres'),
+    'user': os.getenv('DB_USER', 'postgres'),
+    'password': os.getenv('DB_PASSWORD', 'karthi'),
+    'connect_timeout': int(os.getenv('DB_CONNECT_TIMEOUT', '5'))
+}
+
+AUDIT_QUEUE_MAX = int(os.getenv('AUDIT_QUEUE_MAX', '10000'))
+AUDIT_BATCH_SIZE = int(os.getenv('AUDIT_BATCH_SIZE', '500'))
+AUDIT_FLUSH_INTERVAL = float(os.getenv('AUDIT_FLUSH_INTERVAL', '0.5'))  # seconds
+# What to do when the queue is full: 'drop' the record, or 'sync' write it inline (back-pressure on the caller)
+AUDIT_OVERFLOW = os.getenv('AUDIT_OVERFLOW', 'drop')
+# Failed attempts on the same batch before it is split to isolate and drop records the database rejects
+AUDIT_MAX_ATTEMPTS = int(os.getenv('AUDIT_MAX_ATTEMPTS', '3'))
+
+# Errors that mean the database is unreachable (retry), as opposed to a record it refuses (isolate)
+CONNECTION_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError)
+
+class AuditLogger:
+    """Queues audit records in memory and writes them to system_logs in batches from a background thread"""
+
+    def __init__(self, max_queue: int = AUDIT_QUEUE_MAX, batch_size: int = AUDIT_BATCH_SIZE,
+                 flush_interval: float = AUDIT_FLUSH_INTERVAL, overflow: str = AUDIT_OVERFLOW):
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.queue = deque()
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()  # one flush at a time; guards self.conn
+        self.head_failures = 0  # failed attempts on the batch at the front of the queue
+        self.wakeup = threading.Event()
+        self.stopping = False
+        self.thread = None
+        self.conn = None
+        self.last_drop_warning = 0.0
+        self.metrics = {
+            'enqueued': 0,
+            'written': 0,
+            'dropped': 0,
+            'written_inline': 0,
+            'batches': 0,
+            'failed_batches': 0,
+            'rejected': 0,  # records the database refused, dropped after isolation
+            'last_batch_size': 0,
+            'last_flush_ms': 0.0,
+            'max_latency_ms': 0.0,  # enqueue -> commit
+        }
+
+    def log(self, user_id, action: str, module: str, details: str, context: Optional[dict] = None):
+        """Queue one record; never touches the database on the caller's thread unless overflow='sync'"""
+        record = (user_id, action, module, details, context, datetime.datetime.now(), time.perf_counter())
+        with self.lock:
+            accepted = len(self.queue) < self.max_queue
+            if accepted:
+                self.queue.append(record)
+                self.metrics['enqueued'] += 1
+                depth = len(self.queue)
+        if not accepted:
+            self._overflow(record)
+            return
+        if self.thread is None:
+            self.start()
+        if depth >= self.batch_size:
+            self.wakeup.set()
+
+    def _overflow(self, record):
+        self.wakeup.set()
+        if self.overflow == 'sync':
+            # Own short-lived connection: the writer thread's connection may be mid-transaction
+            try:
+                conn = psycopg2.connect(**DATABASE_CONFIG)
+                try:
+                    self._write([record], conn)
+                finally:
+                    conn.close()
+                with self.lock:
+                    self.metrics['written_inline'] += 1
+                return
+            except Exception as e:
+                print(f"⚠️ Audit log inline write failed: {e}")
+        with self.lock:
+            self.metrics['dropped'] += 1
+            dropped = self.metrics['dropped']
+            now = time.monotonic()
+            warn = now - self.last_drop_warning > 10
+            if warn:
+                self.last_drop_warning = now
+        if warn:
+            print(f"⚠️ Audit log queue full ({self.max_queue}), {dropped} record(s) dropped")
+
+    def start(self):
+        """Start the writer thread (idempotent)"""
+        with self.lock:
+            if self.thread is not None:
+                return
+            self.stopping = False
+            self.thread = threading.Thread(target=self._run, name="audit-log-writer", daemon=True)
+            self.thread.start()
+
+    def _connection(self):
+        if self.conn is None or self.conn.closed:
+            self.conn = psycopg2.connect(**DATABASE_CONFIG)
+        return self.conn
+
+    def _write(self, batch: list, conn):
+        try:
+            cursor = conn.cursor()
+            psycopg2.extras.execute_values(cursor, """
+                INSERT INTO system_logs (user_id, action, module, details, context, timestamp)
+                VALUES %s
+            """, [(user_id, action, module, details, Json(context) if context is not None else None, logged_at)
+                  for user_id, action, module, details, context, logged_at, _ in batch], page_size=len(batch))
+            conn.commit()
+        except Exception:
+            try:
+                conn.rollback()
+            except Exception:
+                conn.close()
+            raise
+
+    def _write_isolating(self, batch: list, settled: list) -> int:
+        """Write a batch the database keeps refusing in halves, dropping single records it rejects; returns written.
+        Records written or dropped are appended to ``settled``; connection errors propagate."""
+        try:
+            self._write(batch, self._connection())
+            settled.extend(batch)
+            return len(batch)
+        except CONNECTION_ERRORS:
+            raise
+        except Exception as e:
+            if len(batch) == 1:
+                with self.lock:
+                    self.metrics['rejected'] += 1
+                settled.extend(batch)
+                user_id, action, module = batch[0][:3]
+                print(f"❌ Audit record dropped (user {user_id}, {module}/{action}): {e}")
+                return 0
+        middle = len(batch) // 2
+        return self._write_isolating(batch[:middle], settled) + self._write_isolating(batch[middle:], settled)
+
+    def flush(self) -> int:
+        """Write everything queued so far; returns records written"""
+        with self.flush_lock:
+            return self._flush()
+
+    def _flush(self) -> int:
+        written = 0
+        while True:
+            with self.lock:
+                batch = [self.queue.popleft() for _ in range(min(self.batch_size, len(self.queue)))]
+            if not batch:
+                return written
+
+            started = time.perf_counter()
+            settled = []
+            try:
+                if self.head_failures >= AUDIT_MAX_ATTEMPTS:
+                    stored = self._write_isolating(batch, settled)
+                else:
+                    self._write(batch, self._connection())
+                    stored = len(batch)
+                self.head_failures = 0
+            except Exception as e:
+                written_ids = {id(record) for record in settled}
+                pending = [record for record in batch if id(record) not in written_ids]
+                with self.lock:
+                    self.metrics['failed_batches'] += 1
+                    # Put the unwritten records back in front (as far as the bound allows) and retry next cycle
+                    room = self.max_queue - len(self.queue)
+                    self.queue.extendleft(reversed(pending[:room]))
+                    self.metrics['dropped'] += max(0, len(pending) - room)
+                # Unreachable database: keep retrying; refused batch: split it after AUDIT_MAX_ATTEMPTS
+                if not isinstance(e, CONNECTION_ERRORS):
+                    self.head_failures += 1
+                print(f"❌ Audit log flush failed ({len(pending)} records): {e}")
+                return written
+
+            committed = time.perf_counter()
+            with self.lock:
+                self.metrics['batches'] += 1
+                self.metrics['written'] += stored
+                self.metrics['last_batch_size'] = len(batch)
+                self.metrics['last_flush_ms'] = round((committed - started) * 1000, 2)
+                self.metrics['max_latency_ms'] = max(self.metrics['max_latency_ms'],
+                                                     round((committed - batch[0][6]) * 1000, 2))
+            written += stored
+
+    def _run(self):
+        backoff = self.flush_interval
+        while not self.stopping:
+            self.wakeup.wait(backoff)
+            self.wakeup.clear()
+            failures = self.metrics['failed_batches']
+            self.flush()
+            # Back off while the database is unreachable
+            backoff = min(backoff * 2, 30.0) if self.metrics['failed_batches'] > failures else self.flush_interval
+
+    def stop(self, timeout: float = 5.0):
+        """Stop the writer and flush what is left"""
+        self.stopping = True
+        self.wakeup.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+        # flush_lock waits out a writer thread that outlived the join before the connection is closed
+        with self.flush_lock:
+            written = self._flush()
+            if self.conn is not None and not self.conn.closed:
+                self.conn.close()
+        print(f"📝 Audit log stopped ({written} record(s) flushed on shutdown, {len(self.queue)} left)")
+
+    def stats(self) -> dict:
+        return {**self.metrics, 'queue_depth': len(self.queue), 'queue_max': self.max_queue}
+
+# Shared by every module's log_action
+audit_logger = AuditLogger()
+
+def audit(user_id, action: str, module: str, details: str, context: Optional[dict] = None):
+    """Queue an audit record for system_logs; ``context`` is stored as JSONB"""
+    audit_logger.log(user_id, action, module, details, context)
+
+__all__ = ['AuditLogger', 'audit_logger', 'audit']
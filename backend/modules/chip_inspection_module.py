@@ -16,6 +16,12 @@ import psycopg2.extras
 from contextlib import contextmanager
 from dotenv import load_dotenv
 from fpdf import FPDF
+from .module_registry import ModuleManifest
+from .audit_log import audit
+from .event_bus import notify_module, publish_event, cure_topic
+from .cure_scheduler import CureScheduler
+from .grouped_stats import grouped_stats, stats_memo
+from .artifact_manager import register_artifact
 
 # Load environment variables
 load_dotenv()
@@ -69,17 +75,11 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
 
 # Utility functions
 def log_action(user_id: int, action: str, module: str, details: str):
-    """Log user action"""
-    try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                INSERT INTO system_logs (user_id, action, module, details)
-                VALUES (%s, %s, %s, %s)
-            """, (user_id, action, module, details))
-            conn.commit()
-    except Exception as e:
-        print(f"Error logging action: {e}")
+    """Log user action (queued; written to system_logs in batches)"""
+    audit(user_id, action, module, details)
+
+# Running epoxy cures are timed server-side and pushed over the event bus
+cure_scheduler = CureScheduler(get_db_connection)
 
 # Pydantic models
 class ChipPreparationCreate(BaseModel):
@@ -102,79 +102,6 @@ class EpoxyCureControl(BaseModel):
 class ChipPreparationStatus(BaseModel):
     chip_serial_number: str
 
-# Initialize database tables
-def init_chip_preparation_tables():
-    """Initialize chip preparation tables"""
-    try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            
-            # Chip preparation main table
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS chip_preparation (
-                    id SERIAL PRIMARY KEY,
-                    chip_serial_number VARCHAR(100) UNIQUE NOT NULL,
-                    wafer_id VARCHAR(100) NOT NULL,
-                    operator VARCHAR(100) NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    created_by INTEGER REFERENCES users(id)
-                )
-            """)
-            
-            # Section status table
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS chip_preparation_sections (
-                    id SERIAL PRIMARY KEY,
-                    chip_serial_number VARCHAR(100) NOT NULL REFERENCES chip_preparation(chip_serial_number),
-                    section_name VARCHAR(50) NOT NULL,
-                    completed BOOLEAN DEFAULT FALSE,
-                    completed_at TIMESTAMP,
-                    completed_by INTEGER REFERENCES users(id),
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            # Epoxy cure timer table
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS chip_epoxy_cure (
-                    id SERIAL PRIMARY KEY,
-                    chip_serial_number VARCHAR(100) NOT NULL REFERENCES chip_preparation(chip_serial_number),
-                    start_time TIMESTAMP,
-                    end_time TIMESTAMP,
-                    duration_seconds INTEGER DEFAULT 10800,
-                    status VARCHAR(20) DEFAULT 'ready',
-                    remaining_seconds INTEGER DEFAULT 10800,
-                    started_by INTEGER REFERENCES users(id),
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            # Create indexes for better performance
-            cursor.execute("""
-                CREATE INDEX IF NOT EXISTS idx_chip_preparation_chip_serial 
-                ON chip_preparation(chip_serial_number)
-            """)
-            
-            cursor.execute("""
-                CREATE INDEX IF NOT EXISTS idx_chip_sections_chip_serial 
-                ON chip_preparation_sections(chip_serial_number)
-            """)
-            
-            cursor.execute("""
-                CREATE INDEX IF NOT EXISTS idx_chip_epoxy_chip_serial 
-                ON chip_epoxy_cure(chip_serial_number)
-            """)
-            
-            conn.commit()
-            print("✅ Chip preparation tables initialized")
-            
-    except Exception as e:
-        print(f"❌ Chip preparation table initialization error: {e}")
-
-# Initialize tables on module load
-init_chip_preparation_tables()
-
 # Helper functions
 def ensure_chip_preparation_exists(chip_serial_number: str, wafer_id: str, operator: str, user_id: int):
     """Ensure chip preparation record exists"""
@@ -216,35 +143,29 @@ def ensure_chip_preparation_exists(chip_serial_number: str, wafer_id: str, opera
             conn.commit()
 
 # API Endpoints
+def compute_chip_preparation_status() -> dict:
+    """Preparation totals and running cures in one round trip"""
+    with get_db_connection() as conn:
+        stats = grouped_stats(
+            conn.cursor(), "chip_preparation",
+            aggregates={
+                "total_preparations": "COUNT(*)",
+                "todays_preparations": "COUNT(*) FILTER (WHERE created_at >= CURRENT_DATE)",
+                "active_epoxy_cures": "(SELECT COUNT(*) FROM chip_epoxy_cure WHERE status = 'running')"
+            }
+        )
+    return stats["totals"]
+
 @chip_preparation_router.get("/status")
 async def chip_preparation_status(current_user: dict = Depends(get_current_user)):
     """Get chip preparation module status"""
     try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            
-            # Get recent statistics
-            cursor.execute("""
-                SELECT 
-                    COUNT(*) as total,
-                    COUNT(CASE WHEN created_at >= CURRENT_DATE THEN 1 END) as today
-                FROM chip_preparation
-            """)
-            stats = cursor.fetchone()
-            
-            # Get active epoxy cures
-            cursor.execute("""
-                SELECT COUNT(*) FROM chip_epoxy_cure WHERE status = 'running'
-            """)
-            active_cures = cursor.fetchone()[0]
-            
-            return {
-                "module": "chip_preparation",
-                "status": "operational",
-                "total_preparations": stats[0] if stats else 0,
-                "todays_preparations": stats[1] if stats else 0,
-                "active_epoxy_cures": active_cures
-            }
+        stats = await asyncio.to_thread(stats_memo.get, "chip_preparation_status", compute_chip_preparation_status)
+        return {
+            "module": "chip_preparation",
+            "status": "operational",
+            **stats
+        }
     except Exception as e:
         return {
             "module": "chip_preparation",
@@ -427,16 +348,22 @@ async def control_epoxy_cure(
                 # Start epoxy cure
                 cursor.execute("""
                     UPDATE chip_epoxy_cure 
-                    SET status = 'running', start_time = %s, end_time = %s,
+                    SET status = 'running', start_time = %s,
+                        end_time = %s + make_interval(secs => duration_seconds),
                         remaining_seconds = duration_seconds, started_by = %s,
                         updated_at = CURRENT_TIMESTAMP
                     WHERE chip_serial_number = %s
+                    RETURNING duration_seconds
                 """, (
                     current_time,
-                    current_time + datetime.timedelta(seconds=10800),  # 3 hours
+                    current_time,
                     current_user['user_id'],
                     data.chip_serial_number
                 ))
+                cure_row = cursor.fetchone()
+                if not cure_row:
+                    raise HTTPException(status_code=404, detail="Epoxy cure record not found")
+                duration_seconds = cure_row[0] or 10800
                 message = "Epoxy cure started"
                 
             elif data.action == 'stop':
@@ -476,6 +403,11 @@ async def control_epoxy_cure(
             
             conn.commit()
         
+        if data.action == 'start':
+            cure_scheduler.add(data.chip_serial_number, current_time, duration_seconds, current_user['user_id'])
+        else:
+            cure_scheduler.remove(data.chip_serial_number)
+        
         log_action(
             current_user['user_id'],
             f'epoxy_cure_{data.action}',
@@ -483,21 +415,46 @@ async def control_epoxy_cure(
             f"Epoxy cure {data.action} for chip {data.chip_serial_number}"
         )
         
+        cure_event = {
+            "chip_serial_number": data.chip_serial_number,
+            "action": data.action,
+            "message": message,
+            "user": current_user['username']
+        }
+        notify_module('chip_inspection', f'epoxy_cure_{data.action}', cure_event)
+        publish_event(cure_topic(data.chip_serial_number), f'epoxy_cure_{data.action}', cure_event)
+        
         return {
             "success": True,
             "message": message,
             "action": data.action
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to control epoxy cure: {str(e)}")
 
+@chip_preparation_router.get("/epoxy-cure/running")
+async def get_running_epoxy_cures(current_user: dict = Depends(get_current_user)):
+    """All running epoxy cures with their countdowns, from the scheduler (no database query)"""
+    cures = cure_scheduler.running()
+    return {
+        "cures": cures,
+        "count": len(cures),
+        "server_time": datetime.datetime.now().isoformat()
+    }
+
 @chip_preparation_router.get("/epoxy-cure/status/{chip_serial_number}")
 async def get_epoxy_cure_status(
     chip_serial_number: str,
     current_user: dict = Depends(get_current_user)
 ):
     """Get current epoxy cure status and remaining time"""
+    running = cure_scheduler.status(chip_serial_number)
+    if running:
+        return running
+    
     try:
         with get_db_connection() as conn:
             cursor = conn.cursor()
@@ -533,14 +490,6 @@ async def get_epoxy_cure_status(
                     
                     status = 'completed'
                     actual_remaining = 0
-                else:
-                    # Update remaining seconds in database
-                    cursor.execute("""
-                        UPDATE chip_epoxy_cure 
-                        SET remaining_seconds = %s, updated_at = CURRENT_TIMESTAMP
-                        WHERE chip_serial_number = %s
-                    """, (actual_remaining, chip_serial_number))
-                    conn.commit()
                 
                 remaining_seconds = actual_remaining
             
@@ -666,6 +615,7 @@ async def generate_preparation_report(
         pdf_filename = f"chip_preparation_report_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
         pdf_path = os.path.join('reports', pdf_filename)
         pdf.output(pdf_path)
+        register_artifact(pdf_path, 'chip_inspection')
         
         log_action(
             current_user['user_id'],
@@ -680,6 +630,16 @@ async def generate_preparation_report(
         raise HTTPException(status_code=500, detail=f"Failed to generate report: {str(e)}")
 
 # Export router
-__all__ = ['chip_preparation_router']
+MODULE_MANIFEST = ModuleManifest(
+    name='chip_inspection',
+    router=chip_preparation_router,
+    prefix='/modules/chip-inspection',
+    tags=['Chip Inspection'],
+    on_startup=cure_scheduler.start,
+    on_shutdown=cure_scheduler.stop,
+    health_probe=lambda: {"epoxy_cures": cure_scheduler.stats()}
+)
+
+__all__ = ['MODULE_MANIFEST', 'chip_preparation_router']
 
 print("✅ Chip preparation module loaded successfully")
\ No newline at end of file
@@ -0,0 +1,478 @@
+# modules/cluster.py - Shared state for several API workers: Postgres sessions, NOTIFY event relay, instrument routing
+
+import os
+import json
+import time
+import queue
+import socket
+import hashlib
+import datetime
+import threading
+from typing import Dict, List, Optional, Set
+import psycopg2
+import psycopg2.extras
+import psycopg2.extensions
+from dotenv import load_dotenv
+from starlette.responses import JSONResponse
+from .pg_listener import pg_listener, DATABASE_CONFIG
+
+# Load environment variables
+load_dotenv()
+
+# Off by default: one worker keeps sessions and websocket fan-out in process memory
+CLUSTER_MODE = os.getenv('CLUSTER_MODE', 'false').lower() == 'true'
+# Identifies this process in api_sessions and instrument_owners
+WORKER_ID = os.getenv('WORKER_ID') or f"{socket.gethostname()}:{os.getpid()}"
+# Address the proxy or clients use to reach this worker directly (reported to them for instrument routes)
+WORKER_URL = os.getenv('WORKER_URL', '')
+# Instruments this worker may own: comma-separated module names or VISA resources, '*' for all, empty for none
+WORKER_INSTRUMENTS = os.getenv('WORKER_INSTRUMENTS', '*')
+
+EVENT_CHANNEL = 'cluster_events'
+# PostgreSQL rejects NOTIFY payloads of 8000 bytes or more; larger events go through cluster_events
+NOTIFY_PAYLOAD_LIMIT = 7900
+# Seconds an oversize relayed event is kept for the other workers to read
+CLUSTER_EVENT_TTL = 600
+RELAY_QUEUE_SIZE = int(os.getenv('RELAY_QUEUE_SIZE', '10000'))
+# Seconds between instrument ownership claims/heartbeats
+OWNERSHIP_HEARTBEAT = float(os.getenv('OWNERSHIP_HEARTBEAT', '10'))
+# First key of the two-key advisory locks held by instrument owners (second key: hashtext(resource))
+INSTRUMENT_LOCK_CLASS = 4917002
+# Advisory lock held by the worker that runs the cluster-wide background jobs
+LEADER_LOCK_KEY = 4917003
+
+def session_key(token: str) -> str:
+    """Shared-store key for a token (the token itself is never written)"""
+    return hashlib.sha256(token.encode()).hexdigest()
+
+# Sessions and presence
+class SessionStore:
+    """This worker's sessions in api_sessions, one row per session and worker, merged across workers on read"""
+
+    def __init__(self, get_db_connection, worker_id: str = WORKER_ID):
+        self.get_db_connection = get_db_connection
+        self.worker_id = worker_id
+        self.metrics = {'syncs': 0, 'rows_written': 0, 'errors': 0}
+
+    def sync(self, changed: List[dict], ended: List[str], cutoff: datetime.datetime) -> Dict[str, dict]:
+        """Write changed sessions, drop ended and idle ones, and return the other workers' live sessions by key"""
+        with self.get_db_connection() as conn:
+            cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+            psycopg2.extras.execute_values(cursor, """
+                INSERT INTO api_sessions (session_key, worker_id, user_id, username, login_time, last_activity,
+                                          active_modules, current_operations)
+                VALUES %s
+                ON CONFLICT (session_key, worker_id) DO UPDATE
+                SET last_activity = GREATEST(api_sessions.last_activity, EXCLUDED.last_activity),
+                    active_modules = EXCLUDED.active_modules,
+                    current_operations = EXCLUDED.current_operations
+            """, [(session['key'], self.worker_id, session['user_id'], session['username'], session['login_time'],
+                   session['last_activity'], sorted(session['active_modules']),
+                   json.dumps(session['current_operations'])) for session in changed])
+            if ended:
+                cursor.execute("DELETE FROM api_sessions WHERE worker_id = %s AND session_key = ANY(%s)",
+                               (self.worker_id, ended))
+            cursor.execute("DELETE FROM api_sessions WHERE last_activity < %s", (cutoff,))
+            cursor.execute("""
+                SELECT session_key, user_id, username, login_time, last_activity, active_modules, current_operations
+                FROM api_sessions
+                WHERE worker_id <> %s
+            """, (self.worker_id,))
+            rows = cursor.fetchall()
+            conn.commit()
+        self.metrics['syncs'] += 1
+        self.metrics['rows_written'] += len(changed)
+
+        sessions = {}
+        for row in rows:
+            merge_session(sessions, row['session_key'], {
+                'user_id': row['user_id'],
+                'username': row['username'],
+                'login_time': row['login_time'],
+                'last_activity': row['last_activity'],
+                'active_modules': set(row['active_modules'] or ()),
+                'current_operations': dict(row['current_operations'] or {})
+            })
+        return sessions
+
+    def stats(self) -> dict:
+        return {**self.metrics, 'worker_id': self.worker_id}
+
+def merge_session(sessions: Dict[str, dict], key: str, session: dict):
+    """Fold one worker's view of a session into ``sessions`` (latest activity, union of modules)"""
+    merged = sessions.get(key)
+    if merged is None:
+        sessions[key] = {**session, 'active_modules': set(session['active_modules']),
+                         'current_operations': dict(session['current_operations'])}
+        return
+    merged['login_time'] = min(merged['login_time'], session['login_time'])
+    merged['last_activity'] = max(merged['last_activity'], session['last_activity'])
+    merged['active_modules'] |= session['active_modules']
+    merged['current_operations'].update(session['current_operations'])
+
+# Cross-worker websocket events
+class EventRelay:
+    """Forwards this worker's event bus traffic to the other workers over NOTIFY and delivers theirs locally"""
+
+    def __init__(self, bus, get_db_connection, channel: str = EVENT_CHANNEL, worker_id: str = WORKER_ID):
+        self.bus = bus
+        self.get_db_connection = get_db_connection
+        self.channel = channel
+        self.worker_id = worker_id
+        self.queue: queue.Queue = queue.Queue(maxsize=RELAY_QUEUE_SIZE)
+        self.thread: Optional[threading.Thread] = None
+        self.stopping = threading.Event()
+        self.last_cleanup = 0.0
+        self.metrics = {'sent': 0, 'received': 0, 'oversize': 0, 'dropped': 0, 'errors': 0}
+
+    def forward(self, topic: str, message: dict, raw: bool, retain: bool):
+        """Queue a locally published event for the other workers (bus.relay hook; never blocks)"""
+        try:
+            self.queue.put_nowait((topic, message, raw, retain))
+        except queue.Full:
+            self.metrics['dropped'] += 1
+
+    def start(self):
+        """Listen for the other workers' events and start forwarding ours (idempotent)"""
+        if self.thread is not None:
+            return
+        pg_listener.listen(self.channel, self._on_notify)
+        pg_listener.start()
+        self.stopping.clear()
+        self.bus.relay = self.forward
+        self.thread = threading.Thread(target=self._run, name="event-relay", daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """Stop forwarding after sending what is queued"""
+        self.bus.relay = None
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+
+    def _run(self):
+        while not (self.stopping.is_set() and self.queue.empty()):
+            try:
+                batch = [self.queue.get(timeout=1.0)]
+            except queue.Empty:
+                continue
+            while len(batch) < 500:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._send(batch)
+            except Exception as e:
+                self.metrics['errors'] += 1
+                print(f"⚠️ Event relay failed, {len(batch)} events not forwarded: {e}")
+
+    def _send(self, batch: list):
+        """NOTIFY a batch in one transaction (delivered to the listeners on commit)"""
+        with self.get_db_connection() as conn:
+            cursor = conn.cursor()
+            for topic, message, raw, retain in batch:
+                payload = json.dumps({"origin": self.worker_id, "topic": topic, "message": message,
+                                      "raw": raw, "retain": retain}, default=str, separators=(',', ':'))
+                if len(payload.encode()) > NOTIFY_PAYLOAD_LIMIT:
+                    cursor.execute("INSERT INTO cluster_events (payload) VALUES (%s) RETURNING id", (payload,))
+                    payload = json.dumps({"origin": self.worker_id, "ref": cursor.fetchone()[0]})
+                    self.metrics['oversize'] += 1
+                cursor.execute("SELECT pg_notify(%s, %s)", (self.channel, payload))
+            if time.monotonic() - self.last_cleanup > 60:
+                cursor.execute("DELETE FROM cluster_events WHERE created_at < NOW() - %s * INTERVAL '1 second'",
+                               (CLUSTER_EVENT_TTL,))
+                self.last_cleanup = time.monotonic()
+            conn.commit()
+        self.metrics['sent'] += len(batch)
+
+    def _on_notify(self, payload: str):
+        envelope = json.loads(payload)
+        if envelope.get('origin') == self.worker_id:
+            return
+        if 'ref' in envelope:
+            with self.get_db_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT payload FROM cluster_events WHERE id = %s", (envelope['ref'],))
+                row = cursor.fetchone()
+                conn.rollback()
+            if row is None:
+                return
+            envelope = json.loads(row[0])
+        self.metrics['received'] += 1
+        self.bus.deliver(envelope['topic'], envelope['message'], raw=envelope['raw'], retain=envelope['retain'])
+
+    def stats(self) -> dict:
+        return {**self.metrics, 'queued': self.queue.qsize(), 'running': self.thread is not None}
+
+# Instrument ownership
+#
+# Each instrument group is driven by the one worker holding its locks; any other worker answers its routes
+# with 421 and X-Instrument-Url (the owner's WORKER_URL). Workers sharing one socket (uvicorn --workers)
+# cannot be addressed individually, so main.py refuses API_WORKERS > 1 while instrument modules are loaded.
+# Run one process per port instead, each with its own address, behind a proxy that follows the 421:
+#
+#   CLUSTER_MODE=true API_WORKERS=1 API_PORT=8001 WORKER_URL=http://10.0.0.5:8001 python main.py
+#   CLUSTER_MODE=true API_WORKERS=1 API_PORT=8002 WORKER_URL=http://10.0.0.5:8002 python main.py
+#
+#   upstream maq_api { server 10.0.0.5:8001; server 10.0.0.5:8002; }
+#   location / {
+#       proxy_pass http://maq_api;
+#       proxy_intercept_errors on;
+#       error_page 421 = @instrument_owner;
+#   }
+#   location @instrument_owner {
+#       set $owner $upstream_http_x_instrument_url;
+#       proxy_pass $owner$request_uri;  # method and buffered body are kept
+#   }
+#
+# WORKER_INSTRUMENTS pins instruments to the worker on the bench PC that has the VISA connections.
+def instrument_groups(resources: Dict[str, List[str]]) -> Dict[str, List[str]]:
+    """Module -> every resource of its group; modules sharing a resource (S11 and S21 on one VNA) share a group"""
+    groups = {name: set(items) for name, items in resources.items()}
+    changed = True
+    while changed:
+        changed = False
+        for name, items in groups.items():
+            joined = set().union(*(other for other in groups.values() if other & items))
+            if joined != items:
+                groups[name] = joined
+                changed = True
+    return {name: sorted(items) for name, items in groups.items()}
+
+class InstrumentRouter:
+    """Pins each instrument resource to one worker with a session advisory lock and keeps the routing table.
+    Resources are claimed a group at a time, so modules sharing hardware always route to the same worker."""
+
+    def __init__(self, config: Optional[dict] = None, worker_id: str = WORKER_ID, worker_url: str = WORKER_URL,
+                 eligible: str = WORKER_INSTRUMENTS):
+        self.config = config or DATABASE_CONFIG
+        self.worker_id = worker_id
+        self.worker_url = worker_url or None
+        self.eligible = {name.strip() for name in eligible.split(',') if name.strip()}
+        self.paths: Dict[str, str] = {}         # full route path -> instrument module (empty unless started)
+        self.groups: Dict[str, List[str]] = {}  # instrument module -> resources of its group
+        self.owned: Set[str] = set()            # resources whose lock this worker's connection holds
+        self.routes: Dict[str, dict] = {}       # instrument_owners (by resource) as of the last heartbeat
+        self.thread: Optional[threading.Thread] = None
+        self.stopping = threading.Event()
+        self.conn = None
+
+    def may_own(self, group: List[str]) -> bool:
+        members = {name for name, resources in self.groups.items() if resources == group}
+        return '*' in self.eligible or bool(self.eligible & (members | set(group)))
+
+    def is_local(self, instrument: str) -> bool:
+        resources = self.groups.get(instrument)
+        return bool(resources) and all(resource in self.owned for resource in resources)
+
+    def owner(self, instrument: str) -> Optional[dict]:
+        resources = self.groups.get(instrument)
+        return self.routes.get(resources[0]) if resources else None
+
+    def start(self, paths: Dict[str, str], resources: Optional[Dict[str, List[str]]] = None):
+        """Start claiming the instruments behind ``paths`` (full path -> module; ``resources``: module -> VISA resources)"""
+        if self.thread is not None:
+            return
+        self.groups = instrument_groups({name: (resources or {}).get(name) or [name] for name in set(paths.values())})
+        self.paths = dict(paths)
+        self.stopping.clear()
+        self.thread = threading.Thread(target=self._run, name="instrument-owner", daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """Hand the instruments back: drop our routing rows, then close the connection holding the locks"""
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+        self.paths = {}
+
+    def _run(self):
+        backoff = 1.0
+        while not self.stopping.is_set():
+            try:
+                self.conn = psycopg2.connect(**self.config)
+                self.conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                backoff = 1.0
+                while not self.stopping.is_set():
+                    self._heartbeat()
+                    self.stopping.wait(OWNERSHIP_HEARTBEAT)
+                if self.owned:
+                    self.conn.cursor().execute("DELETE FROM instrument_owners WHERE worker_id = %s", (self.worker_id,))
+            except Exception as e:
+                if self.stopping.is_set():
+                    break
+                print(f"⚠️ Instrument ownership connection lost ({e}); retrying in {backoff:.0f}s")
+                self.stopping.wait(backoff)
+                backoff = min(backoff * 2, 60.0)
+            finally:
+                # The advisory locks went with the connection
+                self.owned = set()
+                if self.conn is not None and not self.conn.closed:
+                    self.conn.close()
+                self.conn = None
+
+    def _claim(self, cursor, group: List[str]) -> bool:
+        """Lock every resource of a group (sorted order) or none of them"""
+        locked = []
+        for resource in group:
+            cursor.execute("SELECT pg_try_advisory_lock(%s, hashtext(%s))", (INSTRUMENT_LOCK_CLASS, resource))
+            if not cursor.fetchone()[0]:
+                for held in locked:
+                    cursor.execute("SELECT pg_advisory_unlock(%s, hashtext(%s))", (INSTRUMENT_LOCK_CLASS, held))
+                return False
+            locked.append(resource)
+        return True
+
+    def _heartbeat(self):
+        """Claim free instrument groups we may own, refresh our rows and reload the routing table"""
+        cursor = self.conn.cursor()
+        for group in sorted({tuple(resources) for resources in self.groups.values()}):
+            group = list(group)
+            if all(resource in self.owned for resource in group) or not self.may_own(group):
+                continue
+            if not self._claim(cursor, group):
+                continue
+            psycopg2.extras.execute_values(cursor, """
+                INSERT INTO instrument_owners (instrument, worker_id, base_url)
+                VALUES %s
+                ON CONFLICT (instrument) DO UPDATE
+                SET worker_id = EXCLUDED.worker_id, base_url = EXCLUDED.base_url,
+                    claimed_at = CURRENT_TIMESTAMP, heartbeat_at = CURRENT_TIMESTAMP
+            """, [(resource, self.worker_id, self.worker_url) for resource in group])
+            self.owned.update(group)
+            modules = sorted(name for name, resources in self.groups.items() if resources == group)
+            print(f"🔌 Worker {self.worker_id} now owns {', '.join(group)} ({', '.join(modules)})")
+        if self.owned:
+            cursor.execute("""
+                UPDATE instrument_owners SET heartbeat_at = CURRENT_TIMESTAMP
+                WHERE worker_id = %s AND instrument = ANY(%s)
+            """, (self.worker_id, sorted(self.owned)))
+        cursor.execute("SELECT instrument, worker_id, base_url, claimed_at, heartbeat_at FROM instrument_owners")
+        self.routes = {instrument: {'worker_id': worker_id, 'base_url': base_url,
+                                    'claimed_at': claimed_at.isoformat(), 'heartbeat_at': heartbeat_at.isoformat()}
+                       for instrument, worker_id, base_url, claimed_at, heartbeat_at in cursor.fetchall()}
+
+    def stats(self) -> dict:
+        return {
+            'worker_id': self.worker_id,
+            'connected': self.conn is not None,
+            'owned': sorted(self.owned),
+            'groups': self.groups,
+            'routes': self.routes
+        }
+
+class InstrumentRoutingMiddleware:
+    """ASGI middleware answering 421 for instrument routes owned by another worker (no-op until the router starts)"""
+
+    def __init__(self, app, instruments: InstrumentRouter):
+        self.app = app
+        self.instruments = instruments
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http':
+            instrument = self.instruments.paths.get(scope['path'])
+            if instrument and not self.instruments.is_local(instrument):
+                owner = self.instruments.owner(instrument)
+                headers = {'Retry-After': str(int(OWNERSHIP_HEARTBEAT))}
+                if owner and owner['base_url']:
+                    headers['X-Instrument-Url'] = owner['base_url']
+                response = JSONResponse(status_code=421, headers=headers, content={
+                    "detail": f"The {instrument} instruments are served by another API worker",
+                    "instrument": instrument,
+                    "owner": owner
+                })
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+# Cluster-wide background jobs
+class LeaderElection:
+    """Elects the one worker that runs cluster-wide jobs (cure completions and countdowns, traveler, yield and
+    analytics loads, log partitions) by holding an advisory lock on its own connection; every process leads until started"""
+
+    def __init__(self, config: Optional[dict] = None, worker_id: str = WORKER_ID):
+        self.config = config or DATABASE_CONFIG
+        self.worker_id = worker_id
+        self.started = False  # once started, only the lock holder leads (also while shutting down)
+        self.held = False
+        self.elected_at: Optional[datetime.datetime] = None
+        self.callbacks: List = []  # run (on the election thread) each time this worker becomes leader
+        self.thread: Optional[threading.Thread] = None
+        self.stopping = threading.Event()
+        self.conn = None
+
+    @property
+    def is_leader(self) -> bool:
+        return self.held if self.started else True
+
+    def on_elected(self, callback):
+        """Register a callback for taking over: jobs resync state the previous leader may have left behind"""
+        self.callbacks.append(callback)
+
+    def start(self):
+        if self.thread is not None:
+            return
+        self.started = True
+        self.stopping.clear()
+        self.thread = threading.Thread(target=self._run, name="leader-election", daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """Step down: closing the connection releases the lock to the next worker"""
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+
+    def _run(self):
+        backoff = 1.0
+        while not self.stopping.is_set():
+            try:
+                self.conn = psycopg2.connect(**self.config)
+                self.conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                backoff = 1.0
+                cursor = self.conn.cursor()
+                while not self.stopping.is_set():
+                    if self.held:
+                        cursor.execute("SELECT 1")  # the lock lives as long as this connection
+                    else:
+                        cursor.execute("SELECT pg_try_advisory_lock(%s)", (LEADER_LOCK_KEY,))
+                        if cursor.fetchone()[0]:
+                            self.held = True
+                            self.elected_at = datetime.datetime.now()
+                            print(f"👑 Worker {self.worker_id} is now running the cluster-wide jobs")
+                            for callback in self.callbacks:
+                                try:
+                                    callback()
+                                except Exception as e:
+                                    print(f"⚠️ Leader takeover callback failed: {e}")
+                    self.stopping.wait(OWNERSHIP_HEARTBEAT)
+            except Exception as e:
+                if self.stopping.is_set():
+                    break
+                print(f"⚠️ Leader election connection lost ({e}); retrying in {backoff:.0f}s")
+                self.stopping.wait(backoff)
+                backoff = min(backoff * 2, 60.0)
+            finally:
+                self.held = False
+                if self.conn is not None and not self.conn.closed:
+                    self.conn.close()
+                self.conn = None
+
+    def stats(self) -> dict:
+        return {
+            'worker_id': self.worker_id,
+            'is_leader': self.is_leader,
+            'elected_at': self.elected_at.isoformat() if self.held and self.elected_at else None
+        }
+
+# Shared by the API server (started only in CLUSTER_MODE)
+instrument_router = InstrumentRouter()
+leader = LeaderElection()
+
+__all__ = ['CLUSTER_MODE', 'WORKER_ID', 'SessionStore', 'EventRelay', 'InstrumentRouter',
+           'InstrumentRoutingMiddleware', 'instrument_router', 'instrument_groups', 'LeaderElection', 'leader',
+           'session_key', 'merge_session']
@@ -0,0 +1,283 @@
+# modules/cure_scheduler.py - Server-side epoxy cure timers: in-memory min-heap, countdown and completion events
+
+import os
+import heapq
+import asyncio
+import datetime
+import threading
+from typing import Callable, Dict, List, Optional
+from .event_bus import notify_module, publish_event, cure_topic
+from .pg_listener import pg_listener
+from .cluster import leader
+
+# Seconds between countdown events for running cures
+CURE_TICK_INTERVAL = float(os.getenv('CURE_TICK_INTERVAL', '5'))
+# Seconds before retrying a completion whose database update failed
+CURE_RETRY_INTERVAL = 30.0
+# chip_epoxy_cure notifies the chip serial on start/stop/complete (migration 21), so every worker's heap follows it
+CURE_CHANNEL = 'epoxy_cure_changed'
+
+class CureScheduler:
+    """Keeps running cures in a min-heap on their end time; completes them in the database and pushes events.
+    Every worker mirrors chip_epoxy_cure through NOTIFY; only the cluster leader completes cures and publishes ticks."""
+
+    def __init__(self, get_db_connection: Callable, module: str = 'chip_inspection',
+                 tick_interval: float = CURE_TICK_INTERVAL):
+        self.get_db_connection = get_db_connection
+        self.module = module
+        self.tick_interval = tick_interval
+        self.lock = threading.Lock()
+        self.cures: Dict[str, dict] = {}  # chip serial -> running cure
+        self.heap: List[tuple] = []       # (due, chip serial); stale when due != cure['due']
+        self.task: Optional[asyncio.Task] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.wakeup: Optional[asyncio.Event] = None
+        self.changed: set = set()  # chips notified as changed, reloaded by the loop
+        self.resync_pending = False
+        self.metrics = {'seeded': 0, 'completed': 0, 'ticks': 0, 'failed_completions': 0, 'reloaded': 0}
+
+    # Schedule changes (called by the control endpoint after its transaction commits)
+    def add(self, chip_serial_number: str, start_time: datetime.datetime, duration_seconds: int,
+            started_by: Optional[int] = None):
+        """Track a running cure (replaces any earlier entry for the chip)"""
+        end_time = start_time + datetime.timedelta(seconds=duration_seconds)
+        with self.lock:
+            self.cures[chip_serial_number] = {
+                'chip_serial_number': chip_serial_number,
+                'start_time': start_time,
+                'end_time': end_time,
+                'duration_seconds': duration_seconds,
+                'started_by': started_by,
+                'due': end_time
+            }
+            heapq.heappush(self.heap, (end_time, chip_serial_number))
+        self._wake()
+
+    def remove(self, chip_serial_number: str) -> bool:
+        """Stop tracking a cure (paused or cancelled); its heap entry goes stale"""
+        with self.lock:
+            removed = self.cures.pop(chip_serial_number, None) is not None
+        self._wake()
+        return removed
+
+    def _wake(self):
+        """Wake the loop; safe from the listener and election threads"""
+        if self.loop is not None and self.wakeup is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.wakeup.set)
+
+    def _on_notify(self, chip_serial_number: str):
+        with self.lock:
+            self.changed.add(chip_serial_number)
+        self._wake()
+
+    def _on_resync(self):
+        with self.lock:
+            self.resync_pending = True
+        self._wake()
+
+    # Queries
+    def _describe(self, cure: dict, now: datetime.datetime) -> dict:
+        remaining = max(0, int((cure['end_time'] - now).total_seconds()))
+        return {
+            "chip_serial_number": cure['chip_serial_number'],
+            "status": 'running',
+            "start_time": cure['start_time'].isoformat(),
+            "end_time": cure['end_time'].isoformat(),
+            "duration_seconds": cure['duration_seconds'],
+            "remaining_seconds": remaining,
+            "is_running": True,
+            "is_completed": False
+        }
+
+    def status(self, chip_serial_number: str) -> Optional[dict]:
+        """Status of a running cure from memory, or None if the chip is not curing"""
+        with self.lock:
+            cure = self.cures.get(chip_serial_number)
+        return self._describe(cure, datetime.datetime.now()) if cure else None
+
+    def running(self) -> List[dict]:
+        """Every running cure, soonest to finish first"""
+        now = datetime.datetime.now()
+        with self.lock:
+            cures = sorted(self.cures.values(), key=lambda cure: cure['end_time'])
+        return [self._describe(cure, now) for cure in cures]
+
+    # Database
+    def seed(self) -> int:
+        """Load running cures from the database, dropping any this worker no longer should track"""
+        with self.get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT chip_serial_number, start_time, duration_seconds, started_by
+                FROM chip_epoxy_cure
+                WHERE status = 'running' AND start_time IS NOT NULL
+            """)
+            rows = cursor.fetchall()
+        with self.lock:
+            for chip_serial_number in set(self.cures) - {row[0] for row in rows}:
+                del self.cures[chip_serial_number]
+        for chip_serial_number, start_time, duration_seconds, started_by in rows:
+            self._track(chip_serial_number, start_time, duration_seconds or 10800, started_by)
+        self.metrics['seeded'] = len(rows)
+        return len(rows)
+
+    def reload(self, chip_serial_numbers: List[str]):
+        """Follow chips changed on any worker: track them if running, forget them otherwise"""
+        with self.get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT chip_serial_number, start_time, duration_seconds, started_by
+                FROM chip_epoxy_cure
+                WHERE chip_serial_number = ANY(%s) AND status = 'running' AND start_time IS NOT NULL
+            """, (chip_serial_numbers,))
+            rows = cursor.fetchall()
+        running = {row[0] for row in rows}
+        for chip_serial_number in chip_serial_numbers:
+            if chip_serial_number not in running:
+                self.remove(chip_serial_number)
+        for chip_serial_number, start_time, duration_seconds, started_by in rows:
+            self._track(chip_serial_number, start_time, duration_seconds or 10800, started_by)
+        self.metrics['reloaded'] += len(chip_serial_numbers)
+
+    def _track(self, chip_serial_number: str, start_time: datetime.datetime, duration_seconds: int,
+               started_by: Optional[int]):
+        """add() unless the same run is already tracked"""
+        with self.lock:
+            cure = self.cures.get(chip_serial_number)
+            if cure and cure['start_time'] == start_time and cure['duration_seconds'] == duration_seconds:
+                return
+        self.add(chip_serial_number, start_time, duration_seconds, started_by)
+
+    def _mark_completed(self, cures: List[dict]) -> List[str]:
+        """Set status 'completed' for cures that are still the same run; returns chips updated"""
+        completed = []
+        with self.get_db_connection() as conn:
+            cursor = conn.cursor()
+            for cure in cures:
+                cursor.execute("""
+                    UPDATE chip_epoxy_cure
+                    SET status = 'completed', remaining_seconds = 0, updated_at = CURRENT_TIMESTAMP
+                    WHERE chip_serial_number = %s AND status = 'running' AND start_time = %s
+                """, (cure['chip_serial_number'], cure['start_time']))
+                if cursor.rowcount:
+                    completed.append(cure['chip_serial_number'])
+            conn.commit()
+        return completed
+
+    # Scheduler loop
+    async def _apply_changes(self):
+        with self.lock:
+            resync, self.resync_pending = self.resync_pending, False
+            changed, self.changed = sorted(self.changed), set()
+        try:
+            if resync:
+                await asyncio.to_thread(self.seed)
+            elif changed:
+                await asyncio.to_thread(self.reload, changed)
+        except Exception as e:
+            with self.lock:
+                self.resync_pending = self.resync_pending or resync or bool(changed)
+            print(f"⚠️ Epoxy cure reload failed, retrying: {e}")
+
+    def _pop_due(self, now: datetime.datetime) -> List[dict]:
+        due = []
+        with self.lock:
+            while self.heap and self.heap[0][0] <= now:
+                due_at, chip_serial_number = heapq.heappop(self.heap)
+                cure = self.cures.get(chip_serial_number)
+                if cure is None or cure['due'] != due_at:
+                    continue  # stopped, cancelled or restarted since this entry was pushed
+                del self.cures[chip_serial_number]
+                due.append(cure)
+        return due
+
+    async def _complete_due(self, now: datetime.datetime):
+        due = self._pop_due(now)
+        if not due or not leader.is_leader:
+            return  # on other workers the leader's completion arrives as a notification
+        try:
+            completed = await asyncio.to_thread(self._mark_completed, due)
+        except Exception as e:
+            self.metrics['failed_completions'] += len(due)
+            print(f"❌ Epoxy cure completion failed for {len(due)} chip(s), retrying: {e}")
+            retry_at = now + datetime.timedelta(seconds=CURE_RETRY_INTERVAL)
+            with self.lock:
+                for cure in due:
+                    if cure['chip_serial_number'] not in self.cures:
+                        cure['due'] = retry_at
+                        self.cures[cure['chip_serial_number']] = cure
+                        heapq.heappush(self.heap, (retry_at, cure['chip_serial_number']))
+            return
+
+        for chip_serial_number in completed:
+            event = {
+                "chip_serial_number": chip_serial_number,
+                "status": 'completed',
+                "remaining_seconds": 0
+            }
+            notify_module(self.module, 'epoxy_cure_completed', event)
+            publish_event(cure_topic(chip_serial_number), 'epoxy_cure_completed', event)
+        self.metrics['completed'] += len(completed)
+        if completed:
+            print(f"⏲️ Epoxy cure completed: {', '.join(completed)}")
+
+    def _publish_countdown(self, now: datetime.datetime):
+        running = self.running()
+        if not running:
+            return
+        self.metrics['ticks'] += 1
+        for cure in running:
+            publish_event(cure_topic(cure['chip_serial_number']), 'epoxy_cure_tick', cure, coalesce=True)
+        # One message with every countdown for dashboards watching the whole floor
+        notify_module(self.module, 'epoxy_cure_countdown', {"cures": running}, coalesce=True)
+
+    async def _run(self):
+        next_tick = datetime.datetime.now()
+        while True:
+            now = datetime.datetime.now()
+            try:
+                await self._apply_changes()
+                await self._complete_due(now)
+                if now >= next_tick:
+                    if leader.is_leader:
+                        self._publish_countdown(now)
+                    next_tick = now + datetime.timedelta(seconds=self.tick_interval)
+            except Exception as e:
+                print(f"Epoxy cure scheduler error: {e}")
+
+            with self.lock:
+                next_due = self.heap[0][0] if self.heap else None
+            delay = (next_tick - now).total_seconds()
+            if next_due is not None:
+                delay = min(delay, (next_due - now).total_seconds())
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), max(0.0, delay))
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+
+    async def start(self):
+        """Seed from the database, follow changes made on other workers and start the scheduler loop"""
+        self.loop = asyncio.get_running_loop()
+        self.wakeup = asyncio.Event()
+        pg_listener.listen(CURE_CHANNEL, self._on_notify, on_reconnect=self._on_resync)
+        pg_listener.start()
+        leader.on_elected(self._on_resync)
+        try:
+            seeded = await asyncio.to_thread(self.seed)
+            print(f"⏲️ Epoxy cure scheduler started ({seeded} running cure(s))")
+        except Exception as e:
+            print(f"⚠️ Epoxy cure scheduler could not load running cures: {e}")
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {**self.metrics, 'running': len(self.cures), 'heap_size': len(self.heap)}
+
+__all__ = ['CureScheduler', 'CURE_TICK_INTERVAL']
@@ -7,6 +7,7 @@ from pydantic import BaseModel
 from typing import List, Optional
 import os
 import json
+import asyncio
 import datetime
 import jwt
 import psycopg2
@@ -14,17 +15,24 @@ import psycopg2.extras
 from contextlib import contextmanager
 from dotenv import load_dotenv
 import numpy as np
-import pandas as pd
-import matplotlib.pyplot as plt
 import time
 import csv
 from fpdf import FPDF
 from pathlib import Path
 import uuid
-import pyvisa
-from scipy.signal import find_peaks, savgol_filter
-from scipy import stats
-import pyodbc
+from .artifact_manager import register_artifact, touch_artifact
+from .vpi_analysis import extract_vpi
+from .lazy_imports import lazy_module
+from .module_registry import ModuleManifest
+from .audit_log import audit
+from .event_bus import notify_test
+from .spc import record_result as record_spc_result
+
+# Instrument, plotting and signal stacks are imported on first use
+plt = lazy_module('matplotlib.pyplot')
+pyvisa = lazy_module('pyvisa')
+pyodbc = lazy_module('pyodbc')
+signal = lazy_module('scipy.signal')
 
 # Load environment variables
 load_dotenv()
@@ -57,6 +65,15 @@ DATABASE_CONFIG = {
     'password': os.getenv('DB_PASSWORD', 'maq001')
 }
 
+# DC Vπ analysis parameters
+# Sample window [start, stop) of the smoothed capture used for the transfer plot
+VPI_ANALYSIS_WINDOW = (
+    int(os.getenv('DCVPI_WINDOW_START', '77')),
+    int(os.getenv('DCVPI_WINDOW_STOP', '357'))
+)
+# Archive each raw scope capture to its own compressed file
+VPI_ARCHIVE_RAW = os.getenv('DCVPI_ARCHIVE_RAW', 'false').lower() == 'true'
+
 # Instrument addresses
 SCOPE_ADDRESS = 'USB0::0x0699::0x03C7::C021517::INSTR'
 POWER_METER_ADDRESS = 'USB0::0x1313::0x80BB::M01217713::INSTR'
@@ -117,17 +134,8 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
 
 # Utility functions
 def log_action(user_id: int, action: str, module: str, details: str):
-    """Log user action"""
-    try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                INSERT INTO system_logs (user_id, action, module, details)
-                VALUES (%s, %s, %s, %s)
-            """, (user_id, action, module, details))
-            conn.commit()
-    except Exception as e:
-        print(f"Error logging action: {e}")
+    """Log user action (queued; written to system_logs in batches)"""
+    audit(user_id, action, module, details)
 
 # Pydantic models
 class ModulatorTestRequest(BaseModel):
@@ -136,6 +144,7 @@ class ModulatorTestRequest(BaseModel):
     operator: str
     input_power: float
     notes: Optional[str] = ""
+    archive_raw: Optional[bool] = None  # defaults to DCVPI_ARCHIVE_RAW
 
 class TestResultResponse(BaseModel):
     vpi_value: Optional[float]
@@ -145,6 +154,7 @@ class TestResultResponse(BaseModel):
     result: str
     drift: bool
     plot_filename: Optional[str]
+    vpi_statistics: Optional[dict] = None
 
 class ReportRequest(BaseModel):
     device_type: str
@@ -170,7 +180,9 @@ class ModulatorTestController:
         self.phaseangle = 0
         self.result = None
         self.slope = None
+        self.vpi_extraction = None
         self.voltage_range = [10]
+        self.analysis_window = VPI_ANALYSIS_WINDOW
         
     def connect_instruments(self):
         """Connect to all instruments"""
@@ -326,24 +338,30 @@ class ModulatorTestController:
     
     def detect_transitions(self, time_data, waveform_data):
         """Detect peaks and nulls in waveform data"""
-        peaks, _ = find_peaks(waveform_data, distance=30)
+        peaks, _ = signal.find_peaks(waveform_data, distance=30)
         peaks_time = time_data[peaks]
-        nulls, _ = find_peaks(-waveform_data, distance=30)
+        nulls, _ = signal.find_peaks(-waveform_data, distance=30)
         nulls_time = time_data[nulls]
         
         return peaks, nulls, peaks_time, nulls_time
     
-    def run_vpi_measurement(self, device_type, serial_number):
+    def run_vpi_measurement(self, device_type, serial_number, archive_raw=False):
         """Run VPI measurement"""
         if not self.connected:
             raise Exception("Instruments not connected")
         
+        # Results are per test, not accumulated across tests
+        self.vpi_values = []
+        self.phaseangle = 0
+        self.result = None
+        self.vpi_extraction = None
+        
         try:
             # Set voltage and capture waveforms
             for voltage in self.voltage_range:
                 self.set_modulator_bias_voltage(voltage)
                 time.sleep(0.5)
-                result = self._plot_waveforms_with_transitions(device_type, serial_number)
+                result = self._plot_waveforms_with_transitions(device_type, serial_number, archive_raw)
                 if result:
                     return result
             
@@ -353,7 +371,21 @@ class ModulatorTestController:
             print(f"❌ VPI measurement failed: {e}")
             raise Exception(f"VPI measurement failed: {str(e)}")
     
-    def _plot_waveforms_with_transitions(self, device_type, serial_number):
+    def _archive_raw_capture(self, device_type, serial_number, samplerate, time_data1, waveform_data1,
+                             time_data2, waveform_data2):
+        """Write one raw scope capture to a unique compressed file"""
+        timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+        archive_path = RESULTS_DIR / f"DCvpi_raw_{device_type}_{serial_number}_{timestamp}_{uuid.uuid4().hex[:8]}.npz"
+        np.savez_compressed(
+            archive_path,
+            time_ch1=time_data1, ch1=waveform_data1,
+            time_ch2=time_data2, ch2=waveform_data2,
+            samplerate=samplerate, analysis_window=np.array(self.analysis_window)
+        )
+        register_artifact(archive_path, 'dcvpi', serial_number, 'raw_archive')
+        return archive_path
+    
+    def _plot_waveforms_with_transitions(self, device_type, serial_number, archive_raw=False):
         """Plot waveforms and calculate VPI"""
         try:
             channel1 = 'CH1'  # Used for Vπ calculation
@@ -381,22 +413,20 @@ class ModulatorTestController:
                 
                 if time_data1 is not None and waveform_data1 is not None and time_data2 is not None and waveform_data2 is not None:
                     # Smooth the data
-                    smoothed_waveform_data1 = savgol_filter(waveform_data1, window_length=31, polyorder=3)
-                    smoothed_waveform_data2 = savgol_filter(waveform_data2, window_length=31, polyorder=3)
+                    smoothed_waveform_data1 = signal.savgol_filter(waveform_data1, window_length=31, polyorder=3)
+                    smoothed_waveform_data2 = signal.savgol_filter(waveform_data2, window_length=31, polyorder=3)
                     
-                    # Save data to CSV
-                    np.savetxt("waveform_data1.csv", 
-                              np.column_stack([smoothed_waveform_data1, smoothed_waveform_data2]), 
-                              delimiter=",", header="Voltage,Power", comments='')
+                    if archive_raw:
+                        self._archive_raw_capture(device_type, serial_number, samplerate,
+                                                  time_data1, waveform_data1, time_data2, waveform_data2)
                     
-                    # Read and filter data
-                    df = pd.read_csv('waveform_data1.csv')
-                    df_filtered = df.loc[77:356, ['Voltage', 'Power']]
+                    # Analysis window as views on the smoothed capture (no copy, no scratch file)
+                    window_start, window_stop = self.analysis_window
+                    drive_voltage_values = smoothed_waveform_data1[window_start:window_stop]
+                    output_power_values = smoothed_waveform_data2[window_start:window_stop]
                     
                     # Create plot
                     fig, ax = plt.subplots(figsize=(10, 6))
-                    drive_voltage_values = df_filtered['Voltage'].values
-                    output_power_values = df_filtered['Power'].values
                     
                     # Detect transitions
                     peaks, nulls, peaks_time, nulls_time = self.detect_transitions(drive_voltage_values, output_power_values)
@@ -420,46 +450,26 @@ class ModulatorTestController:
                     sample_rate = float(self.scope.query("HORizontal:MAIn:SAMPLERate?"))
                     samples_per_period = int(time_period * sample_rate)
                     
-                    start_index = 0
-                    end_index = int(samples_per_period)
+                    # All periods at once, on the full-length captures (indices stay aligned)
+                    extraction = extract_vpi(time_data1, waveform_data1, smoothed_waveform_data2,
+                                             samples_per_period, min_vpi, max_vpi)
+                    self.vpi_extraction = extraction
+                    self.slope = extraction['statistics']['ramp_slope']
                     
-                    while end_index <= len(waveform_data1):
-                        ramp_segment = waveform_data1[start_index:end_index]
-                        t_segment = time_data1[start_index:end_index]
-                        self.slope, intercept, r_value, p_value, std_err = stats.linregress(t_segment, ramp_segment)
-                        
-                        peak_indices, _ = find_peaks(output_power_values[start_index:end_index], distance=30)
-                        null_indices, _ = find_peaks(-output_power_values[start_index:end_index], distance=30)
+                    if extraction['vpi'] is not None:
+                        vpi_found = True
+                        self.vpi_values = extraction['accepted']
+                        self.phaseangle = extraction['phase_angle']
                         
-                        if len(peak_indices) > 0 and len(null_indices) > 0:
-                            ramp_values_at_peaks = ramp_segment[peak_indices]
-                            ramp_values_at_nulls = ramp_segment[null_indices]
-                            
-                            for peak, null in zip(ramp_values_at_peaks, ramp_values_at_nulls):
-                                vpi = abs(peak - null)
-                                if min_vpi <= vpi <= max_vpi:
-                                    self.vpi_values.append(vpi)
-                                    vpi_found = True
-                                    
-                                    # Calculate phase angle
-                                    closest_peak_index = np.argmin(np.abs(drive_voltage_values[peak_indices]))
-                                    bias_voltage_at_peak = drive_voltage_values[peak_indices[closest_peak_index]]
-                                    phase_angle = (bias_voltage_at_peak / vpi) * 180
-                                    self.phaseangle = phase_angle
-                                    break
-                        
-                        if vpi_found:
-                            # Save plot
-                            current_date = time.strftime('%Y-%m-%d')
-                            plot_filename = f'DCvpiplot_{device_type}_{serial_number}_{current_date}.png'
-                            plot_path = GRAPHS_DIR / plot_filename
-                            plt.savefig(plot_path)
-                            plt.close(fig)
-                            self.result = "PASS"
-                            return plot_filename
-                        
-                        start_index = end_index
-                        end_index += samples_per_period
+                        # Save plot
+                        current_date = time.strftime('%Y-%m-%d')
+                        plot_filename = f'DCvpiplot_{device_type}_{serial_number}_{current_date}.png'
+                        plot_path = GRAPHS_DIR / plot_filename
+                        plt.savefig(plot_path)
+                        plt.close(fig)
+                        register_artifact(plot_path, 'dcvpi', serial_number)
+                        self.result = "PASS"
+                        return plot_filename
                     
                     plt.close(fig)
                 
@@ -496,9 +506,11 @@ class ModulatorTestController:
             
             # Save data
             current_date = time.strftime('%Y-%m-%d')
-            np.savetxt(RESULTS_DIR / f"waveform_data_{device_type}_{serial_number}_{current_date}.csv", 
+            waveform_file = RESULTS_DIR / f"waveform_data_{device_type}_{serial_number}_{current_date}.csv"
+            np.savetxt(waveform_file, 
                       np.column_stack([x_data, y_data]), 
                       delimiter=",", header="Time,Power", comments='')
+            register_artifact(waveform_file, 'dcvpi', serial_number)
             
             # Filter valid data
             y_data = np.array(y_data)
@@ -512,7 +524,7 @@ class ModulatorTestController:
             null_power = np.min(y_data)
             
             # Find peaks and nulls
-            peaks, _ = find_peaks(y_data, prominence=0.1)
+            peaks, _ = signal.find_peaks(y_data, prominence=0.1)
             threshold = 0.9
             nulls = []
             
@@ -610,6 +622,9 @@ def save_test_result(test_data: dict):
             test_id = cursor.fetchone()[0]
             conn.commit()
             print(f"✅ Test result saved with ID: {test_id}")
+            # Update the SPC charts for this device type (never fails the save)
+            record_spc_result(conn, 'dcvpi', test_id, test_data['device_type'], test_data['serial_number'],
+                              test_data)
             return test_id
     except Exception as e:
         print(f"❌ Error saving test result: {e}")
@@ -673,6 +688,11 @@ async def run_modulator_test(
     if current_user['role'] not in ['admin', 'operator']:
         raise HTTPException(status_code=403, detail="Insufficient permissions")
     
+    notify_test('dcvpi', 'test_started', test_config.serial_number, {
+        "user": current_user['username'],
+        "device_type": test_config.device_type
+    })
+    
     try:
         # Ensure instruments are connected
         if not modulator_controller.connected:
@@ -680,8 +700,9 @@ async def run_modulator_test(
                 raise HTTPException(status_code=500, detail="Failed to connect to instruments")
         
         # Run VPI measurement
+        archive_raw = VPI_ARCHIVE_RAW if test_config.archive_raw is None else test_config.archive_raw
         plot_filename = modulator_controller.run_vpi_measurement(
-            test_config.device_type, test_config.serial_number
+            test_config.device_type, test_config.serial_number, archive_raw
         )
         
         # Run power measurement
@@ -690,7 +711,8 @@ async def run_modulator_test(
         )
         
         # Get results
-        vpi_value = np.mean(modulator_controller.vpi_values) if modulator_controller.vpi_values else None
+        extraction = modulator_controller.vpi_extraction
+        vpi_value = extraction['vpi'] if extraction else None
         phase_angle = modulator_controller.phaseangle
         result = modulator_controller.result
         
@@ -713,10 +735,17 @@ async def run_modulator_test(
             'plot_path': str(GRAPHS_DIR / plot_filename) if plot_filename else None
         }
         
-        test_id = save_test_result(test_data)
+        # Off the event loop: the SPC update can wait on chart row locks
+        test_id = await asyncio.to_thread(save_test_result, test_data)
         
         log_action(current_user['user_id'], 'run_modulator_test', 'modulator',
                   f"Test: {test_config.device_type} {test_config.serial_number} - {result}")
+        notify_test('dcvpi', 'test_completed', test_config.serial_number, {
+            "test_id": test_id,
+            "device_type": test_config.device_type,
+            "vpi_value": vpi_value,
+            "result": result
+        })
         
         return TestResultResponse(
             vpi_value=vpi_value,
@@ -725,11 +754,13 @@ async def run_modulator_test(
             phase_angle=phase_angle,
             result=result,
             drift=drift,
-            plot_filename=plot_filename
+            plot_filename=plot_filename,
+            vpi_statistics=extraction['statistics'] if extraction else None
         )
         
     except Exception as e:
         print(f"❌ Modulator test failed: {e}")
+        notify_test('dcvpi', 'test_error', test_config.serial_number, {"error": str(e)})
         raise HTTPException(status_code=500, detail=str(e))
 
 @modulator_router.get("/history")
@@ -789,6 +820,7 @@ async def get_graph_image(filename: str):
     try:
         file_path = GRAPHS_DIR / filename
         if file_path.exists():
+            touch_artifact(file_path)
             return FileResponse(file_path)
         else:
             raise HTTPException(status_code=404, detail="Graph image not found")
@@ -861,6 +893,7 @@ async def generate_pdf_report(
         pdf_filename = f"ModulatorTest_Report_{report_data.device_type}_{report_data.serial_number}_{timestamp}.pdf"
         pdf_path = REPORTS_DIR / pdf_filename
         pdf.output(str(pdf_path))
+        register_artifact(pdf_path, 'dcvpi', report_data.serial_number)
         
         log_action(current_user['user_id'], 'generate_report', 'modulator',
                   f"Generated report for {report_data.device_type} {report_data.serial_number}")
@@ -922,7 +955,17 @@ async def generate_pdf_report(
 # # Initialize tables on module load
 # init_modulator_tables()
 
+MODULE_MANIFEST = ModuleManifest(
+    name='dcvpi',
+    router=modulator_router,
+    prefix='/api/modulator',
+    tags=['Modulator Testing'],
+    health_probe=lambda: {"instruments_connected": modulator_controller.connected},
+    instrument_routes=['/status', '/run-test'],
+    instruments=[SCOPE_ADDRESS, POWER_METER_ADDRESS, FUNC_GEN_ADDRESS, AMP_ADDRESS]
+)
+
 # Export router
-__all__ = ['modulator_router']
+__all__ = ['MODULE_MANIFEST', 'modulator_router']
 
 print("✅ Modulator testing module loaded successfully")
\ No newline at end of file
@@ -0,0 +1,116 @@
+# modules/device_state.py - Device stage transitions: row-locked updates of devices plus an append-only device_events log
+
+from typing import Iterable, List, Optional
+import psycopg2.extras
+
+DEVICE_STATUSES = ('not_started', 'in_progress', 'completed')
+
+def status_for(current_stage: Optional[str], completed_tests) -> str:
+    """The status the old read-time CASE derived: completed stage, any completed test, or nothing yet"""
+    if current_stage == 'completed':
+        return 'completed'
+    return 'in_progress' if completed_tests else 'not_started'
+
+def lock_device(cursor, serial_number: str) -> Optional[dict]:
+    """Current state of a device, locking its row until the transaction ends"""
+    cursor.execute("""
+        SELECT serial_number, current_stage, completed_tests, status, device_type
+        FROM devices
+        WHERE serial_number = %s
+        FOR UPDATE
+    """, (serial_number,))
+    return cursor.fetchone()
+
+def record_event(cursor, serial_number: str, event_type: str, test_id: Optional[str] = None,
+                 from_stage: Optional[str] = None, to_stage: Optional[str] = None,
+                 from_status: Optional[str] = None, to_status: Optional[str] = None,
+                 user_id: Optional[int] = None):
+    """Append one transition to device_events"""
+    cursor.execute("""
+        INSERT INTO device_events (
+            serial_number, event_type, test_id, from_stage, to_stage, from_status, to_status, user_id
+        )
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+    """, (serial_number, event_type, test_id, from_stage, to_stage, from_status, to_status, user_id))
+
+def record_created(cursor, devices: Iterable[tuple], user_id: Optional[int] = None):
+    """'created' events for newly inserted (serial_number, first stage) pairs"""
+    rows = [(serial_number, 'created', None, None, stage, None, 'not_started', user_id)
+            for serial_number, stage in devices]
+    if rows:
+        psycopg2.extras.execute_values(cursor, """
+            INSERT INTO device_events (
+                serial_number, event_type, test_id, from_stage, to_stage, from_status, to_status, user_id
+            )
+            VALUES %s
+        """, rows, page_size=1000)
+
+def start_test(conn, serial_number: str, test_id: str, user_id: Optional[int] = None) -> Optional[dict]:
+    """Move a device to ``test_id``; returns the previous and new state, or None if the device does not exist"""
+    cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    previous = lock_device(cursor, serial_number)
+    if previous is None:
+        return None
+
+    status = status_for(test_id, previous['completed_tests'])
+    cursor.execute("""
+        UPDATE devices
+        SET current_stage = %s, status = %s, status_updated_at = CURRENT_TIMESTAMP
+        WHERE serial_number = %s
+    """, (test_id, status, serial_number))
+    record_event(cursor, serial_number, 'test_started', test_id,
+                 previous['current_stage'], test_id, previous['status'], status, user_id)
+    return {"previous": dict(previous), "current_stage": test_id, "status": status}
+
+def complete_test(conn, serial_number: str, test_id: str, next_stage: str,
+                  user_id: Optional[int] = None) -> Optional[dict]:
+    """Append ``test_id`` to completed_tests in SQL (once) and move to ``next_stage``; None if the device does not exist"""
+    cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    previous = lock_device(cursor, serial_number)
+    if previous is None:
+        return None
+
+    status = status_for(next_stage, True)
+    cursor.execute("""
+        UPDATE devices
+        SET completed_tests = CASE
+                WHEN %s = ANY(COALESCE(completed_tests, '{}')) THEN completed_tests
+                ELSE array_append(COALESCE(completed_tests, '{}'), %s)
+            END,
+            current_stage = %s,
+            status = %s,
+            status_updated_at = CURRENT_TIMESTAMP
+        WHERE serial_number = %s
+        RETURNING completed_tests
+    """, (test_id, test_id, next_stage, status, serial_number))
+    completed_tests: List[str] = list(cursor.fetchone()['completed_tests'] or [])
+    record_event(cursor, serial_number, 'test_completed', test_id,
+                 previous['current_stage'], next_stage, previous['status'], status, user_id)
+    return {
+        "previous": dict(previous),
+        "current_stage": next_stage,
+        "status": status,
+        "completed_tests": completed_tests
+    }
+
+def device_events(cursor, serial_number: str, limit: int = 500) -> List[dict]:
+    """A device's transitions in order, with seconds since the previous one (cycle time per step)"""
+    cursor.execute("""
+        SELECT id, event_type, test_id, from_stage, to_stage, from_status, to_status, user_id, created_at,
+               EXTRACT(EPOCH FROM created_at - LAG(created_at) OVER (ORDER BY id)) AS seconds_since_previous
+        FROM device_events
+        WHERE serial_number = %s
+        ORDER BY id
+        LIMIT %s
+    """, (serial_number, limit))
+    events = []
+    for row in cursor.fetchall():
+        event = dict(row)
+        event['created_at'] = event['created_at'].isoformat() if event['created_at'] else None
+        if event['seconds_since_previous'] is not None:
+            event['seconds_since_previous'] = float(event['seconds_since_previous'])
+        events.append(event)
+    return events
+
+__all__ = ['DEVICE_STATUSES', 'status_for', 'lock_device', 'record_event', 'record_created',
+           'start_test', 'complete_test', 'device_events']
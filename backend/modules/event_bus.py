@@ -0,0 +1,179 @@
+# modules/event_bus.py - In-process event bus: modules publish events, websocket topic subscribers receive them
+
+import os
+import asyncio
+import datetime
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional
+from .ws_hub import hub as default_hub, module_topic, user_topic
+
+# High-frequency events (progress, countdown ticks) are merged and sent at most this often per topic
+EVENT_COALESCE_INTERVAL = float(os.getenv('EVENT_COALESCE_INTERVAL', '0.5'))  # seconds
+# Topics whose last event is kept for replay to new subscribers
+EVENT_RETAIN_TOPICS = int(os.getenv('EVENT_RETAIN_TOPICS', '2000'))
+
+# Topic families clients may subscribe to (user:<id> is added per connection by the hub)
+TOPIC_PREFIXES = ('module:', 'device:', 'mo:', 'cure:')
+
+def device_topic(serial_number: str) -> str:
+    return f"device:{serial_number}"
+
+def mo_topic(mo_number: str) -> str:
+    return f"mo:{mo_number}"
+
+def cure_topic(chip_serial_number: str) -> str:
+    return f"cure:{chip_serial_number}"
+
+def is_subscribable(topic: str, user_id: int) -> bool:
+    """Topics a client may subscribe to: the known families and its own user topic"""
+    return topic.startswith(TOPIC_PREFIXES) or topic == user_topic(user_id)
+
+class EventBus:
+    """Publishes events to hub topics from any thread, coalesces bursts and keeps the last event per topic for replay"""
+
+    def __init__(self, hub=default_hub, coalesce_interval: float = EVENT_COALESCE_INTERVAL,
+                 retain_topics: int = EVENT_RETAIN_TOPICS):
+        self.hub = hub
+        self.coalesce_interval = coalesce_interval
+        self.retain_topics = retain_topics
+        self.lock = threading.Lock()
+        self.retained: OrderedDict = OrderedDict()  # topic -> last event
+        self.pending: OrderedDict = OrderedDict()   # (topic, type) -> (latest coalesced event, retain)
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.loop_thread: Optional[int] = None
+        self.flusher: Optional[asyncio.Task] = None
+        self.relay: Optional[Callable] = None  # relay(topic, message, raw, retain) forwards to other API workers
+        self.metrics = {
+            'published': 0,
+            'coalesced': 0,  # events superseded before they were sent
+            'replayed': 0,
+        }
+
+    def publish(self, topic: str, event_type: str, data: dict, coalesce: bool = False,
+                retain: bool = True, **fields) -> dict:
+        """Publish an event; safe to call from worker threads. ``coalesce`` keeps only the newest event of this type per interval"""
+        event = {
+            "type": event_type,
+            "topic": topic,
+            **fields,
+            "data": data,
+            "timestamp": datetime.datetime.utcnow().isoformat()
+        }
+        with self.lock:
+            self.metrics['published'] += 1
+            if retain:
+                self.retained[topic] = event
+                self.retained.move_to_end(topic)
+                while len(self.retained) > self.retain_topics:
+                    self.retained.popitem(last=False)
+            if coalesce and self.flusher is not None:
+                key = (topic, event_type)
+                if key in self.pending:
+                    self.metrics['coalesced'] += 1
+                self.pending[key] = (event, retain)
+                return event
+            # A direct event (e.g. test_completed) supersedes coalesced ones still waiting on the same topic
+            for key in [key for key in self.pending if key[0] == topic]:
+                del self.pending[key]
+                self.metrics['coalesced'] += 1
+        self._dispatch(topic, event)
+        if self.relay:
+            self.relay(topic, event, False, retain)
+        return event
+
+    def broadcast(self, topic: str, message: dict):
+        """Send a plain hub message (no event envelope, not retained) on this and every other worker"""
+        self._dispatch(topic, message)
+        if self.relay:
+            self.relay(topic, message, True, False)
+
+    def deliver(self, topic: str, message: dict, raw: bool = False, retain: bool = True):
+        """Hand an event relayed from another worker to this worker's subscribers; safe from any thread"""
+        if not raw and retain:
+            with self.lock:
+                self.retained[topic] = message
+                self.retained.move_to_end(topic)
+                while len(self.retained) > self.retain_topics:
+                    self.retained.popitem(last=False)
+        self._dispatch(topic, message)
+
+    def _dispatch(self, topic: str, event: dict):
+        if self.loop is None or threading.get_ident() == self.loop_thread:
+            try:
+                asyncio.get_running_loop()
+            except RuntimeError:
+                return  # no event loop (CLI/scripts): retained only
+            self.hub.publish(topic, event)
+        elif not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.hub.publish, topic, event)
+
+    def replay(self, conn, topic: str) -> bool:
+        """Send the last retained event on ``topic`` to a new subscriber"""
+        with self.lock:
+            event = self.retained.get(topic)
+        if event is None:
+            return False
+        self.metrics['replayed'] += 1
+        return self.hub.send(conn, {**event, "replay": True})
+
+    def last_event(self, topic: str) -> Optional[dict]:
+        with self.lock:
+            return self.retained.get(topic)
+
+    def flush(self) -> int:
+        """Send pending coalesced events (called on the event loop)"""
+        with self.lock:
+            events = list(self.pending.values())
+            self.pending.clear()
+        for event, retain in events:
+            self.hub.publish(event["topic"], event)
+            if self.relay:
+                self.relay(event["topic"], event, False, retain)
+        return len(events)
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.coalesce_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Event bus flush error: {e}")
+
+    async def start(self):
+        """Bind to the running loop and start the coalescing flusher"""
+        self.loop = asyncio.get_running_loop()
+        self.loop_thread = threading.get_ident()
+        if self.flusher is None:
+            self.flusher = asyncio.create_task(self._flush_periodically())
+
+    async def stop(self):
+        if self.flusher is not None:
+            self.flusher.cancel()
+            self.flusher = None
+        self.flush()
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {**self.metrics, 'retained_topics': len(self.retained), 'pending': len(self.pending)}
+
+# Shared by the API server and the module routers
+event_bus = EventBus()
+
+def notify_module(module: str, message_type: str, data: dict, coalesce: bool = False) -> dict:
+    """Publish the standard module notification envelope to the module's subscribers"""
+    return event_bus.publish(module_topic(module), message_type, data, coalesce=coalesce, module=module)
+
+def publish_event(topic: str, event_type: str, data: dict, coalesce: bool = False) -> dict:
+    """Publish an event on a device:/mo:/cure: topic"""
+    return event_bus.publish(topic, event_type, data, coalesce=coalesce)
+
+def notify_test(module: str, event_type: str, serial_number: Optional[str], data: dict, coalesce: bool = False):
+    """Test lifecycle event (test_started/test_completed/test_error) on the module and device topics"""
+    payload = {"serial_number": serial_number, **data}
+    notify_module(module, event_type, payload, coalesce=coalesce)
+    if serial_number:
+        event_bus.publish(device_topic(serial_number), event_type, payload, coalesce=coalesce, module=module)
+
+__all__ = ['EventBus', 'event_bus', 'notify_module', 'notify_test', 'publish_event', 'is_subscribable',
+           'device_topic', 'mo_topic', 'cure_topic']
@@ -0,0 +1,387 @@
+# modules/export_module.py - Streaming bulk export of station test results as CSV, Parquet or Arrow
+
+from fastapi import APIRouter, HTTPException, Depends
+from fastapi.responses import StreamingResponse
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from starlette.background import BackgroundTask
+from typing import Iterator, List, Optional
+import os
+import io
+import csv
+import json
+import uuid
+import asyncio
+import datetime
+import threading
+import importlib.util
+import jwt
+import psycopg2
+from dotenv import load_dotenv
+from .module_registry import ModuleManifest
+from .audit_log import audit
+from .lazy_imports import lazy_module
+
+# Load environment variables
+load_dotenv()
+
+# Router for result exports
+export_router = APIRouter()
+
+# Security
+security = HTTPBearer()
+SECRET_KEY = os.getenv('SECRET_KEY', 'default-dev-key-change-in-production')
+
+# Database configuration (exports use their own connections so long downloads never hold pool connections)
+DATABASE_CONFIG = {
+    'host': os.getenv('DB_HOST', '192.168.99.121'),
+    'port': int(os.getenv('DB_PORT', '5432')),
+    'database': os.getenv('DB_NAME', 'postgres'),
+    'user': os.getenv('DB_USER', 'postgres'),
+    'password': os.getenv('DB_PASSWORD', 'karthi')
+}
+
+# Rows fetched from the server-side cursor per round trip (and per CSV chunk / Arrow batch / Parquet row group)
+EXPORT_ITERSIZE = int(os.getenv('EXPORT_ITERSIZE', '5000'))
+# Exports streaming at the same time; further requests get 429
+EXPORT_MAX_CONCURRENT = int(os.getenv('EXPORT_MAX_CONCURRENT', '3'))
+
+# pyarrow is optional; CSV is always available
+pa = lazy_module('pyarrow')
+pa_ipc = lazy_module('pyarrow.ipc')
+pq = lazy_module('pyarrow.parquet')
+PYARROW_AVAILABLE = importlib.util.find_spec('pyarrow') is not None
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrows'),
+}
+
+# Column kinds: int, float, text, timestamp, bool; traces are JSON arrays stored as text
+EXPORT_SOURCES = {
+    's11': {
+        'table': 's11_test_results', 'serial': 'housing_sno', 'timestamp': '"timestamp"',
+        'columns': [('id', 'int'), ('test_id', 'text'), ('device_type', 'text'), ('chips_no', 'text'),
+                    ('housing_sno', 'text'), ('housing_lno', 'text'), ('operator', 'text'), ('result', 'text'),
+                    ('failure_details', 'text'), ('"timestamp"', 'timestamp')],
+        'traces': ['frequency_data', 'magnitude_data', 'limit_data']
+    },
+    's21': {
+        'table': 's21_test_results', 'serial': 'serial_number', 'timestamp': 'test_date',
+        'columns': [('id', 'int'), ('device_type', 'text'), ('serial_number', 'text'), ('product_number', 'text'),
+                    ('s21_bandwidth', 'float'), ('frequency_3db', 'float'), ('ripple_result', 'text'),
+                    ('overall_result', 'text'), ('operator', 'text'), ('notes', 'text'), ('test_date', 'timestamp')],
+        'traces': []
+    },
+    'twotone': {
+        'table': 'twotone_test_results', 'serial': 'serial_number', 'timestamp': 'test_date',
+        'columns': [('id', 'int'), ('device_type', 'text'), ('serial_number', 'text'), ('rf_vpi_1ghz', 'float'),
+                    ('mixterm1', 'float'), ('mixterm2', 'float'), ('fundamental_term1', 'float'),
+                    ('fundamental_term2', 'float'), ('result', 'text'), ('operator', 'text'), ('notes', 'text'),
+                    ('test_date', 'timestamp')],
+        'traces': []
+    },
+    'dcvpi': {
+        'table': 'modulator_test_results', 'serial': 'serial_number', 'timestamp': 'test_date',
+        'columns': [('id', 'int'), ('device_type', 'text'), ('serial_number', 'text'), ('vpi_value', 'float'),
+                    ('insertion_loss', 'float'), ('extinction_ratio', 'float'), ('phase_angle', 'float'),
+                    ('result', 'text'), ('drift', 'bool'), ('operator', 'text'), ('notes', 'text'),
+                    ('test_date', 'timestamp')],
+        'traces': []
+    },
+}
+
+_SQL_CASTS = {'int': 'BIGINT', 'float': 'DOUBLE PRECISION', 'text': 'TEXT', 'timestamp': 'TIMESTAMP', 'bool': 'BOOLEAN'}
+
+# Concurrent export slots
+_export_slots = threading.BoundedSemaphore(EXPORT_MAX_CONCURRENT)
+export_state = {'active': 0, 'completed': 0, 'failed': 0, 'rows_exported': 0}
+_state_lock = threading.Lock()
+
+# Authentication functions
+def verify_jwt_token(token: str) -> dict:
+    """Verify JWT token and return user data"""
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
+        return payload
+    except jwt.ExpiredSignatureError:
+        raise HTTPException(status_code=401, detail="Token expired. Please login again.")
+    except jwt.InvalidTokenError:
+        raise HTTPException(status_code=401, detail="Invalid token. Please login again.")
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
+    """Get current user from JWT token"""
+    return verify_jwt_token(credentials.credentials)
+
+def log_action(user_id: int, action: str, module: str, details: str):
+    """Log user action to system logs"""
+    audit(user_id, action, module, details)
+
+# Query building
+def _column_name(column: str) -> str:
+    return column.strip('"')
+
+def export_columns(source: str, include_traces: bool) -> List[tuple]:
+    """(name, kind) of every exported column, in output order"""
+    spec = EXPORT_SOURCES[source]
+    columns = [(_column_name(column), kind) for column, kind in spec['columns']]
+    columns.append(('manufacturing_order_number', 'text'))
+    if include_traces:
+        columns += [(trace, 'trace') for trace in spec['traces']]
+    return columns
+
+def export_query(source: str, include_traces: bool, has_devices: bool, device_type: Optional[str] = None,
+                 start: Optional[datetime.datetime] = None, end: Optional[datetime.datetime] = None,
+                 manufacturing_order: Optional[str] = None) -> tuple:
+    """SELECT and parameters for an export, oldest first"""
+    spec = EXPORT_SOURCES[source]
+    select = [f"s.{column}::{_SQL_CASTS[kind]} AS {_column_name(column)}" for column, kind in spec['columns']]
+    select.append("d.manufacturing_order_number" if has_devices else "NULL::TEXT AS manufacturing_order_number")
+    if include_traces:
+        select += [f"s.{trace}" for trace in spec['traces']]
+
+    query = f"SELECT {', '.join(select)} FROM {spec['table']} s"
+    if has_devices:
+        query += f" LEFT JOIN devices d ON d.serial_number = s.{spec['serial']}"
+
+    conditions, params = [], []
+    if device_type:
+        conditions.append("s.device_type = %s")
+        params.append(device_type)
+    if start:
+        conditions.append(f"s.{spec['timestamp']} >= %s")
+        params.append(start)
+    if end:
+        conditions.append(f"s.{spec['timestamp']} < %s")
+        params.append(end)
+    if manufacturing_order:
+        conditions.append("d.manufacturing_order_number = %s")
+        params.append(manufacturing_order)
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    return query + " ORDER BY s.id", params
+
+def _decode_trace(value) -> Optional[list]:
+    if not value:
+        return None
+    try:
+        return [float(x) for x in json.loads(value)]
+    except (ValueError, TypeError):
+        return None
+
+# Streaming
+def stream_batches(query: str, params: list, itersize: int = EXPORT_ITERSIZE) -> Iterator[list]:
+    """Row batches from a server-side cursor on a dedicated read-only connection"""
+    conn = psycopg2.connect(**DATABASE_CONFIG)
+    try:
+        conn.set_session(readonly=True)
+        cursor = conn.cursor(name=f"export_{uuid.uuid4().hex[:12]}")
+        cursor.itersize = itersize
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(itersize)
+            if not rows:
+                break
+            yield rows
+        cursor.close()
+        conn.rollback()
+    finally:
+        conn.close()
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that collects bytes until the response generator takes them"""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def take(self) -> bytes:
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+def csv_chunks(batches: Iterator[list], columns: List[tuple]) -> Iterator[bytes]:
+    """Header then one encoded chunk per batch; traces stay JSON arrays"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([name for name, _ in columns])
+    for rows in batches:
+        for row in rows:
+            writer.writerow(['' if value is None else value.isoformat() if isinstance(value, datetime.datetime) else value
+                             for value in row])
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+def arrow_schema(columns: List[tuple]):
+    types = {'int': pa.int64(), 'float': pa.float64(), 'text': pa.string(), 'timestamp': pa.timestamp('us'),
+             'bool': pa.bool_(), 'trace': pa.list_(pa.float64())}
+    return pa.schema([(name, types[kind]) for name, kind in columns])
+
+def arrow_chunks(batches: Iterator[list], columns: List[tuple], export_format: str) -> Iterator[bytes]:
+    """Arrow IPC stream or Parquet file written batch by batch (one record batch / row group per fetch)"""
+    schema = arrow_schema(columns)
+    trace_positions = [i for i, (_, kind) in enumerate(columns) if kind == 'trace']
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema) if export_format == 'parquet' else pa_ipc.new_stream(sink, schema)
+    try:
+        for rows in batches:
+            values = list(zip(*rows))
+            for i in trace_positions:
+                values[i] = [_decode_trace(value) for value in values[i]]
+            batch = pa.RecordBatch.from_arrays([pa.array(column, type=field.type)
+                                                for column, field in zip(values, schema)], schema=schema)
+            writer.write_batch(batch)
+            yield sink.take()
+    finally:
+        writer.close()
+    yield sink.take()
+
+class _ExportSlot:
+    """One held export slot, released exactly once (stream end or response teardown)"""
+
+    def __init__(self):
+        self.released = False
+        self.lock = threading.Lock()
+
+    def release(self):
+        with self.lock:
+            if self.released:
+                return
+            self.released = True
+        _export_slots.release()
+        with _state_lock:
+            export_state['active'] -= 1
+
+def export_stream(slot: _ExportSlot, query: str, params: list, columns: List[tuple],
+                  export_format: str) -> Iterator[bytes]:
+    """Encoded response body; iterated in the threadpool so the event loop stays free"""
+    rows_exported = 0
+
+    def counted(batches):
+        nonlocal rows_exported
+        for rows in batches:
+            rows_exported += len(rows)
+            yield rows
+
+    batches = counted(stream_batches(query, params))
+    try:
+        if export_format == 'csv':
+            yield from csv_chunks(batches, columns)
+        else:
+            yield from arrow_chunks(batches, columns, export_format)
+        with _state_lock:
+            export_state['completed'] += 1
+    except Exception as e:
+        with _state_lock:
+            export_state['failed'] += 1
+        print(f"❌ Export failed after {rows_exported} rows: {e}")
+        raise
+    finally:
+        batches.close()
+        with _state_lock:
+            export_state['rows_exported'] += rows_exported
+        slot.release()
+
+def _has_devices_table() -> bool:
+    conn = psycopg2.connect(**DATABASE_CONFIG)
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT to_regclass('public.devices') IS NOT NULL")
+        return cursor.fetchone()[0]
+    finally:
+        conn.close()
+
+# API Endpoints
+@export_router.get("/sources")
+async def list_export_sources(current_user: dict = Depends(get_current_user)):
+    """Exportable result sets, their columns and the available formats"""
+    return {
+        "sources": {
+            source: {
+                "table": spec['table'],
+                "columns": [name for name, _ in export_columns(source, False)],
+                "traces": spec['traces']
+            }
+            for source, spec in EXPORT_SOURCES.items()
+        },
+        "formats": [name for name in EXPORT_FORMATS if name == 'csv' or PYARROW_AVAILABLE],
+        "batch_rows": EXPORT_ITERSIZE
+    }
+
+@export_router.get("/{source}")
+async def export_results(
+    source: str,
+    format: str = 'csv',
+    device_type: Optional[str] = None,
+    start: Optional[datetime.datetime] = None,
+    end: Optional[datetime.datetime] = None,
+    manufacturing_order: Optional[str] = None,
+    include_traces: bool = False,
+    current_user: dict = Depends(get_current_user)
+):
+    """Stream every matching result row (``start`` inclusive, ``end`` exclusive) as CSV, Parquet or Arrow"""
+    if source not in EXPORT_SOURCES:
+        raise HTTPException(status_code=404, detail=f"Unknown export source: {source}")
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format: {format}")
+    if format != 'csv' and not PYARROW_AVAILABLE:
+        raise HTTPException(status_code=501, detail=f"{format} export requires pyarrow on the server")
+
+    if not _export_slots.acquire(blocking=False):
+        raise HTTPException(status_code=429, detail="Too many exports running; try again shortly")
+    with _state_lock:
+        export_state['active'] += 1
+    slot = _ExportSlot()
+
+    try:
+        has_devices = await asyncio.to_thread(_has_devices_table)
+        if manufacturing_order and not has_devices:
+            raise HTTPException(status_code=400, detail="Manufacturing order filter needs the devices table")
+        columns = export_columns(source, include_traces)
+        query, params = export_query(source, include_traces, has_devices, device_type,
+                                     start, end, manufacturing_order)
+    except HTTPException:
+        slot.release()
+        raise
+    except Exception as e:
+        slot.release()
+        raise HTTPException(status_code=500, detail=f"Failed to start export: {str(e)}")
+
+    media_type, extension = EXPORT_FORMATS[format]
+    filename = f"{source}_results_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}"
+    log_action(current_user['user_id'], 'export_results', 'export',
+               f"Exported {source} as {format} (device_type={device_type}, start={start}, end={end}, "
+               f"mo={manufacturing_order}, traces={include_traces})")
+    return StreamingResponse(
+        export_stream(slot, query, params, columns, format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+        background=BackgroundTask(slot.release)  # when the stream never started
+    )
+
+MODULE_MANIFEST = ModuleManifest(
+    name='export',
+    router=export_router,
+    prefix='/api/export',
+    tags=['Data Export'],
+    health_probe=lambda: {**export_state, 'pyarrow': PYARROW_AVAILABLE}
+)
+
+# Export router and helpers
+__all__ = ['MODULE_MANIFEST', 'export_router', 'export_query', 'export_columns', 'stream_batches']
+
+print("✅ Data export module loaded successfully")
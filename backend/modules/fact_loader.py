@@ -0,0 +1,345 @@
+# modules/fact_loader.py - Incremental ETL from the station result tables into analytics.fact_test_results
+
+import os
+import sys
+import time
+import asyncio
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+from .pg_listener import pg_listener, DATABASE_CONFIG
+from .cluster import leader
+
+# Rows per upsert batch
+ETL_BATCH_SIZE = int(os.getenv('ETL_BATCH_SIZE', '5000'))
+# Seconds between watermark polls while NOTIFY is unavailable (and as a safety net while it is)
+ETL_POLL_INTERVAL = float(os.getenv('ETL_POLL_INTERVAL', '5'))
+ETL_IDLE_POLL_INTERVAL = float(os.getenv('ETL_IDLE_POLL_INTERVAL', '60'))
+# Ids below the watermark re-checked each pass: a transaction that took a lower id can commit after a higher one
+ETL_LOOKBACK_IDS = int(os.getenv('ETL_LOOKBACK_IDS', '200'))
+# Hours of rows re-synced after the LISTEN connection comes back (edits made meanwhile were not notified)
+ETL_RESYNC_HOURS = int(os.getenv('ETL_RESYNC_HOURS', '24'))
+
+ETL_CHANNEL = 'fact_source_changed'
+
+# Source table -> how its rows map onto the fact table (measurements in measurement_1..3 order).
+# metric_1 is the dashboard's processing time; no result table records a duration, so the loader leaves it NULL.
+FACT_SOURCES = {
+    's11_test_results': {
+        'test_type': 's11', 'serial': 'housing_sno', 'result': 'result', 'timestamp': '"timestamp"',
+        'measurements': []
+    },
+    's21_test_results': {
+        'test_type': 'sparameter', 'serial': 'serial_number', 'result': 'overall_result', 'timestamp': 'test_date',
+        'measurements': ['s21_bandwidth', 'frequency_3db']
+    },
+    'twotone_test_results': {
+        'test_type': 'twotone', 'serial': 'serial_number', 'result': 'result', 'timestamp': 'test_date',
+        'measurements': ['rf_vpi_1ghz', 'mixterm1', 'mixterm2']
+    },
+    'modulator_test_results': {
+        'test_type': 'dc_vpi', 'serial': 'serial_number', 'result': 'result', 'timestamp': 'test_date',
+        'measurements': ['vpi_value', 'insertion_loss', 'extinction_ratio']
+    },
+}
+
+FACT_COLUMNS = ('source_table', 'source_id', 'test_type', 'serial_number', 'device_type', 'result',
+                'operator_name', 'test_timestamp', 'measurement_1', 'measurement_2', 'measurement_3')
+
+def source_select(table: str) -> str:
+    """SELECT producing fact rows from a source table (filter appended by the caller)"""
+    spec = FACT_SOURCES[table]
+    measurements = [f"s.{column}::DOUBLE PRECISION" for column in spec['measurements']]
+    measurements += ['NULL::DOUBLE PRECISION'] * (3 - len(measurements))
+    return f"""
+        SELECT '{table}'::VARCHAR AS source_table, s.id::BIGINT AS source_id, '{spec['test_type']}'::VARCHAR AS test_type,
+               s.{spec['serial']} AS serial_number, s.device_type, UPPER(s.{spec['result']}) AS result,
+               s.operator AS operator_name, s.{spec['timestamp']} AS test_timestamp,
+               {measurements[0]} AS measurement_1, {measurements[1]} AS measurement_2,
+               {measurements[2]} AS measurement_3
+        FROM {table} s
+    """
+
+def upsert_sql(table: str, where: str, limit: bool = False) -> str:
+    """Upsert the selected source rows; returns (highest source id read, rows read, rows written)"""
+    updates = ', '.join(f"{column} = EXCLUDED.{column}" for column in FACT_COLUMNS[2:])
+    changed = ' OR '.join(f"f.{column} IS DISTINCT FROM EXCLUDED.{column}" for column in FACT_COLUMNS[2:])
+    return f"""
+        WITH batch AS (
+            {source_select(table)}
+            WHERE {where}
+            ORDER BY s.id
+            {'LIMIT %s' if limit else ''}
+        ), written AS (
+            INSERT INTO analytics.fact_test_results AS f ({', '.join(FACT_COLUMNS)})
+            SELECT {', '.join(FACT_COLUMNS)} FROM batch
+            ON CONFLICT (source_table, source_id) DO UPDATE SET {updates}, loaded_at = CURRENT_TIMESTAMP
+            WHERE {changed}
+            RETURNING 1
+        )
+        SELECT (SELECT MAX(source_id) FROM batch), (SELECT COUNT(*) FROM batch), (SELECT COUNT(*) FROM written)
+    """
+
+class FactLoader:
+    """Keeps analytics.fact_test_results in step with the result tables using per-table id watermarks"""
+
+    def __init__(self, get_db_connection: Callable, batch_size: int = ETL_BATCH_SIZE):
+        self.get_db_connection = get_db_connection
+        self.batch_size = batch_size
+        self.lock = threading.Lock()
+        self.changed: Dict[str, set] = {}  # table -> source ids edited or deleted below the watermark
+        self.resync_pending = False
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.wakeup: Optional[asyncio.Event] = None
+        self.task: Optional[asyncio.Task] = None
+        self.metrics = {'runs': 0, 'rows_written': 0, 'rows_deleted': 0, 'errors': 0,
+                        'last_run_at': None, 'last_error': None}
+
+    # Database steps (each in its own transaction)
+    def existing_sources(self, cursor) -> List[str]:
+        cursor.execute("SELECT relname FROM pg_class WHERE relkind IN ('r', 'p') AND relname = ANY(%s)",
+                       (list(FACT_SOURCES),))
+        return [row[0] for row in cursor.fetchall()]
+
+    def load_new(self, table: str) -> int:
+        """Upsert rows above the table's watermark in batches; the watermark moves in the same transaction"""
+        written_total = 0
+        while True:
+            with self.get_db_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    INSERT INTO analytics.etl_watermarks (source_table) VALUES (%s)
+                    ON CONFLICT (source_table) DO NOTHING
+                """, (table,))
+                cursor.execute("SELECT last_id FROM analytics.etl_watermarks WHERE source_table = %s FOR UPDATE",
+                               (table,))
+                last_id = cursor.fetchone()[0]
+                cursor.execute(upsert_sql(table, "s.id > %s", limit=True), (last_id, self.batch_size))
+                max_id, read, written = cursor.fetchone()
+                if max_id is not None:
+                    cursor.execute("""
+                        UPDATE analytics.etl_watermarks
+                        SET last_id = %s, rows_loaded = rows_loaded + %s, last_run_at = CURRENT_TIMESTAMP
+                        WHERE source_table = %s
+                    """, (max_id, written, table))
+                conn.commit()
+            written_total += written
+            if read < self.batch_size:
+                return written_total  # caught up; a full batch means there may be more
+
+    def recheck_tail(self, table: str, lookback: int = ETL_LOOKBACK_IDS) -> int:
+        """Upsert the ids just below the watermark (rows that committed late); unchanged rows are not rewritten"""
+        with self.get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT last_id FROM analytics.etl_watermarks WHERE source_table = %s", (table,))
+            row = cursor.fetchone()
+            if not row or not row[0]:
+                return 0
+            cursor.execute(upsert_sql(table, "s.id > %s AND s.id <= %s"), (max(row[0] - lookback, 0), row[0]))
+            _, _, written = cursor.fetchone()
+            conn.commit()
+        return written
+
+    def load_changed(self, table: str, source_ids: List[int]) -> tuple:
+        """Re-load edited rows and drop facts whose source row was deleted"""
+        with self.get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(upsert_sql(table, "s.id = ANY(%s)"), (source_ids,))
+            _, _, written = cursor.fetchone()
+            cursor.execute(f"""
+                DELETE FROM analytics.fact_test_results f
+                WHERE f.source_table = %s AND f.source_id = ANY(%s)
+                  AND NOT EXISTS (SELECT 1 FROM {table} s WHERE s.id = f.source_id)
+            """, (table, source_ids))
+            deleted = cursor.rowcount
+            conn.commit()
+        return written, deleted
+
+    def load_range(self, table: str, low: int, high: int) -> int:
+        """Upsert source ids in [low, high] (backfill chunk)"""
+        with self.get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(upsert_sql(table, "s.id BETWEEN %s AND %s"), (low, high))
+            _, _, written = cursor.fetchone()
+            conn.commit()
+        return written
+
+    def resync_recent(self, table: str, hours: int = ETL_RESYNC_HOURS) -> int:
+        """Upsert rows from the last ``hours`` (after missed notifications)"""
+        spec = FACT_SOURCES[table]
+        with self.get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(upsert_sql(table, f"s.{spec['timestamp']} >= NOW() - make_interval(hours => %s)"), (hours,))
+            _, _, written = cursor.fetchone()
+            conn.commit()
+        return written
+
+    def run_once(self) -> dict:
+        """One incremental pass over every source table"""
+        with self.lock:
+            changed, self.changed = self.changed, {}
+            resync, self.resync_pending = self.resync_pending, False
+
+        with self.get_db_connection() as conn:
+            tables = self.existing_sources(conn.cursor())
+
+        summary = {}
+        for table in tables:
+            written = self.load_new(table) + self.recheck_tail(table)
+            deleted = 0
+            if table in changed:
+                changed_written, deleted = self.load_changed(table, sorted(changed[table]))
+                written += changed_written
+            if resync:
+                written += self.resync_recent(table)
+            if written or deleted:
+                summary[table] = {'written': written, 'deleted': deleted}
+            self.metrics['rows_written'] += written
+            self.metrics['rows_deleted'] += deleted
+        self.metrics['runs'] += 1
+        self.metrics['last_run_at'] = datetime.datetime.now().isoformat()
+        return summary
+
+    def backfill(self, tables: Optional[List[str]] = None, chunk_size: int = 20000, workers: int = 4) -> dict:
+        """Load full history in id-range chunks on parallel connections, then move the watermarks past it"""
+        with self.get_db_connection() as conn:
+            cursor = conn.cursor()
+            tables = [t for t in (tables or list(FACT_SOURCES)) if t in self.existing_sources(cursor)]
+            bounds = {}
+            for table in tables:
+                cursor.execute(f"SELECT MIN(id), MAX(id) FROM {table}")
+                bounds[table] = cursor.fetchone()
+
+        chunks = [(table, low, min(low + chunk_size - 1, high))
+                  for table, (first, high) in bounds.items() if first is not None
+                  for low in range(first, high + 1, chunk_size)]
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            written = list(pool.map(lambda chunk: self.load_range(*chunk), chunks))
+
+        with self.get_db_connection() as conn:
+            cursor = conn.cursor()
+            for table, (_, high) in bounds.items():
+                if high is None:
+                    continue
+                cursor.execute("""
+                    INSERT INTO analytics.etl_watermarks (source_table, last_id, last_run_at)
+                    VALUES (%s, %s, CURRENT_TIMESTAMP)
+                    ON CONFLICT (source_table) DO UPDATE
+                    SET last_id = GREATEST(etl_watermarks.last_id, EXCLUDED.last_id), last_run_at = CURRENT_TIMESTAMP
+                """, (table, high))
+            conn.commit()
+
+        self.metrics['rows_written'] += sum(written)
+        return {
+            "tables": {table: {"min_id": low, "max_id": high} for table, (low, high) in bounds.items()},
+            "chunks": len(chunks),
+            "rows_written": sum(written),
+            "elapsed_ms": int((time.perf_counter() - started) * 1000)
+        }
+
+    def watermarks(self) -> List[dict]:
+        with self.get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT source_table, last_id, rows_loaded, last_run_at
+                FROM analytics.etl_watermarks
+                ORDER BY source_table
+            """)
+            return [{"source_table": table, "last_id": last_id, "rows_loaded": rows_loaded,
+                     "last_run_at": last_run_at.isoformat() if last_run_at else None}
+                    for table, last_id, rows_loaded, last_run_at in cursor.fetchall()]
+
+    # Notifications (listener thread)
+    def _on_notify(self, payload: str):
+        table, _, source_id = payload.partition(':')
+        if table not in FACT_SOURCES or not leader.is_leader:
+            return  # another worker loads; a takeover resyncs
+        if source_id:
+            with self.lock:
+                self.changed.setdefault(table, set()).add(int(source_id))
+        self._wake()
+
+    def _on_reconnect(self):
+        with self.lock:
+            self.resync_pending = True
+        self._wake()
+
+    def _wake(self):
+        if self.loop is not None and self.wakeup is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.wakeup.set)
+
+    # Background loop
+    async def _run(self):
+        while True:
+            interval = ETL_IDLE_POLL_INTERVAL if pg_listener.connected else ETL_POLL_INTERVAL
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), interval)
+                await asyncio.sleep(0.2)  # let a burst of inserts land in one pass
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            if not leader.is_leader:
+                continue
+            try:
+                summary = await asyncio.to_thread(self.run_once)
+                if summary:
+                    print(f"📈 Analytics ETL: {summary}")
+            except Exception as e:
+                self.metrics['errors'] += 1
+                self.metrics['last_error'] = str(e)
+                print(f"Analytics ETL error: {e}")
+
+    async def start(self):
+        """Listen for result table changes and start loading (first pass right away)"""
+        self.loop = asyncio.get_running_loop()
+        self.wakeup = asyncio.Event()
+        self.wakeup.set()
+        pg_listener.listen(ETL_CHANNEL, self._on_notify, on_reconnect=self._on_reconnect)
+        pg_listener.start()
+        leader.on_elected(self._on_reconnect)
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    def stats(self) -> dict:
+        with self.lock:
+            pending = sum(len(ids) for ids in self.changed.values())
+        return {**self.metrics, 'pending_changed_rows': pending}
+
+def main(argv: list) -> int:
+    """Command line entry point: status, run, or backfill [table ...]"""
+    import psycopg2
+    command = argv[1] if len(argv) > 1 else 'status'
+    if command not in ('status', 'run', 'backfill'):
+        print("Usage: python -m modules.fact_loader [status|run|backfill [table ...]]")
+        return 2
+
+    @contextmanager
+    def connect():
+        conn = psycopg2.connect(**DATABASE_CONFIG)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    loader = FactLoader(connect)
+    if command == 'backfill':
+        result = loader.backfill(argv[2:] or None)
+        print(f"🎉 Backfilled {result['rows_written']} rows in {result['chunks']} chunk(s), {result['elapsed_ms']} ms")
+    elif command == 'run':
+        print(f"✅ Incremental pass: {loader.run_once() or 'nothing new'}")
+    for mark in loader.watermarks():
+        print(f"  📋 {mark['source_table']:24s} last id {mark['last_id']:>8} | {mark['rows_loaded']} rows | {mark['last_run_at']}")
+    return 0
+
+__all__ = ['FactLoader', 'FACT_SOURCES', 'source_select', 'upsert_sql']
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,108 @@
+# modules/grouped_stats.py - Statistics in one scan (FILTER aggregates over GROUPING SETS) with a short-lived memo
+
+import os
+import time
+import threading
+from decimal import Decimal
+from typing import Callable, Dict, Iterable, Optional, Sequence
+
+# Seconds a computed statistics result is served before the next request recomputes it
+STATS_CACHE_TTL = float(os.getenv('STATS_CACHE_TTL', '10'))
+
+def _plain(value):
+    """Decimals from SUM/AVG as int or float so results serialize like the old per-query counts"""
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    return value
+
+def grouped_stats_sql(source: str, aggregates: Dict[str, str], dimensions: Dict[str, str],
+                      grouping_sets: Sequence[tuple], where: Optional[str] = None) -> str:
+    """SELECT computing ``aggregates`` for every grouping set in one pass over ``source``"""
+    columns = [f"GROUPING({expression}) AS grouped_{name}" for name, expression in dimensions.items()]
+    columns += [f"{expression} AS {name}" for name, expression in dimensions.items()]
+    columns += [f"{expression} AS {name}" for name, expression in aggregates.items()]
+    sets = ', '.join('(' + ', '.join(dimensions[name] for name in grouping_set) + ')' for grouping_set in grouping_sets)
+    return f"""
+        SELECT {', '.join(columns)}
+        FROM {source}
+        {f'WHERE {where}' if where else ''}
+        GROUP BY GROUPING SETS ({sets})
+    """
+
+def grouped_stats(cursor, source: str, aggregates: Dict[str, str], dimensions: Optional[Dict[str, str]] = None,
+                  grouping_sets: Optional[Iterable[tuple]] = None, where: Optional[str] = None,
+                  params: Optional[Sequence] = None) -> dict:
+    """Totals plus per-dimension breakdowns of ``aggregates`` from one query (default sets: each dimension alone)"""
+    # Result: {"totals": {aggregate: value}, "by": {"dim" or "dim_a/dim_b": [{dim..., aggregate...}]}}
+    dimensions = dimensions or {}
+    sets = [()] + [tuple(grouping_set) for grouping_set in (grouping_sets or [(name,) for name in dimensions]) if grouping_set]
+    cursor.execute(grouped_stats_sql(source, aggregates, dimensions, sets, where), params or ())
+
+    names = list(dimensions)
+    width = len(names)
+    result = {"totals": {name: 0 for name in aggregates},
+              "by": {'/'.join(grouping_set): [] for grouping_set in sets if grouping_set}}
+    for row in cursor.fetchall():
+        flags, keys, values = row[:width], row[width:2 * width], row[2 * width:]
+        present = [name for name, flag in zip(names, flags) if flag == 0]
+        item = {name: _plain(value) for name, value in zip(aggregates, values)}
+        if not present:
+            result["totals"] = item
+            continue
+        for name, key in zip(names, keys):
+            if name in present:
+                item[name] = key
+        result["by"]['/'.join(present)].append(item)
+    return result
+
+class StatsMemo:
+    """Computed statistics by key for ``ttl`` seconds; concurrent misses on one key compute it once"""
+
+    def __init__(self, ttl: float = STATS_CACHE_TTL):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries: Dict[str, tuple] = {}            # key -> (value, computed at)
+        self.key_locks: Dict[str, threading.Lock] = {}
+        self.metrics = {'hits': 0, 'misses': 0}
+
+    def _fresh(self, key: str):
+        entry = self.entries.get(key)
+        if entry and time.monotonic() - entry[1] < self.ttl:
+            self.metrics['hits'] += 1
+            return entry
+        return None
+
+    def get(self, key: str, compute: Callable):
+        """Memoized ``compute()`` for ``key``; callers must not mutate the returned value"""
+        with self.lock:
+            entry = self._fresh(key)
+            if entry:
+                return entry[0]
+            key_lock = self.key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            with self.lock:
+                entry = self._fresh(key)
+                if entry:
+                    return entry[0]
+                self.metrics['misses'] += 1
+            value = compute()
+            with self.lock:
+                self.entries[key] = (value, time.monotonic())
+            return value
+
+    def invalidate(self, key: Optional[str] = None):
+        with self.lock:
+            if key is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(key, None)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {**self.metrics, 'keys': sorted(self.entries), 'ttl': self.ttl}
+
+# Shared memo for the statistics endpoints
+stats_memo = StatsMemo()
+
+__all__ = ['grouped_stats', 'grouped_stats_sql', 'StatsMemo', 'stats_memo', 'STATS_CACHE_TTL']
@@ -1,6 +1,6 @@
 # modules/housing_inspection_module.py - Chip Inspection Backend Module
 
-from fastapi import APIRouter, HTTPException, Depends, File, UploadFile, Form
+from fastapi import APIRouter, HTTPException, Depends, File, UploadFile, Form, Query
 from fastapi.responses import FileResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel
@@ -10,14 +10,19 @@ import json
 import uuid
 import datetime
 import asyncio
-from PIL import Image
-import shutil
 import jwt
 import psycopg2
 import psycopg2.extras
 from contextlib import contextmanager
 from dotenv import load_dotenv
 from fpdf import FPDF
+from .image_pipeline import schedule_derivatives, select_image_variant, shutdown_image_pipeline
+from .artifact_manager import register_artifact
+from .upload_storage import register_upload_target, stream_upload, finalize_upload_session
+from .module_registry import ModuleManifest
+from .audit_log import audit
+from .event_bus import notify_module
+from .grouped_stats import grouped_stats, stats_memo
 
 # Load environment variables
 load_dotenv()
@@ -71,21 +76,13 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
 
 # Utility functions
 def log_action(user_id: int, action: str, module: str, details: str):
-    """Log user action"""
-    try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                INSERT INTO system_logs (user_id, action, module, details)
-                VALUES (%s, %s, %s, %s)
-            """, (user_id, action, module, details))
-            conn.commit()
-    except Exception as e:
-        print(f"Error logging action: {e}")
+    """Log user action (queued; written to system_logs in batches)"""
+    audit(user_id, action, module, details)
 
 async def notify_module_users(module: str, message_type: str, data: dict):
-    """Simplified notification function"""
+    """Publish a notification to the module's WebSocket subscribers"""
     print(f"📢 Chip Inspection Notification - {message_type}: {data}")
+    notify_module(module, message_type, data)
 
 # Pydantic models
 class InspectionCreate(BaseModel):
@@ -104,59 +101,13 @@ class InspectionFilter(BaseModel):
     operator: Optional[str] = "all"
     date_range: Optional[str] = "today"
 
-# Initialize database tables
-def init_Housing_inspection_tables():
-    """Initialize chip inspection tables"""
-    try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            
-            # Chip inspections table
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS Housing_inspections (
-                    id SERIAL PRIMARY KEY,
-                    inspection_id VARCHAR(255) UNIQUE NOT NULL,
-                    operator VARCHAR(100) NOT NULL,
-                    housing_lot_number VARCHAR(100) NOT NULL,
-                    Housing_Serial_Number VARCHAR(100) NOT NULL,
-                    notes TEXT,
-                    status VARCHAR(50) NOT NULL DEFAULT 'started',
-                    image_path TEXT,
-                    image_filename VARCHAR(255),
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    created_by INTEGER REFERENCES users(id)
-                )
-            """)
-            
-            # Create index for better performance
-            cursor.execute("""
-                CREATE INDEX IF NOT EXISTS idx_housing_inspections_status 
-                ON housing_inspections(status)
-            """)
-            
-            cursor.execute("""
-                CREATE INDEX IF NOT EXISTS idx_housing_inspections_created_at 
-                ON housing_inspections(created_at)
-            """)
-            
-            conn.commit()
-            print("✅ Housing inspection tables initialized")
-            
-    except Exception as e:
-        print(f"❌ Housing inspection table initialization error: {e}")
-
-# Initialize tables on module load
-init_Housing_inspection_tables()
 
 # File handling utilities
 UPLOAD_DIR = "uploads/Housing_inspections"
 ALLOWED_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp'}
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
 
-def ensure_upload_directory():
-    """Ensure upload directory exists"""
-    os.makedirs(UPLOAD_DIR, exist_ok=True)
+register_upload_target('housing_inspection', UPLOAD_DIR, MAX_FILE_SIZE, ALLOWED_EXTENSIONS)
 
 def validate_image_file(file: UploadFile) -> bool:
     """Validate uploaded image file"""
@@ -171,31 +122,15 @@ def validate_image_file(file: UploadFile) -> bool:
     
     return True
 
-def save_uploaded_image(file: UploadFile, inspection_id: str) -> str:
-    """Save uploaded image and return file path"""
-    ensure_upload_directory()
-    
-    # Generate unique filename
-    file_ext = os.path.splitext(file.filename)[1].lower()
-    filename = f"{inspection_id}_{uuid.uuid4().hex[:8]}{file_ext}"
-    file_path = os.path.join(UPLOAD_DIR, filename)
+async def save_uploaded_image(file: UploadFile) -> str:
+    """Stream uploaded image to storage and queue its thumbnail/preview derivatives"""
+    stored = await stream_upload(file, 'housing_inspection')
     
-    # Save file
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    # Identical images share one file, so derivatives only need building once
+    if not stored['deduplicated']:
+        schedule_derivatives(stored['path'])
     
-    # Optimize image if it's too large
-    try:
-        with Image.open(file_path) as img:
-            # Resize if image is too large
-            max_size = (1920, 1080)
-            if img.size[0] > max_size[0] or img.size[1] > max_size[1]:
-                img.thumbnail(max_size, Image.Resampling.LANCZOS)
-                img.save(file_path, optimize=True, quality=85)
-    except Exception as e:
-        print(f"Warning: Could not optimize image: {e}")
-    
-    return file_path
+    return stored['path']
 
 # API Endpoints
 @housing_inspection_router.get("/status")
@@ -237,6 +172,7 @@ async def save_inspection(
     notes: str = Form(""),
     status: str = Form("started"),
     image: Optional[UploadFile] = File(None),
+    image_upload_id: Optional[str] = Form(None),  # completed resumable upload session
     current_user: dict = Depends(get_current_user)
 ):
     """Save chip inspection"""
@@ -253,16 +189,13 @@ async def save_inspection(
             if not validate_image_file(image):
                 raise HTTPException(status_code=400, detail="Invalid image file type")
             
-            # Check file size
-            contents = await image.read()
-            if len(contents) > MAX_FILE_SIZE:
-                raise HTTPException(status_code=400, detail="Image file too large (max 10MB)")
-            
-            # Reset file pointer
-            await image.seek(0)
-            
-            image_path = save_uploaded_image(image, inspection_id)
+            # Size cap is enforced while streaming
+            image_path = await save_uploaded_image(image)
             image_filename = image.filename
+        elif image_upload_id:
+            stored = await finalize_upload_session(image_upload_id, 'housing_inspection', current_user['user_id'])
+            image_path, image_filename = stored['path'], stored['original_filename']
+            schedule_derivatives(image_path)
         
         # Save to database
         with get_db_connection() as conn:
@@ -302,6 +235,8 @@ async def save_inspection(
             "inspection_id": inspection_id
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         log_action(
             current_user['user_id'], 
@@ -373,6 +308,7 @@ async def get_inspections(
                     "status": row['status'],
                     "image_path": row['image_path'],
                     "image_filename": row['image_filename'],
+                    "thumbnail_url": f"/modules/housing_inspection/image/{row['id']}?w=320" if row['image_path'] else None,
                     "created_at": row['created_at'].isoformat() if row['created_at'] else None,
                     "updated_at": row['updated_at'].isoformat() if row['updated_at'] else None
                 })
@@ -428,9 +364,11 @@ async def update_inspection_status(
 @housing_inspection_router.get("/image/{inspection_id}")
 async def get_inspection_image(
     inspection_id: int,
+    w: Optional[int] = Query(None, ge=1, description="Display width; serves the smallest size that fits"),
+    h: Optional[int] = Query(None, ge=1, description="Display height; serves the smallest size that fits"),
     current_user: dict = Depends(get_current_user)
 ):
-    """Get inspection image"""
+    """Get inspection image (original, or a smaller derivative when w/h are given)"""
     try:
         with get_db_connection() as conn:
             cursor = conn.cursor()
@@ -448,12 +386,21 @@ async def get_inspection_image(
             if not os.path.exists(image_path):
                 raise HTTPException(status_code=404, detail="Image file not found")
             
+            serve_path, media_type = select_image_variant(image_path, w, h)
+            if serve_path != image_path:
+                base_name = os.path.splitext(image_filename or os.path.basename(image_path))[0]
+                image_filename = f"{base_name}{os.path.splitext(serve_path)[1]}"
+            
+            # File names are unique per upload, so clients may cache aggressively
             return FileResponse(
-                image_path,
+                serve_path,
                 filename=image_filename,
-                media_type="image/*"
+                media_type=media_type,
+                headers={"Cache-Control": "private, max-age=86400"}
             )
             
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to retrieve image: {str(e)}")
 
@@ -545,6 +492,7 @@ async def generate_inspection_report(
         pdf_filename = f"housing_inspection_report_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
         pdf_path = os.path.join('reports', pdf_filename)
         pdf.output(pdf_path)
+        register_artifact(pdf_path, 'housing_inspection')
         
         log_action(
             current_user['user_id'],
@@ -558,54 +506,44 @@ async def generate_inspection_report(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to generate report: {str(e)}")
 
+def compute_inspection_statistics() -> dict:
+    """Totals, today's count and status/operator breakdowns in one scan of housing_inspections"""
+    with get_db_connection() as conn:
+        stats = grouped_stats(
+            conn.cursor(), "housing_inspections",
+            aggregates={
+                "count": "COUNT(*)",
+                "today": "COUNT(*) FILTER (WHERE created_at >= CURRENT_DATE)"
+            },
+            dimensions={"status": "status", "operator": "operator"}
+        )
+
+    top_operators = sorted(stats["by"]["operator"], key=lambda row: row["count"], reverse=True)[:5]
+    return {
+        "total_inspections": stats["totals"]["count"],
+        "status_breakdown": {row["status"]: row["count"] for row in stats["by"]["status"]},
+        "todays_inspections": stats["totals"]["today"],
+        "top_operators": [{"operator": row["operator"], "count": row["count"]} for row in top_operators]
+    }
+
 @housing_inspection_router.get("/statistics")
 async def get_inspection_statistics(current_user: dict = Depends(get_current_user)):
     """Get inspection statistics"""
     try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            
-            # Total inspections
-            cursor.execute("SELECT COUNT(*) FROM housing_inspections")
-            total_inspections = cursor.fetchone()[0] or 0
-            
-            # Status breakdown
-            cursor.execute("""
-                SELECT status, COUNT(*) 
-                FROM housing_inspections 
-                GROUP BY status
-            """)
-            status_counts = dict(cursor.fetchall())
-            
-            # Today's inspections
-            cursor.execute("""
-                SELECT COUNT(*) 
-                FROM housing_inspections 
-                WHERE created_at >= CURRENT_DATE
-            """)
-            todays_inspections = cursor.fetchone()[0] or 0
-            
-            # Top operators
-            cursor.execute("""
-                SELECT operator, COUNT(*) as count
-                FROM housing_inspections 
-                GROUP BY operator 
-                ORDER BY count DESC 
-                LIMIT 5
-            """)
-            top_operators = [{"operator": row[0], "count": row[1]} for row in cursor.fetchall()]
-            
-            return {
-                "total_inspections": total_inspections,
-                "status_breakdown": status_counts,
-                "todays_inspections": todays_inspections,
-                "top_operators": top_operators
-            }
+        return await asyncio.to_thread(stats_memo.get, "housing_inspection_statistics", compute_inspection_statistics)
             
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get statistics: {str(e)}")
 
 # Export router
-__all__ = ['housing_inspection_router']
+MODULE_MANIFEST = ModuleManifest(
+    name='housing_inspection',
+    router=housing_inspection_router,
+    prefix='/modules/housing_inspection',
+    tags=['housing_inspection Testing'],
+    on_shutdown=shutdown_image_pipeline
+)
+
+__all__ = ['MODULE_MANIFEST', 'housing_inspection_router']
 
 print("✅ Chip inspection module loaded successfully")
\ No newline at end of file
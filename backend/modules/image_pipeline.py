@@ -0,0 +1,131 @@
+# modules/image_pipeline.py - Inspection image derivatives
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+import os
+import time
+import threading
+from PIL import Image, ImageOps, features
+
+# Derivative sizes (bounding boxes), smallest first
+DERIVATIVE_SIZES = {
+    'thumb': (320, 240),
+    'preview': (1920, 1080),
+}
+
+# Prefer WebP when Pillow was built with it, otherwise fall back to JPEG
+if features.check('webp'):
+    DERIVATIVE_FORMAT, DERIVATIVE_EXT, DERIVATIVE_MEDIA_TYPE = 'WEBP', '.webp', 'image/webp'
+else:
+    DERIVATIVE_FORMAT, DERIVATIVE_EXT, DERIVATIVE_MEDIA_TYPE = 'JPEG', '.jpg', 'image/jpeg'
+
+DERIVATIVE_QUALITY = 82
+
+MEDIA_TYPES = {
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.png': 'image/png',
+    '.gif': 'image/gif',
+    '.bmp': 'image/bmp',
+    '.webp': 'image/webp',
+}
+
+# Background worker pool so resizing never runs on the request thread
+image_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('IMAGE_WORKERS', '2')),
+    thread_name_prefix='image-derivatives'
+)
+
+_pending = set()
+_pending_lock = threading.Lock()
+
+# Originals whose derivatives failed: path -> (failures, retry not before); retries back off exponentially
+DERIVATIVE_RETRY_BASE = 60  # seconds
+DERIVATIVE_RETRY_MAX = 24 * 3600
+_failed = {}
+
+def derivative_path(original_path: str, size_name: str) -> str:
+    """Path of a derivative next to its original"""
+    stem = os.path.splitext(original_path)[0]
+    return f"{stem}_{size_name}{DERIVATIVE_EXT}"
+
+def media_type_for(path: str) -> str:
+    """Media type from file extension"""
+    return MEDIA_TYPES.get(os.path.splitext(path)[1].lower(), 'application/octet-stream')
+
+def generate_derivatives(original_path: str) -> dict:
+    """Decode the original once and write every derivative size"""
+    written = {}
+    try:
+        with Image.open(original_path) as img:
+            img = ImageOps.exif_transpose(img)
+            if img.mode not in ('RGB', 'RGBA'):
+                img = img.convert('RGBA' if 'transparency' in img.info else 'RGB')
+            if DERIVATIVE_FORMAT == 'JPEG' and img.mode == 'RGBA':
+                img = img.convert('RGB')
+
+            # Largest first so each smaller size resamples an already reduced image
+            source = img
+            for size_name, box in sorted(DERIVATIVE_SIZES.items(), key=lambda item: -item[1][0]):
+                resized = source.copy()
+                resized.thumbnail(box, Image.Resampling.LANCZOS)
+
+                target = derivative_path(original_path, size_name)
+                tmp_path = f"{target}.tmp"
+                resized.save(tmp_path, DERIVATIVE_FORMAT, quality=DERIVATIVE_QUALITY, optimize=True)
+                os.replace(tmp_path, target)
+
+                written[size_name] = target
+                source = resized
+        with _pending_lock:
+            _failed.pop(original_path, None)
+    except Exception as e:
+        with _pending_lock:
+            failures = _failed.get(original_path, (0, 0))[0] + 1
+            delay = min(DERIVATIVE_RETRY_BASE * 2 ** (failures - 1), DERIVATIVE_RETRY_MAX)
+            _failed[original_path] = (failures, time.monotonic() + delay)
+        print(f"⚠️ Could not generate image derivatives for {original_path} (attempt {failures}, "
+              f"next try in {delay}s): {e}")
+    finally:
+        with _pending_lock:
+            _pending.discard(original_path)
+
+    return written
+
+def schedule_derivatives(original_path: str):
+    """Queue derivative generation on the worker pool (deduplicated per image, backing off after failures)"""
+    with _pending_lock:
+        if original_path in _pending:
+            return None
+        failed = _failed.get(original_path)
+        if failed and time.monotonic() < failed[1]:
+            return None
+        _pending.add(original_path)
+    return image_executor.submit(generate_derivatives, original_path)
+
+def select_image_variant(original_path: str, width: Optional[int] = None,
+                         height: Optional[int] = None) -> Tuple[str, str]:
+    """Pick the smallest available size that covers the requested box"""
+    if width or height:
+        for size_name, (box_w, box_h) in sorted(DERIVATIVE_SIZES.items(), key=lambda item: item[1][0]):
+            if (width or 0) > box_w or (height or 0) > box_h:
+                continue
+
+            candidate = derivative_path(original_path, size_name)
+            if os.path.exists(candidate):
+                return candidate, DERIVATIVE_MEDIA_TYPE
+
+            # Legacy upload or still processing: build it in the background, serve a larger one now
+            schedule_derivatives(original_path)
+
+    return original_path, media_type_for(original_path)
+
+def shutdown_image_pipeline():
+    """Finish queued derivative jobs and stop the worker pool"""
+    image_executor.shutdown(wait=True)
+    print("🧹 Image derivative workers stopped")
+
+__all__ = [
+    'DERIVATIVE_SIZES', 'derivative_path', 'generate_derivatives', 'schedule_derivatives',
+    'select_image_variant', 'shutdown_image_pipeline'
+]
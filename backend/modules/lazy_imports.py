@@ -0,0 +1,66 @@
+# modules/lazy_imports.py - Deferred imports for heavy instrument and plotting stacks
+
+import importlib
+import threading
+import time
+
+# Stacks that were actually loaded, with their import time (seconds)
+loaded_stacks = {}
+
+_import_lock = threading.Lock()
+
+def _use_agg_backend():
+    """Headless plotting backend, selected before pyplot is first imported"""
+    import matplotlib
+    matplotlib.use('Agg')
+
+_SETUP_HOOKS = {
+    'matplotlib.pyplot': _use_agg_backend,
+}
+
+class LazyModule:
+    """Module proxy that imports the real module on first attribute access"""
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            with _import_lock:
+                if self._module is None:
+                    started = time.perf_counter()
+                    setup = _SETUP_HOOKS.get(self._name)
+                    if setup:
+                        setup()
+                    module = importlib.import_module(self._name)
+                    loaded_stacks[self._name] = round(time.perf_counter() - started, 3)
+                    print(f"📦 Loaded {self._name} on first use ({loaded_stacks[self._name]}s)")
+                    self._module = module
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = 'loaded' if self._module is not None else 'not loaded'
+        return f"<lazy module '{self._name}' ({state})>"
+
+def lazy_module(name: str) -> LazyModule:
+    """Return a proxy for ``name`` that is imported when first used"""
+    return LazyModule(name)
+
+# Names PyInstaller cannot see through the proxies
+LAZY_HIDDEN_IMPORTS = [
+    'matplotlib.pyplot',
+    'matplotlib.backends.backend_agg',
+    'pandas',
+    'pyvisa',
+    'pyodbc',
+    'scipy.signal',
+    'scipy.ndimage',
+    'pyarrow.parquet',
+    'pyarrow.ipc',
+]
+
+__all__ = ['lazy_module', 'loaded_stacks', 'LAZY_HIDDEN_IMPORTS']
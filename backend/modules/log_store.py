@@ -0,0 +1,144 @@
+# modules/log_store.py - Monthly system_logs partitions and the filtered, cursor-paginated log query
+
+import os
+import base64
+import datetime
+from typing import Optional
+import psycopg2.extras
+
+# Partitions kept ahead of time so inserts never land in the default partition
+LOG_PARTITIONS_AHEAD = int(os.getenv('LOG_PARTITIONS_AHEAD', '2'))
+# Whole months of logs to keep (0 = keep everything)
+LOG_RETENTION_MONTHS = int(os.getenv('LOG_RETENTION_MONTHS', '0'))
+MAX_PAGE_SIZE = 500
+
+def _month_start(day: datetime.date, offset: int = 0) -> datetime.date:
+    """First day of the month ``offset`` months from ``day``"""
+    month_index = day.year * 12 + day.month - 1 + offset
+    return datetime.date(month_index // 12, month_index % 12 + 1, 1)
+
+def partition_name(month: datetime.date) -> str:
+    return f"system_logs_{month:%Y_%m}"
+
+def ensure_log_partitions(cursor, months_ahead: int = LOG_PARTITIONS_AHEAD) -> list:
+    """Create monthly partitions from the current month up to ``months_ahead``; returns the ones created"""
+    today = datetime.date.today()
+    created = []
+    for offset in range(months_ahead + 1):
+        start = _month_start(today, offset)
+        name = partition_name(start)
+        cursor.execute("SELECT to_regclass(%s) IS NOT NULL", (f"public.{name}",))
+        if cursor.fetchone()[0]:
+            continue
+        cursor.execute(f"""
+            CREATE TABLE {name} PARTITION OF system_logs
+            FOR VALUES FROM (%s) TO (%s)
+        """, (start, _month_start(start, 1)))
+        created.append(name)
+    return created
+
+def drop_expired_log_partitions(cursor, retention_months: int = LOG_RETENTION_MONTHS) -> list:
+    """Drop monthly partitions entirely older than the retention window; returns the ones dropped"""
+    if retention_months <= 0:
+        return []
+    cutoff = _month_start(datetime.date.today(), -retention_months)
+    cursor.execute("""
+        SELECT child.relname
+        FROM pg_inherits
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE parent.relname = 'system_logs' AND child.relname ~ '^system_logs_[0-9]{4}_[0-9]{2}$'
+    """)
+    dropped = []
+    for (name,) in cursor.fetchall():
+        year, month = int(name[-7:-3]), int(name[-2:])
+        if datetime.date(year, month, 1) < cutoff:
+            cursor.execute(f"ALTER TABLE system_logs DETACH PARTITION {name}")
+            cursor.execute(f"DROP TABLE {name}")
+            dropped.append(name)
+    return sorted(dropped)
+
+def maintain_log_partitions(conn) -> dict:
+    """Create upcoming partitions and drop expired ones"""
+    cursor = conn.cursor()
+    created = ensure_log_partitions(cursor)
+    dropped = drop_expired_log_partitions(cursor)
+    conn.commit()
+    if created or dropped:
+        print(f"🗂️ system_logs partitions: created {created or 'none'}, dropped {dropped or 'none'}")
+    return {"created": created, "dropped": dropped}
+
+# Cursor pagination: opaque "<timestamp>|<id>" of the last row returned
+def encode_cursor(timestamp: datetime.datetime, log_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{timestamp.isoformat()}|{log_id}".encode()).decode()
+
+def decode_cursor(cursor_value: str) -> tuple:
+    try:
+        timestamp, log_id = base64.urlsafe_b64decode(cursor_value.encode()).decode().split("|")
+        return datetime.datetime.fromisoformat(timestamp), int(log_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+def query_logs(conn, limit: int = 50, cursor: Optional[str] = None, module: Optional[str] = None,
+               action: Optional[str] = None, user_id: Optional[int] = None, username: Optional[str] = None,
+               since: Optional[datetime.datetime] = None, until: Optional[datetime.datetime] = None) -> dict:
+    """Newest-first page of logs; every filter narrows an index range on (…, timestamp)"""
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    conditions = []
+    params = []
+
+    if module:
+        conditions.append("sl.module = %s")
+        params.append(module)
+    if action:
+        conditions.append("sl.action = %s")
+        params.append(action)
+    if user_id is not None:
+        conditions.append("sl.user_id = %s")
+        params.append(user_id)
+    if username:
+        conditions.append("sl.user_id = (SELECT id FROM users WHERE username = %s)")
+        params.append(username)
+    # Time bounds also prune partitions
+    if since:
+        conditions.append("sl.timestamp >= %s")
+        params.append(since)
+    if until:
+        conditions.append("sl.timestamp < %s")
+        params.append(until)
+    if cursor:
+        after_timestamp, after_id = decode_cursor(cursor)
+        conditions.append("(sl.timestamp, sl.id) < (%s, %s)")
+        params.extend([after_timestamp, after_id])
+
+    where_clause = ("WHERE " + " AND ".join(conditions)) if conditions else ""
+    db_cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    db_cursor.execute(f"""
+        SELECT sl.id, sl.user_id, sl.action, sl.module, sl.details, sl.context, sl.timestamp, u.username
+        FROM system_logs sl
+        LEFT JOIN users u ON sl.user_id = u.id
+        {where_clause}
+        ORDER BY sl.timestamp DESC, sl.id DESC
+        LIMIT %s
+    """, params + [limit + 1])
+    rows = db_cursor.fetchall()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    logs = [
+        {
+            "id": row['id'],
+            "user_id": row['user_id'],
+            "action": row['action'],
+            "module": row['module'],
+            "details": row['details'],
+            "context": row['context'],
+            "timestamp": str(row['timestamp']),
+            "username": row['username']
+        }
+        for row in rows
+    ]
+    next_cursor = encode_cursor(rows[-1]['timestamp'], rows[-1]['id']) if has_more else None
+    return {"logs": logs, "next_cursor": next_cursor}
+
+__all__ = ['ensure_log_partitions', 'drop_expired_log_partitions', 'maintain_log_partitions', 'query_logs']
@@ -8,6 +8,7 @@ import logging
 from datetime import datetime
 
 from .database import get_db_cursor
+from .sequence_cache import SequenceCache
 from .models import (
     TestSequenceResponse, DeviceRegistration, DeviceResponse, 
     DeviceListResponse, ManufacturingOrderResponse, TestDefinitionsResponse,
@@ -17,6 +18,9 @@ from .models import (
 router = APIRouter(tags=["manufacturing"])
 logger = logging.getLogger(__name__)
 
+# Compiled test sequences per device type (a missing is_required counts as optional in this router)
+sequence_cache = SequenceCache(get_db_cursor, required_default=False)
+
 # Helper function to determine device type from serial number
 def get_device_type_from_serial(serial_number: str) -> str:
     """Extract device type from serial number"""
@@ -39,44 +43,31 @@ async def get_device_test_sequences(device_type: str):
     Get test sequences for a specific device type from your existing table
     """
     try:
-        with get_db_cursor() as cursor:
-            query = """
-            SELECT test_sequence 
-            FROM device_test_sequences 
-            WHERE device_type = %s
-            """
-            
-            cursor.execute(query, (device_type,))
-            result = cursor.fetchone()
-            
-            if not result:
-                raise HTTPException(
-                    status_code=404, 
-                    detail=f"Device type {device_type} not found"
-                )
-            
-            # Parse the JSONB test_sequence
-            test_sequences = result['test_sequence']
-            
-            if isinstance(test_sequences, list):
-                test_sequences.sort(key=lambda x: int(x.get('sequence_order', 0)))
-                
-                formatted_sequences = []
-                for seq in test_sequences:
-                    formatted_sequences.append({
-                        "test_id": seq.get("test_id"),
-                        "sequence_order": int(seq.get("sequence_order", 0)),
-                        "is_required": str(seq.get("is_required", "false")).lower() == "true",
-                        "test_number": seq.get("test_number")
-                    })
-                
-                return TestSequenceResponse(test_sequences=formatted_sequences)
-            else:
-                raise HTTPException(
-                    status_code=500,
-                    detail="Invalid test sequence format in database"
-                )
+        compiled = sequence_cache.get(device_type)
+        
+        if compiled is None:
+            raise HTTPException(
+                status_code=404, 
+                detail=f"Device type {device_type} not found"
+            )
+        
+        if not compiled.valid:
+            raise HTTPException(
+                status_code=500,
+                detail="Invalid test sequence format in database"
+            )
+        
+        formatted_sequences = [{
+            "test_id": step.test_id,
+            "sequence_order": step.sequence_order,
+            "is_required": step.is_required,
+            "test_number": step.test_number
+        } for step in compiled.steps]
+        
+        return TestSequenceResponse(test_sequences=formatted_sequences)
                 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error getting test sequences for {device_type}: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -85,76 +76,39 @@ async def get_device_test_sequences(device_type: str):
 async def get_device_type_tests_preview(device_type: str):
     """Get all tests for a device type to show operators what's involved"""
     try:
-        with get_db_cursor() as cursor:
-            # Get test sequences
-            cursor.execute("""
-                SELECT test_sequence 
-                FROM device_test_sequences 
-                WHERE device_type = %s
-            """, (device_type,))
-            
-            result = cursor.fetchone()
-            if not result:
-                raise HTTPException(status_code=404, detail=f"Device type {device_type} not found")
-            
-            test_sequences = result['test_sequence']
-            if isinstance(test_sequences, list):
-                test_sequences.sort(key=lambda x: int(x.get('sequence_order', 0)))
-                
-                # Get test definitions for descriptions
-                test_ids = [test['test_id'] for test in test_sequences]
-                
-                if test_ids:
-                    placeholders = ','.join(['%s'] * len(test_ids))
-                    cursor.execute(f"""
-                        SELECT test_id, test_name, description, estimated_duration_minutes
-                        FROM test_definitions 
-                        WHERE test_id IN ({placeholders})
-                    """, test_ids)
-                    
-                    test_definitions = {row['test_id']: row for row in cursor.fetchall()}
-                else:
-                    test_definitions = {}
-                
-                # Combine test sequence with definitions
-                detailed_tests = []
-                total_required_time = 0
-                total_optional_time = 0
-                
-                for test in test_sequences:
-                    test_def = test_definitions.get(test['test_id'], {})
-                    is_required = str(test.get('is_required', 'false')).lower() == 'true'
-                    duration = test_def.get('estimated_duration_minutes', 0) or 0
-                    
-                    if is_required:
-                        total_required_time += duration
-                    else:
-                        total_optional_time += duration
-                    
-                    detailed_tests.append({
-                        "test_id": test['test_id'],
-                        "test_name": test_def.get('test_name', test['test_id']),
-                        "description": test_def.get('description', ''),
-                        "sequence_order": test['sequence_order'],
-                        "is_required": is_required,
-                        "estimated_duration_minutes": duration
-                    })
-                
-                return {
-                    "device_type": device_type,
-                    "tests": detailed_tests,
-                    "summary": {
-                        "total_tests": len(detailed_tests),
-                        "required_tests": sum(1 for t in detailed_tests if t['is_required']),
-                        "optional_tests": sum(1 for t in detailed_tests if not t['is_required']),
-                        "total_required_time_minutes": total_required_time,
-                        "total_optional_time_minutes": total_optional_time,
-                        "estimated_total_hours": round((total_required_time + total_optional_time) / 60, 1)
-                    }
-                }
-            
+        compiled = sequence_cache.get(device_type)
+        if compiled is None:
+            raise HTTPException(status_code=404, detail=f"Device type {device_type} not found")
+        
+        if not compiled.valid:
             return {"device_type": device_type, "tests": [], "summary": {}}
+        
+        detailed_tests = [{
+            "test_id": step.test_id,
+            "test_name": step.test_name,
+            "description": step.description,
+            "sequence_order": step.sequence_order,
+            "is_required": step.is_required,
+            "estimated_duration_minutes": step.estimated_duration_minutes
+        } for step in compiled.steps]
+        
+        total_required_time = compiled.total_required_minutes
+        total_optional_time = compiled.total_optional_minutes
+        return {
+            "device_type": device_type,
+            "tests": detailed_tests,
+            "summary": {
+                "total_tests": len(detailed_tests),
+                "required_tests": len(compiled.required_tests),
+                "optional_tests": len(detailed_tests) - len(compiled.required_tests),
+                "total_required_time_minutes": total_required_time,
+                "total_optional_time_minutes": total_optional_time,
+                "estimated_total_hours": round((total_required_time + total_optional_time) / 60, 1)
+            }
+        }
             
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error getting tests preview for {device_type}: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -164,28 +118,12 @@ async def create_device_simple(serial_number: str, device_type: str):
     """Create a new device with default test sequence for the device type"""
     try:
         with get_db_cursor() as cursor:
-            # Verify device type exists and get test sequence
-            cursor.execute("""
-                SELECT test_sequence 
-                FROM device_test_sequences 
-                WHERE device_type = %s
-            """, (device_type,))
-            
-            result = cursor.fetchone()
-            if not result:
+            # Verify device type exists and get its first required test
+            compiled = sequence_cache.get(device_type, cursor)
+            if compiled is None:
                 raise HTTPException(status_code=404, detail=f"Device type {device_type} not found")
             
-            test_sequences = result['test_sequence']
-            if isinstance(test_sequences, list):
-                test_sequences.sort(key=lambda x: int(x.get('sequence_order', 0)))
-                # Get first required test
-                first_test = None
-                for test in test_sequences:
-                    if str(test.get('is_required', 'false')).lower() == 'true':
-                        first_test = test['test_id']
-                        break
-            else:
-                first_test = None
+            first_test = compiled.required_tests[0] if compiled.required_tests else None
             
             # Insert device into your actual devices table structure
             cursor.execute("""
@@ -281,30 +219,15 @@ async def get_device_details(serial_number: str):
                     detail=f"Cannot determine device type from serial number: {serial_number}"
                 )
             
-            # 2. Get required tests from device_test_sequences table
-            cursor.execute("""
-                SELECT test_sequence 
-                FROM device_test_sequences 
-                WHERE device_type = %s
-            """, (device_type,))
-            
-            test_seq_result = cursor.fetchone()
-            if not test_seq_result:
+            # 2. Get required tests from the compiled device_test_sequences entry
+            compiled = sequence_cache.get(device_type, cursor)
+            if compiled is None:
                 raise HTTPException(
                     status_code=404, 
                     detail=f"No test sequence found for device type: {device_type}"
                 )
             
-            # Parse the JSONB test sequence
-            test_sequences = test_seq_result['test_sequence']
-            required_tests = []
-            
-            if isinstance(test_sequences, list):
-                test_sequences.sort(key=lambda x: int(x.get('sequence_order', 0)))
-                required_tests = [
-                    test['test_id'] for test in test_sequences 
-                    if str(test.get('is_required', 'false')).lower() == 'true'
-                ]
+            required_tests = list(compiled.required_tests)
             
             # 3. Check if device exists in devices table
             cursor.execute("""
@@ -486,37 +409,10 @@ async def complete_test(serial_number: str, test_id: str):
             if test_id not in completed_tests:
                 completed_tests.append(test_id)
             
-            # Get device type and required tests to find next test
+            # Next required test from the device type's compiled sequence
             device_type = get_device_type_from_serial(serial_number)
-            if device_type:
-                cursor.execute("""
-                    SELECT test_sequence 
-                    FROM device_test_sequences 
-                    WHERE device_type = %s
-                """, (device_type,))
-                
-                test_seq_result = cursor.fetchone()
-                if test_seq_result:
-                    test_sequences = test_seq_result['test_sequence']
-                    if isinstance(test_sequences, list):
-                        test_sequences.sort(key=lambda x: int(x.get('sequence_order', 0)))
-                        required_tests = [
-                            test['test_id'] for test in test_sequences 
-                            if str(test.get('is_required', 'false')).lower() == 'true'
-                        ]
-                        
-                        # Find next test
-                        try:
-                            current_index = required_tests.index(test_id)
-                            next_test = required_tests[current_index + 1] if current_index + 1 < len(required_tests) else 'completed'
-                        except ValueError:
-                            next_test = 'completed'
-                    else:
-                        next_test = 'completed'
-                else:
-                    next_test = 'completed'
-            else:
-                next_test = 'completed'
+            compiled = sequence_cache.get(device_type, cursor) if device_type else None
+            next_test = compiled.next_after(test_id) if compiled else 'completed'
             
             # Update device
             cursor.execute("""
@@ -8,14 +8,19 @@ from typing import List, Optional
 import os
 import json
 import uuid
+import asyncio
 import datetime
 import jwt
 import psycopg2
 import psycopg2.extras
 from contextlib import contextmanager
 from dotenv import load_dotenv
-import shutil
 from pathlib import Path
+from .upload_storage import register_upload_target, stream_upload, finalize_upload_session
+from .module_registry import ModuleManifest
+from .audit_log import audit
+from .event_bus import notify_module, publish_event, mo_topic
+from .grouped_stats import grouped_stats, stats_memo
 
 # Load environment variables
 load_dotenv()
@@ -30,6 +35,8 @@ SECRET_KEY = os.getenv('SECRET_KEY', 'default-dev-key-change-in-production')
 # File storage configuration
 UPLOAD_DIR = Path(os.getenv('UPLOAD_DIR', './uploads/manufacturing_orders'))
 UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+MAX_PO_FILE_SIZE = int(os.getenv('MAX_PO_FILE_SIZE', str(200 * 1024 * 1024)))  # 200MB scans
+register_upload_target('manufacturing_order', UPLOAD_DIR, MAX_PO_FILE_SIZE)
 
 # Database configuration
 DATABASE_CONFIG = {
@@ -73,17 +80,8 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
 
 # Utility functions
 def log_action(user_id: int, action: str, module: str, details: str):
-    """Log user action"""
-    try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                INSERT INTO system_logs (user_id, action, module, details)
-                VALUES (%s, %s, %s, %s)
-            """, (user_id, action, module, details))
-            conn.commit()
-    except Exception as e:
-        print(f"Error logging action: {e}")
+    """Log user action (queued; written to system_logs in batches)"""
+    audit(user_id, action, module, details)
 
 # Pydantic models
 class DeviceDetail(BaseModel):
@@ -108,19 +106,15 @@ class DeviceTypeValidation(BaseModel):
     device_types: List[str]
 
 # Helper functions
-def save_uploaded_file(file: UploadFile, mo_number: str) -> tuple:
-    """Save uploaded file and return file path and original filename"""
+async def save_uploaded_file(file: UploadFile, mo_number: str) -> tuple:
+    """Stream uploaded file to content-addressed storage and return file path and original filename"""
     try:
-        # Create unique filename
-        file_extension = Path(file.filename).suffix
-        unique_filename = f"{mo_number}_{uuid.uuid4()}{file_extension}"
-        file_path = UPLOAD_DIR / unique_filename
-        
-        # Save file
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        return str(file_path), file.filename
+        stored = await stream_upload(file, 'manufacturing_order')
+        if stored['deduplicated']:
+            print(f"♻️ MO {mo_number}: identical file already stored, reusing {stored['path']}")
+        return stored['path'], stored['original_filename']
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to save file: {str(e)}")
 
@@ -215,6 +209,7 @@ async def create_manufacturing_order(
     due_date: Optional[str] = Form(None),
     notes: Optional[str] = Form(""),
     file: Optional[UploadFile] = File(None),
+    upload_id: Optional[str] = Form(None),  # completed resumable upload session
     current_user: dict = Depends(get_current_user)
 ):
     """Create new manufacturing order (admin only)"""
@@ -259,8 +254,12 @@ async def create_manufacturing_order(
         # Handle file upload
         if file and file.filename:
             print(f"📁 Processing file upload: {file.filename}")
-            file_path, original_filename = save_uploaded_file(file, manufacturing_order_number)
+            file_path, original_filename = await save_uploaded_file(file, manufacturing_order_number)
             print(f"✅ File saved to: {file_path}")
+        elif upload_id:
+            stored = await finalize_upload_session(upload_id, 'manufacturing_order', current_user['user_id'])
+            file_path, original_filename = stored['path'], stored['original_filename']
+            print(f"✅ Resumable upload finalized: {file_path}")
         
         print("🔗 Connecting to database...")
         with get_db_connection() as conn:
@@ -352,6 +351,16 @@ async def create_manufacturing_order(
         except Exception as log_error:
             print(f"⚠️ Logging failed (non-critical): {log_error}")
         
+        mo_event = {
+            "manufacturing_order_number": manufacturing_order_number,
+            "customer_name": customer_name,
+            "product_line": product_line,
+            "priority": priority,
+            "created_by": current_user['username']
+        }
+        notify_module('purchase_manufacturing_orders', 'mo_created', mo_event)
+        publish_event(mo_topic(manufacturing_order_number), 'mo_created', mo_event)
+        
         print("🎉 Manufacturing order creation completed successfully!")
         return {
             "success": True,
@@ -533,12 +542,76 @@ async def update_manufacturing_order_status(
         log_action(current_user['user_id'], 'update_mo_status', 'mo_management',
                   f"Updated MO {mo_number} status to {update_data.status}")
         
+        mo_event = {
+            "manufacturing_order_number": mo_number,
+            "status": update_data.status,
+            "updated_by": current_user['username']
+        }
+        notify_module('purchase_manufacturing_orders', 'mo_status_changed', mo_event)
+        publish_event(mo_topic(mo_number), 'mo_status_changed', mo_event)
+        
         return {"success": True, "message": "Manufacturing order status updated successfully"}
         
     except Exception as e:
         print(f"❌ Error updating manufacturing order status: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to update manufacturing order status: {str(e)}")
 
+def compute_order_analytics() -> dict:
+    """Status, priority, product line and device type rollups plus recent order counts in one scan"""
+    with get_db_connection() as conn:
+        stats = grouped_stats(
+            conn.cursor(),
+            """manufacturing_orders mo
+               LEFT JOIN manufacturing_order_devices mod ON mo.manufacturing_order_number = mod.manufacturing_order_number""",
+            aggregates={
+                # Orders appear once per device line after the join, hence DISTINCT
+                "orders": "COUNT(DISTINCT mo.manufacturing_order_number)",
+                "total_devices": "COALESCE(SUM(mod.quantity), 0)",
+                "mo_this_week": "COUNT(DISTINCT mo.manufacturing_order_number) "
+                                "FILTER (WHERE mo.created_at >= CURRENT_DATE - INTERVAL '7 days')",
+                "mo_this_month": "COUNT(DISTINCT mo.manufacturing_order_number) "
+                                 "FILTER (WHERE mo.created_at >= CURRENT_DATE - INTERVAL '30 days')"
+            },
+            dimensions={
+                "status": "mo.status",
+                "priority": "mo.priority",
+                "product_line": "mo.product_line",
+                "device_type": "mod.device_type"
+            },
+            grouping_sets=[("status",), ("priority",), ("product_line",), ("product_line", "device_type")]
+        )
+
+    by = stats["by"]
+    product_line_stats = [
+        {
+            "product_line": row["product_line"],
+            "manufacturing_orders": row["orders"],
+            "total_devices": row["total_devices"] or 0
+        }
+        for row in sorted(by["product_line"], key=lambda row: row["orders"], reverse=True)
+    ]
+    device_rows = [row for row in by["product_line/device_type"] if row["device_type"] is not None]
+    device_rows.sort(key=lambda row: (row["product_line"] is None, row["product_line"] or "", -row["total_devices"]))
+    device_stats = [
+        {
+            "product_line": row["product_line"],
+            "device_type": row["device_type"],
+            "total_quantity": row["total_devices"],
+            "order_count": row["orders"]
+        }
+        for row in device_rows
+    ]
+    return {
+        "manufacturing_order_stats": {row["status"]: row["orders"] for row in by["status"]},
+        "priority_stats": {row["priority"]: row["orders"] for row in by["priority"]},
+        "product_line_stats": product_line_stats,
+        "device_type_stats": device_stats,
+        "recent_activity": {
+            "mo_this_week": stats["totals"]["mo_this_week"] or 0,
+            "mo_this_month": stats["totals"]["mo_this_month"] or 0
+        }
+    }
+
 @mo_router.get("/analytics/summary")
 async def get_order_analytics(current_user: dict = Depends(get_current_user)):
     """Get manufacturing order analytics summary"""
@@ -546,85 +619,7 @@ async def get_order_analytics(current_user: dict = Depends(get_current_user)):
         raise HTTPException(status_code=403, detail="Insufficient permissions")
     
     try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            
-            # Manufacturing order statistics
-            cursor.execute("""
-                SELECT status, COUNT(*) as count
-                FROM manufacturing_orders
-                GROUP BY status
-            """)
-            mo_status_counts = dict(cursor.fetchall())
-            
-            # Priority statistics
-            cursor.execute("""
-                SELECT priority, COUNT(*) as count
-                FROM manufacturing_orders
-                GROUP BY priority
-            """)
-            priority_counts = dict(cursor.fetchall())
-            
-            # Product line statistics
-            cursor.execute("""
-                SELECT 
-                    mo.product_line,
-                    COUNT(DISTINCT mo.manufacturing_order_number) as manufacturing_orders,
-                    COALESCE(SUM(mod.quantity), 0) as total_devices
-                FROM manufacturing_orders mo
-                LEFT JOIN manufacturing_order_devices mod ON mo.manufacturing_order_number = mod.manufacturing_order_number
-                GROUP BY mo.product_line
-                ORDER BY manufacturing_orders DESC
-            """)
-            product_line_stats = [
-                {
-                    "product_line": row[0],
-                    "manufacturing_orders": row[1],
-                    "total_devices": row[2] or 0
-                }
-                for row in cursor.fetchall()
-            ]
-            
-            # Device type statistics by product line
-            cursor.execute("""
-                SELECT 
-                    mo.product_line,
-                    mod.device_type,
-                    SUM(mod.quantity) as total_quantity,
-                    COUNT(DISTINCT mo.manufacturing_order_number) as order_count
-                FROM manufacturing_orders mo
-                JOIN manufacturing_order_devices mod ON mo.manufacturing_order_number = mod.manufacturing_order_number
-                GROUP BY mo.product_line, mod.device_type
-                ORDER BY mo.product_line, total_quantity DESC
-            """)
-            device_stats = [
-                {
-                    "product_line": row[0],
-                    "device_type": row[1],
-                    "total_quantity": row[2],
-                    "order_count": row[3]
-                }
-                for row in cursor.fetchall()
-            ]
-            
-            # Recent activity
-            cursor.execute("""
-                SELECT 
-                    (SELECT COUNT(*) FROM manufacturing_orders WHERE created_at >= CURRENT_DATE - INTERVAL '7 days') as mo_this_week,
-                    (SELECT COUNT(*) FROM manufacturing_orders WHERE created_at >= CURRENT_DATE - INTERVAL '30 days') as mo_this_month
-            """)
-            recent_activity = cursor.fetchone()
-            
-            return {
-                "manufacturing_order_stats": mo_status_counts,
-                "priority_stats": priority_counts,
-                "product_line_stats": product_line_stats,
-                "device_type_stats": device_stats,
-                "recent_activity": {
-                    "mo_this_week": recent_activity[0] or 0,
-                    "mo_this_month": recent_activity[1] or 0
-                }
-            }
+        return await asyncio.to_thread(stats_memo.get, "manufacturing_order_analytics", compute_order_analytics)
             
     except Exception as e:
         print(f"❌ Error getting analytics: {e}")
@@ -696,7 +691,14 @@ def get_manufacturing_order_by_number(mo_number: str) -> dict:
         print(f"❌ Error getting MO by number: {e}")
         return None
 
+MODULE_MANIFEST = ModuleManifest(
+    name='purchase_manufacturing_orders',
+    router=mo_router,
+    prefix='/admin',
+    tags=['Purchase Orders & Manufacturing Orders']
+)
+
 # Export router and helper functions
-__all__ = ['mo_router', 'get_manufacturing_order_by_number']
+__all__ = ['MODULE_MANIFEST', 'mo_router', 'get_manufacturing_order_by_number']
 
 print("✅ Manufacturing Orders module (no ID column) loaded successfully")
\ No newline at end of file
@@ -17,12 +17,18 @@ import asyncio
 import logging
 import uuid
 import os
+import time
 import psycopg2
 import psycopg2.extras
 import psycopg2.pool
 import jwt
 from contextlib import contextmanager
 from dotenv import load_dotenv
+from .module_registry import ModuleManifest
+from .audit_log import audit
+from .event_bus import notify_test, publish_event, mo_topic
+from .sequence_cache import SequenceCache, start_sequence_listener
+from . import device_state
 
 # Load environment variables
 load_dotenv()
@@ -47,6 +53,9 @@ DATABASE_CONFIG = {
     'password': os.getenv('DB_PASSWORD', 'karthi')
 }
 
+# Upper bound on devices serialized by one bulk request
+MAX_BULK_DEVICES = 2000
+
 # Global connection pool and db function
 db_pool = None
 get_db_connection_func = None
@@ -99,6 +108,15 @@ def set_db_connection(db_func):
     global get_db_connection_func
     get_db_connection_func = db_func
 
+@contextmanager
+def get_dict_cursor():
+    """RealDictCursor on a pooled connection (for the sequence cache loader)"""
+    with get_db_connection() as conn:
+        yield conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+
+# Compiled test sequences per device type (is_required defaults to True, as stored by this module)
+sequence_cache = SequenceCache(get_dict_cursor)
+
 def verify_jwt_token(token: str) -> dict:
     """Verify JWT token"""
     try:
@@ -116,17 +134,8 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     return user_data
 
 def log_action(user_id: int, action: str, module: str, details: str):
-    """Log user action"""
-    try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                INSERT INTO system_logs (user_id, action, module, details)
-                VALUES (%s, %s, %s, %s)
-            """, (user_id, action, module, details))
-            conn.commit()
-    except Exception as e:
-        logger.error(f"Error logging action: {e}")
+    """Log user action (queued; written to system_logs in batches)"""
+    audit(user_id, action, module, details)
 
 # Helper function to determine device type from serial number
 def get_device_type_from_serial(serial_number: str) -> str:
@@ -211,6 +220,22 @@ class ApiResponse(BaseModel):
     message: str
     data: Optional[Dict[str, Any]] = None
 
+class BulkDeviceCreate(BaseModel):
+    """Serial numbers as an explicit list, or a range: prefix + zero-padded numbers from start"""
+    device_type: Optional[str] = None  # inferred from each serial number when omitted
+    serial_numbers: List[str] = []
+    serial_prefix: Optional[str] = None
+    start: int = 1
+    count: int = 0
+    width: int = 4
+
+    def expand(self) -> List[str]:
+        serials = [serial.strip() for serial in self.serial_numbers if serial and serial.strip()]
+        if self.serial_prefix and self.count > 0:
+            serials.extend(f"{self.serial_prefix}{number:0{self.width}d}"
+                           for number in range(self.start, self.start + self.count))
+        return serials
+
 # Helper Functions
 def get_mo_by_number(manufacturing_order_number: str) -> Optional[dict]:
     """Get Manufacturing Order by number"""
@@ -254,6 +279,68 @@ def get_mo_by_number(manufacturing_order_number: str) -> Optional[dict]:
         logger.error(f"Error getting MO {manufacturing_order_number}: {e}", exc_info=True)
         return None
 
+def serialize_devices(manufacturing_order_number: str, devices: List[tuple], user_id: Optional[int] = None) -> dict:
+    """Create (serial_number, device_type) pairs for an MO in one transaction; returns per-serial outcomes, or None if the MO does not exist"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        
+        cursor.execute("""
+            SELECT manufacturing_order_number FROM manufacturing_orders
+            WHERE TRIM(manufacturing_order_number) = %s
+        """, (manufacturing_order_number,))
+        if not cursor.fetchone():
+            return None
+        
+        # Resolve each device type's compiled test sequence once
+        device_types = sorted({device_type for _, device_type in devices if device_type})
+        dict_cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        sequences = {}
+        for device_type in device_types:
+            compiled = sequence_cache.get(device_type, dict_cursor)
+            if compiled is not None:
+                sequences[device_type] = compiled
+        
+        results = {}
+        rows = []
+        for serial_number, device_type in devices:
+            if serial_number in results:
+                continue
+            if not device_type:
+                results[serial_number] = {"status": "invalid", "detail": "Device type could not be determined"}
+            elif device_type not in sequences:
+                results[serial_number] = {"status": "invalid",
+                                          "detail": f"No test sequence found for device type: {device_type}"}
+            else:
+                compiled = sequences[device_type]
+                rows.append((serial_number, compiled.first_test, [], device_type,
+                             list(compiled.required_tests), manufacturing_order_number))
+                results[serial_number] = {"status": "exists", "detail": "Device already exists"}
+        
+        created = []
+        if rows:
+            created = psycopg2.extras.execute_values(cursor, """
+                INSERT INTO devices (
+                    serial_number, current_stage, completed_tests, device_type,
+                    required_tests, manufacturing_order_number
+                )
+                VALUES %s
+                ON CONFLICT (serial_number) DO NOTHING
+                RETURNING serial_number, current_stage
+            """, rows, page_size=1000, fetch=True)
+            device_state.record_created(cursor, created, user_id)
+        conn.commit()
+    
+    for serial_number, _ in created:
+        results[serial_number] = {"status": "created"}
+    
+    return {
+        "results": [
+            {"serial_number": serial_number, "device_type": device_type, **results[serial_number]}
+            for serial_number, device_type in dict(devices).items()
+        ],
+        "created": len(created)
+    }
+
 # Manufacturing Orders API Endpoints
 @router.get("/manufacturing-orders", response_model=ManufacturingOrderResponse)
 async def get_manufacturing_orders(current_user: dict = Depends(get_current_user)):
@@ -374,45 +461,31 @@ async def get_manufacturing_order(
 async def get_device_test_sequences(device_type: str):
     """Get test sequences for a specific device type from your existing table"""
     try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-            
-            query = """
-            SELECT test_sequence 
-            FROM device_test_sequences 
-            WHERE device_type = %s
-            """
-            
-            cursor.execute(query, (device_type,))
-            result = cursor.fetchone()
-            
-            if not result:
-                raise HTTPException(
-                    status_code=404, 
-                    detail=f"Device type {device_type} not found"
-                )
-            
-            test_sequences = result['test_sequence']
-            
-            if isinstance(test_sequences, list):
-                test_sequences.sort(key=lambda x: int(x.get('sequence_order', 0)))
-                
-                formatted_sequences = []
-                for seq in test_sequences:
-                    formatted_sequences.append({
-                        "test_id": seq.get("test_id"),
-                        "sequence_order": int(seq.get("sequence_order", 0)),
-                        "is_required": seq.get("is_required", True),
-                        "test_number": seq.get("test_number")
-                    })
-                
-                return TestSequenceResponse(test_sequences=formatted_sequences)
-            else:
-                raise HTTPException(
-                    status_code=500,
-                    detail="Invalid test sequence format in database"
-                )
+        compiled = await asyncio.to_thread(sequence_cache.get, device_type)
+        
+        if compiled is None:
+            raise HTTPException(
+                status_code=404, 
+                detail=f"Device type {device_type} not found"
+            )
+        
+        if not compiled.valid:
+            raise HTTPException(
+                status_code=500,
+                detail="Invalid test sequence format in database"
+            )
+        
+        formatted_sequences = [{
+            "test_id": step.test_id,
+            "sequence_order": step.sequence_order,
+            "is_required": step.is_required,
+            "test_number": step.test_number
+        } for step in compiled.steps]
+        
+        return TestSequenceResponse(test_sequences=formatted_sequences)
                 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error getting test sequences for {device_type}: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -421,80 +494,39 @@ async def get_device_test_sequences(device_type: str):
 async def get_device_type_tests_preview(device_type: str):
     """Get all tests for a device type to show operators what's involved"""
     try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-            
-            # Get test sequences
-            cursor.execute("""
-                SELECT test_sequence 
-                FROM device_test_sequences 
-                WHERE device_type = %s
-            """, (device_type,))
-            
-            result = cursor.fetchone()
-            if not result:
-                raise HTTPException(status_code=404, detail=f"Device type {device_type} not found")
-            
-            test_sequences = result['test_sequence']
-            if isinstance(test_sequences, list):
-                test_sequences.sort(key=lambda x: int(x.get('sequence_order', 0)))
-                
-                # Get test definitions for descriptions
-                test_ids = [test['test_id'] for test in test_sequences]
-                
-                if test_ids:
-                    placeholders = ','.join(['%s'] * len(test_ids))
-                    cursor.execute(f"""
-                        SELECT test_id, test_name, description, estimated_duration_minutes
-                        FROM test_definitions 
-                        WHERE test_id IN ({placeholders})
-                    """, test_ids)
-                    
-                    test_definitions = {row['test_id']: row for row in cursor.fetchall()}
-                else:
-                    test_definitions = {}
-                
-                # Combine test sequence with definitions
-                detailed_tests = []
-                total_required_time = 0
-                total_optional_time = 0
-                
-                for test in test_sequences:
-                    test_def = test_definitions.get(test['test_id'], {})
-                    is_required = test.get('is_required', True)  # Default to True since your data uses boolean
-                    if isinstance(is_required, str):
-                        is_required = is_required.lower() == 'true'
-                    duration = test_def.get('estimated_duration_minutes', 0) or 0
-                    
-                    if is_required:
-                        total_required_time += duration
-                    else:
-                        total_optional_time += duration
-                    
-                    detailed_tests.append({
-                        "test_id": test['test_id'],
-                        "test_name": test_def.get('test_name', test['test_id']),
-                        "description": test_def.get('description', ''),
-                        "sequence_order": test['sequence_order'],
-                        "is_required": is_required,
-                        "estimated_duration_minutes": duration
-                    })
-                
-                return {
-                    "device_type": device_type,
-                    "tests": detailed_tests,
-                    "summary": {
-                        "total_tests": len(detailed_tests),
-                        "required_tests": sum(1 for t in detailed_tests if t['is_required']),
-                        "optional_tests": sum(1 for t in detailed_tests if not t['is_required']),
-                        "total_required_time_minutes": total_required_time,
-                        "total_optional_time_minutes": total_optional_time,
-                        "estimated_total_hours": round((total_required_time + total_optional_time) / 60, 1)
-                    }
-                }
-            
+        compiled = await asyncio.to_thread(sequence_cache.get, device_type)
+        if compiled is None:
+            raise HTTPException(status_code=404, detail=f"Device type {device_type} not found")
+        
+        if not compiled.valid:
             return {"device_type": device_type, "tests": [], "summary": {}}
+        
+        detailed_tests = [{
+            "test_id": step.test_id,
+            "test_name": step.test_name,
+            "description": step.description,
+            "sequence_order": step.sequence_order,
+            "is_required": step.is_required,
+            "estimated_duration_minutes": step.estimated_duration_minutes
+        } for step in compiled.steps]
+        
+        total_required_time = compiled.total_required_minutes
+        total_optional_time = compiled.total_optional_minutes
+        return {
+            "device_type": device_type,
+            "tests": detailed_tests,
+            "summary": {
+                "total_tests": len(detailed_tests),
+                "required_tests": len(compiled.required_tests),
+                "optional_tests": len(detailed_tests) - len(compiled.required_tests),
+                "total_required_time_minutes": total_required_time,
+                "total_optional_time_minutes": total_optional_time,
+                "estimated_total_hours": round((total_required_time + total_optional_time) / 60, 1)
+            }
+        }
             
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error getting tests preview for {device_type}: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -528,6 +560,71 @@ async def get_test_definitions():
         logger.error(f"Error getting test definitions: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# Enhanced device search with better filtering (declared before /devices/{serial_number}, which would match "search")
+@router.get("/devices/search")
+async def search_devices(
+    q: Optional[str] = None,
+    device_type: Optional[str] = None,
+    status: Optional[str] = None,
+    mo_number: Optional[str] = None,
+    limit: int = 50,
+    offset: int = 0,
+    current_user: dict = Depends(get_current_user)
+):
+    """Enhanced device search with multiple filters"""
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+            
+            # Build dynamic filter (status is stored on the device row)
+            where_clause = " WHERE 1=1"
+            params = []
+            
+            # Add filters
+            if q:
+                where_clause += " AND d.serial_number ILIKE %s"
+                params.append(f"%{q}%")
+            
+            if device_type:
+                where_clause += " AND (d.serial_number LIKE %s OR d.serial_number LIKE %s)"
+                params.extend([f"{device_type}%", f"{device_type}-%"])
+            
+            if status:
+                where_clause += " AND d.status = %s"
+                params.append(status)
+            
+            if mo_number:
+                where_clause += " AND d.manufacturing_order_number = %s"
+                params.append(mo_number.strip())
+            
+            # Add ordering and pagination
+            cursor.execute("""
+                SELECT d.serial_number, d.current_stage, d.completed_tests, d.status, d.manufacturing_order_number
+                FROM devices d
+            """ + where_clause + " ORDER BY d.serial_number LIMIT %s OFFSET %s", params + [limit, offset])
+            devices = cursor.fetchall()
+            
+            # Get total count for pagination
+            cursor.execute("SELECT COUNT(*) FROM devices d" + where_clause, params)
+            total_count = cursor.fetchone()['count']
+            
+            return {
+                "devices": [dict(device) for device in devices],
+                "total_count": total_count,
+                "limit": limit,
+                "offset": offset,
+                "filters": {
+                    "search_query": q,
+                    "device_type": device_type,
+                    "status": status,
+                    "mo_number": mo_number
+                }
+            }
+            
+    except Exception as e:
+        logger.error(f"Error searching devices: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.get("/devices/{serial_number}")
 async def get_device_details(serial_number: str):
     """Get device details - now uses stored device_type and required_tests"""
@@ -537,7 +634,7 @@ async def get_device_details(serial_number: str):
             
             # Get device with all fields including device_type and required_tests
             cursor.execute("""
-                SELECT serial_number, current_stage, completed_tests, device_type, required_tests
+                SELECT serial_number, current_stage, completed_tests, device_type, required_tests, status
                 FROM devices 
                 WHERE serial_number = %s
             """, (serial_number,))
@@ -554,14 +651,7 @@ async def get_device_details(serial_number: str):
             completed_steps = list(device_row['completed_tests'] or [])
             required_tests = list(device_row['required_tests'] or [])
             device_type = device_row['device_type']
-            
-            # Determine status
-            if device_row['current_stage'] == 'completed':
-                status = "completed"
-            elif completed_steps:
-                status = "in_progress"
-            else:
-                status = "not_started"
+            status = device_row['status']
             
             device_info = {
                 "serial_number": device_row['serial_number'],
@@ -616,39 +706,16 @@ async def create_device_simple(
                     detail=f"Device {serial_number} already exists"
                 )
             
-            # Get test sequence for this device type
-            cursor.execute("""
-                SELECT test_sequence 
-                FROM device_test_sequences 
-                WHERE device_type = %s
-            """, (device_type,))
-            
-            test_seq_result = cursor.fetchone()
-            if not test_seq_result:
+            # Get the compiled test sequence for this device type
+            compiled = sequence_cache.get(device_type, cursor)
+            if compiled is None:
                 raise HTTPException(
                     status_code=404, 
                     detail=f"No test sequence found for device type: {device_type}"
                 )
             
-            # Parse the test sequence
-            test_sequences = test_seq_result['test_sequence']
-            required_tests = []
-            first_test = 'not_started'
-            
-            if isinstance(test_sequences, list):
-                test_sequences.sort(key=lambda x: int(x.get('sequence_order', 0)))
-                
-                # Get required tests in order
-                for test in test_sequences:
-                    is_required = test.get('is_required', True)
-                    if isinstance(is_required, str):
-                        is_required = is_required.lower() == 'true'
-                    if is_required:
-                        required_tests.append(test['test_id'])
-                
-                # Set first test as current stage
-                if required_tests:
-                    first_test = required_tests[0]
+            required_tests = list(compiled.required_tests)
+            first_test = compiled.first_test
             
             # Insert device with test sequence
             cursor.execute("""
@@ -664,6 +731,7 @@ async def create_device_simple(
             """, (serial_number, first_test, [], device_type, required_tests))
             
             new_device = cursor.fetchone()
+            device_state.record_created(cursor, [(serial_number, first_test)], current_user['user_id'])
             conn.commit()
             
             logger.info(f"Device created successfully: {dict(new_device)}")
@@ -695,6 +763,61 @@ async def create_device_simple(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/manufacturing-orders/{manufacturing_order_number}/devices/bulk")
+async def create_devices_bulk(
+    manufacturing_order_number: str,
+    request: BulkDeviceCreate,
+    current_user: dict = Depends(get_current_user)
+):
+    """Serialize many devices for an MO in one transaction; returns an outcome per serial number"""
+    if current_user['role'] not in ['admin', 'operator']:
+        raise HTTPException(status_code=403, detail="Insufficient permissions")
+    
+    manufacturing_order_number = manufacturing_order_number.strip()
+    serial_numbers = request.expand()
+    if not serial_numbers:
+        raise HTTPException(status_code=400, detail="Provide serial_numbers or serial_prefix and count")
+    if len(serial_numbers) > MAX_BULK_DEVICES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BULK_DEVICES} devices per request")
+    
+    device_type = request.device_type.strip() if request.device_type else None
+    devices = [(serial_number, device_type or get_device_type_from_serial(serial_number))
+               for serial_number in serial_numbers]
+    
+    started = time.perf_counter()
+    try:
+        outcome = await asyncio.to_thread(serialize_devices, manufacturing_order_number, devices,
+                                    current_user['user_id'])
+    except Exception as e:
+        logger.error(f"Error serializing devices for MO {manufacturing_order_number}: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    if outcome is None:
+        raise HTTPException(status_code=404, detail=f"Manufacturing Order {manufacturing_order_number} not found")
+    
+    summary = {"requested": len(serial_numbers), "created": 0, "exists": 0, "invalid": 0}
+    for result in outcome['results']:
+        summary[result['status']] += 1
+    summary['duplicates_in_request'] = len(serial_numbers) - len(outcome['results'])
+    
+    log_action(
+        current_user['user_id'],
+        'create_devices_bulk',
+        'manufacturing_workflow',
+        f"Serialized {summary['created']} of {len(serial_numbers)} devices for MO {manufacturing_order_number}"
+    )
+    if summary['created']:
+        publish_event(mo_topic(manufacturing_order_number), 'devices_serialized', {
+            "manufacturing_order_number": manufacturing_order_number,
+            "created": [r['serial_number'] for r in outcome['results'] if r['status'] == 'created']
+        })
+    
+    return {
+        "manufacturing_order_number": manufacturing_order_number,
+        "summary": summary,
+        "results": outcome['results'],
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)
+    }
+
 @router.post("/devices/register")
 async def register_device(device_data: DeviceRegistration):
     """Register a new device - don't store required_tests, get them from device_test_sequences"""
@@ -716,6 +839,7 @@ async def register_device(device_data: DeviceRegistration):
                 first_test,
                 []  # Empty array for completed tests
             ))
+            device_state.record_created(cursor, [(device_data.serial_number, first_test)])
             
             conn.commit()
             
@@ -733,32 +857,22 @@ async def start_test(serial_number: str, test_id: str):
     """Start a test for a device - No device type validation"""
     try:
         with get_db_connection() as conn:
-            cursor = conn.cursor()
-            
-            # Check if device exists
-            cursor.execute("""
-                SELECT serial_number FROM devices WHERE serial_number = %s
-            """, (serial_number,))
-            
-            if not cursor.fetchone():
-                raise HTTPException(
-                    status_code=404,
-                    detail=f"Device {serial_number} not found"
-                )
-            
-            # Update current_stage
-            cursor.execute("""
-                UPDATE devices 
-                SET current_stage = %s
-                WHERE serial_number = %s
-            """, (test_id, serial_number))
-            
+            # Lock the device row, move it to this test and record the transition
+            transition = device_state.start_test(conn, serial_number, test_id)
             conn.commit()
-            
-            return {
-                "message": "Test started successfully",
-                "data": {"test_id": test_id, "status": "running"}
-            }
+        
+        if transition is None:
+            raise HTTPException(
+                status_code=404,
+                detail=f"Device {serial_number} not found"
+            )
+        
+        notify_test('manufacturing_workflow', 'test_started', serial_number, {"test_id": test_id})
+        
+        return {
+            "message": "Test started successfully",
+            "data": {"test_id": test_id, "status": "running"}
+        }
             
     except HTTPException:
         raise
@@ -817,43 +931,27 @@ async def get_test_status(serial_number: str, test_id: str):
 async def complete_test(serial_number: str, test_id: str):
     """Complete a test for a device - No device type validation"""
     try:
+        # Set next stage to 'completed' or manual selection
+        # Since we don't have device type validation, operator will manually select next test
+        next_stage = 'completed'  # Default to completed, operator can change manually
+        
         with get_db_connection() as conn:
-            cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-            
-            # Get current device state
-            cursor.execute("""
-                SELECT completed_tests, current_stage
-                FROM devices 
-                WHERE serial_number = %s
-            """, (serial_number,))
-            
-            result = cursor.fetchone()
-            if not result:
-                raise HTTPException(status_code=404, detail=f"Device {serial_number} not found")
-            
-            completed_tests = list(result['completed_tests'] or [])
-            
-            # Add test to completed if not already there
-            if test_id not in completed_tests:
-                completed_tests.append(test_id)
-            
-            # Set next stage to 'completed' or manual selection
-            # Since we don't have device type validation, operator will manually select next test
-            next_stage = 'completed'  # Default to completed, operator can change manually
-            
-            # Update device
-            cursor.execute("""
-                UPDATE devices 
-                SET completed_tests = %s, current_stage = %s
-                WHERE serial_number = %s
-            """, (completed_tests, next_stage, serial_number))
-            
+            # Lock the device row and append the test in SQL, so concurrent stations cannot lose an update
+            transition = device_state.complete_test(conn, serial_number, test_id, next_stage)
             conn.commit()
-            
-            return {
-                "message": f"Test {test_id} completed successfully",
-                "data": {"test_id": test_id, "status": "completed", "next_test": next_stage}
-            }
+        
+        if transition is None:
+            raise HTTPException(status_code=404, detail=f"Device {serial_number} not found")
+        
+        notify_test('manufacturing_workflow', 'test_completed', serial_number, {
+            "test_id": test_id,
+            "next_test": next_stage
+        })
+        
+        return {
+            "message": f"Test {test_id} completed successfully",
+            "data": {"test_id": test_id, "status": "completed", "next_test": next_stage}
+        }
             
     except HTTPException:
         raise
@@ -870,7 +968,7 @@ async def get_all_devices(limit: int = 50, offset: int = 0):
             
             # Get devices with pagination
             cursor.execute("""
-                SELECT serial_number, current_stage, completed_tests
+                SELECT serial_number, current_stage, completed_tests, status
                 FROM devices 
                 ORDER BY serial_number
                 LIMIT %s OFFSET %s
@@ -893,14 +991,6 @@ async def get_all_devices(limit: int = 50, offset: int = 0):
                     if test_def:
                         current_test_name = test_def['test_name']
                 
-                # Determine status
-                if device['current_stage'] == 'completed':
-                    status = "completed"
-                elif completed_tests:
-                    status = "in_progress"
-                else:
-                    status = "not_started"
-                
                 device_list.append({
                     "serial_number": device['serial_number'],
                     "device_type": None,  # Not needed
@@ -908,7 +998,7 @@ async def get_all_devices(limit: int = 50, offset: int = 0):
                     "current_test_name": current_test_name,
                     "completed_tests_count": len(completed_tests),
                     "completed_tests": completed_tests,
-                    "status": status
+                    "status": device['status']
                 })
             
             # Get total count
@@ -1035,7 +1125,7 @@ async def get_device_next_step(
             
             # Get device details
             cursor.execute("""
-                SELECT serial_number, current_stage, completed_tests
+                SELECT serial_number, current_stage, completed_tests, device_type
                 FROM devices 
                 WHERE serial_number = %s
             """, (serial_number,))
@@ -1055,14 +1145,18 @@ async def get_device_next_step(
                 next_step = "not_started"
                 next_step_name = "Ready to start first test"
             elif current_stage:
-                # Get test name for current stage
-                cursor.execute("""
-                    SELECT test_name FROM test_definitions 
-                    WHERE test_id = %s
-                """, (current_stage,))
-                test_def = cursor.fetchone()
+                # Test name for the current stage from the device type's compiled sequence
+                compiled = sequence_cache.get(device['device_type'], cursor) if device['device_type'] else None
+                if compiled is not None and current_stage in compiled.by_test_id:
+                    next_step_name = compiled.test_name(current_stage)
+                else:
+                    cursor.execute("""
+                        SELECT test_name FROM test_definitions 
+                        WHERE test_id = %s
+                    """, (current_stage,))
+                    test_def = cursor.fetchone()
+                    next_step_name = test_def['test_name'] if test_def else current_stage
                 next_step = current_stage
-                next_step_name = test_def['test_name'] if test_def else current_stage
             else:
                 next_step = None
                 next_step_name = "No next step defined"
@@ -1082,6 +1176,24 @@ async def get_device_next_step(
         logger.error(f"Error getting next step for {serial_number}: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/devices/{serial_number}/events")
+async def get_device_events(
+    serial_number: str,
+    limit: int = 500,
+    current_user: dict = Depends(get_current_user)
+):
+    """Stage transitions recorded for a device, oldest first, with time spent between them"""
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+            events = device_state.device_events(cursor, serial_number, min(max(limit, 1), 5000))
+        
+        return {"serial_number": serial_number, "events": events}
+        
+    except Exception as e:
+        logger.error(f"Error getting events for {serial_number}: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.post("/devices/{serial_number}/continue")
 async def continue_device_testing(
     serial_number: str,
@@ -1144,12 +1256,7 @@ async def get_device_type_summary(
             
             # Get devices for this device type
             cursor.execute("""
-                SELECT d.serial_number, d.current_stage, d.completed_tests,
-                       CASE 
-                           WHEN d.current_stage = 'completed' THEN 'completed'
-                           WHEN array_length(d.completed_tests, 1) > 0 THEN 'in_progress'
-                           ELSE 'not_started'
-                       END as status
+                SELECT d.serial_number, d.current_stage, d.completed_tests, d.status
                 FROM devices d
                 WHERE (d.serial_number LIKE %s OR d.serial_number LIKE %s)
                 ORDER BY d.serial_number
@@ -1188,83 +1295,6 @@ async def get_device_type_summary(
         logger.error(f"Error getting device type summary for {mo_number}/{device_type}: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-# Enhanced device search with better filtering
-@router.get("/devices/search")
-async def search_devices(
-    q: Optional[str] = None,
-    device_type: Optional[str] = None,
-    status: Optional[str] = None,
-    mo_number: Optional[str] = None,
-    limit: int = 50,
-    offset: int = 0,
-    current_user: dict = Depends(get_current_user)
-):
-    """Enhanced device search with multiple filters"""
-    try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-            
-            # Build dynamic query
-            base_query = """
-                SELECT d.serial_number, d.current_stage, d.completed_tests,
-                       CASE 
-                           WHEN d.current_stage = 'completed' THEN 'completed'
-                           WHEN array_length(d.completed_tests, 1) > 0 THEN 'in_progress'
-                           ELSE 'not_started'
-                       END as status
-                FROM devices d
-                WHERE 1=1
-            """
-            
-            params = []
-            
-            # Add filters
-            if q:
-                base_query += " AND d.serial_number ILIKE %s"
-                params.append(f"%{q}%")
-            
-            if device_type:
-                base_query += " AND (d.serial_number LIKE %s OR d.serial_number LIKE %s)"
-                params.extend([f"{device_type}%", f"{device_type}-%"])
-            
-            # Add status filter in HAVING clause since status is calculated
-            having_clause = ""
-            if status:
-                having_clause = f" HAVING status = %s"
-                params.append(status)
-            
-            # Add ordering and pagination
-            base_query += having_clause + " ORDER BY d.serial_number LIMIT %s OFFSET %s"
-            params.extend([limit, offset])
-            
-            cursor.execute(base_query, params)
-            devices = cursor.fetchall()
-            
-            # Get total count for pagination
-            count_query = base_query.replace("LIMIT %s OFFSET %s", "").replace(
-                "SELECT d.serial_number, d.current_stage, d.completed_tests, CASE WHEN d.current_stage = 'completed' THEN 'completed' WHEN array_length(d.completed_tests, 1) > 0 THEN 'in_progress' ELSE 'not_started' END as status",
-                "SELECT COUNT(*)"
-            )
-            cursor.execute(count_query, params[:-2])  # Remove limit/offset params
-            total_count = cursor.fetchone()['count']
-            
-            return {
-                "devices": [dict(device) for device in devices],
-                "total_count": total_count,
-                "limit": limit,
-                "offset": offset,
-                "filters": {
-                    "search_query": q,
-                    "device_type": device_type,
-                    "status": status,
-                    "mo_number": mo_number
-                }
-            }
-            
-    except Exception as e:
-        logger.error(f"Error searching devices: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
-
 # Debug Endpoints
 @router.get("/debug/devices")
 async def debug_existing_devices():
@@ -1346,62 +1376,24 @@ async def debug_table_structure(table_name: str):
 async def get_test_sequence_with_instructions(device_type: str):
     """Get test sequence with work instruction PDFs"""
     try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-            
-            # Get test sequence
-            cursor.execute("""
-                SELECT test_sequence 
-                FROM device_test_sequences 
-                WHERE device_type = %s
-            """, (device_type,))
-            
-            result = cursor.fetchone()
-            if not result:
-                raise HTTPException(status_code=404, detail=f"Device type {device_type} not found")
-            
-            test_sequences = result['test_sequence']
-            if isinstance(test_sequences, list):
-                test_sequences.sort(key=lambda x: int(x.get('sequence_order', 0)))
-                
-                # Get test definitions with work instructions
-                test_ids = [test['test_id'] for test in test_sequences]
-                
-                if test_ids:
-                    placeholders = ','.join(['%s'] * len(test_ids))
-                    cursor.execute(f"""
-                        SELECT test_id, test_name, description, 
-                               estimated_duration_minutes, work_instruction_pdf
-                        FROM test_definitions 
-                        WHERE test_id IN ({placeholders})
-                    """, test_ids)
-                    
-                    test_definitions = {row['test_id']: row for row in cursor.fetchall()}
-                else:
-                    test_definitions = {}
-                
-                # Combine test sequence with definitions and PDFs
-                detailed_tests = []
-                for test in test_sequences:
-                    test_def = test_definitions.get(test['test_id'], {})
-                    is_required = test.get('is_required', True)
-                    if isinstance(is_required, str):
-                        is_required = is_required.lower() == 'true'
-                    
-                    detailed_tests.append({
-                        "test_id": test['test_id'],
-                        "test_name": test_def.get('test_name', test['test_id']),
-                        "description": test_def.get('description', ''),
-                        "sequence_order": test['sequence_order'],
-                        "is_required": is_required,
-                        "estimated_duration_minutes": test_def.get('estimated_duration_minutes', 0),
-                        "work_instruction_pdf": test_def.get('work_instruction_pdf')
-                    })
-                
-                return {"test_sequence": detailed_tests}
-            
-            return {"test_sequence": []}
+        compiled = await asyncio.to_thread(sequence_cache.get, device_type)
+        if compiled is None:
+            raise HTTPException(status_code=404, detail=f"Device type {device_type} not found")
+        
+        detailed_tests = [{
+            "test_id": step.test_id,
+            "test_name": step.test_name,
+            "description": step.description,
+            "sequence_order": step.sequence_order,
+            "is_required": step.is_required,
+            "estimated_duration_minutes": step.estimated_duration_minutes,
+            "work_instruction_pdf": step.work_instruction_pdf
+        } for step in compiled.steps]
+        
+        return {"test_sequence": detailed_tests}
             
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error getting test sequence for {device_type}: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -1416,18 +1408,14 @@ async def get_devices_by_type_simple(device_type: str):
             # Get devices that match this device type
             cursor.execute("""
                 SELECT d.serial_number, d.current_stage, d.completed_tests, 
-                       d.created_at, d.device_type,
-                       CASE 
-                           WHEN d.current_stage = 'completed' THEN 'completed'
-                           WHEN array_length(d.completed_tests, 1) > 0 THEN 'in_progress'
-                           ELSE 'not_started'
-                       END as status
+                       d.created_at, d.device_type, d.status
                 FROM devices d
                 WHERE d.device_type = %s
                 ORDER BY d.created_at DESC
             """, (device_type,))
             
             devices = cursor.fetchall()
+            compiled = sequence_cache.get(device_type, cursor) if devices else None
             
             # Enhance with current test name
             enhanced_devices = []
@@ -1436,12 +1424,15 @@ async def get_devices_by_type_simple(device_type: str):
                 
                 # Get current test name if available
                 if device['current_stage'] and device['current_stage'] not in ['not_started', 'completed']:
-                    cursor.execute("""
-                        SELECT test_name FROM test_definitions 
-                        WHERE test_id = %s
-                    """, (device['current_stage'],))
-                    test_def = cursor.fetchone()
-                    device_dict['current_test_name'] = test_def['test_name'] if test_def else device['current_stage']
+                    if compiled is not None and device['current_stage'] in compiled.by_test_id:
+                        device_dict['current_test_name'] = compiled.test_name(device['current_stage'])
+                    else:
+                        cursor.execute("""
+                            SELECT test_name FROM test_definitions 
+                            WHERE test_id = %s
+                        """, (device['current_stage'],))
+                        test_def = cursor.fetchone()
+                        device_dict['current_test_name'] = test_def['test_name'] if test_def else device['current_stage']
                 else:
                     device_dict['current_test_name'] = None
                 
@@ -1457,97 +1448,13 @@ async def get_devices_by_type_simple(device_type: str):
         logger.error(f"Error getting devices for type {device_type}: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.post("/devices/create")
-async def create_device_simplified(
-    serial_number: str,
-    device_type: str,
-    current_user: dict = Depends(get_current_user)
-):
-    """Create a new device with automatic test sequence setup"""
-    try:
-        serial_number = serial_number.strip()
-        device_type = device_type.strip()
-        
-        with get_db_connection() as conn:
-            cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-            
-            # Check if device already exists
-            cursor.execute("""
-                SELECT serial_number FROM devices WHERE serial_number = %s
-            """, (serial_number,))
-            
-            if cursor.fetchone():
-                raise HTTPException(status_code=409, detail=f"Device {serial_number} already exists")
-            
-            # Get test sequence for this device type
-            cursor.execute("""
-                SELECT test_sequence FROM device_test_sequences WHERE device_type = %s
-            """, (device_type,))
-            
-            test_seq_result = cursor.fetchone()
-            if not test_seq_result:
-                raise HTTPException(status_code=404, detail=f"No test sequence found for device type: {device_type}")
-            
-            # Parse the test sequence
-            test_sequences = test_seq_result['test_sequence']
-            required_tests = []
-            first_test = 'not_started'
-            
-            if isinstance(test_sequences, list):
-                test_sequences.sort(key=lambda x: int(x.get('sequence_order', 0)))
-                
-                # Get required tests in order
-                for test in test_sequences:
-                    is_required = test.get('is_required', True)
-                    if isinstance(is_required, str):
-                        is_required = is_required.lower() == 'true'
-                    if is_required:
-                        required_tests.append(test['test_id'])
-                
-                # Set first test as current stage
-                if required_tests:
-                    first_test = required_tests[0]
-            
-            # Insert device
-            cursor.execute("""
-                INSERT INTO devices (
-                    serial_number, 
-                    device_type,
-                    current_stage, 
-                    completed_tests,
-                    required_tests,
-                    created_at
-                )
-                VALUES (%s, %s, %s, %s, %s, CURRENT_TIMESTAMP)
-                RETURNING serial_number, device_type, current_stage, created_at
-            """, (serial_number, device_type, first_test, [], required_tests))
-            
-            new_device = cursor.fetchone()
-            conn.commit()
-            
-            # Log the action
-            log_action(
-                current_user['user_id'],
-                'create_device',
-                'manufacturing_workflow',
-                f"Created device {serial_number} of type {device_type}"
-            )
-            
-            return {
-                "message": f"Device {serial_number} created successfully",
-                "device": {
-                    "serial_number": new_device['serial_number'],
-                    "device_type": new_device['device_type'],
-                    "current_stage": new_device['current_stage'],
-                    "created_at": new_device['created_at'].isoformat()
-                }
-            }
-            
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"Error creating device {serial_number}: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
-
-# Initialize DB pool on module load
-init_db_pool()
\ No newline at end of file
+MODULE_MANIFEST = ModuleManifest(
+    name='manufacturing_workflow',
+    router=router,
+    prefix='/api/manufacturing',
+    tags=['Manufacturing Workflow'],
+    # Share main's connection pool instead of opening a second one
+    on_load=lambda services: set_db_connection(services['get_db_connection']),
+    on_startup=start_sequence_listener,
+    health_probe=lambda: {"sequence_cache": sequence_cache.stats()}
+)
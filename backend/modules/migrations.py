@@ -0,0 +1,1054 @@
+# modules/migrations.py - Versioned schema migrations, applied once at deploy time
+#
+# Usage (from the backend directory):
+#     python -m modules.migrations status     # show applied / pending versions
+#     python -m modules.migrations upgrade    # apply pending migrations
+#
+# The API only checks the schema version at startup; it never issues DDL on a request path.
+
+import os
+import sys
+import time
+import psycopg2
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Database configuration (same defaults as the API server)
+DATABASE_CONFIG = {
+    'host': os.getenv('DB_HOST', '192.168.99.121'),
+    'port': int(os.getenv('DB_PORT', '5432')),
+    'database': os.getenv('DB_NAME', 'postgres'),
+    'user': os.getenv('DB_USER', 'postgres'),
+    'password': os.getenv('DB_PASSWORD', 'karthi'),
+    'connect_timeout': int(os.getenv('DB_CONNECT_TIMEOUT', '5'))
+}
+
+# Serialises concurrent deploys (arbitrary application-wide advisory lock key)
+MIGRATION_LOCK_KEY = 74210032
+
+def index_if_table(table: str, index: str, columns: str) -> str:
+    """CREATE INDEX on a table that is provisioned outside this runner, skipped if it is absent"""
+    return f"""
+        DO $$
+        BEGIN
+            IF to_regclass('public.{table}') IS NOT NULL THEN
+                CREATE INDEX IF NOT EXISTS {index} ON {table}({columns});
+            END IF;
+        END $$;
+    """
+
+# Ordered migrations: (version, description, statements). Never edit an applied entry; append a new one.
+MIGRATIONS = [
+    (1, "core tables: users, sessions, system_logs, system_status", [
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id SERIAL PRIMARY KEY,
+            username VARCHAR(50) UNIQUE NOT NULL,
+            password_hash VARCHAR(255) NOT NULL,
+            email VARCHAR(100),
+            role VARCHAR(20) NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_login TIMESTAMP,
+            is_active BOOLEAN DEFAULT TRUE
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS sessions (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER REFERENCES users(id),
+            session_token VARCHAR(255),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            expires_at TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS system_logs (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER REFERENCES users(id),
+            action VARCHAR(100),
+            module VARCHAR(50),
+            details TEXT,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS system_status (
+            id SERIAL PRIMARY KEY,
+            component VARCHAR(50) UNIQUE,
+            status VARCHAR(20),
+            message TEXT,
+            last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+    ]),
+    (2, "chip preparation tables", [
+        """
+        CREATE TABLE IF NOT EXISTS chip_preparation (
+            id SERIAL PRIMARY KEY,
+            chip_serial_number VARCHAR(100) UNIQUE NOT NULL,
+            wafer_id VARCHAR(100) NOT NULL,
+            operator VARCHAR(100) NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            created_by INTEGER REFERENCES users(id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS chip_preparation_sections (
+            id SERIAL PRIMARY KEY,
+            chip_serial_number VARCHAR(100) NOT NULL REFERENCES chip_preparation(chip_serial_number),
+            section_name VARCHAR(50) NOT NULL,
+            completed BOOLEAN DEFAULT FALSE,
+            completed_at TIMESTAMP,
+            completed_by INTEGER REFERENCES users(id),
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS chip_epoxy_cure (
+            id SERIAL PRIMARY KEY,
+            chip_serial_number VARCHAR(100) NOT NULL REFERENCES chip_preparation(chip_serial_number),
+            start_time TIMESTAMP,
+            end_time TIMESTAMP,
+            duration_seconds INTEGER DEFAULT 10800,
+            status VARCHAR(20) DEFAULT 'ready',
+            remaining_seconds INTEGER DEFAULT 10800,
+            started_by INTEGER REFERENCES users(id),
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_chip_sections_chip_serial ON chip_preparation_sections(chip_serial_number)",
+        "CREATE INDEX IF NOT EXISTS idx_chip_epoxy_chip_serial ON chip_epoxy_cure(chip_serial_number)",
+    ]),
+    (3, "housing inspection table", [
+        """
+        CREATE TABLE IF NOT EXISTS housing_inspections (
+            id SERIAL PRIMARY KEY,
+            inspection_id VARCHAR(255) UNIQUE NOT NULL,
+            operator VARCHAR(100) NOT NULL,
+            housing_lot_number VARCHAR(100) NOT NULL,
+            housing_serial_number VARCHAR(100) NOT NULL,
+            notes TEXT,
+            status VARCHAR(50) NOT NULL DEFAULT 'started',
+            image_path TEXT,
+            image_filename VARCHAR(255),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            created_by INTEGER REFERENCES users(id)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_housing_inspections_status ON housing_inspections(status)",
+        "CREATE INDEX IF NOT EXISTS idx_housing_inspections_created_at ON housing_inspections(created_at)",
+    ]),
+    (4, "two-tone spec table with default ranges", [
+        """
+        CREATE TABLE IF NOT EXISTS twotone_test_spec (
+            device_type VARCHAR(100) PRIMARY KEY,
+            rf_vpi_min DECIMAL(8,3) NOT NULL,
+            rf_vpi_max DECIMAL(8,3) NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        INSERT INTO twotone_test_spec (device_type, rf_vpi_min, rf_vpi_max) VALUES
+            ('LNA2322', 4.0, 5.0),
+            ('LNA2124', 3.8, 4.8),
+            ('LNA6213', 5.0, 6.0),
+            ('LNA6112', 5.0, 6.0),
+            ('LNLVL-IM-Z', 1.7, 2.7),
+            ('LNQ4314', 5.5, 6.5)
+        ON CONFLICT (device_type) DO NOTHING
+        """,
+    ]),
+    (5, "S11 results table", [
+        """
+        CREATE TABLE IF NOT EXISTS s11_test_results (
+            id SERIAL PRIMARY KEY,
+            test_id VARCHAR(255) UNIQUE NOT NULL,
+            device_type VARCHAR(100) NOT NULL,
+            chips_no VARCHAR(100) NOT NULL,
+            housing_sno VARCHAR(100) NOT NULL,
+            housing_lno VARCHAR(100) NOT NULL,
+            operator VARCHAR(100) NOT NULL,
+            result VARCHAR(20) NOT NULL,
+            plot_path TEXT,
+            frequency_data TEXT,
+            magnitude_data TEXT,
+            limit_data TEXT,
+            failure_details TEXT,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            created_by INTEGER REFERENCES users(id)
+        )
+        """,
+    ]),
+    (6, "artifact index", [
+        """
+        CREATE TABLE IF NOT EXISTS artifacts (
+            id SERIAL PRIMARY KEY,
+            path TEXT UNIQUE NOT NULL,
+            artifact_type VARCHAR(30) NOT NULL,
+            owner_module VARCHAR(50),
+            owner_ref VARCHAR(255),
+            size_bytes BIGINT NOT NULL DEFAULT 0,
+            storage_tier VARCHAR(20) NOT NULL DEFAULT 'hot',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_accessed TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            compressed_at TIMESTAMP,
+            deleted_at TIMESTAMP
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_artifacts_type_tier_accessed ON artifacts(artifact_type, storage_tier, last_accessed)",
+        "CREATE INDEX IF NOT EXISTS idx_artifacts_owner ON artifacts(owner_module, owner_ref)",
+    ]),
+    (7, "hot-query indexes: test date, device type, serial number, MO number", [
+        # Result tables (test history, station dashboards, traveler lookups)
+        index_if_table('s21_test_results', 'idx_s21_results_device_type', 'device_type'),
+        index_if_table('s21_test_results', 'idx_s21_results_test_date', 'test_date'),
+        index_if_table('s21_test_results', 'idx_s21_results_serial_number', 'serial_number'),
+        index_if_table('twotone_test_results', 'idx_twotone_results_device_type', 'device_type'),
+        index_if_table('twotone_test_results', 'idx_twotone_results_test_date', 'test_date'),
+        index_if_table('twotone_test_results', 'idx_twotone_results_serial_number', 'serial_number'),
+        index_if_table('modulator_test_results', 'idx_modulator_results_device_type', 'device_type'),
+        index_if_table('modulator_test_results', 'idx_modulator_results_test_date', 'test_date'),
+        index_if_table('modulator_test_results', 'idx_modulator_results_serial_number', 'serial_number'),
+        "CREATE INDEX IF NOT EXISTS idx_s11_results_device_type ON s11_test_results(device_type)",
+        "CREATE INDEX IF NOT EXISTS idx_s11_results_timestamp ON s11_test_results(timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_s11_results_housing_sno ON s11_test_results(housing_sno)",
+        # Manufacturing workflow
+        index_if_table('devices', 'idx_devices_device_type', 'device_type'),
+        index_if_table('device_test_sequences', 'idx_device_test_sequences_device_type', 'device_type'),
+        index_if_table('manufacturing_order_devices', 'idx_mo_devices_mo_number_device_type',
+                       'manufacturing_order_number, device_type'),
+        index_if_table('manufacturing_orders', 'idx_manufacturing_orders_created_at', 'created_at'),
+    ]),
+    (8, "system_logs partitioned by month with JSONB context and query indexes", [
+        # Move the old table (and its sequence / primary key names) out of the way
+        "ALTER TABLE system_logs RENAME TO system_logs_unpartitioned",
+        "ALTER SEQUENCE IF EXISTS system_logs_id_seq RENAME TO system_logs_unpartitioned_id_seq",
+        "ALTER INDEX IF EXISTS system_logs_pkey RENAME TO system_logs_unpartitioned_pkey",
+        """
+        CREATE TABLE system_logs (
+            id BIGSERIAL,
+            user_id INTEGER REFERENCES users(id),
+            action VARCHAR(100),
+            module VARCHAR(50),
+            details TEXT,
+            context JSONB,
+            timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (id, timestamp)
+        ) PARTITION BY RANGE (timestamp)
+        """,
+        "CREATE TABLE system_logs_default PARTITION OF system_logs DEFAULT",
+        # Monthly partitions from the oldest existing record up to two months ahead
+        """
+        DO $$
+        DECLARE
+            month_start DATE;
+            last_month DATE := date_trunc('month', CURRENT_DATE + INTERVAL '2 months')::date;
+        BEGIN
+            SELECT date_trunc('month', COALESCE(MIN(timestamp), CURRENT_TIMESTAMP))::date
+            INTO month_start FROM system_logs_unpartitioned;
+            WHILE month_start <= last_month LOOP
+                EXECUTE format('CREATE TABLE IF NOT EXISTS %I PARTITION OF system_logs FOR VALUES FROM (%L) TO (%L)',
+                               'system_logs_' || to_char(month_start, 'YYYY_MM'),
+                               month_start, (month_start + INTERVAL '1 month')::date);
+                month_start := (month_start + INTERVAL '1 month')::date;
+            END LOOP;
+        END $$;
+        """,
+        # Copy history; the user counts that log_action appended to details become structured context
+        r"""
+        INSERT INTO system_logs (id, user_id, action, module, details, context, timestamp)
+        SELECT id, user_id, action, module,
+               regexp_replace(details, ' \| Active users: \d+ \| Module users: \d+$', ''),
+               CASE WHEN details ~ '\| Active users: \d+ \| Module users: \d+$' THEN jsonb_build_object(
+                   'active_users', substring(details from 'Active users: (\d+)')::int,
+                   'module_users', substring(details from 'Module users: (\d+)')::int)
+               END,
+               COALESCE(timestamp, CURRENT_TIMESTAMP)
+        FROM system_logs_unpartitioned
+        """,
+        "SELECT setval(pg_get_serial_sequence('system_logs', 'id'), COALESCE((SELECT MAX(id) FROM system_logs), 0) + 1, false)",
+        "DROP TABLE system_logs_unpartitioned",
+        "CREATE INDEX idx_system_logs_timestamp ON system_logs (timestamp DESC, id DESC)",
+        "CREATE INDEX idx_system_logs_module_timestamp ON system_logs (module, timestamp DESC)",
+        "CREATE INDEX idx_system_logs_user_timestamp ON system_logs (user_id, timestamp DESC)",
+        "CREATE INDEX idx_system_logs_action_timestamp ON system_logs (action, timestamp DESC)",
+    ]),
+    (9, "devices: manufacturing order link and unique serial numbers for bulk serialization", [
+        """
+        DO $$
+        BEGIN
+            IF to_regclass('public.devices') IS NOT NULL THEN
+                ALTER TABLE devices ADD COLUMN IF NOT EXISTS manufacturing_order_number VARCHAR(100);
+                CREATE INDEX IF NOT EXISTS idx_devices_mo_number ON devices(manufacturing_order_number);
+                -- ON CONFLICT (serial_number) needs a unique index on exactly that column
+                IF NOT EXISTS (
+                    SELECT 1 FROM pg_index i
+                    JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = i.indkey[0]
+                    WHERE i.indrelid = 'public.devices'::regclass AND i.indisunique
+                      AND i.indnatts = 1 AND a.attname = 'serial_number'
+                ) THEN
+                    CREATE UNIQUE INDEX idx_devices_serial_number_unique ON devices(serial_number);
+                END IF;
+            END IF;
+        END $$;
+        """,
+    ]),
+    (10, "NOTIFY device_sequences_changed when test sequences or test definitions change", [
+        """
+        CREATE OR REPLACE FUNCTION notify_device_sequence_changed() RETURNS trigger AS $$
+        BEGIN
+            IF TG_TABLE_NAME = 'device_test_sequences' THEN
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    PERFORM pg_notify('device_sequences_changed', OLD.device_type);
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    PERFORM pg_notify('device_sequences_changed', NEW.device_type);
+                END IF;
+            ELSE
+                -- A test definition can appear in any sequence
+                PERFORM pg_notify('device_sequences_changed', '*');
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+        """,
+        """
+        DO $$
+        BEGIN
+            IF to_regclass('public.device_test_sequences') IS NOT NULL THEN
+                DROP TRIGGER IF EXISTS trg_device_test_sequences_notify ON device_test_sequences;
+                CREATE TRIGGER trg_device_test_sequences_notify
+                    AFTER INSERT OR UPDATE OR DELETE ON device_test_sequences
+                    FOR EACH ROW EXECUTE FUNCTION notify_device_sequence_changed();
+            END IF;
+            IF to_regclass('public.test_definitions') IS NOT NULL THEN
+                DROP TRIGGER IF EXISTS trg_test_definitions_notify ON test_definitions;
+                CREATE TRIGGER trg_test_definitions_notify
+                    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON test_definitions
+                    FOR EACH STATEMENT EXECUTE FUNCTION notify_device_sequence_changed();
+            END IF;
+        END $$;
+        """,
+    ]),
+    (11, "devices: stored status column and append-only device_events transition log", [
+        """
+        CREATE TABLE IF NOT EXISTS device_events (
+            id BIGSERIAL PRIMARY KEY,
+            serial_number VARCHAR(100) NOT NULL,
+            event_type VARCHAR(30) NOT NULL,
+            test_id VARCHAR(100),
+            from_stage VARCHAR(100),
+            to_stage VARCHAR(100),
+            from_status VARCHAR(20),
+            to_status VARCHAR(20),
+            user_id INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_device_events_serial ON device_events(serial_number, id)",
+        "CREATE INDEX IF NOT EXISTS idx_device_events_type_created ON device_events(event_type, created_at)",
+        """
+        CREATE OR REPLACE FUNCTION device_events_append_only() RETURNS trigger AS $$
+        BEGIN
+            RAISE EXCEPTION 'device_events is append-only';
+        END;
+        $$ LANGUAGE plpgsql;
+        """,
+        "DROP TRIGGER IF EXISTS trg_device_events_append_only ON device_events",
+        """
+        CREATE TRIGGER trg_device_events_append_only
+            BEFORE UPDATE OR DELETE ON device_events
+            FOR EACH ROW EXECUTE FUNCTION device_events_append_only()
+        """,
+        """
+        DO $$
+        BEGIN
+            IF to_regclass('public.devices') IS NOT NULL THEN
+                ALTER TABLE devices ADD COLUMN IF NOT EXISTS status VARCHAR(20);
+                ALTER TABLE devices ADD COLUMN IF NOT EXISTS status_updated_at TIMESTAMP;
+                UPDATE devices SET status = CASE
+                        WHEN current_stage = 'completed' THEN 'completed'
+                        WHEN array_length(completed_tests, 1) > 0 THEN 'in_progress'
+                        ELSE 'not_started'
+                    END
+                WHERE status IS NULL;
+                ALTER TABLE devices ALTER COLUMN status SET DEFAULT 'not_started';
+                CREATE INDEX IF NOT EXISTS idx_devices_status ON devices(status);
+                CREATE INDEX IF NOT EXISTS idx_devices_type_status ON devices(device_type, status);
+            END IF;
+        END $$;
+        """,
+    ]),
+    (12, "device_traveler materialized view: every module's records per device serial, refreshed on NOTIFY", [
+        # Sources are added for the tables that exist when it runs; SELECT rebuild_device_traveler() picks up new ones
+        """
+        CREATE OR REPLACE FUNCTION rebuild_device_traveler() RETURNS integer AS $fn$
+        DECLARE
+            parts TEXT[] := ARRAY[]::TEXT[];
+            source_tables TEXT[] := ARRAY['device_events'];
+            source_table TEXT;
+            mo_column TEXT := 'NULL::TEXT';
+            mo_join TEXT := '';
+        BEGIN
+            -- Workflow transitions
+            parts := parts || $q$
+                SELECT e.serial_number::TEXT, 'workflow'::TEXT AS source, e.id::TEXT AS record_id,
+                       e.created_at AS event_at, e.event_type::TEXT AS result, NULL::TEXT AS operator,
+                       NULL::TEXT AS chip_serial_number,
+                       jsonb_build_object('test_id', e.test_id, 'from_stage', e.from_stage, 'to_stage', e.to_stage,
+                                          'to_status', e.to_status, 'user_id', e.user_id) AS details
+                FROM device_events e
+            $q$;
+
+            IF to_regclass('public.s11_test_results') IS NOT NULL THEN
+                source_tables := source_tables || 's11_test_results'::TEXT;
+                -- S11 is measured on the housed device: housing_sno is the device serial, chips_no the chip inside
+                parts := parts || $q$
+                    SELECT s.housing_sno::TEXT, 's11', s.test_id::TEXT, s."timestamp", s.result::TEXT,
+                           s.operator::TEXT, s.chips_no::TEXT,
+                           jsonb_build_object('device_type', s.device_type, 'housing_lno', s.housing_lno,
+                                              'plot_path', s.plot_path)
+                    FROM s11_test_results s
+                $q$;
+                IF to_regclass('public.chip_preparation') IS NOT NULL THEN
+                    source_tables := source_tables || 'chip_preparation'::TEXT;
+                    parts := parts || $q$
+                        SELECT DISTINCT s.housing_sno::TEXT, 'chip_preparation', cp.chip_serial_number::TEXT,
+                               cp.created_at, 'prepared'::TEXT, cp.operator::TEXT, cp.chip_serial_number::TEXT,
+                               jsonb_build_object('wafer_id', cp.wafer_id)
+                        FROM chip_preparation cp
+                        JOIN s11_test_results s ON s.chips_no = cp.chip_serial_number
+                    $q$;
+                END IF;
+                IF to_regclass('public.chip_epoxy_cure') IS NOT NULL THEN
+                    source_tables := source_tables || 'chip_epoxy_cure'::TEXT;
+                    parts := parts || $q$
+                        SELECT DISTINCT s.housing_sno::TEXT, 'epoxy_cure', c.id::TEXT,
+                               COALESCE(c.end_time, c.start_time, c.updated_at), c.status::TEXT, NULL::TEXT,
+                               c.chip_serial_number::TEXT,
+                               jsonb_build_object('start_time', c.start_time, 'end_time', c.end_time,
+                                                  'duration_seconds', c.duration_seconds)
+                        FROM chip_epoxy_cure c
+                        JOIN s11_test_results s ON s.chips_no = c.chip_serial_number
+                    $q$;
+                END IF;
+            END IF;
+
+            IF to_regclass('public.housing_inspections') IS NOT NULL THEN
+                source_tables := source_tables || 'housing_inspections'::TEXT;
+                parts := parts || $q$
+                    SELECT h.housing_serial_number::TEXT, 'housing_inspection', h.inspection_id::TEXT,
+                           h.created_at, h.status::TEXT, h.operator::TEXT, NULL::TEXT,
+                           jsonb_build_object('housing_lot_number', h.housing_lot_number, 'notes', h.notes,
+                                              'image_filename', h.image_filename)
+                    FROM housing_inspections h
+                $q$;
+            END IF;
+
+            IF to_regclass('public.s21_test_results') IS NOT NULL THEN
+                source_tables := source_tables || 's21_test_results'::TEXT;
+                parts := parts || $q$
+                    SELECT r.serial_number::TEXT, 's21', r.id::TEXT, r.test_date, r.overall_result::TEXT,
+                           r.operator::TEXT, NULL::TEXT,
+                           jsonb_build_object('device_type', r.device_type, 's21_bandwidth', r.s21_bandwidth,
+                                              'frequency_3db', r.frequency_3db, 'ripple_result', r.ripple_result,
+                                              'notes', r.notes)
+                    FROM s21_test_results r
+                $q$;
+            END IF;
+
+            IF to_regclass('public.twotone_test_results') IS NOT NULL THEN
+                source_tables := source_tables || 'twotone_test_results'::TEXT;
+                parts := parts || $q$
+                    SELECT r.serial_number::TEXT, 'twotone', r.id::TEXT, r.test_date, r.result::TEXT,
+                           r.operator::TEXT, NULL::TEXT,
+                           jsonb_build_object('device_type', r.device_type, 'rf_vpi_1ghz', r.rf_vpi_1ghz,
+                                              'mixterm1', r.mixterm1, 'mixterm2', r.mixterm2, 'notes', r.notes)
+                    FROM twotone_test_results r
+                $q$;
+            END IF;
+
+            IF to_regclass('public.modulator_test_results') IS NOT NULL THEN
+                source_tables := source_tables || 'modulator_test_results'::TEXT;
+                parts := parts || $q$
+                    SELECT r.serial_number::TEXT, 'dcvpi', r.id::TEXT, r.test_date, r.result::TEXT,
+                           r.operator::TEXT, NULL::TEXT,
+                           jsonb_build_object('device_type', r.device_type, 'vpi_value', r.vpi_value,
+                                              'insertion_loss', r.insertion_loss,
+                                              'extinction_ratio', r.extinction_ratio, 'drift', r.drift,
+                                              'notes', r.notes)
+                    FROM modulator_test_results r
+                $q$;
+            END IF;
+
+            IF to_regclass('public.devices') IS NOT NULL THEN
+                source_tables := source_tables || 'devices'::TEXT;
+                mo_column := 'd.manufacturing_order_number::TEXT';
+                mo_join := 'LEFT JOIN devices d ON d.serial_number = t.serial_number';
+            END IF;
+
+            DROP MATERIALIZED VIEW IF EXISTS device_traveler;
+            EXECUTE 'CREATE MATERIALIZED VIEW device_traveler AS '
+                 || 'SELECT t.serial_number, t.source, t.record_id, t.event_at, t.result, t.operator, '
+                 || 't.chip_serial_number, t.details, ' || mo_column || ' AS manufacturing_order_number '
+                 || 'FROM (' || array_to_string(parts, ' UNION ALL ') || ') AS t(serial_number, source, record_id, '
+                 || 'event_at, result, operator, chip_serial_number, details) '
+                 || mo_join || ' WHERE t.serial_number IS NOT NULL';
+            -- The unique index lets REFRESH ... CONCURRENTLY keep the view readable while it rebuilds
+            CREATE UNIQUE INDEX idx_device_traveler_record ON device_traveler(source, record_id, serial_number);
+            CREATE INDEX idx_device_traveler_serial ON device_traveler(serial_number, event_at);
+            CREATE INDEX idx_device_traveler_mo ON device_traveler(manufacturing_order_number);
+            CREATE INDEX idx_device_traveler_chip ON device_traveler(chip_serial_number);
+
+            FOREACH source_table IN ARRAY source_tables LOOP
+                EXECUTE format('DROP TRIGGER IF EXISTS trg_traveler_notify ON %I', source_table);
+                EXECUTE format('CREATE TRIGGER trg_traveler_notify AFTER INSERT OR UPDATE OR DELETE ON %I '
+                               'FOR EACH STATEMENT EXECUTE FUNCTION notify_traveler_changed()', source_table);
+            END LOOP;
+            RETURN array_length(parts, 1);
+        END;
+        $fn$ LANGUAGE plpgsql;
+        """,
+        """
+        CREATE OR REPLACE FUNCTION notify_traveler_changed() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('traveler_changed', TG_TABLE_NAME);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+        """,
+        "SELECT rebuild_device_traveler()",
+    ]),
+    (13, "analytics.fact_test_results upsert keys, ETL watermarks and change notifications from result tables", [
+        "CREATE SCHEMA IF NOT EXISTS analytics",
+        """
+        CREATE TABLE IF NOT EXISTS analytics.fact_test_results (
+            id BIGSERIAL PRIMARY KEY,
+            test_type VARCHAR(50),
+            result VARCHAR(20),
+            operator_name VARCHAR(100),
+            test_timestamp TIMESTAMP,
+            metric_1 DOUBLE PRECISION
+        )
+        """,
+        # The table may predate this runner; add what the loader writes
+        "ALTER TABLE analytics.fact_test_results ADD COLUMN IF NOT EXISTS source_table VARCHAR(64)",
+        "ALTER TABLE analytics.fact_test_results ADD COLUMN IF NOT EXISTS source_id BIGINT",
+        "ALTER TABLE analytics.fact_test_results ADD COLUMN IF NOT EXISTS serial_number VARCHAR(100)",
+        "ALTER TABLE analytics.fact_test_results ADD COLUMN IF NOT EXISTS device_type VARCHAR(100)",
+        "ALTER TABLE analytics.fact_test_results ADD COLUMN IF NOT EXISTS metric_2 DOUBLE PRECISION",
+        "ALTER TABLE analytics.fact_test_results ADD COLUMN IF NOT EXISTS metric_3 DOUBLE PRECISION",
+        "ALTER TABLE analytics.fact_test_results ADD COLUMN IF NOT EXISTS loaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP",
+        """
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_fact_test_results_source
+            ON analytics.fact_test_results(source_table, source_id)
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_fact_test_results_timestamp ON analytics.fact_test_results(test_timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_fact_test_results_type ON analytics.fact_test_results(test_type)",
+        """
+        CREATE TABLE IF NOT EXISTS analytics.etl_watermarks (
+            source_table VARCHAR(64) PRIMARY KEY,
+            last_id BIGINT NOT NULL DEFAULT 0,
+            rows_loaded BIGINT NOT NULL DEFAULT 0,
+            last_run_at TIMESTAMP
+        )
+        """,
+        """
+        CREATE OR REPLACE FUNCTION notify_fact_source_changed() RETURNS trigger AS $$
+        BEGIN
+            IF TG_LEVEL = 'STATEMENT' THEN
+                -- New rows: the loader picks them up from its watermark
+                PERFORM pg_notify('fact_source_changed', TG_TABLE_NAME);
+            ELSE
+                -- Edited or deleted rows are below the watermark; name them
+                PERFORM pg_notify('fact_source_changed', TG_TABLE_NAME || ':' || OLD.id);
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+        """,
+        """
+        DO $$
+        DECLARE
+            source_table TEXT;
+        BEGIN
+            FOREACH source_table IN ARRAY ARRAY['s11_test_results', 's21_test_results',
+                                               'twotone_test_results', 'modulator_test_results'] LOOP
+                IF to_regclass('public.' || source_table) IS NOT NULL THEN
+                    EXECUTE format('DROP TRIGGER IF EXISTS trg_fact_insert_notify ON %I', source_table);
+                    EXECUTE format('CREATE TRIGGER trg_fact_insert_notify AFTER INSERT ON %I '
+                                   'FOR EACH STATEMENT EXECUTE FUNCTION notify_fact_source_changed()', source_table);
+                    EXECUTE format('DROP TRIGGER IF EXISTS trg_fact_change_notify ON %I', source_table);
+                    EXECUTE format('CREATE TRIGGER trg_fact_change_notify AFTER UPDATE OR DELETE ON %I '
+                                   'FOR EACH ROW EXECUTE FUNCTION notify_fact_source_changed()', source_table);
+                END IF;
+            END LOOP;
+        END $$;
+        """,
+    ]),
+    (14, "SPC: rolling state per device type and metric, control chart points with rule violations", [
+        """
+        CREATE TABLE IF NOT EXISTS spc_state (
+            device_type VARCHAR(100) NOT NULL,
+            metric VARCHAR(50) NOT NULL,
+            n BIGINT NOT NULL DEFAULT 0,
+            mean DOUBLE PRECISION NOT NULL DEFAULT 0,
+            m2 DOUBLE PRECISION NOT NULL DEFAULT 0,
+            center DOUBLE PRECISION,
+            sigma DOUBLE PRECISION,
+            ewma DOUBLE PRECISION,
+            cusum_pos DOUBLE PRECISION NOT NULL DEFAULT 0,
+            cusum_neg DOUBLE PRECISION NOT NULL DEFAULT 0,
+            recent_z DOUBLE PRECISION[] NOT NULL DEFAULT '{}',
+            last_value DOUBLE PRECISION,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (device_type, metric)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS spc_points (
+            id BIGSERIAL PRIMARY KEY,
+            device_type VARCHAR(100) NOT NULL,
+            metric VARCHAR(50) NOT NULL,
+            source_table VARCHAR(64) NOT NULL,
+            source_id BIGINT NOT NULL,
+            serial_number VARCHAR(100),
+            value DOUBLE PRECISION NOT NULL,
+            z DOUBLE PRECISION,
+            ewma DOUBLE PRECISION,
+            cusum_pos DOUBLE PRECISION,
+            cusum_neg DOUBLE PRECISION,
+            violations TEXT[] NOT NULL DEFAULT '{}',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE (source_table, source_id, metric)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_spc_points_chart ON spc_points(device_type, metric, id DESC)",
+        """
+        CREATE INDEX IF NOT EXISTS idx_spc_points_alerts
+            ON spc_points(created_at DESC) WHERE violations <> '{}'
+        """,
+    ]),
+    (15, "yield rollups: per-unit station outcomes, material links, yield and failure Pareto aggregates", [
+        """
+        CREATE TABLE IF NOT EXISTS yield_units (
+            station VARCHAR(30) NOT NULL,
+            serial_number VARCHAR(100) NOT NULL,
+            device_type VARCHAR(100),
+            first_operator VARCHAR(100),
+            attempts INTEGER NOT NULL DEFAULT 0,
+            first_passed BOOLEAN,
+            last_passed BOOLEAN,
+            failure_modes JSONB NOT NULL DEFAULT '{}',
+            first_at TIMESTAMP,
+            last_at TIMESTAMP,
+            PRIMARY KEY (station, serial_number)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_yield_units_serial ON yield_units(serial_number)",
+        """
+        CREATE TABLE IF NOT EXISTS yield_materials (
+            serial_number VARCHAR(100) PRIMARY KEY,
+            chip_serial_number VARCHAR(100),
+            wafer_id VARCHAR(100),
+            housing_lot VARCHAR(100),
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS yield_rollup (
+            station VARCHAR(30) NOT NULL,
+            dimension VARCHAR(30) NOT NULL,
+            dim_value VARCHAR(100) NOT NULL,
+            units INTEGER NOT NULL DEFAULT 0,
+            first_pass INTEGER NOT NULL DEFAULT 0,
+            final_pass INTEGER NOT NULL DEFAULT 0,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (station, dimension, dim_value)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_yield_rollup_dimension ON yield_rollup(dimension, dim_value)",
+        """
+        CREATE TABLE IF NOT EXISTS yield_pareto (
+            station VARCHAR(30) NOT NULL,
+            dimension VARCHAR(30) NOT NULL,
+            dim_value VARCHAR(100) NOT NULL,
+            failure_mode VARCHAR(200) NOT NULL,
+            failures INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (station, dimension, dim_value, failure_mode)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_yield_pareto_dimension ON yield_pareto(dimension, dim_value)",
+        """
+        CREATE TABLE IF NOT EXISTS yield_watermarks (
+            source_table VARCHAR(64) PRIMARY KEY,
+            last_id BIGINT NOT NULL DEFAULT 0,
+            last_run_at TIMESTAMP
+        )
+        """,
+    ]),
+    (16, "cluster state: shared sessions per worker, relayed oversize events, instrument routing table", [
+        """
+        CREATE TABLE IF NOT EXISTS api_sessions (
+            session_key CHAR(64) NOT NULL,
+            worker_id VARCHAR(200) NOT NULL,
+            user_id INTEGER NOT NULL,
+            username VARCHAR(100) NOT NULL,
+            login_time TIMESTAMP NOT NULL,
+            last_activity TIMESTAMP NOT NULL,
+            active_modules TEXT[] NOT NULL DEFAULT '{}',
+            current_operations JSONB NOT NULL DEFAULT '{}',
+            PRIMARY KEY (session_key, worker_id)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_api_sessions_last_activity ON api_sessions(last_activity)",
+        """
+        CREATE TABLE IF NOT EXISTS cluster_events (
+            id BIGSERIAL PRIMARY KEY,
+            payload TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS instrument_owners (
+            instrument VARCHAR(50) PRIMARY KEY,
+            worker_id VARCHAR(200) NOT NULL,
+            base_url TEXT,
+            claimed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            heartbeat_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+    ]),
+    (17, "analytics.fact_test_results: loader measurements in measurement_1..3, metric_1 kept for processing time", [
+        "ALTER TABLE analytics.fact_test_results ADD COLUMN IF NOT EXISTS measurement_1 DOUBLE PRECISION",
+        "ALTER TABLE analytics.fact_test_results ADD COLUMN IF NOT EXISTS measurement_2 DOUBLE PRECISION",
+        "ALTER TABLE analytics.fact_test_results ADD COLUMN IF NOT EXISTS measurement_3 DOUBLE PRECISION",
+        # Rows written by the loader (source_table set) carried measurements in the metric columns
+        """
+        UPDATE analytics.fact_test_results
+        SET measurement_1 = metric_1, measurement_2 = metric_2, measurement_3 = metric_3, metric_1 = NULL
+        WHERE source_table IS NOT NULL
+        """,
+        "ALTER TABLE analytics.fact_test_results DROP COLUMN IF EXISTS metric_2",
+        "ALTER TABLE analytics.fact_test_results DROP COLUMN IF EXISTS metric_3",
+    ]),
+    (18, "yield_attempts: result rows counted near the yield watermark (late commits)", [
+        """
+        CREATE TABLE IF NOT EXISTS yield_attempts (
+            source_table VARCHAR(64) NOT NULL,
+            source_id BIGINT NOT NULL,
+            PRIMARY KEY (source_table, source_id)
+        )
+        """,
+        # Rows up to the current watermarks were already counted (window = default YIELD_LOOKBACK_IDS)
+        """
+        INSERT INTO yield_attempts (source_table, source_id)
+        SELECT w.source_table, g.id
+        FROM yield_watermarks w, generate_series(GREATEST(w.last_id - 200, 1), w.last_id) AS g(id)
+        ON CONFLICT DO NOTHING
+        """,
+    ]),
+    (19, "device_traveler as a table maintained per device: triggers queue changed serials, the API re-derives them", [
+        """
+        CREATE TABLE IF NOT EXISTS traveler_dirty (
+            serial_number TEXT PRIMARY KEY,
+            queued_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE OR REPLACE FUNCTION queue_traveler_serial() RETURNS trigger AS $$
+        DECLARE
+            rec JSONB;
+        BEGIN
+            FOREACH rec IN ARRAY ARRAY[to_jsonb(NEW), to_jsonb(OLD)] LOOP
+                CONTINUE WHEN rec IS NULL OR rec ->> TG_ARGV[0] IS NULL;
+                IF TG_NARGS > 1 THEN
+                    -- Chip-keyed rows show up on the traveler of every device the chip went into
+                    INSERT INTO traveler_dirty (serial_number)
+                    SELECT DISTINCT s.housing_sno::TEXT FROM s11_test_results s
+                    WHERE s.chips_no = rec ->> TG_ARGV[0] AND s.housing_sno IS NOT NULL
+                    ON CONFLICT DO NOTHING;
+                ELSE
+                    INSERT INTO traveler_dirty (serial_number) VALUES (rec ->> TG_ARGV[0]) ON CONFLICT DO NOTHING;
+                END IF;
+            END LOOP;
+            PERFORM pg_notify('traveler_changed', TG_TABLE_NAME);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+        """,
+        """
+        CREATE OR REPLACE FUNCTION rebuild_device_traveler() RETURNS integer AS $fn$
+        DECLARE
+            parts TEXT[] := ARRAY[]::TEXT[];
+            source_tables TEXT[] := ARRAY['device_events'];
+            -- Arguments of each source table's queue_traveler_serial trigger: the serial column, 'chip' for chip-keyed rows
+            trigger_args TEXT[] := ARRAY[$a$'serial_number'$a$];
+            mo_column TEXT := 'NULL::TEXT';
+            mo_join TEXT := '';
+        BEGIN
+            -- Workflow transitions
+            parts := parts || $q$
+                SELECT e.serial_number::TEXT, 'workflow'::TEXT AS source, e.id::TEXT AS record_id,
+                       e.created_at AS event_at, e.event_type::TEXT AS result, NULL::TEXT AS operator,
+                       NULL::TEXT AS chip_serial_number,
+                       jsonb_build_object('test_id', e.test_id, 'from_stage', e.from_stage, 'to_stage', e.to_stage,
+                                          'to_status', e.to_status, 'user_id', e.user_id) AS details
+                FROM device_events e
+            $q$;
+
+            IF to_regclass('public.s11_test_results') IS NOT NULL THEN
+                source_tables := source_tables || 's11_test_results'::TEXT;
+                trigger_args := trigger_args || $a$'housing_sno'$a$::TEXT;
+                -- S11 is measured on the housed device: housing_sno is the device serial, chips_no the chip inside
+                parts := parts || $q$
+                    SELECT s.housing_sno::TEXT, 's11', s.test_id::TEXT, s."timestamp", s.result::TEXT,
+                           s.operator::TEXT, s.chips_no::TEXT,
+                           jsonb_build_object('device_type', s.device_type, 'housing_lno', s.housing_lno,
+                                              'plot_path', s.plot_path)
+                    FROM s11_test_results s
+                $q$;
+                IF to_regclass('public.chip_preparation') IS NOT NULL THEN
+                    source_tables := source_tables || 'chip_preparation'::TEXT;
+                    trigger_args := trigger_args || $a$'chip_serial_number', 'chip'$a$::TEXT;
+                    parts := parts || $q$
+                        SELECT DISTINCT s.housing_sno::TEXT, 'chip_preparation', cp.chip_serial_number::TEXT,
+                               cp.created_at, 'prepared'::TEXT, cp.operator::TEXT, cp.chip_serial_number::TEXT,
+                               jsonb_build_object('wafer_id', cp.wafer_id)
+                        FROM chip_preparation cp
+                        JOIN s11_test_results s ON s.chips_no = cp.chip_serial_number
+                    $q$;
+                END IF;
+                IF to_regclass('public.chip_epoxy_cure') IS NOT NULL THEN
+                    source_tables := source_tables || 'chip_epoxy_cure'::TEXT;
+                    trigger_args := trigger_args || $a$'chip_serial_number', 'chip'$a$::TEXT;
+                    parts := parts || $q$
+                        SELECT DISTINCT s.housing_sno::TEXT, 'epoxy_cure', c.id::TEXT,
+                               COALESCE(c.end_time, c.start_time, c.updated_at), c.status::TEXT, NULL::TEXT,
+                               c.chip_serial_number::TEXT,
+                               jsonb_build_object('start_time', c.start_time, 'end_time', c.end_time,
+                                                  'duration_seconds', c.duration_seconds)
+                        FROM chip_epoxy_cure c
+                        JOIN s11_test_results s ON s.chips_no = c.chip_serial_number
+                    $q$;
+                END IF;
+            END IF;
+
+            IF to_regclass('public.housing_inspections') IS NOT NULL THEN
+                source_tables := source_tables || 'housing_inspections'::TEXT;
+                trigger_args := trigger_args || $a$'housing_serial_number'$a$::TEXT;
+                parts := parts || $q$
+                    SELECT h.housing_serial_number::TEXT, 'housing_inspection', h.inspection_id::TEXT,
+                           h.created_at, h.status::TEXT, h.operator::TEXT, NULL::TEXT,
+                           jsonb_build_object('housing_lot_number', h.housing_lot_number, 'notes', h.notes,
+                                              'image_filename', h.image_filename)
+                    FROM housing_inspections h
+                $q$;
+            END IF;
+
+            IF to_regclass('public.s21_test_results') IS NOT NULL THEN
+                source_tables := source_tables || 's21_test_results'::TEXT;
+                trigger_args := trigger_args || $a$'serial_number'$a$::TEXT;
+                parts := parts || $q$
+                    SELECT r.serial_number::TEXT, 's21', r.id::TEXT, r.test_date, r.overall_result::TEXT,
+                           r.operator::TEXT, NULL::TEXT,
+                           jsonb_build_object('device_type', r.device_type, 's21_bandwidth', r.s21_bandwidth,
+                                              'frequency_3db', r.frequency_3db, 'ripple_result', r.ripple_result,
+                                              'notes', r.notes)
+                    FROM s21_test_results r
+                $q$;
+            END IF;
+
+            IF to_regclass('public.twotone_test_results') IS NOT NULL THEN
+                source_tables := source_tables || 'twotone_test_results'::TEXT;
+                trigger_args := trigger_args || $a$'serial_number'$a$::TEXT;
+                parts := parts || $q$
+                    SELECT r.serial_number::TEXT, 'twotone', r.id::TEXT, r.test_date, r.result::TEXT,
+                           r.operator::TEXT, NULL::TEXT,
+                           jsonb_build_object('device_type', r.device_type, 'rf_vpi_1ghz', r.rf_vpi_1ghz,
+                                              'mixterm1', r.mixterm1, 'mixterm2', r.mixterm2, 'notes', r.notes)
+                    FROM twotone_test_results r
+                $q$;
+            END IF;
+
+            IF to_regclass('public.modulator_test_results') IS NOT NULL THEN
+                source_tables := source_tables || 'modulator_test_results'::TEXT;
+                trigger_args := trigger_args || $a$'serial_number'$a$::TEXT;
+                parts := parts || $q$
+                    SELECT r.serial_number::TEXT, 'dcvpi', r.id::TEXT, r.test_date, r.result::TEXT,
+                           r.operator::TEXT, NULL::TEXT,
+                           jsonb_build_object('device_type', r.device_type, 'vpi_value', r.vpi_value,
+                                              'insertion_loss', r.insertion_loss,
+                                              'extinction_ratio', r.extinction_ratio, 'drift', r.drift,
+                                              'notes', r.notes)
+                    FROM modulator_test_results r
+                $q$;
+            END IF;
+
+            IF to_regclass('public.devices') IS NOT NULL THEN
+                source_tables := source_tables || 'devices'::TEXT;
+                trigger_args := trigger_args || $a$'serial_number'$a$::TEXT;
+                mo_column := 'd.manufacturing_order_number::TEXT';
+                mo_join := 'LEFT JOIN devices d ON d.serial_number = t.serial_number';
+            END IF;
+
+            DROP VIEW IF EXISTS device_traveler_source;
+            EXECUTE 'CREATE VIEW device_traveler_source AS '
+                 || 'SELECT t.serial_number, t.source, t.record_id, t.event_at, t.result, t.operator, '
+                 || 't.chip_serial_number, t.details, ' || mo_column || ' AS manufacturing_order_number '
+                 || 'FROM (' || array_to_string(parts, ' UNION ALL ') || ') AS t(serial_number, source, record_id, '
+                 || 'event_at, result, operator, chip_serial_number, details) '
+                 || mo_join || ' WHERE t.serial_number IS NOT NULL';
+
+            -- A plain table, so a changed device's rows are re-derived on their own instead of the whole history
+            IF (SELECT relkind FROM pg_class WHERE oid = to_regclass('public.device_traveler')) = 'm' THEN
+                DROP MATERIALIZED VIEW device_traveler;
+            ELSE
+                DROP TABLE IF EXISTS device_traveler;
+            END IF;
+            CREATE TABLE device_traveler AS SELECT * FROM device_traveler_source;
+            CREATE UNIQUE INDEX idx_device_traveler_record ON device_traveler(source, record_id, serial_number);
+            CREATE INDEX idx_device_traveler_serial ON device_traveler(serial_number, event_at);
+            CREATE INDEX idx_device_traveler_mo ON device_traveler(manufacturing_order_number);
+            CREATE INDEX idx_device_traveler_chip ON device_traveler(chip_serial_number);
+
+            FOR i IN 1 .. array_length(source_tables, 1) LOOP
+                EXECUTE format('DROP TRIGGER IF EXISTS trg_traveler_notify ON %I', source_tables[i]);
+                EXECUTE format('CREATE TRIGGER trg_traveler_notify AFTER INSERT OR UPDATE OR DELETE ON %I '
+                               'FOR EACH ROW EXECUTE FUNCTION queue_traveler_serial(%s)',
+                               source_tables[i], trigger_args[i]);
+            END LOOP;
+            RETURN array_length(parts, 1);
+        END;
+        $fn$ LANGUAGE plpgsql;
+        """,
+        "SELECT rebuild_device_traveler()",
+        "DROP FUNCTION IF EXISTS notify_traveler_changed()",
+    ]),
+    (20, "instrument_owners keyed by instrument resource (VISA address) instead of module", [
+        "ALTER TABLE instrument_owners ALTER COLUMN instrument TYPE VARCHAR(200)",
+        # Rows keyed by module name; live owners re-insert theirs by resource on the next heartbeat
+        "DELETE FROM instrument_owners",
+    ]),
+    (21, "chip_epoxy_cure notifies start/stop/completion so every API worker's cure scheduler follows it", [
+        """
+        CREATE OR REPLACE FUNCTION notify_epoxy_cure_changed() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                PERFORM pg_notify('epoxy_cure_changed', OLD.chip_serial_number);
+            ELSE
+                PERFORM pg_notify('epoxy_cure_changed', NEW.chip_serial_number);
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+        """,
+        "DROP TRIGGER IF EXISTS trg_epoxy_cure_notify ON chip_epoxy_cure",
+        """
+        CREATE TRIGGER trg_epoxy_cure_notify
+            AFTER INSERT OR DELETE OR UPDATE OF status, start_time, duration_seconds ON chip_epoxy_cure
+            FOR EACH ROW EXECUTE FUNCTION notify_epoxy_cure_changed()
+        """,
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+def ensure_version_table(cursor):
+    """Create the schema_migrations bookkeeping table"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            duration_ms INTEGER
+        )
+    """)
+
+def get_applied_versions(conn) -> set:
+    """Versions recorded in schema_migrations (empty if the table does not exist yet)"""
+    cursor = conn.cursor()
+    cursor.execute("SELECT to_regclass('public.schema_migrations') IS NOT NULL")
+    if not cursor.fetchone()[0]:
+        return set()
+    cursor.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in cursor.fetchall()}
+
+def pending_migrations(conn) -> list:
+    """Migrations not yet applied, in order"""
+    applied = get_applied_versions(conn)
+    return [migration for migration in MIGRATIONS if migration[0] not in applied]
+
+def apply_migrations(conn) -> list:
+    """Apply every pending migration, each in its own transaction; returns applied versions"""
+    applied_now = []
+    cursor = conn.cursor()
+    cursor.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_KEY,))
+    try:
+        ensure_version_table(cursor)
+        conn.commit()
+
+        for version, description, statements in pending_migrations(conn):
+            started = time.perf_counter()
+            try:
+                for statement in statements:
+                    cursor.execute(statement)
+                duration_ms = int((time.perf_counter() - started) * 1000)
+                cursor.execute("""
+                    INSERT INTO schema_migrations (version, description, duration_ms)
+                    VALUES (%s, %s, %s)
+                """, (version, description, duration_ms))
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                print(f"❌ Migration {version} ({description}) failed: {e}")
+                raise
+            applied_now.append(version)
+            print(f"✅ Migration {version}: {description} ({duration_ms} ms)")
+    finally:
+        cursor.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_KEY,))
+        conn.commit()
+
+    return applied_now
+
+def check_schema_version(conn) -> dict:
+    """Current vs expected schema version, for the startup check and /health"""
+    applied = get_applied_versions(conn)
+    pending = [version for version, _, _ in MIGRATIONS if version not in applied]
+    return {
+        "current": max(applied) if applied else 0,
+        "expected": LATEST_VERSION,
+        "pending": pending,
+        "up_to_date": not pending
+    }
+
+def main(argv: list) -> int:
+    """Command line entry point"""
+    command = argv[1] if len(argv) > 1 else 'status'
+    if command not in ('status', 'upgrade'):
+        print("Usage: python -m modules.migrations [status|upgrade]")
+        return 2
+
+    conn = psycopg2.connect(**DATABASE_CONFIG)
+    try:
+        if command == 'upgrade':
+            applied = apply_migrations(conn)
+            print(f"🎉 Applied {len(applied)} migration(s)" if applied else "✅ Schema already up to date")
+
+        state = check_schema_version(conn)
+        print(f"📋 Schema version {state['current']} (expected {state['expected']})")
+        for version, description, _ in MIGRATIONS:
+            marker = "⏳" if version in state['pending'] else "✅"
+            print(f"  {marker} {version:3d} {description}")
+        return 0 if state['up_to_date'] else 1
+    finally:
+        conn.close()
+
+__all__ = ['MIGRATIONS', 'LATEST_VERSION', 'apply_migrations', 'check_schema_version', 'pending_migrations']
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
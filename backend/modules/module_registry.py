@@ -0,0 +1,174 @@
+# modules/module_registry.py - Module manifests, router mounting, lifecycle hooks and route checks
+
+import importlib
+import inspect
+import re
+import time
+from typing import Callable, Dict, List, Optional
+
+class ModuleManifest:
+    """How a module plugs into the app: router, mount point, lifecycle hooks and health probe"""
+
+    def __init__(self, name: str, router, prefix: str, tags: Optional[List[str]] = None,
+                 on_load: Optional[Callable] = None, on_startup: Optional[Callable] = None,
+                 on_shutdown: Optional[Callable] = None, health_probe: Optional[Callable] = None,
+                 instrument_routes: Optional[List[str]] = None, instruments: Optional[List[str]] = None):
+        self.name = name
+        self.router = router
+        self.prefix = prefix
+        self.tags = tags or [name]
+        self.on_load = on_load            # on_load(services) - wire shared services before mounting
+        self.on_startup = on_startup      # sync or async, run from the app lifespan
+        self.on_shutdown = on_shutdown    # sync or async, run on shutdown
+        self.health_probe = health_probe  # returns a JSON-serialisable dict
+        self.instrument_routes = instrument_routes or []  # paths under prefix served by this worker's instrument owner
+        self.instruments = instruments or []              # VISA resources those routes open (ownership is per resource)
+
+    def __repr__(self):
+        return f"<ModuleManifest {self.name} at {self.prefix}>"
+
+async def _call_hook(hook, *args):
+    """Run a sync or async hook"""
+    result = hook(*args)
+    if inspect.isawaitable(result):
+        result = await result
+    return result
+
+class ModuleRegistry:
+    """Loads modules from their MODULE_MANIFEST and mounts each router exactly once"""
+
+    def __init__(self):
+        self.manifests: Dict[str, ModuleManifest] = {}
+        self.failed: Dict[str, str] = {}  # import path -> error
+
+    def load(self, app, import_path: str, services: Optional[dict] = None) -> Optional[ModuleManifest]:
+        """Import a module, run its on_load hook and mount its router"""
+        try:
+            module = importlib.import_module(import_path)
+            manifest = getattr(module, 'MODULE_MANIFEST', None)
+            if manifest is None:
+                raise ImportError(f"{import_path} has no MODULE_MANIFEST")
+            if manifest.name in self.manifests:
+                raise ValueError(f"module '{manifest.name}' is already registered")
+            if manifest.on_load:
+                manifest.on_load(services or {})
+            app.include_router(manifest.router, prefix=manifest.prefix, tags=manifest.tags)
+        except Exception as e:
+            self.failed[import_path] = str(e)
+            print(f"⚠️  Module {import_path} not loaded: {e}")
+            return None
+
+        self.manifests[manifest.name] = manifest
+        print(f"✅ {manifest.name} module registered at {manifest.prefix or '/'}")
+        return manifest
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self.manifests
+
+    async def startup(self) -> Dict[str, float]:
+        """Run every on_startup hook; returns per-module durations in seconds"""
+        timings = {}
+        for name, manifest in self.manifests.items():
+            if not manifest.on_startup:
+                continue
+            started = time.perf_counter()
+            try:
+                await _call_hook(manifest.on_startup)
+            except Exception as e:
+                print(f"❌ {name} startup hook failed: {e}")
+            timings[name] = round(time.perf_counter() - started, 3)
+        return timings
+
+    async def shutdown(self):
+        """Run on_shutdown hooks in reverse load order"""
+        for name, manifest in reversed(list(self.manifests.items())):
+            if not manifest.on_shutdown:
+                continue
+            try:
+                await _call_hook(manifest.on_shutdown)
+            except Exception as e:
+                print(f"❌ {name} shutdown hook failed: {e}")
+
+    def instrument_paths(self) -> Dict[str, str]:
+        """Full path -> module name for every route that drives instrument hardware"""
+        return {manifest.prefix + route: name
+                for name, manifest in self.manifests.items() for route in manifest.instrument_routes}
+
+    def instrument_resources(self) -> Dict[str, List[str]]:
+        """Module name -> instrument resources it drives (its own name when the manifest lists none)"""
+        return {name: list(manifest.instruments) or [name]
+                for name, manifest in self.manifests.items() if manifest.instrument_routes}
+
+    def health(self) -> dict:
+        """Loaded/failed state of every module plus its probe output"""
+        report = {}
+        for name, manifest in self.manifests.items():
+            entry = {"status": "loaded", "prefix": manifest.prefix}
+            if manifest.health_probe:
+                try:
+                    entry.update(manifest.health_probe())
+                except Exception as e:
+                    entry["status"] = "degraded"
+                    entry["error"] = str(e)
+            report[name] = entry
+        for import_path, error in self.failed.items():
+            report[import_path] = {"status": "not_loaded", "error": error}
+        return report
+
+# Route table checks
+_PARAM_PATTERN = re.compile(r"{[^}]+}")
+
+def _route_methods(route) -> set:
+    methods = getattr(route, 'methods', None)
+    if methods:
+        return set(methods) - {'HEAD'} or set(methods)
+    return {'WEBSOCKET'}
+
+def find_route_conflicts(routes) -> List[dict]:
+    """Duplicate (same method and path) and shadowed (unreachable behind an earlier pattern) routes"""
+    entries = []
+    for route in routes:
+        path = getattr(route, 'path', None)
+        regex = getattr(route, 'path_regex', None)
+        if path is None or regex is None:
+            continue
+        # A concrete path that only this route's template produces, for matching against earlier routes
+        sample = _PARAM_PATTERN.sub("__param__", path)
+        entries.append((route, path, regex, sample, _route_methods(route)))
+
+    conflicts = []
+    for i, (route, path, _, sample, methods) in enumerate(entries):
+        for earlier, earlier_path, earlier_regex, _, earlier_methods in entries[:i]:
+            shared = methods & earlier_methods
+            if not shared:
+                continue
+            if earlier_path == path:
+                kind = "duplicate"
+            elif earlier_regex.match(sample):
+                kind = "shadowed"
+            else:
+                continue
+            conflicts.append({
+                "kind": kind,
+                "methods": sorted(shared),
+                "path": path,
+                "endpoint": getattr(getattr(route, 'endpoint', None), '__qualname__', repr(route)),
+                "hidden_by": earlier_path,
+                "hidden_by_endpoint": getattr(getattr(earlier, 'endpoint', None), '__qualname__', repr(earlier))
+            })
+            break
+    return conflicts
+
+def report_route_conflicts(app, strict: bool = False) -> List[dict]:
+    """Print route conflicts; raise in strict mode so a bad registration fails fast"""
+    conflicts = find_route_conflicts(app.routes)
+    for conflict in conflicts:
+        print(f"⚠️  {conflict['kind'].capitalize()} route {','.join(conflict['methods'])} {conflict['path']} "
+              f"({conflict['endpoint']}) is hidden by {conflict['hidden_by']} ({conflict['hidden_by_endpoint']})")
+    if conflicts and strict:
+        raise RuntimeError(f"{len(conflicts)} duplicate or shadowed route(s)")
+    if not conflicts:
+        print(f"✅ Route table OK ({len(app.routes)} routes, no duplicates or shadowed paths)")
+    return conflicts
+
+__all__ = ['ModuleManifest', 'ModuleRegistry', 'find_route_conflicts', 'report_route_conflicts']
@@ -0,0 +1,158 @@
+# modules/pg_listener.py - One background LISTEN connection dispatching PostgreSQL NOTIFY payloads to callbacks
+
+import os
+import select
+import socket
+import threading
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional
+import psycopg2
+import psycopg2.extensions
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Database configuration (same defaults as the API server)
+DATABASE_CONFIG = {
+    'host': os.getenv('DB_HOST', '192.168.99.121'),
+    'port': int(os.getenv('DB_PORT', '5432')),
+    'database': os.getenv('DB_NAME', 'postgres'),
+    'user': os.getenv('DB_USER', 'postgres'),
+    'password': os.getenv('DB_PASSWORD', 'karthi'),
+    'connect_timeout': int(os.getenv('DB_CONNECT_TIMEOUT', '5'))
+}
+
+POLL_TIMEOUT = 5.0  # seconds between liveness checks of the LISTEN connection
+
+class PgListener:
+    """Runs LISTEN for registered channels on a dedicated connection and calls back with each payload"""
+
+    def __init__(self, config: Optional[dict] = None):
+        self.config = config or DATABASE_CONFIG
+        self.callbacks: Dict[str, List[Callable]] = defaultdict(list)       # channel -> callback(payload)
+        self.reconnect_callbacks: Dict[str, List[Callable]] = defaultdict(list)  # channel -> callback()
+        self.lock = threading.Lock()
+        self.thread: Optional[threading.Thread] = None
+        self.stopping = threading.Event()
+        self.conn = None
+        self.connected = False
+        # Wakes the poll loop when a channel is registered (a socket pair so select() also works on Windows)
+        self.wake_recv, self.wake_send = socket.socketpair()
+        self.wake_recv.setblocking(False)
+        self.metrics = {'notifications': 0, 'reconnects': 0, 'callback_errors': 0}
+
+    def listen(self, channel: str, callback: Callable, on_reconnect: Optional[Callable] = None):
+        """Register a callback for a channel; ``on_reconnect`` runs whenever notifications may have been missed"""
+        with self.lock:
+            self.callbacks[channel].append(callback)
+            if on_reconnect:
+                self.reconnect_callbacks[channel].append(on_reconnect)
+        # A running listener issues LISTEN right away, then calls the channel's on_reconnect for the gap
+        self.wake_send.send(b'\0')
+
+    def start(self):
+        """Start the listener thread (idempotent)"""
+        with self.lock:
+            if self.thread is not None:
+                return
+            self.stopping.clear()
+            self.thread = threading.Thread(target=self._run, name="pg-listener", daemon=True)
+            self.thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self.stopping.set()
+        self.wake_send.send(b'\0')
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+
+    def _connect(self):
+        conn = psycopg2.connect(**self.config)
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        cursor = conn.cursor()
+        with self.lock:
+            channels = list(self.callbacks)
+        for channel in channels:
+            cursor.execute(f'LISTEN "{channel}"')
+        return conn, set(channels)
+
+    def _drain_wakeups(self):
+        try:
+            while self.wake_recv.recv(64):
+                pass
+        except BlockingIOError:
+            pass
+
+    def _dispatch(self, channel: str, payload: str):
+        with self.lock:
+            callbacks = list(self.callbacks.get(channel, ()))
+        for callback in callbacks:
+            try:
+                callback(payload)
+            except Exception as e:
+                self.metrics['callback_errors'] += 1
+                print(f"⚠️ NOTIFY callback for {channel} failed: {e}")
+
+    def _missed(self, channels: Optional[List[str]] = None):
+        """Call on_reconnect for ``channels`` (all by default): notifications before their LISTEN were not seen"""
+        with self.lock:
+            callbacks = [cb for channel, cbs in self.reconnect_callbacks.items()
+                         if channels is None or channel in channels for cb in cbs]
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                self.metrics['callback_errors'] += 1
+                print(f"⚠️ NOTIFY reconnect callback failed: {e}")
+
+    def _run(self):
+        backoff = 1.0
+        while not self.stopping.is_set():
+            try:
+                self.conn, listening = self._connect()
+                self.connected = True
+                backoff = 1.0
+                self._missed()
+                while not self.stopping.is_set():
+                    with self.lock:
+                        new_channels = [channel for channel in self.callbacks if channel not in listening]
+                    for channel in new_channels:
+                        self.conn.cursor().execute(f'LISTEN "{channel}"')
+                        listening.add(channel)
+                    if new_channels:
+                        self._missed(new_channels)
+
+                    readable, _, _ = select.select([self.conn, self.wake_recv], [], [], POLL_TIMEOUT)
+                    if not readable:
+                        self.conn.cursor().execute("SELECT 1")  # surface a dead connection
+                        continue
+                    if self.wake_recv in readable:
+                        self._drain_wakeups()
+                    self.conn.poll()
+                    while self.conn.notifies:
+                        notify = self.conn.notifies.pop(0)
+                        self.metrics['notifications'] += 1
+                        self._dispatch(notify.channel, notify.payload)
+            except Exception as e:
+                if self.stopping.is_set():
+                    break
+                self.metrics['reconnects'] += 1
+                print(f"⚠️ LISTEN connection lost ({e}); retrying in {backoff:.0f}s")
+                self.stopping.wait(backoff)
+                backoff = min(backoff * 2, 60.0)
+            finally:
+                self.connected = False
+                if self.conn is not None and not self.conn.closed:
+                    self.conn.close()
+                self.conn = None
+
+    def stats(self) -> dict:
+        with self.lock:
+            channels = sorted(self.callbacks)
+        return {**self.metrics, 'connected': self.connected, 'channels': channels}
+
+# Shared LISTEN connection for the whole process
+pg_listener = PgListener()
+
+__all__ = ['PgListener', 'pg_listener']
@@ -5,18 +5,13 @@ from fastapi.responses import FileResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel
 from typing import List, Optional
-import pyvisa
 import time
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib
-matplotlib.use('Agg')
 import os
 import json
 import uuid
 import datetime
 import asyncio
-import pyodbc
 from fpdf import FPDF
 from concurrent.futures import ThreadPoolExecutor
 import jwt
@@ -24,6 +19,17 @@ import psycopg2
 import psycopg2.extras
 from contextlib import contextmanager
 from dotenv import load_dotenv
+from .artifact_manager import register_artifact, touch_artifact
+from .lazy_imports import lazy_module
+from .module_registry import ModuleManifest
+from .audit_log import audit
+from .event_bus import notify_module
+from .grouped_stats import grouped_stats, stats_memo
+
+# Instrument and plotting stacks are imported on first use (pyplot with the Agg backend)
+pyvisa = lazy_module('pyvisa')
+pyodbc = lazy_module('pyodbc')
+plt = lazy_module('matplotlib.pyplot')
 
 # Load environment variables
 load_dotenv()
@@ -44,6 +50,9 @@ DATABASE_CONFIG = {
     'password': os.getenv('DB_PASSWORD', 'maq001')
 }
 
+# VNA configuration (the same analyzer as the S21 station)
+VNA_ADDRESS = os.getenv('VNA_ADDRESS', "TCPIP0::127.0.0.1::5025::SOCKET")
+
 # Global variables
 executor = ThreadPoolExecutor(max_workers=2)
 
@@ -76,21 +85,12 @@ def verify_jwt_token(token: str) -> dict:
 
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
     """Get current user from JWT token"""
-    return verify_jwt_token(credentials.credentials)
+    return {**verify_jwt_token(credentials.credentials), 'token': credentials.credentials}
 
 # Utility functions (local copies)
 def log_action(user_id: int, action: str, module: str, details: str):
-    """Log user action"""
-    try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                INSERT INTO system_logs (user_id, action, module, details)
-                VALUES (%s, %s, %s, %s)
-            """, (user_id, action, module, details))
-            conn.commit()
-    except Exception as e:
-        print(f"Error logging action: {e}")
+    """Log user action (queued; written to system_logs in batches)"""
+    audit(user_id, action, module, details)
 
 def update_component_status(component: str, status: str, message: str):
     """Update component status"""
@@ -106,19 +106,34 @@ def update_component_status(component: str, status: str, message: str):
     except Exception as e:
         print(f"Error updating component status: {e}")
 
-# Notification functions (simplified for now)
+# Notification functions
 async def notify_module_users(module: str, message_type: str, data: dict):
-    """Simplified notification function"""
+    """Publish a notification to the module's WebSocket subscribers"""
     print(f"📢 S11 Notification - {message_type}: {data}")
-    # In production, this would integrate with the WebSocket manager
+    notify_module(module, message_type, data)
+
+# Session tracking hooks, wired to the API server's session manager in on_load
+session_hooks = {}
+
+def set_session_hooks(services: dict):
+    """Use the server's session tracking for module activity"""
+    for name in ('track_module_activity', 'end_module_activity'):
+        if name in services:
+            session_hooks[name] = services[name]
 
 def track_module_activity(token: str, module: str, operation: str):
     """Track module activity"""
     print(f"👤 S11 Activity: {operation}")
+    hook = session_hooks.get('track_module_activity')
+    if hook:
+        hook(token, module, operation)
 
 def end_module_activity(token: str, module: str):
     """End module activity"""
     print(f"👤 S11 Activity ended for {module}")
+    hook = session_hooks.get('end_module_activity')
+    if hook:
+        hook(token, module)
 
 # Pydantic models
 class TestParameters(BaseModel):
@@ -154,11 +169,10 @@ class VNAController:
         """Connect to VNA with thread safety"""
         async with self.lock:
             try:
-                vna_address = os.getenv('VNA_ADDRESS', "TCPIP0::127.0.0.1::5025::SOCKET")
-                print(f"🔌 Attempting to connect to VNA at {vna_address}...")
+                print(f"🔌 Attempting to connect to VNA at {VNA_ADDRESS}...")
                 
                 self.rm = pyvisa.ResourceManager()
-                self.vna = self.rm.open_resource(vna_address)
+                self.vna = self.rm.open_resource(VNA_ADDRESS)
                 self.vna.read_termination = '\n'
                 self.vna.timeout = 10000
                 
@@ -392,6 +406,7 @@ def generate_plot(freqs, mags, limit_data, test_params, test_id):
         plot_path = os.path.join('results', plot_filename)
         plt.savefig(plot_path, dpi=150, bbox_inches='tight')
         plt.close()
+        register_artifact(plot_path, 's11', test_id)
         
         print(f"📊 Plot saved: {plot_path}")
         return plot_path
@@ -405,27 +420,6 @@ def save_test_results_pg(test_data: dict, user_id: int):
         with get_db_connection() as conn:
             cursor = conn.cursor()
             
-            # Ensure S11 results table exists
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS s11_test_results (
-                    id SERIAL PRIMARY KEY,
-                    test_id VARCHAR(255) UNIQUE NOT NULL,
-                    device_type VARCHAR(100) NOT NULL,
-                    chips_no VARCHAR(100) NOT NULL,
-                    housing_sno VARCHAR(100) NOT NULL,
-                    housing_lno VARCHAR(100) NOT NULL,
-                    operator VARCHAR(100) NOT NULL,
-                    result VARCHAR(20) NOT NULL,
-                    plot_path TEXT,
-                    frequency_data TEXT,
-                    magnitude_data TEXT,
-                    limit_data TEXT,
-                    failure_details TEXT,
-                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    created_by INTEGER REFERENCES users(id)
-                )
-            """)
-            
             insert_query = """
             INSERT INTO s11_test_results 
             (test_id, device_type, chips_no, housing_sno, housing_lno, operator, 
@@ -484,7 +478,7 @@ async def connect_vna(current_user: dict = Depends(get_current_user)):
     
     try:
         # Track activity
-        track_module_activity('', 's11', 'connecting_vna')
+        track_module_activity(current_user['token'], 's11', 'connecting_vna')
         
         success = await vna_controller.connect()
         status = "connected" if success else "disconnected"
@@ -504,7 +498,7 @@ async def connect_vna(current_user: dict = Depends(get_current_user)):
             'message': message
         })
         
-        end_module_activity('', 's11')
+        end_module_activity(current_user['token'], 's11')
         
         return {
             "success": success, 
@@ -549,7 +543,7 @@ async def start_test(
     
     try:
         # Track module usage
-        track_module_activity('', 's11', 'test_running')
+        track_module_activity(current_user['token'], 's11', 'test_running')
         
         # Notify other users that a test is starting
         await notify_module_users('s11', 'test_started', {
@@ -595,7 +589,7 @@ async def start_test(
         }
         
         # End module usage
-        end_module_activity('', 's11')
+        end_module_activity(current_user['token'], 's11')
         
         # Log completion
         log_action(current_user['user_id'], 'test_complete', 's11',
@@ -612,7 +606,7 @@ async def start_test(
         return test_result
         
     except Exception as e:
-        end_module_activity('', 's11')
+        end_module_activity(current_user['token'], 's11')
         log_action(current_user['user_id'], 'test_error', 's11', f"Test failed: {str(e)}")
         
         # Notify error
@@ -655,6 +649,7 @@ async def get_plot(test_id: str, current_user: dict = Depends(get_current_user))
     plot_path = os.path.join('results', f'S11graph_{test_id}.png')
     if not os.path.exists(plot_path):
         raise HTTPException(status_code=404, detail="Plot not found")
+    touch_artifact(plot_path)
     return FileResponse(plot_path)
 
 @s11_router.post("/pdf/generate")
@@ -715,6 +710,7 @@ async def generate_pdf_report(test_data: dict, current_user: dict = Depends(get_
         pdf_filename = f"S11_test_report_{test_data['test_id']}.pdf"
         pdf_path = os.path.join('results', pdf_filename)
         pdf.output(pdf_path)
+        register_artifact(pdf_path, 's11', test_data['test_id'])
         
         log_action(current_user['user_id'], 'pdf_generate', 's11',
                   f"Generated PDF for test {test_data['test_id']}")
@@ -771,54 +767,45 @@ async def get_test_history(
         print(f"❌ Error getting test history: {e}")
         raise HTTPException(status_code=500, detail="Failed to retrieve test history")
 
+def compute_s11_statistics() -> dict:
+    """Totals, pass/fail, per device type and last-24h counts in one scan of s11_test_results"""
+    with get_db_connection() as conn:
+        stats = grouped_stats(
+            conn.cursor(), "s11_test_results",
+            aggregates={
+                "total_tests": "COUNT(*)",
+                "pass_count": "COUNT(*) FILTER (WHERE result = 'PASS')",
+                "fail_count": "COUNT(*) FILTER (WHERE result = 'FAIL')",
+                "recent_tests_24h": "COUNT(*) FILTER (WHERE timestamp > NOW() - INTERVAL '24 hours')"
+            },
+            dimensions={"device_type": "device_type"}
+        )
+
+    totals = stats["totals"]
+    device_stats = [
+        {
+            "device_type": row["device_type"],
+            "total_tests": row["total_tests"],
+            "pass_count": row["pass_count"],
+            "pass_rate": (row["pass_count"] / row["total_tests"] * 100) if row["total_tests"] > 0 else 0
+        }
+        for row in sorted(stats["by"]["device_type"], key=lambda row: row["total_tests"], reverse=True)
+    ]
+    return {
+        "total_tests": totals["total_tests"],
+        "pass_count": totals["pass_count"],
+        "fail_count": totals["fail_count"],
+        "pass_rate": (totals["pass_count"] / totals["total_tests"] * 100) if totals["total_tests"] > 0 else 0,
+        "device_statistics": device_stats,
+        "recent_tests_24h": totals["recent_tests_24h"]
+    }
+
 @s11_router.get("/statistics")
 async def get_s11_statistics(current_user: dict = Depends(get_current_user)):
     """Get S11 module statistics"""
     try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            
-            # Total tests
-            cursor.execute("SELECT COUNT(*) FROM s11_test_results")
-            total_tests = cursor.fetchone()[0] or 0
-            
-            # Pass/Fail counts
-            cursor.execute("SELECT result, COUNT(*) FROM s11_test_results GROUP BY result")
-            result_counts = dict(cursor.fetchall())
-            
-            # Tests by device type
-            cursor.execute("""
-                SELECT device_type, COUNT(*) as count, 
-                       SUM(CASE WHEN result = 'PASS' THEN 1 ELSE 0 END) as pass_count
-                FROM s11_test_results 
-                GROUP BY device_type 
-                ORDER BY count DESC
-            """)
-            device_stats = []
-            for row in cursor.fetchall():
-                device_stats.append({
-                    "device_type": row[0],
-                    "total_tests": row[1],
-                    "pass_count": row[2],
-                    "pass_rate": (row[2] / row[1] * 100) if row[1] > 0 else 0
-                })
-            
-            # Recent activity (last 24 hours)
-            cursor.execute("""
-                SELECT COUNT(*) FROM s11_test_results 
-                WHERE timestamp > NOW() - INTERVAL '24 hours'
-            """)
-            recent_tests = cursor.fetchone()[0] or 0
-            
-            return {
-                "total_tests": total_tests,
-                "pass_count": result_counts.get('PASS', 0),
-                "fail_count": result_counts.get('FAIL', 0),
-                "pass_rate": (result_counts.get('PASS', 0) / total_tests * 100) if total_tests > 0 else 0,
-                "device_statistics": device_stats,
-                "recent_tests_24h": recent_tests,
-                "vna_connected": vna_controller.is_connected
-            }
+        statistics = await asyncio.to_thread(stats_memo.get, "s11_statistics", compute_s11_statistics)
+        return {**statistics, "vna_connected": vna_controller.is_connected}
             
     except Exception as e:
         print(f"❌ Error getting statistics: {e}")
@@ -867,7 +854,19 @@ async def cleanup_s11_module():
     except Exception as e:
         print(f"❌ S11 cleanup error: {e}")
 
+MODULE_MANIFEST = ModuleManifest(
+    name='s11',
+    router=s11_router,
+    prefix='/modules/s11',
+    tags=['S11 Testing'],
+    on_load=set_session_hooks,
+    on_shutdown=cleanup_s11_module,
+    health_probe=lambda: {"vna_connected": vna_controller.is_connected},
+    instrument_routes=['/status', '/vna/status', '/vna/connect', '/vna/disconnect', '/test/start'],
+    instruments=[VNA_ADDRESS]
+)
+
 # Export the router and cleanup function
-__all__ = ['s11_router', 'cleanup_s11_module']
+__all__ = ['MODULE_MANIFEST', 's11_router', 'cleanup_s11_module']
 
 print("✅ S11 module loaded successfully")
\ No newline at end of file
@@ -0,0 +1,187 @@
+# modules/sequence_cache.py - Compiled, immutable test sequences per device type, invalidated by NOTIFY
+
+import os
+import time
+import threading
+from types import MappingProxyType
+from typing import Callable, Dict, Mapping, NamedTuple, Optional, Tuple
+from .pg_listener import pg_listener
+
+# Channel the device_test_sequences / test_definitions triggers notify (migration 10)
+SEQUENCE_CHANNEL = 'device_sequences_changed'
+# Seconds a compiled sequence is trusted while the LISTEN connection is down
+SEQUENCE_CACHE_TTL = float(os.getenv('SEQUENCE_CACHE_TTL', '60'))
+
+class SequenceStep(NamedTuple):
+    """One test of a device type's sequence joined with its test definition"""
+    test_id: str
+    sequence_order: int
+    is_required: bool
+    test_number: Optional[str]
+    test_name: str
+    description: str
+    estimated_duration_minutes: int
+    work_instruction_pdf: Optional[str]
+
+class CompiledSequence(NamedTuple):
+    """A device type's test sequence, sorted once, with next-step lookups and time totals"""
+    device_type: str
+    steps: Tuple[SequenceStep, ...]
+    required_tests: Tuple[str, ...]
+    next_required: Mapping[str, str]   # required test id -> next required test id or 'completed'
+    by_test_id: Mapping[str, SequenceStep]
+    total_required_minutes: int
+    total_optional_minutes: int
+    valid: bool                        # False when test_sequence in the database is not a list
+
+    @property
+    def first_test(self) -> str:
+        return self.required_tests[0] if self.required_tests else 'not_started'
+
+    def next_after(self, test_id: str) -> str:
+        """Next required test after ``test_id``; 'completed' after the last one or for tests outside the sequence"""
+        return self.next_required.get(test_id, 'completed')
+
+    def test_name(self, test_id: str) -> str:
+        step = self.by_test_id.get(test_id)
+        return step.test_name if step else test_id
+
+def parse_required(value, default: bool) -> bool:
+    """is_required is stored as a boolean or as a 'true'/'false' string"""
+    if value is None:
+        return default
+    if isinstance(value, str):
+        return value.lower() == 'true'
+    return bool(value)
+
+def compile_sequence(device_type: str, test_sequence, definitions: Dict[str, dict],
+                     required_default: bool = True) -> CompiledSequence:
+    """Sort, coerce and join a device_test_sequences.test_sequence value with test_definitions rows"""
+    valid = isinstance(test_sequence, list)
+    entries = sorted(test_sequence, key=lambda x: int(x.get('sequence_order', 0))) if valid else []
+
+    steps = []
+    for entry in entries:
+        definition = definitions.get(entry['test_id'], {})
+        steps.append(SequenceStep(
+            test_id=entry['test_id'],
+            sequence_order=int(entry.get('sequence_order', 0)),
+            is_required=parse_required(entry.get('is_required'), required_default),
+            test_number=entry.get('test_number'),
+            test_name=definition.get('test_name') or entry['test_id'],
+            description=definition.get('description') or '',
+            estimated_duration_minutes=definition.get('estimated_duration_minutes') or 0,
+            work_instruction_pdf=definition.get('work_instruction_pdf')
+        ))
+
+    required_tests = tuple(step.test_id for step in steps if step.is_required)
+    next_required = {test_id: (required_tests[i + 1] if i + 1 < len(required_tests) else 'completed')
+                     for i, test_id in enumerate(required_tests)}
+    return CompiledSequence(
+        device_type=device_type,
+        steps=tuple(steps),
+        required_tests=required_tests,
+        next_required=MappingProxyType(next_required),
+        by_test_id=MappingProxyType({step.test_id: step for step in steps}),
+        total_required_minutes=sum(step.estimated_duration_minutes for step in steps if step.is_required),
+        total_optional_minutes=sum(step.estimated_duration_minutes for step in steps if not step.is_required),
+        valid=valid
+    )
+
+def load_compiled_sequence(cursor, device_type: str, required_default: bool = True) -> Optional[CompiledSequence]:
+    """Read and compile one device type's sequence with a dict-row cursor; None if the type has no sequence"""
+    cursor.execute("""
+        SELECT test_sequence
+        FROM device_test_sequences
+        WHERE device_type = %s
+    """, (device_type,))
+    row = cursor.fetchone()
+    if not row:
+        return None
+
+    test_sequence = row['test_sequence']
+    definitions = {}
+    if isinstance(test_sequence, list) and test_sequence:
+        cursor.execute("""
+            SELECT test_id, test_name, description, estimated_duration_minutes, work_instruction_pdf
+            FROM test_definitions
+            WHERE test_id = ANY(%s)
+        """, ([entry['test_id'] for entry in test_sequence],))
+        definitions = {row['test_id']: row for row in cursor.fetchall()}
+    return compile_sequence(device_type, test_sequence, definitions, required_default)
+
+class SequenceCache:
+    """Compiled sequences by device type; entries live until a NOTIFY invalidates them (or the TTL while not listening)"""
+
+    def __init__(self, cursor_factory: Callable, required_default: bool = True, ttl: float = SEQUENCE_CACHE_TTL):
+        self.cursor_factory = cursor_factory  # context manager yielding a dict-row cursor
+        self.required_default = required_default
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries: Dict[str, tuple] = {}   # device type -> (compiled sequence, loaded at)
+        self.generation = 0                   # bumped by invalidate(); loads started earlier are not stored
+        self.metrics = {'hits': 0, 'misses': 0, 'invalidations': 0}
+        _caches.append(self)
+
+    def get(self, device_type: str, cursor=None) -> Optional[CompiledSequence]:
+        """Compiled sequence for a device type, loading it on a miss (with ``cursor`` if the caller holds one)"""
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(device_type)
+            if entry and (pg_listener.connected or now - entry[1] < self.ttl):
+                self.metrics['hits'] += 1
+                return entry[0]
+            self.metrics['misses'] += 1
+            generation = self.generation
+
+        if cursor is not None:
+            compiled = load_compiled_sequence(cursor, device_type, self.required_default)
+        else:
+            with self.cursor_factory() as own_cursor:
+                compiled = load_compiled_sequence(own_cursor, device_type, self.required_default)
+
+        if compiled is not None:
+            with self.lock:
+                if generation == self.generation:
+                    self.entries[device_type] = (compiled, now)
+        return compiled
+
+    def invalidate(self, device_type: Optional[str] = None):
+        """Drop one device type, or everything when ``device_type`` is None"""
+        with self.lock:
+            self.generation += 1
+            self.metrics['invalidations'] += 1
+            if device_type is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(device_type, None)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {**self.metrics, 'device_types': len(self.entries), 'listening': pg_listener.connected}
+
+# Every cache in the process; one NOTIFY invalidates them all
+_caches = []
+
+def _on_sequence_changed(payload: str):
+    device_type = None if payload in ('', '*') else payload
+    for cache in list(_caches):
+        cache.invalidate(device_type)
+
+def _on_listener_reconnect():
+    # Changes made while the connection was down were not notified
+    for cache in list(_caches):
+        cache.invalidate()
+
+_listening = False
+
+def start_sequence_listener():
+    """Subscribe the caches to sequence change notifications and start the shared listener"""
+    global _listening
+    if not _listening:
+        pg_listener.listen(SEQUENCE_CHANNEL, _on_sequence_changed, on_reconnect=_on_listener_reconnect)
+        _listening = True
+    pg_listener.start()
+
+__all__ = ['SequenceStep', 'CompiledSequence', 'SequenceCache', 'compile_sequence', 'load_compiled_sequence',
+           'parse_required', 'start_sequence_listener', 'SEQUENCE_CHANNEL', 'SEQUENCE_CACHE_TTL']
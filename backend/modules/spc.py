@@ -0,0 +1,326 @@
+# modules/spc.py - Statistical process control: rolling per device type/metric state updated as each result is saved
+
+import os
+import math
+import uuid
+from typing import Dict, List, Optional
+import psycopg2.errors
+import psycopg2.extras
+from .event_bus import notify_module
+
+# Points collected before control limits are frozen from the running mean and standard deviation
+SPC_BASELINE_POINTS = int(os.getenv('SPC_BASELINE_POINTS', '25'))
+# EWMA smoothing weight and width of its control limits (in sigmas of the EWMA statistic)
+SPC_EWMA_LAMBDA = float(os.getenv('SPC_EWMA_LAMBDA', '0.2'))
+SPC_EWMA_L = float(os.getenv('SPC_EWMA_L', '3'))
+# Tabular CUSUM slack k and decision interval h, in sigmas
+SPC_CUSUM_K = float(os.getenv('SPC_CUSUM_K', '0.5'))
+SPC_CUSUM_H = float(os.getenv('SPC_CUSUM_H', '5'))
+# How long a rebuild waits for the chart state lock before giving up (saves queue behind a waiting rebuild)
+SPC_REBUILD_LOCK_TIMEOUT = os.getenv('SPC_REBUILD_LOCK_TIMEOUT', '5s')
+
+RECENT_Z_POINTS = 9  # longest Western Electric run, plus the point before it
+
+# Result source -> table and the metrics charted from it (metric names are unique across sources)
+SPC_SOURCES = {
+    'twotone': {'table': 'twotone_test_results', 'serial': 'serial_number', 'timestamp': 'test_date',
+                'metrics': ['rf_vpi_1ghz']},
+    'dcvpi': {'table': 'modulator_test_results', 'serial': 'serial_number', 'timestamp': 'test_date',
+              'metrics': ['vpi_value', 'insertion_loss', 'extinction_ratio']},
+    's21': {'table': 's21_test_results', 'serial': 'serial_number', 'timestamp': 'test_date',
+            'metrics': ['frequency_3db']},
+}
+
+SPC_RULES = {
+    'we1': "1 point beyond 3 sigma",
+    'we2': "2 of 3 points beyond 2 sigma on one side",
+    'we3': "4 of 5 points beyond 1 sigma on one side",
+    'we4': "8 points in a row on one side of the center line",
+    'ewma': "EWMA outside its control limits",
+    'cusum_high': "CUSUM detected an upward shift",
+    'cusum_low': "CUSUM detected a downward shift",
+}
+
+def western_electric(recent_z: List[float]) -> List[str]:
+    """Western Electric rules broken by the newest z-score (last element) together with the ones before it"""
+    if not recent_z:
+        return []
+    violations = []
+    current = recent_z[-1]
+    if abs(current) > 3:
+        violations.append('we1')
+    for side in (1, -1):
+        if side * current > 2 and sum(1 for z in recent_z[-3:] if side * z > 2) >= 2 and len(recent_z) >= 3:
+            violations.append('we2')
+        if side * current > 1 and sum(1 for z in recent_z[-5:] if side * z > 1) >= 4 and len(recent_z) >= 5:
+            violations.append('we3')
+        # Only when the run reaches 8, not on every later point of the same run
+        if (len(recent_z) >= 8 and all(side * z > 0 for z in recent_z[-8:])
+                and (len(recent_z) == 8 or side * recent_z[-9] <= 0)):
+            violations.append('we4')
+    return violations
+
+class SpcState:
+    """Welford mean/variance, frozen control limits, EWMA and CUSUM for one device type and metric"""
+
+    def __init__(self, device_type: str, metric: str, n: int = 0, mean: float = 0.0, m2: float = 0.0,
+                 center: Optional[float] = None, sigma: Optional[float] = None, ewma: Optional[float] = None,
+                 cusum_pos: float = 0.0, cusum_neg: float = 0.0, recent_z: Optional[List[float]] = None,
+                 last_value: Optional[float] = None):
+        self.device_type = device_type
+        self.metric = metric
+        self.n = n
+        self.mean = mean
+        self.m2 = m2
+        self.center = center
+        self.sigma = sigma
+        self.ewma = ewma
+        self.cusum_pos = cusum_pos
+        self.cusum_neg = cusum_neg
+        self.recent_z = list(recent_z or [])
+        self.last_value = last_value
+
+    @property
+    def stdev(self) -> float:
+        return math.sqrt(self.m2 / (self.n - 1)) if self.n > 1 else 0.0
+
+    @property
+    def baselined(self) -> bool:
+        return self.center is not None and bool(self.sigma)
+
+    def set_baseline(self, center: float, sigma: float):
+        """Freeze control limits and restart EWMA, CUSUM and the rule window from them"""
+        self.center = center
+        self.sigma = sigma
+        self.ewma = center
+        self.cusum_pos = 0.0
+        self.cusum_neg = 0.0
+        self.recent_z = []
+
+    def update(self, value: float) -> dict:
+        """Fold one measurement in; returns its chart point with any rule violations"""
+        self.n += 1
+        delta = value - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (value - self.mean)
+        self.last_value = value
+
+        point = {'value': value, 'z': None, 'ewma': None, 'cusum_pos': None, 'cusum_neg': None, 'violations': []}
+        if not self.baselined:
+            if self.n >= SPC_BASELINE_POINTS and self.stdev > 0:
+                self.set_baseline(self.mean, self.stdev)
+            return point
+
+        z = (value - self.center) / self.sigma
+        self.ewma = SPC_EWMA_LAMBDA * value + (1 - SPC_EWMA_LAMBDA) * self.ewma
+        k = SPC_CUSUM_K * self.sigma
+        self.cusum_pos = max(0.0, self.cusum_pos + value - self.center - k)
+        self.cusum_neg = max(0.0, self.cusum_neg + self.center - value - k)
+        self.recent_z = (self.recent_z + [z])[-RECENT_Z_POINTS:]
+
+        violations = western_electric(self.recent_z)
+        if abs(self.ewma - self.center) > self.ewma_half_width:
+            violations.append('ewma')
+        point.update(z=z, ewma=self.ewma, cusum_pos=self.cusum_pos, cusum_neg=self.cusum_neg, violations=violations)
+
+        # Restart a CUSUM side once it has signalled so one shift raises one alert
+        h = SPC_CUSUM_H * self.sigma
+        if self.cusum_pos > h:
+            violations.append('cusum_high')
+            self.cusum_pos = 0.0
+        if self.cusum_neg > h:
+            violations.append('cusum_low')
+            self.cusum_neg = 0.0
+        return point
+
+    @property
+    def ewma_half_width(self) -> float:
+        return SPC_EWMA_L * self.sigma * math.sqrt(SPC_EWMA_LAMBDA / (2 - SPC_EWMA_LAMBDA))
+
+    def limits(self) -> dict:
+        """Chart lines and running statistics"""
+        limits = {
+            "device_type": self.device_type, "metric": self.metric, "n": self.n,
+            "mean": self.mean, "stdev": self.stdev, "last_value": self.last_value,
+            "baselined": self.baselined, "baseline_points": SPC_BASELINE_POINTS
+        }
+        if self.baselined:
+            limits.update({
+                "center": self.center, "sigma": self.sigma,
+                "ucl": self.center + 3 * self.sigma, "lcl": self.center - 3 * self.sigma,
+                "zones": {f"{k}sigma": [self.center - k * self.sigma, self.center + k * self.sigma] for k in (1, 2)},
+                "ewma": self.ewma,
+                "ewma_ucl": self.center + self.ewma_half_width, "ewma_lcl": self.center - self.ewma_half_width,
+                "cusum_pos": self.cusum_pos, "cusum_neg": self.cusum_neg, "cusum_h": SPC_CUSUM_H * self.sigma
+            })
+        return limits
+
+    def row(self) -> tuple:
+        return (self.n, self.mean, self.m2, self.center, self.sigma, self.ewma, self.cusum_pos, self.cusum_neg,
+                self.recent_z, self.last_value, self.device_type, self.metric)
+
+STATE_COLUMNS = "device_type, metric, n, mean, m2, center, sigma, ewma, cusum_pos, cusum_neg, recent_z, last_value"
+
+def state_from_row(row: dict) -> SpcState:
+    return SpcState(**{key: row[key] for key in STATE_COLUMNS.split(', ')})
+
+# Database
+def lock_state(cursor, device_type: str, metric: str) -> SpcState:
+    """State for a device type and metric (created empty), row-locked until the transaction ends"""
+    cursor.execute("""
+        INSERT INTO spc_state (device_type, metric) VALUES (%s, %s)
+        ON CONFLICT (device_type, metric) DO NOTHING
+    """, (device_type, metric))
+    cursor.execute(f"""
+        SELECT {STATE_COLUMNS} FROM spc_state
+        WHERE device_type = %s AND metric = %s
+        FOR UPDATE
+    """, (device_type, metric))
+    return state_from_row(cursor.fetchone())
+
+def save_state(cursor, state: SpcState):
+    cursor.execute("""
+        UPDATE spc_state
+        SET n = %s, mean = %s, m2 = %s, center = %s, sigma = %s, ewma = %s, cusum_pos = %s, cusum_neg = %s,
+            recent_z = %s, last_value = %s, updated_at = CURRENT_TIMESTAMP
+        WHERE device_type = %s AND metric = %s
+    """, state.row())
+
+def _measurement(value) -> Optional[float]:
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return value if math.isfinite(value) else None
+
+def record_result(conn, source: str, result_id: int, device_type: str, serial_number: Optional[str],
+                  values: Dict[str, object]) -> List[dict]:
+    """Fold a just-saved result's metrics into SPC state and publish its points; never raises"""
+    table = SPC_SOURCES[source]['table']
+    points = []
+    try:
+        cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        for metric in SPC_SOURCES[source]['metrics']:  # fixed order, so concurrent saves lock states alike
+            value = _measurement(values.get(metric))
+            if value is None or not device_type:
+                continue
+            state = lock_state(cursor, device_type, metric)
+            point = state.update(value)
+            cursor.execute("""
+                INSERT INTO spc_points (device_type, metric, source_table, source_id, serial_number,
+                                        value, z, ewma, cusum_pos, cusum_neg, violations)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                ON CONFLICT (source_table, source_id, metric) DO NOTHING
+                RETURNING id, created_at
+            """, (device_type, metric, table, result_id, serial_number, point['value'], point['z'],
+                  point['ewma'], point['cusum_pos'], point['cusum_neg'], point['violations']))
+            inserted = cursor.fetchone()
+            if inserted is None:
+                conn.rollback()  # already recorded (e.g. by a rebuild)
+                return []
+            save_state(cursor, state)
+            points.append({**point, "id": inserted['id'], "created_at": inserted['created_at'].isoformat(),
+                           "device_type": device_type, "metric": metric, "serial_number": serial_number,
+                           "source": source, "source_id": result_id, "limits": state.limits()})
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print(f"⚠️ SPC update for {source} result {result_id} failed: {e}")
+        return []
+
+    for point in points:
+        notify_module('spc', 'spc_point', point, coalesce=True)
+        if point['violations']:
+            notify_module('spc', 'spc_alert', {
+                **point, "rules": {rule: SPC_RULES[rule] for rule in point['violations']}
+            })
+    return points
+
+def rebaseline(conn, device_type: str, metric: str, points: int = SPC_BASELINE_POINTS) -> Optional[dict]:
+    """Freeze new limits from the latest ``points`` values; None when there are fewer than two"""
+    cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    cursor.execute("""
+        SELECT COUNT(*) AS n, AVG(value) AS center, STDDEV_SAMP(value) AS sigma
+        FROM (
+            SELECT value FROM spc_points
+            WHERE device_type = %s AND metric = %s
+            ORDER BY id DESC
+            LIMIT %s
+        ) latest
+    """, (device_type, metric, points))
+    baseline = cursor.fetchone()
+    if baseline['n'] < 2 or not baseline['sigma']:
+        return None
+    state = lock_state(cursor, device_type, metric)
+    state.set_baseline(float(baseline['center']), float(baseline['sigma']))
+    save_state(cursor, state)
+    conn.commit()
+    return state.limits()
+
+def rebuild(conn, sources: Optional[List[str]] = None, batch_size: int = 5000) -> Optional[dict]:
+    """Replay result history (test date order) into fresh SPC state and chart points.
+    Returns None if the chart state stayed locked for SPC_REBUILD_LOCK_TIMEOUT (nothing is changed)."""
+    cursor = conn.cursor()
+    # Saves arriving meanwhile wait on the lock (in worker threads), then apply on top of the rebuilt state.
+    # Fail fast instead of queueing behind a long save transaction, which would stall every save queued after us.
+    cursor.execute("SELECT set_config('lock_timeout', %s, true)", (SPC_REBUILD_LOCK_TIMEOUT,))
+    try:
+        cursor.execute("LOCK TABLE spc_state IN EXCLUSIVE MODE")
+    except psycopg2.errors.LockNotAvailable:
+        # Handled here: connection helpers turn any database error into a generic 500
+        conn.rollback()
+        return None
+    cursor.execute("SET LOCAL lock_timeout = DEFAULT")
+    summary = {}
+    for source in sources or list(SPC_SOURCES):
+        spec = SPC_SOURCES[source]
+        cursor.execute("SELECT to_regclass(%s) IS NOT NULL", (f"public.{spec['table']}",))
+        if not cursor.fetchone()[0]:
+            continue
+        cursor.execute("DELETE FROM spc_points WHERE source_table = %s", (spec['table'],))
+        cursor.execute("DELETE FROM spc_state WHERE metric = ANY(%s)", (spec['metrics'],))
+
+        states: Dict[tuple, SpcState] = {}
+        written = alerting = 0
+        reader = conn.cursor(name=f"spc_rebuild_{uuid.uuid4().hex[:12]}")
+        reader.itersize = batch_size
+        reader.execute(f"""
+            SELECT id, device_type, {spec['serial']}, {', '.join(spec['metrics'])}
+            FROM {spec['table']}
+            WHERE device_type IS NOT NULL
+            ORDER BY {spec['timestamp']} NULLS FIRST, id
+        """)
+        while True:
+            rows = reader.fetchmany(batch_size)
+            if not rows:
+                break
+            points = []
+            for row in rows:
+                result_id, device_type, serial_number = row[:3]
+                for metric, raw in zip(spec['metrics'], row[3:]):
+                    value = _measurement(raw)
+                    if value is None:
+                        continue
+                    state = states.setdefault((device_type, metric), SpcState(device_type, metric))
+                    point = state.update(value)
+                    points.append((device_type, metric, spec['table'], result_id, serial_number, point['value'],
+                                   point['z'], point['ewma'], point['cusum_pos'], point['cusum_neg'],
+                                   point['violations']))
+            psycopg2.extras.execute_values(cursor, """
+                INSERT INTO spc_points (device_type, metric, source_table, source_id, serial_number,
+                                        value, z, ewma, cusum_pos, cusum_neg, violations)
+                VALUES %s
+            """, points, page_size=1000)
+            written += len(points)
+            alerting += sum(1 for point in points if point[-1])
+        reader.close()
+
+        psycopg2.extras.execute_values(cursor, f"""
+            INSERT INTO spc_state ({STATE_COLUMNS}) VALUES %s
+        """, [(state.device_type, state.metric) + state.row()[:-2] for state in states.values()])
+        summary[source] = {"points": written, "charts": len(states), "alerting_points": alerting}
+    conn.commit()
+    return summary
+
+__all__ = ['SpcState', 'SPC_SOURCES', 'SPC_RULES', 'western_electric', 'record_result', 'rebaseline', 'rebuild',
+           'lock_state', 'state_from_row', 'SPC_BASELINE_POINTS']
@@ -0,0 +1,284 @@
+# modules/spc_module.py - SPC control charts, rolling statistics and rule-violation alerts
+
+from fastapi import APIRouter, HTTPException, Depends
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from typing import Optional
+import os
+import asyncio
+import datetime
+import jwt
+import psycopg2
+import psycopg2.extras
+from contextlib import contextmanager
+from dotenv import load_dotenv
+from .module_registry import ModuleManifest
+from .audit_log import audit
+from . import spc
+
+# Load environment variables
+load_dotenv()
+
+# Router for statistical process control
+spc_router = APIRouter()
+
+# Security
+security = HTTPBearer()
+SECRET_KEY = os.getenv('SECRET_KEY', 'default-dev-key-change-in-production')
+
+# Database configuration
+DATABASE_CONFIG = {
+    'host': os.getenv('DB_HOST', 'localhost'),
+    'port': int(os.getenv('DB_PORT', '5432')),
+    'database': os.getenv('DB_NAME', 'MAQ_Lab_Manager'),
+    'user': os.getenv('DB_USER', 'karthi'),
+    'password': os.getenv('DB_PASSWORD', 'maq001')
+}
+
+SPC_METRICS = {metric: source for source, spec in spc.SPC_SOURCES.items() for metric in spec['metrics']}
+
+# Shared connection pool from main.py (set in on_load)
+get_db_connection_func = None
+
+# Database connection
+@contextmanager
+def get_db_connection():
+    """Get PostgreSQL database connection (the API server's pool when available)"""
+    if get_db_connection_func:
+        with get_db_connection_func() as conn:
+            yield conn
+        return
+    conn = None
+    try:
+        conn = psycopg2.connect(**DATABASE_CONFIG)
+        yield conn
+    except psycopg2.Error as e:
+        if conn:
+            conn.rollback()
+        raise HTTPException(status_code=500, detail=f"Database connection failed: {str(e)}")
+    finally:
+        if conn:
+            conn.close()
+
+def set_db_connection(services: dict):
+    """Use the API server's connection pool"""
+    global get_db_connection_func
+    get_db_connection_func = services.get('get_db_connection')
+
+# Authentication functions
+def verify_jwt_token(token: str) -> dict:
+    """Verify JWT token and return user data"""
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
+        return payload
+    except jwt.ExpiredSignatureError:
+        raise HTTPException(status_code=401, detail="Token expired. Please login again.")
+    except jwt.InvalidTokenError:
+        raise HTTPException(status_code=401, detail="Invalid token. Please login again.")
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
+    """Get current user from JWT token"""
+    return verify_jwt_token(credentials.credentials)
+
+def log_action(user_id: int, action: str, module: str, details: str):
+    """Log user action to system logs"""
+    audit(user_id, action, module, details)
+
+# Queries
+def _serialize(row: dict) -> dict:
+    item = dict(row)
+    for key, value in item.items():
+        if isinstance(value, (datetime.date, datetime.datetime)):
+            item[key] = value.isoformat()
+    return item
+
+def get_summary(device_type: Optional[str] = None) -> list:
+    """Every chart's limits and running statistics with its violations in the last 24 hours"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        cursor.execute(f"""
+            SELECT {spc.STATE_COLUMNS}, s.updated_at, COALESCE(v.alerts_24h, 0) AS alerts_24h
+            FROM spc_state s
+            LEFT JOIN (
+                SELECT device_type, metric, COUNT(*) AS alerts_24h
+                FROM spc_points
+                WHERE violations <> '{{}}' AND created_at >= NOW() - INTERVAL '24 hours'
+                GROUP BY device_type, metric
+            ) v USING (device_type, metric)
+            WHERE %(device_type)s::TEXT IS NULL OR device_type = %(device_type)s
+            ORDER BY device_type, metric
+        """, {"device_type": device_type})
+        return [{**spc.state_from_row(row).limits(), "alerts_24h": row['alerts_24h'],
+                 "updated_at": row['updated_at'].isoformat() if row['updated_at'] else None}
+                for row in cursor.fetchall()]
+
+def get_chart(device_type: str, metric: str, limit: int) -> Optional[dict]:
+    """Current limits plus the latest ``limit`` points, oldest first; None when the chart does not exist"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        cursor.execute(f"""
+            SELECT {spc.STATE_COLUMNS} FROM spc_state
+            WHERE device_type = %s AND metric = %s
+        """, (device_type, metric))
+        state = cursor.fetchone()
+        if not state:
+            return None
+        cursor.execute("""
+            SELECT id, serial_number, source_id, value, z, ewma, cusum_pos, cusum_neg, violations, created_at
+            FROM spc_points
+            WHERE device_type = %s AND metric = %s
+            ORDER BY id DESC
+            LIMIT %s
+        """, (device_type, metric, limit))
+        points = [_serialize(row) for row in reversed(cursor.fetchall())]
+    return {"limits": spc.state_from_row(state).limits(), "points": points}
+
+def get_alerts(device_type: Optional[str], metric: Optional[str], since: Optional[datetime.datetime],
+               limit: int) -> list:
+    """Points that broke a rule, newest first"""
+    query = """
+        SELECT id, device_type, metric, serial_number, source_table, source_id, value, z, violations, created_at
+        FROM spc_points
+        WHERE violations <> '{}'
+    """
+    params = []
+    if device_type:
+        query += " AND device_type = %s"
+        params.append(device_type)
+    if metric:
+        query += " AND metric = %s"
+        params.append(metric)
+    if since:
+        query += " AND created_at >= %s"
+        params.append(since)
+    query += " ORDER BY created_at DESC, id DESC LIMIT %s"
+    params.append(limit)
+
+    with get_db_connection() as conn:
+        cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        cursor.execute(query, params)
+        return [{**_serialize(row), "rules": {rule: spc.SPC_RULES.get(rule, rule) for rule in row['violations']}}
+                for row in cursor.fetchall()]
+
+def rebaseline_chart(device_type: str, metric: str, points: int) -> Optional[dict]:
+    with get_db_connection() as conn:
+        return spc.rebaseline(conn, device_type, metric, points)
+
+def rebuild_charts(sources: Optional[list]) -> dict:
+    with get_db_connection() as conn:
+        return spc.rebuild(conn, sources)
+
+# API Endpoints
+@spc_router.get("/metrics")
+async def list_spc_metrics(current_user: dict = Depends(get_current_user)):
+    """Charted metrics per result source, the rules checked and the chart settings"""
+    return {
+        "sources": {source: spec['metrics'] for source, spec in spc.SPC_SOURCES.items()},
+        "rules": spc.SPC_RULES,
+        "settings": {
+            "baseline_points": spc.SPC_BASELINE_POINTS,
+            "ewma_lambda": spc.SPC_EWMA_LAMBDA,
+            "ewma_l": spc.SPC_EWMA_L,
+            "cusum_k": spc.SPC_CUSUM_K,
+            "cusum_h": spc.SPC_CUSUM_H
+        },
+        "websocket_topic": "module:spc"
+    }
+
+@spc_router.get("/summary")
+async def spc_summary(device_type: Optional[str] = None, current_user: dict = Depends(get_current_user)):
+    """Limits and rolling statistics of every chart"""
+    try:
+        return {"charts": await asyncio.to_thread(get_summary, device_type)}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get SPC summary: {str(e)}")
+
+@spc_router.get("/charts/{device_type}/{metric}")
+async def spc_chart(device_type: str, metric: str, limit: int = 200,
+                    current_user: dict = Depends(get_current_user)):
+    """Control chart data for one device type and metric"""
+    if metric not in SPC_METRICS:
+        raise HTTPException(status_code=400, detail=f"Unknown SPC metric: {metric}")
+    try:
+        chart = await asyncio.to_thread(get_chart, device_type, metric, min(max(limit, 1), 5000))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get SPC chart: {str(e)}")
+
+    if chart is None:
+        raise HTTPException(status_code=404, detail=f"No SPC data for {device_type} {metric}")
+    return chart
+
+@spc_router.get("/alerts")
+async def spc_alerts(
+    device_type: Optional[str] = None,
+    metric: Optional[str] = None,
+    since: Optional[datetime.datetime] = None,
+    limit: int = 100,
+    current_user: dict = Depends(get_current_user)
+):
+    """Recent rule violations"""
+    try:
+        alerts = await asyncio.to_thread(get_alerts, device_type, metric, since, min(max(limit, 1), 1000))
+        return {"alerts": alerts, "count": len(alerts)}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get SPC alerts: {str(e)}")
+
+@spc_router.post("/charts/{device_type}/{metric}/rebaseline")
+async def spc_rebaseline(device_type: str, metric: str, points: int = spc.SPC_BASELINE_POINTS,
+                         current_user: dict = Depends(get_current_user)):
+    """Freeze new control limits from the latest points, e.g. after a deliberate process change (admin only)"""
+    if current_user.get('role') != 'admin':
+        raise HTTPException(status_code=403, detail="Admin access required")
+    if metric not in SPC_METRICS:
+        raise HTTPException(status_code=400, detail=f"Unknown SPC metric: {metric}")
+    try:
+        limits = await asyncio.to_thread(rebaseline_chart, device_type, metric, max(points, 2))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to rebaseline: {str(e)}")
+
+    if limits is None:
+        raise HTTPException(status_code=400, detail=f"Not enough varying points to baseline {device_type} {metric}")
+    log_action(current_user['user_id'], 'spc_rebaseline', 'spc',
+               f"Rebaselined {device_type} {metric}: center {limits['center']:.4g}, sigma {limits['sigma']:.4g}")
+    return limits
+
+@spc_router.post("/rebuild")
+async def spc_rebuild(source: Optional[str] = None, current_user: dict = Depends(get_current_user)):
+    """Replay stored results into fresh SPC state, e.g. to seed charts from history (admin only)"""
+    if current_user.get('role') != 'admin':
+        raise HTTPException(status_code=403, detail="Admin access required")
+    if source and source not in spc.SPC_SOURCES:
+        raise HTTPException(status_code=400, detail=f"Unknown SPC source: {source}")
+    try:
+        summary = await asyncio.to_thread(rebuild_charts, [source] if source else None)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"SPC rebuild failed: {str(e)}")
+
+    if summary is None:
+        raise HTTPException(status_code=409, detail="SPC charts are being updated; retry the rebuild shortly")
+
+    log_action(current_user['user_id'], 'spc_rebuild', 'spc',
+               "Rebuilt SPC charts: " + ", ".join(f"{name} {result['points']} points" for name, result in summary.items()))
+    return {"sources": summary}
+
+MODULE_MANIFEST = ModuleManifest(
+    name='spc',
+    router=spc_router,
+    prefix='/api/spc',
+    tags=['Statistical Process Control'],
+    on_load=set_db_connection
+)
+
+# Export router and helpers
+__all__ = ['MODULE_MANIFEST', 'spc_router', 'get_chart', 'get_summary', 'get_alerts']
+
+print("✅ SPC module loaded successfully")
@@ -0,0 +1,320 @@
+# modules/traveler_module.py - Device traveler: every station's records for a device serial in one timeline
+
+from fastapi import APIRouter, HTTPException, Depends
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from typing import Optional
+import os
+import time
+import asyncio
+import datetime
+import threading
+import jwt
+import psycopg2
+import psycopg2.extras
+from contextlib import contextmanager
+from dotenv import load_dotenv
+from .module_registry import ModuleManifest
+from .audit_log import audit
+from .pg_listener import pg_listener
+from .cluster import leader
+
+# Load environment variables
+load_dotenv()
+
+# Router for device travelers
+traveler_router = APIRouter()
+
+# Security
+security = HTTPBearer()
+SECRET_KEY = os.getenv('SECRET_KEY', 'default-dev-key-change-in-production')
+
+# Database configuration
+DATABASE_CONFIG = {
+    'host': os.getenv('DB_HOST', 'localhost'),
+    'port': int(os.getenv('DB_PORT', '5432')),
+    'database': os.getenv('DB_NAME', 'MAQ_Lab_Manager'),
+    'user': os.getenv('DB_USER', 'karthi'),
+    'password': os.getenv('DB_PASSWORD', 'maq001')
+}
+
+# Channel the source-table triggers notify after queueing changed serials in traveler_dirty (migration 19)
+TRAVELER_CHANNEL = 'traveler_changed'
+# Seconds between passes over queued devices while source tables are changing
+TRAVELER_REFRESH_INTERVAL = float(os.getenv('TRAVELER_REFRESH_INTERVAL', '2'))
+# Seconds between unconditional passes while the LISTEN connection is down
+TRAVELER_FALLBACK_REFRESH = float(os.getenv('TRAVELER_FALLBACK_REFRESH', '60'))
+# Devices re-derived per transaction
+TRAVELER_BATCH_SIZE = int(os.getenv('TRAVELER_BATCH_SIZE', '500'))
+
+TRAVELER_SOURCES = ('workflow', 's11', 'chip_preparation', 'epoxy_cure', 'housing_inspection', 's21', 'twotone', 'dcvpi')
+
+# Refresh state: set from the listener thread, read by the refresh loop
+_dirty = threading.Event()
+_refresh_task = None
+refresh_state = {'refreshed_at': None, 'last_duration_ms': None, 'refreshes': 0, 'devices_updated': 0,
+                 'last_error': None}
+
+# Shared connection pool from main.py (set in on_load)
+get_db_connection_func = None
+
+# Database connection
+@contextmanager
+def get_db_connection():
+    """Get PostgreSQL database connection (the API server's pool when available)"""
+    if get_db_connection_func:
+        with get_db_connection_func() as conn:
+            yield conn
+        return
+    conn = None
+    try:
+        conn = psycopg2.connect(**DATABASE_CONFIG)
+        yield conn
+    except psycopg2.Error as e:
+        if conn:
+            conn.rollback()
+        raise HTTPException(status_code=500, detail=f"Database connection failed: {str(e)}")
+    finally:
+        if conn:
+            conn.close()
+
+def set_db_connection(services: dict):
+    """Use the API server's connection pool"""
+    global get_db_connection_func
+    get_db_connection_func = services.get('get_db_connection')
+
+# Authentication functions
+def verify_jwt_token(token: str) -> dict:
+    """Verify JWT token and return user data"""
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
+        return payload
+    except jwt.ExpiredSignatureError:
+        raise HTTPException(status_code=401, detail="Token expired. Please login again.")
+    except jwt.InvalidTokenError:
+        raise HTTPException(status_code=401, detail="Invalid token. Please login again.")
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
+    """Get current user from JWT token"""
+    return verify_jwt_token(credentials.credentials)
+
+def log_action(user_id: int, action: str, module: str, details: str):
+    """Log user action to system logs"""
+    audit(user_id, action, module, details)
+
+# Traveler maintenance
+def apply_queued_devices(conn, batch_size: int = TRAVELER_BATCH_SIZE) -> int:
+    """Re-derive device_traveler rows for the serials the source-table triggers queued; returns devices updated"""
+    cursor = conn.cursor()
+    updated = 0
+    while True:
+        # Claimed and rewritten in one transaction: readers see a device's old rows until its new ones commit
+        cursor.execute("""
+            DELETE FROM traveler_dirty
+            WHERE serial_number IN (
+                SELECT serial_number FROM traveler_dirty ORDER BY queued_at LIMIT %s FOR UPDATE SKIP LOCKED
+            )
+            RETURNING serial_number
+        """, (batch_size,))
+        serials = [row[0] for row in cursor.fetchall()]
+        if serials:
+            cursor.execute("DELETE FROM device_traveler WHERE serial_number = ANY(%s)", (serials,))
+            cursor.execute("""
+                INSERT INTO device_traveler
+                SELECT * FROM device_traveler_source WHERE serial_number = ANY(%s)
+            """, (serials,))
+        conn.commit()
+        updated += len(serials)
+        if len(serials) < batch_size:
+            return updated
+
+def refresh_traveler(rebuild: bool = False) -> dict:
+    """Bring device_traveler up to date for changed devices; ``rebuild`` re-creates it to pick up newly created source tables"""
+    started = time.perf_counter()
+    with get_db_connection() as conn:
+        if rebuild:
+            cursor = conn.cursor()
+            cursor.execute("SELECT rebuild_device_traveler()")
+            conn.commit()
+        refresh_state['devices_updated'] += apply_queued_devices(conn)
+    refresh_state['refreshed_at'] = datetime.datetime.now()
+    refresh_state['last_duration_ms'] = int((time.perf_counter() - started) * 1000)
+    refresh_state['refreshes'] += 1
+    refresh_state['last_error'] = None
+    return refresh_state
+
+def _on_traveler_changed(payload: str):
+    _dirty.set()
+
+async def refresh_periodically():
+    """Apply queued devices after source tables change (NOTIFY), or on a slow timer while not listening"""
+    last_refresh = time.monotonic()
+    while True:
+        await asyncio.sleep(TRAVELER_REFRESH_INTERVAL)
+        overdue = not pg_listener.connected and time.monotonic() - last_refresh >= TRAVELER_FALLBACK_REFRESH
+        if not (_dirty.is_set() or overdue) or not leader.is_leader:
+            continue
+        _dirty.clear()
+        try:
+            await asyncio.to_thread(refresh_traveler)
+        except Exception as e:
+            refresh_state['last_error'] = str(e)
+            _dirty.set()  # try again next interval
+            print(f"Traveler refresh error: {e}")
+        last_refresh = time.monotonic()
+
+def start_traveler_refresh():
+    """Listen for source table changes and start the refresh loop"""
+    global _refresh_task
+    # Changes made while the listener was disconnected were not notified
+    pg_listener.listen(TRAVELER_CHANNEL, _on_traveler_changed, on_reconnect=_dirty.set)
+    pg_listener.start()
+    leader.on_elected(_dirty.set)  # take over what the previous leader left queued
+    _dirty.set()  # devices queued while the API was down
+    _refresh_task = asyncio.create_task(refresh_periodically())
+
+def stop_traveler_refresh():
+    if _refresh_task:
+        _refresh_task.cancel()
+
+# Queries
+def _serialize(row: dict) -> dict:
+    item = dict(row)
+    for key, value in item.items():
+        if isinstance(value, (datetime.date, datetime.datetime)):
+            item[key] = value.isoformat()
+    return item
+
+def get_device_traveler(serial_number: str, sources: Optional[list] = None,
+                        since: Optional[datetime.datetime] = None) -> dict:
+    """Device header plus its timeline from device_traveler, oldest first"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+
+        cursor.execute("SELECT to_regclass('public.devices') IS NOT NULL AS has_devices")
+        device = None
+        if cursor.fetchone()['has_devices']:
+            cursor.execute("""
+                SELECT serial_number, device_type, manufacturing_order_number, current_stage,
+                       completed_tests, required_tests, status, created_at
+                FROM devices
+                WHERE serial_number = %s
+            """, (serial_number,))
+            device = cursor.fetchone()
+
+        query = """
+            SELECT source, record_id, event_at, result, operator, chip_serial_number, details
+            FROM device_traveler
+            WHERE serial_number = %s
+        """
+        params = [serial_number]
+        if sources:
+            query += " AND source = ANY(%s)"
+            params.append(list(sources))
+        if since:
+            query += " AND event_at >= %s"
+            params.append(since)
+        cursor.execute(query + " ORDER BY event_at NULLS FIRST, source, record_id", params)
+        timeline = [_serialize(row) for row in cursor.fetchall()]
+
+    counts = {}
+    for event in timeline:
+        counts[event['source']] = counts.get(event['source'], 0) + 1
+    return {
+        "serial_number": serial_number,
+        "device": _serialize(device) if device else None,
+        "chips": sorted({event['chip_serial_number'] for event in timeline if event['chip_serial_number']}),
+        "counts": counts,
+        "timeline": timeline,
+        "refreshed_at": refresh_state['refreshed_at'].isoformat() if refresh_state['refreshed_at'] else None
+    }
+
+def get_mo_traveler_summary(manufacturing_order_number: str) -> list:
+    """Per-device record counts, failures and last activity for a manufacturing order"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        cursor.execute("""
+            WITH per_source AS (
+                SELECT serial_number, source, COUNT(*) AS records,
+                       COUNT(*) FILTER (WHERE UPPER(result) IN ('FAIL', 'FAILED')) AS failures,
+                       MAX(event_at) AS last_event_at
+                FROM device_traveler
+                WHERE manufacturing_order_number = %s
+                GROUP BY serial_number, source
+            )
+            SELECT serial_number, SUM(records)::INTEGER AS records, SUM(failures)::INTEGER AS failures,
+                   jsonb_object_agg(source, records) AS by_source, MAX(last_event_at) AS last_event_at
+            FROM per_source
+            GROUP BY serial_number
+            ORDER BY serial_number
+        """, (manufacturing_order_number,))
+        return [_serialize(row) for row in cursor.fetchall()]
+
+# API Endpoints
+@traveler_router.get("/devices/{serial_number}")
+async def device_traveler(
+    serial_number: str,
+    sources: Optional[str] = None,
+    since: Optional[datetime.datetime] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    """Full history of a device across all stations (comma-separated ``sources`` to filter)"""
+    source_list = [source.strip() for source in sources.split(',') if source.strip()] if sources else None
+    if source_list:
+        unknown = [source for source in source_list if source not in TRAVELER_SOURCES]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown sources: {', '.join(unknown)}")
+    try:
+        traveler = await asyncio.to_thread(get_device_traveler, serial_number, source_list, since)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to build traveler: {str(e)}")
+
+    if traveler['device'] is None and not traveler['timeline']:
+        raise HTTPException(status_code=404, detail=f"No records for device {serial_number}")
+    return traveler
+
+@traveler_router.get("/manufacturing-orders/{manufacturing_order_number}")
+async def manufacturing_order_traveler(manufacturing_order_number: str,
+                                       current_user: dict = Depends(get_current_user)):
+    """Traveler summary for every device of a manufacturing order"""
+    try:
+        devices = await asyncio.to_thread(get_mo_traveler_summary, manufacturing_order_number.strip())
+        return {"manufacturing_order_number": manufacturing_order_number, "devices": devices}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get MO traveler: {str(e)}")
+
+@traveler_router.post("/refresh")
+async def refresh_traveler_now(rebuild: bool = False, current_user: dict = Depends(get_current_user)):
+    """Apply queued device changes now; ``rebuild`` re-creates the traveler with source tables added since the last build (admin only)"""
+    if current_user.get('role') != 'admin':
+        raise HTTPException(status_code=403, detail="Admin access required")
+    try:
+        state = await asyncio.to_thread(refresh_traveler, rebuild)
+        log_action(current_user['user_id'], 'traveler_refresh', 'traveler',
+                   f"{'Rebuilt' if rebuild else 'Refreshed'} device traveler in {state['last_duration_ms']} ms")
+        return {**state, "refreshed_at": state['refreshed_at'].isoformat()}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Traveler refresh failed: {str(e)}")
+
+MODULE_MANIFEST = ModuleManifest(
+    name='traveler',
+    router=traveler_router,
+    prefix='/api/traveler',
+    tags=['Device Traveler'],
+    on_load=set_db_connection,
+    on_startup=start_traveler_refresh,
+    on_shutdown=stop_traveler_refresh,
+    health_probe=lambda: {**refresh_state,
+                          'refreshed_at': refresh_state['refreshed_at'].isoformat() if refresh_state['refreshed_at'] else None,
+                          'pending_changes': _dirty.is_set()}
+)
+
+# Export router and helpers
+__all__ = ['MODULE_MANIFEST', 'traveler_router', 'get_device_traveler', 'refresh_traveler']
+
+print("✅ Device traveler module loaded successfully")
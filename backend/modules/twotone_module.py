@@ -7,6 +7,7 @@ from pydantic import BaseModel
 from typing import List, Optional
 import os
 import json
+import asyncio
 import datetime
 import jwt
 import psycopg2
@@ -18,6 +19,11 @@ import time
 from fpdf import FPDF
 from pathlib import Path
 import uuid
+from .artifact_manager import register_artifact, touch_artifact
+from .module_registry import ModuleManifest
+from .audit_log import audit
+from .event_bus import notify_test
+from .spc import record_result as record_spc_result
 
 # Load environment variables
 load_dotenv()
@@ -84,17 +90,8 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
 
 # Utility functions
 def log_action(user_id: int, action: str, module: str, details: str):
-    """Log user action"""
-    try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                INSERT INTO system_logs (user_id, action, module, details)
-                VALUES (%s, %s, %s, %s)
-            """, (user_id, action, module, details))
-            conn.commit()
-    except Exception as e:
-        print(f"Error logging action: {e}")
+    """Log user action (queued; written to system_logs in batches)"""
+    audit(user_id, action, module, details)
 
 # Pydantic models
 class TestConfigurationRequest(BaseModel):
@@ -223,6 +220,7 @@ class TwoToneESAController:
             # Save locally
             with open(local_path, 'wb') as file:
                 file.write(bytearray(screenshot))
+            register_artifact(local_path, 'twotone', serial_number)
             
             print(f"✅ Graph saved: {local_path}")
             return str(local_path)
@@ -283,6 +281,9 @@ def save_test_result(test_data: dict):
             test_id = cursor.fetchone()[0]
             conn.commit()
             print(f"✅ Test result saved with ID: {test_id}")
+            # Update the SPC charts for this device type (never fails the save)
+            record_spc_result(conn, 'twotone', test_id, test_data['device_type'], test_data['serial_number'],
+                              {'rf_vpi_1ghz': test_data['vpi']})
             return test_id
     except Exception as e:
         print(f"❌ Error saving test result: {e}")
@@ -383,6 +384,11 @@ async def run_twotone_test(
     if current_user['role'] not in ['admin', 'operator']:
         raise HTTPException(status_code=403, detail="Insufficient permissions")
     
+    notify_test('twotone', 'test_started', test_config.serial_number, {
+        "user": current_user['username'],
+        "device_type": test_config.device_type
+    })
+    
     try:
         # Ensure ESA is connected and initialized
         if not esa_controller.connected:
@@ -424,10 +430,17 @@ async def run_twotone_test(
         }
         
         # Save to database
-        test_id = save_test_result(test_data)
+        # Off the event loop: the SPC update can wait on chart row locks
+        test_id = await asyncio.to_thread(save_test_result, test_data)
         
         log_action(current_user['user_id'], 'run_twotone_test', 'twotone',
                   f"Test completed: {test_config.device_type} {test_config.serial_number} - {test_result}")
+        notify_test('twotone', 'test_completed', test_config.serial_number, {
+            "test_id": test_id,
+            "device_type": test_config.device_type,
+            "vpi": vpi,
+            "result": test_result
+        })
         
         return {
             "test_id": test_id,
@@ -444,6 +457,7 @@ async def run_twotone_test(
         
     except Exception as e:
         print(f"❌ Test execution failed: {e}")
+        notify_test('twotone', 'test_error', test_config.serial_number, {"error": str(e)})
         raise HTTPException(status_code=500, detail=str(e))
 
 @twotone_router.get("/history")
@@ -499,6 +513,7 @@ async def get_graph_image(filename: str):
     try:
         file_path = GRAPHS_DIR / filename
         if file_path.exists():
+            touch_artifact(file_path)
             return FileResponse(file_path)
         else:
             raise HTTPException(status_code=404, detail="Graph image not found")
@@ -546,6 +561,7 @@ async def generate_pdf_report(
         pdf_filename = f"1GHzVpi_Test_Report_{report_data.device_type}_{report_data.serial_number}_{timestamp}.pdf"
         pdf_path = REPORTS_DIR / pdf_filename
         pdf.output(str(pdf_path))
+        register_artifact(pdf_path, 'twotone', report_data.serial_number)
         
         log_action(current_user['user_id'], 'generate_report', 'twotone',
                   f"Generated report for {report_data.device_type} {report_data.serial_number}")
@@ -560,63 +576,17 @@ async def generate_pdf_report(
         print(f"❌ Report generation failed: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to generate report: {str(e)}")
 
-# Initialize database tables
-def init_twotone_tables():
-    """Initialize two-tone testing tables"""
-    try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            
-    
-            
-            # Test ranges table
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS twotone_test_Spec (
-                    device_type VARCHAR(100) PRIMARY KEY,
-                    rf_vpi_min DECIMAL(8,3) NOT NULL,
-                    rf_vpi_max DECIMAL(8,3) NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            # Insert default test ranges if table is empty
-            cursor.execute("SELECT COUNT(*) FROM twotone_test_Spec")
-            if cursor.fetchone()[0] == 0:
-                default_ranges = [
-                    ('LNA2322', 4.0, 5.0),
-                    ('LNA2124', 3.8, 4.8),
-                    ('LNA6213', 5.0, 6.0),
-                    ('LNA6112', 5.0, 6.0),
-                    ('LNLVL-IM-Z', 1.7, 2.7),
-                    ('LNQ4314', 5.5, 6.5)
-                ]
-                
-                cursor.executemany("""
-                    INSERT INTO twotone_test_Spec (device_type, rf_vpi_min, rf_vpi_max)
-                    VALUES (%s, %s, %s)
-                """, default_ranges)
-            
-            # Create indexes
-            cursor.execute("""
-                CREATE INDEX IF NOT EXISTS idx_twotone_results_device_type 
-                ON twotone_test_results(device_type)
-            """)
-            
-            cursor.execute("""
-                CREATE INDEX IF NOT EXISTS idx_twotone_results_test_date 
-                ON twotone_test_results(test_date)
-            """)
-            
-            conn.commit()
-            print("✅ Two-tone testing tables initialized")
-            
-    except Exception as e:
-        print(f"❌ Two-tone table initialization error: {e}")
-
-# Initialize tables on module load
-init_twotone_tables()
+MODULE_MANIFEST = ModuleManifest(
+    name='twotone',
+    router=twotone_router,
+    prefix='/modules/twotone',
+    tags=['Two-Tone Testing'],
+    health_probe=lambda: {"esa_connected": esa_controller.connected},
+    instrument_routes=['/status', '/initialize', '/run-test'],
+    instruments=[INSTRUMENT_ADDRESS]
+)
 
 # Export router
-__all__ = ['twotone_router']
+__all__ = ['MODULE_MANIFEST', 'twotone_router']
 
 print("✅ Two-tone testing module loaded successfully")
\ No newline at end of file
@@ -0,0 +1,352 @@
+# modules/upload_storage.py - Streaming, deduplicating and resumable file uploads
+
+from fastapi import APIRouter, HTTPException, Depends, Request, UploadFile
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from pydantic import BaseModel
+from pathlib import Path
+from typing import Optional, Set
+import os
+import json
+import uuid
+import time
+import hashlib
+import asyncio
+import aiofiles
+import aiofiles.os
+import jwt
+from dotenv import load_dotenv
+from .artifact_manager import register_artifact
+from .module_registry import ModuleManifest
+
+# Load environment variables
+load_dotenv()
+
+# Router for resumable upload sessions
+upload_router = APIRouter()
+
+# Security
+security = HTTPBearer()
+SECRET_KEY = os.getenv('SECRET_KEY', 'default-dev-key-change-in-production')
+
+# Streaming configuration
+CHUNK_SIZE = 1024 * 1024  # 1MB
+SESSION_TTL_SECONDS = int(os.getenv('UPLOAD_SESSION_TTL', str(24 * 3600)))
+
+# Upload targets registered by modules: purpose -> settings
+UPLOAD_TARGETS = {}
+
+# Open resumable sessions: upload_id -> running SHA-256 (lost on restart, rebuilt on finalize)
+_session_hashers = {}
+_session_locks = {}
+
+# Authentication functions
+def verify_jwt_token(token: str) -> dict:
+    """Verify JWT token and return user data"""
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
+        return payload
+    except jwt.ExpiredSignatureError:
+        raise HTTPException(status_code=401, detail="Token expired. Please login again.")
+    except jwt.InvalidTokenError:
+        raise HTTPException(status_code=401, detail="Invalid token. Please login again.")
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
+    """Get current user from JWT token"""
+    return verify_jwt_token(credentials.credentials)
+
+# Pydantic models
+class UploadSessionCreate(BaseModel):
+    purpose: str
+    filename: str
+    total_size: int
+
+# Utility functions
+def register_upload_target(purpose: str, directory, max_bytes: int, allowed_extensions: Optional[Set[str]] = None):
+    """Register a storage directory and limits for an upload purpose"""
+    directory = Path(directory)
+    (directory / '.incoming').mkdir(parents=True, exist_ok=True)
+    UPLOAD_TARGETS[purpose] = {
+        'directory': directory,
+        'max_bytes': max_bytes,
+        'allowed_extensions': {ext.lower() for ext in allowed_extensions} if allowed_extensions else None
+    }
+
+def get_upload_target(purpose: str) -> dict:
+    """Look up a registered upload target"""
+    target = UPLOAD_TARGETS.get(purpose)
+    if not target:
+        raise HTTPException(status_code=400, detail=f"Unknown upload purpose: {purpose}")
+    return target
+
+def check_extension(target: dict, filename: str) -> str:
+    """Validate file extension against the target and return it"""
+    extension = Path(filename or '').suffix.lower()
+    allowed = target['allowed_extensions']
+    if allowed is not None and extension not in allowed:
+        raise HTTPException(status_code=400, detail=f"File type {extension or '(none)'} not allowed")
+    return extension
+
+def too_large(max_bytes: int) -> HTTPException:
+    """413 error for size cap violations"""
+    return HTTPException(status_code=413, detail=f"File too large (max {max_bytes // (1024 * 1024)}MB)")
+
+async def commit_blob(target: dict, tmp_path: Path, sha256: str, extension: str) -> tuple:
+    """Move a fully written temp file to its content-addressed name; returns (path, deduplicated)"""
+    final_path = target['directory'] / f"{sha256}{extension}"
+
+    if await aiofiles.os.path.exists(final_path):
+        await aiofiles.os.remove(tmp_path)
+        return final_path, True
+
+    await aiofiles.os.replace(tmp_path, final_path)
+    await asyncio.to_thread(register_artifact, final_path, None, sha256, 'upload')
+    return final_path, False
+
+async def stream_upload(file: UploadFile, purpose: str) -> dict:
+    """Stream an UploadFile to disk in chunks, enforcing the size cap and hashing as it goes"""
+    target = get_upload_target(purpose)
+    extension = check_extension(target, file.filename)
+    max_bytes = target['max_bytes']
+
+    tmp_path = target['directory'] / '.incoming' / f"{uuid.uuid4().hex}.part"
+    hasher = hashlib.sha256()
+    size = 0
+
+    try:
+        async with aiofiles.open(tmp_path, 'wb') as out:
+            while True:
+                chunk = await file.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise too_large(max_bytes)
+                hasher.update(chunk)
+                await out.write(chunk)
+    except BaseException:
+        if await aiofiles.os.path.exists(tmp_path):
+            await aiofiles.os.remove(tmp_path)
+        raise
+
+    sha256 = hasher.hexdigest()
+    final_path, deduplicated = await commit_blob(target, tmp_path, sha256, extension)
+
+    return {
+        'path': str(final_path),
+        'original_filename': file.filename,
+        'size': size,
+        'sha256': sha256,
+        'deduplicated': deduplicated
+    }
+
+# Resumable session helpers
+def session_paths(target: dict, upload_id: str) -> tuple:
+    """Data and metadata file for a resumable session"""
+    incoming = target['directory'] / '.incoming'
+    return incoming / f"{upload_id}.part", incoming / f"{upload_id}.json"
+
+def find_session(upload_id: str) -> tuple:
+    """Locate a resumable session across registered targets"""
+    try:
+        uuid.UUID(upload_id)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+
+    for purpose, target in UPLOAD_TARGETS.items():
+        data_path, meta_path = session_paths(target, upload_id)
+        if meta_path.exists():
+            with open(meta_path) as f:
+                meta = json.load(f)
+            return target, meta, data_path, meta_path
+
+    raise HTTPException(status_code=404, detail="Upload session not found")
+
+def session_status(meta: dict, data_path: Path) -> dict:
+    """Public view of a resumable session"""
+    received = data_path.stat().st_size if data_path.exists() else 0
+    return {
+        "upload_id": meta['upload_id'],
+        "purpose": meta['purpose'],
+        "filename": meta['filename'],
+        "total_size": meta['total_size'],
+        "received": received,
+        "complete": received == meta['total_size'],
+        "chunk_size": CHUNK_SIZE
+    }
+
+def hash_file(path: Path) -> str:
+    """SHA-256 of a file on disk (used when a session outlives its in-memory hasher)"""
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+async def finalize_upload_session(upload_id: str, purpose: str, user_id: int) -> dict:
+    """Turn a completed resumable session into a stored, deduplicated file"""
+    target, meta, data_path, meta_path = await asyncio.to_thread(find_session, upload_id)
+
+    if meta['purpose'] != purpose:
+        raise HTTPException(status_code=400, detail="Upload session belongs to a different purpose")
+    if meta['user_id'] != user_id:
+        raise HTTPException(status_code=403, detail="Upload session belongs to another user")
+
+    status = await asyncio.to_thread(session_status, meta, data_path)
+    if not status['complete']:
+        raise HTTPException(status_code=409, detail=f"Upload incomplete: {status['received']} of {meta['total_size']} bytes received")
+
+    hasher = _session_hashers.pop(upload_id, None)
+    _session_locks.pop(upload_id, None)
+    if hasher is not None:
+        sha256 = hasher.hexdigest()
+    else:
+        sha256 = await asyncio.to_thread(hash_file, data_path)
+
+    extension = Path(meta['filename']).suffix.lower()
+    final_path, deduplicated = await commit_blob(target, data_path, sha256, extension)
+    await aiofiles.os.remove(meta_path)
+
+    return {
+        'path': str(final_path),
+        'original_filename': meta['filename'],
+        'size': meta['total_size'],
+        'sha256': sha256,
+        'deduplicated': deduplicated
+    }
+
+def cleanup_stale_sessions():
+    """Remove resumable sessions older than the TTL"""
+    cutoff = time.time() - SESSION_TTL_SECONDS
+    removed = 0
+    for target in UPLOAD_TARGETS.values():
+        for meta_path in (target['directory'] / '.incoming').glob('*.json'):
+            if meta_path.stat().st_mtime >= cutoff:
+                continue
+            upload_id = meta_path.stem
+            data_path, _ = session_paths(target, upload_id)
+            for path in (data_path, meta_path):
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+            _session_hashers.pop(upload_id, None)
+            _session_locks.pop(upload_id, None)
+            removed += 1
+    if removed:
+        print(f"🧹 Removed {removed} stale upload sessions")
+    return removed
+
+# API Endpoints
+@upload_router.post("/sessions")
+async def create_upload_session(
+    session: UploadSessionCreate,
+    current_user: dict = Depends(get_current_user)
+):
+    """Open a resumable upload session"""
+    if current_user['role'] == 'viewer':
+        raise HTTPException(status_code=403, detail="Viewers cannot upload files")
+
+    target = get_upload_target(session.purpose)
+    check_extension(target, session.filename)
+    if session.total_size <= 0:
+        raise HTTPException(status_code=400, detail="total_size must be positive")
+    if session.total_size > target['max_bytes']:
+        raise too_large(target['max_bytes'])
+
+    upload_id = str(uuid.uuid4())
+    data_path, meta_path = session_paths(target, upload_id)
+    meta = {
+        'upload_id': upload_id,
+        'purpose': session.purpose,
+        'filename': session.filename,
+        'total_size': session.total_size,
+        'user_id': current_user['user_id'],
+        'created_at': time.time()
+    }
+
+    async with aiofiles.open(data_path, 'wb'):
+        pass
+    async with aiofiles.open(meta_path, 'w') as f:
+        await f.write(json.dumps(meta))
+
+    _session_hashers[upload_id] = hashlib.sha256()
+    return await asyncio.to_thread(session_status, meta, data_path)
+
+@upload_router.get("/sessions/{upload_id}")
+async def get_upload_session(upload_id: str, current_user: dict = Depends(get_current_user)):
+    """Get received offset of a resumable upload"""
+    target, meta, data_path, meta_path = await asyncio.to_thread(find_session, upload_id)
+    if meta['user_id'] != current_user['user_id']:
+        raise HTTPException(status_code=403, detail="Upload session belongs to another user")
+    return await asyncio.to_thread(session_status, meta, data_path)
+
+@upload_router.put("/sessions/{upload_id}")
+async def append_upload_chunk(
+    upload_id: str,
+    offset: int,
+    request: Request,
+    current_user: dict = Depends(get_current_user)
+):
+    """Append a chunk at the given offset (raw request body)"""
+    target, meta, data_path, meta_path = await asyncio.to_thread(find_session, upload_id)
+    if meta['user_id'] != current_user['user_id']:
+        raise HTTPException(status_code=403, detail="Upload session belongs to another user")
+
+    lock = _session_locks.setdefault(upload_id, asyncio.Lock())
+    async with lock:
+        received = (await aiofiles.os.stat(data_path)).st_size
+        if offset != received:
+            raise HTTPException(status_code=409, detail={"message": "Offset mismatch", "received": received})
+
+        # A hasher only exists while every byte so far went through this process
+        hasher = _session_hashers.get(upload_id)
+        written = received
+
+        try:
+            async with aiofiles.open(data_path, 'ab') as out:
+                async for chunk in request.stream():
+                    if not chunk:
+                        continue
+                    written += len(chunk)
+                    if written > meta['total_size']:
+                        raise HTTPException(status_code=413, detail="Chunk exceeds declared total_size")
+                    if hasher is not None:
+                        hasher.update(chunk)
+                    await out.write(chunk)
+        except HTTPException:
+            # Roll back the partial chunk so the client can retry from the same offset
+            await asyncio.to_thread(os.truncate, data_path, received)
+            _session_hashers.pop(upload_id, None)
+            raise
+
+    return await asyncio.to_thread(session_status, meta, data_path)
+
+@upload_router.delete("/sessions/{upload_id}")
+async def abort_upload_session(upload_id: str, current_user: dict = Depends(get_current_user)):
+    """Abort a resumable upload and discard received data"""
+    target, meta, data_path, meta_path = await asyncio.to_thread(find_session, upload_id)
+    if meta['user_id'] != current_user['user_id'] and current_user['role'] != 'admin':
+        raise HTTPException(status_code=403, detail="Upload session belongs to another user")
+
+    for path in (data_path, meta_path):
+        if await aiofiles.os.path.exists(path):
+            await aiofiles.os.remove(path)
+    _session_hashers.pop(upload_id, None)
+    _session_locks.pop(upload_id, None)
+
+    return {"success": True, "message": "Upload session aborted"}
+
+MODULE_MANIFEST = ModuleManifest(
+    name='uploads',
+    router=upload_router,
+    prefix='/uploads',
+    tags=['Uploads']
+)
+
+# Export router and helpers
+__all__ = [
+    'MODULE_MANIFEST', 'upload_router', 'register_upload_target', 'stream_upload',
+    'finalize_upload_session', 'cleanup_stale_sessions'
+]
+
+print("✅ Upload storage module loaded successfully")
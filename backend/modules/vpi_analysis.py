@@ -0,0 +1,170 @@
+# modules/vpi_analysis.py - Vectorized DC Vπ extraction
+
+from typing import Optional
+import numpy as np
+from .lazy_imports import lazy_module
+
+# scipy is only needed once a capture is analysed
+ndimage = lazy_module('scipy.ndimage')
+
+# Minimum spacing between extrema of the same kind (samples), as find_peaks(distance=30)
+DEFAULT_EXTREMA_DISTANCE = 30
+
+def find_period_offset(ramp: np.ndarray, samples_per_period: int) -> int:
+    """Index of the first ramp reset (flyback), so periods start on a clean ramp"""
+    head = ramp[:samples_per_period + 1]
+    if len(head) < 2:
+        return 0
+    jumps = np.abs(np.diff(head))
+    offset = int(np.argmax(jumps)) + 1
+    # A smooth ramp without a visible flyback: keep the capture as is
+    if jumps[offset - 1] < 4 * np.median(jumps):
+        return 0
+    return offset % samples_per_period
+
+def split_periods(data: np.ndarray, samples_per_period: int, offset: int = 0) -> np.ndarray:
+    """Reshape a capture into (n_periods, samples_per_period); trailing partial period is dropped"""
+    usable = (len(data) - offset) // samples_per_period
+    return data[offset:offset + usable * samples_per_period].reshape(usable, samples_per_period)
+
+def fit_ramps(t_periods: np.ndarray, v_periods: np.ndarray) -> tuple:
+    """Least-squares line through every period at once; returns slope, intercept, r²"""
+    t_mean = t_periods.mean(axis=1, keepdims=True)
+    v_mean = v_periods.mean(axis=1, keepdims=True)
+    dt = t_periods - t_mean
+    dv = v_periods - v_mean
+
+    s_tt = np.einsum('ij,ij->i', dt, dt)
+    s_tv = np.einsum('ij,ij->i', dt, dv)
+    s_vv = np.einsum('ij,ij->i', dv, dv)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = s_tv / s_tt
+        r_squared = np.where(s_vv > 0, (s_tv * s_tv) / (s_tt * s_vv), 0.0)
+    intercept = v_mean[:, 0] - slope * t_mean[:, 0]
+
+    return slope, intercept, r_squared
+
+def find_extrema(p_periods: np.ndarray, distance: int = DEFAULT_EXTREMA_DISTANCE) -> tuple:
+    """Batched peak/null detection; returns boolean masks with the shape of p_periods"""
+    size = 2 * distance + 1
+    rolling_max = ndimage.maximum_filter1d(p_periods, size=size, axis=1, mode='nearest')
+    rolling_min = ndimage.minimum_filter1d(p_periods, size=size, axis=1, mode='nearest')
+    midpoint = 0.5 * (p_periods.max(axis=1, keepdims=True) + p_periods.min(axis=1, keepdims=True))
+
+    # Strict rise into the sample picks the first point of a flat top; period edges are excluded
+    rising = np.zeros_like(p_periods, dtype=bool)
+    falling = np.zeros_like(p_periods, dtype=bool)
+    rising[:, 1:-1] = p_periods[:, 1:-1] > p_periods[:, :-2]
+    falling[:, 1:-1] = p_periods[:, 1:-1] < p_periods[:, :-2]
+
+    peaks = (p_periods == rolling_max) & rising & (p_periods > midpoint)
+    nulls = (p_periods == rolling_min) & falling & (p_periods < midpoint)
+    return peaks, nulls
+
+def extract_vpi(time_data: np.ndarray, ramp_data: np.ndarray, power_data: np.ndarray,
+                samples_per_period: int, min_vpi: float, max_vpi: float,
+                distance: int = DEFAULT_EXTREMA_DISTANCE, min_r_squared: float = 0.9,
+                edge_trim: float = 0.05) -> dict:
+    """Every Vπ candidate (adjacent peak/null pair) across all ramp periods, with statistics.
+
+    ``time_data``/``ramp_data`` are the drive channel and ``power_data`` the optical
+    channel of the same capture (same length, same sample clock). ``edge_trim`` is the
+    fraction of each period ignored on both sides of the flyback.
+    """
+    time_data = np.asarray(time_data, dtype=float)
+    ramp_data = np.asarray(ramp_data, dtype=float)
+    power_data = np.asarray(power_data, dtype=float)
+    if not (len(time_data) == len(ramp_data) == len(power_data)):
+        raise ValueError("time, ramp and power captures must have the same length")
+    if samples_per_period < 2 * distance + 3:
+        raise ValueError(f"samples_per_period={samples_per_period} too short for extrema distance {distance}")
+
+    offset = find_period_offset(ramp_data, samples_per_period)
+    t_periods = split_periods(time_data, samples_per_period, offset)
+    v_periods = split_periods(ramp_data, samples_per_period, offset)
+    p_periods = split_periods(power_data, samples_per_period, offset)
+    n_periods = t_periods.shape[0]
+    if n_periods == 0:
+        raise ValueError("capture is shorter than one ramp period")
+
+    trim = int(samples_per_period * edge_trim)
+    inner = slice(trim, samples_per_period - trim)
+
+    slope, intercept, r_squared = fit_ramps(t_periods[:, inner], v_periods[:, inner])
+    peaks, nulls = find_extrema(p_periods, distance)
+    peaks[:, :trim] = nulls[:, :trim] = False
+    peaks[:, samples_per_period - trim:] = nulls[:, samples_per_period - trim:] = False
+
+    # Drive voltage from the fitted ramp, which is far less noisy than the raw samples
+    fitted_voltage = slope[:, None] * t_periods + intercept[:, None]
+
+    # Extrema in row-major order; neighbours of opposite kind in the same period form a candidate
+    kind = peaks.astype(np.int8) - nulls.astype(np.int8)
+    rows, cols = np.nonzero(kind)
+    kinds = kind[rows, cols]
+    pair = (rows[:-1] == rows[1:]) & (kinds[:-1] != kinds[1:])
+    pair &= r_squared[rows[:-1]] >= min_r_squared
+
+    first = np.nonzero(pair)[0]
+    second = first + 1
+    cand_rows = rows[first]
+    peak_cols = np.where(kinds[first] > 0, cols[first], cols[second])
+    null_cols = np.where(kinds[first] > 0, cols[second], cols[first])
+    peak_voltage = fitted_voltage[cand_rows, peak_cols]
+    null_voltage = fitted_voltage[cand_rows, null_cols]
+    vpi = np.abs(peak_voltage - null_voltage)
+    in_range = (vpi >= min_vpi) & (vpi <= max_vpi)
+
+    candidates = [
+        {
+            "period": int(cand_rows[i]),
+            "peak_index": int(offset + cand_rows[i] * samples_per_period + peak_cols[i]),
+            "null_index": int(offset + cand_rows[i] * samples_per_period + null_cols[i]),
+            "peak_voltage": float(peak_voltage[i]),
+            "null_voltage": float(null_voltage[i]),
+            "vpi": float(vpi[i]),
+            "in_range": bool(in_range[i])
+        }
+        for i in range(len(vpi))
+    ]
+
+    accepted = vpi[in_range]
+    statistics = {
+        "periods": int(n_periods),
+        "period_offset": int(offset),
+        "candidates": int(len(vpi)),
+        "in_range": int(len(accepted)),
+        "mean": float(np.mean(accepted)) if len(accepted) else None,
+        "median": float(np.median(accepted)) if len(accepted) else None,
+        "std": float(np.std(accepted, ddof=1)) if len(accepted) > 1 else None,
+        "min": float(np.min(accepted)) if len(accepted) else None,
+        "max": float(np.max(accepted)) if len(accepted) else None,
+        "ramp_slope": float(np.median(slope)),
+        "ramp_r_squared_min": float(np.min(r_squared))
+    }
+
+    vpi_value = statistics["median"]
+    phase_angle = None
+    if vpi_value:
+        # Bias point: accepted peak closest to 0 V drive
+        accepted_peaks = peak_voltage[in_range]
+        bias_voltage_at_peak = accepted_peaks[np.argmin(np.abs(accepted_peaks))]
+        phase_angle = float(bias_voltage_at_peak / vpi_value * 180)
+
+    return {
+        "vpi": vpi_value,
+        "phase_angle": phase_angle,
+        "accepted": accepted.tolist(),
+        "candidates": candidates,
+        "statistics": statistics
+    }
+
+def samples_per_period_from(frequency: float, sample_rate: float) -> Optional[int]:
+    """Samples in one ramp period"""
+    if not frequency or frequency <= 0:
+        return None
+    return int(sample_rate / frequency)
+
+__all__ = ['extract_vpi', 'fit_ramps', 'find_extrema', 'split_periods', 'find_period_offset',
+           'samples_per_period_from']
@@ -0,0 +1,203 @@
+# modules/ws_hub.py - WebSocket pub/sub hub with per-connection bounded send queues
+
+import os
+import json
+import time
+import asyncio
+import itertools
+from collections import defaultdict
+from typing import Dict, Optional, Set
+
+# Messages a client may fall behind before it is evicted as a slow consumer
+WS_SEND_QUEUE = int(os.getenv('WS_SEND_QUEUE', '100'))
+# Seconds a single send may take before the client is evicted
+WS_SEND_TIMEOUT = float(os.getenv('WS_SEND_TIMEOUT', '10'))
+# Close code sent to evicted clients (1013 = try again later)
+WS_EVICT_CODE = 1013
+
+SYSTEM_TOPIC = "system"
+
+def module_topic(module: str) -> str:
+    return f"module:{module}"
+
+def user_topic(user_id: int) -> str:
+    return f"user:{user_id}"
+
+class HubConnection:
+    """One accepted websocket: its topics, send queue, writer task and lag metrics"""
+
+    def __init__(self, connection_id: int, websocket, user_id: int, max_queue: int):
+        self.id = connection_id
+        self.websocket = websocket
+        self.user_id = user_id
+        self.topics: Set[str] = set()
+        self.queue = asyncio.Queue(max_queue)
+        self.writer: Optional[asyncio.Task] = None
+        self.connected_at = time.monotonic()
+        self.closed = False
+        self.sent = 0
+        self.last_lag_ms = 0.0
+        self.max_lag_ms = 0.0
+
+    def stats(self) -> dict:
+        return {
+            "connection_id": self.id,
+            "user_id": self.user_id,
+            "topics": sorted(self.topics),
+            "queue_depth": self.queue.qsize(),
+            "queue_max": self.queue.maxsize,
+            "sent": self.sent,
+            "last_lag_ms": self.last_lag_ms,  # enqueue -> send complete
+            "max_lag_ms": self.max_lag_ms,
+            "connected_seconds": round(time.monotonic() - self.connected_at, 1)
+        }
+
+class WebSocketHub:
+    """Topic fan-out: each message is serialized once and queued to every subscriber; one writer task per connection sends"""
+
+    def __init__(self, max_queue: int = WS_SEND_QUEUE, send_timeout: float = WS_SEND_TIMEOUT):
+        self.max_queue = max_queue
+        self.send_timeout = send_timeout
+        self.connections: Dict[int, HubConnection] = {}
+        self.subscribers: Dict[str, Set[int]] = defaultdict(set)  # topic -> connection ids
+        self.ids = itertools.count(1)
+        self.metrics = {
+            'published': 0,
+            'delivered': 0,
+            'evicted': 0,
+            'send_errors': 0,
+            'max_fanout_ms': 0.0,  # serialize + enqueue for one publish
+        }
+
+    async def connect(self, websocket, user_id: int) -> HubConnection:
+        """Accept the socket, start its writer and subscribe it to the system and personal topics"""
+        await websocket.accept()
+        conn = HubConnection(next(self.ids), websocket, user_id, self.max_queue)
+        self.connections[conn.id] = conn
+        conn.writer = asyncio.create_task(self._writer(conn))
+        self.subscribe(conn, SYSTEM_TOPIC)
+        self.subscribe(conn, user_topic(user_id))
+        print(f"🔌 WebSocket connected for user {user_id} (connection {conn.id})")
+        return conn
+
+    async def disconnect(self, conn: HubConnection):
+        """Unregister a connection whose client went away (idempotent)"""
+        if self._remove(conn):
+            print(f"🔌 WebSocket disconnected for user {conn.user_id} (connection {conn.id})")
+
+    def subscribe(self, conn: HubConnection, topic: str):
+        if not conn.closed:
+            conn.topics.add(topic)
+            self.subscribers[topic].add(conn.id)
+
+    def unsubscribe(self, conn: HubConnection, topic: str):
+        conn.topics.discard(topic)
+        subscribers = self.subscribers.get(topic)
+        if subscribers is not None:
+            subscribers.discard(conn.id)
+            if not subscribers:
+                del self.subscribers[topic]
+
+    def send(self, conn: HubConnection, message: dict) -> bool:
+        """Queue a message for one connection"""
+        return self._enqueue(conn, json.dumps(message, default=str), time.perf_counter())
+
+    def publish(self, topic: str, message: dict) -> int:
+        """Serialize once and queue to every subscriber of ``topic``; returns connections reached"""
+        started = time.perf_counter()
+        subscriber_ids = self.subscribers.get(topic)
+        if not subscriber_ids:
+            return 0
+        payload = json.dumps(message, default=str)
+        delivered = 0
+        for connection_id in list(subscriber_ids):
+            conn = self.connections.get(connection_id)
+            if conn is not None and self._enqueue(conn, payload, started):
+                delivered += 1
+        self.metrics['published'] += 1
+        self.metrics['delivered'] += delivered
+        self.metrics['max_fanout_ms'] = max(self.metrics['max_fanout_ms'],
+                                            round((time.perf_counter() - started) * 1000, 3))
+        return delivered
+
+    def _enqueue(self, conn: HubConnection, payload: str, enqueued_at: float) -> bool:
+        if conn.closed:
+            return False
+        try:
+            conn.queue.put_nowait((payload, enqueued_at))
+            return True
+        except asyncio.QueueFull:
+            self._evict(conn, f"send queue full ({conn.queue.maxsize} messages behind)")
+            return False
+
+    async def _writer(self, conn: HubConnection):
+        """Drain one connection's queue; a stalled or failed send only affects this connection"""
+        try:
+            while True:
+                payload, enqueued_at = await conn.queue.get()
+                await asyncio.wait_for(conn.websocket.send_text(payload), self.send_timeout)
+                lag_ms = round((time.perf_counter() - enqueued_at) * 1000, 2)
+                conn.sent += 1
+                conn.last_lag_ms = lag_ms
+                conn.max_lag_ms = max(conn.max_lag_ms, lag_ms)
+        except asyncio.CancelledError:
+            raise
+        except asyncio.TimeoutError:
+            self._evict(conn, f"send took longer than {self.send_timeout}s")
+        except Exception as e:
+            self.metrics['send_errors'] += 1
+            print(f"⚠️ WebSocket send failed for user {conn.user_id} (connection {conn.id}): {e}")
+            self._remove(conn)
+
+    def _remove(self, conn: HubConnection) -> bool:
+        if conn.closed:
+            return False
+        conn.closed = True
+        self.connections.pop(conn.id, None)
+        for topic in list(conn.topics):
+            self.unsubscribe(conn, topic)
+        if conn.writer is not None and conn.writer is not asyncio.current_task():
+            conn.writer.cancel()
+        return True
+
+    def _evict(self, conn: HubConnection, reason: str):
+        """Drop a slow consumer and close its socket in the background"""
+        if not self._remove(conn):
+            return
+        self.metrics['evicted'] += 1
+        print(f"⚠️ Evicting slow WebSocket client: user {conn.user_id} (connection {conn.id}), {reason}")
+        asyncio.get_running_loop().create_task(self._close(conn, WS_EVICT_CODE))
+
+    async def _close(self, conn: HubConnection, code: int = 1000):
+        try:
+            await asyncio.wait_for(conn.websocket.close(code=code), self.send_timeout)
+        except Exception:
+            pass
+
+    async def close_all(self):
+        """Close every connection (shutdown)"""
+        conns = list(self.connections.values())
+        for conn in conns:
+            self._remove(conn)
+        await asyncio.gather(*(self._close(conn) for conn in conns))
+        print(f"🔌 All WebSocket connections closed ({len(conns)})")
+
+    def connection_count(self) -> int:
+        return len(self.connections)
+
+    def stats(self, per_connection: bool = False) -> dict:
+        summary = {
+            **self.metrics,
+            'connections': len(self.connections),
+            'topics': {topic: len(ids) for topic, ids in self.subscribers.items()},
+            'max_queue_depth': max((c.queue.qsize() for c in self.connections.values()), default=0),
+            'max_lag_ms': max((c.max_lag_ms for c in self.connections.values()), default=0.0)
+        }
+        if per_connection:
+            summary['per_connection'] = [conn.stats() for conn in self.connections.values()]
+        return summary
+
+# Shared by the API server and the event bus
+hub = WebSocketHub()
+
+__all__ = ['WebSocketHub', 'HubConnection', 'hub', 'module_topic', 'user_topic', 'SYSTEM_TOPIC']
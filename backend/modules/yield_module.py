@@ -0,0 +1,555 @@
+# modules/yield_module.py - First-pass/final yield and failure Pareto by wafer, housing lot, operator and device type
+
+from fastapi import APIRouter, HTTPException, Depends
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from collections import defaultdict
+from typing import Dict, Optional
+import os
+import json
+import time
+import asyncio
+import datetime
+import threading
+import jwt
+import psycopg2
+import psycopg2.extras
+from contextlib import contextmanager
+from dotenv import load_dotenv
+from .module_registry import ModuleManifest
+from .audit_log import audit
+from .pg_listener import pg_listener
+from .cluster import leader
+
+# Load environment variables
+load_dotenv()
+
+# Router for yield analytics
+yield_router = APIRouter()
+
+# Security
+security = HTTPBearer()
+SECRET_KEY = os.getenv('SECRET_KEY', 'default-dev-key-change-in-production')
+
+# Database configuration
+DATABASE_CONFIG = {
+    'host': os.getenv('DB_HOST', 'localhost'),
+    'port': int(os.getenv('DB_PORT', '5432')),
+    'database': os.getenv('DB_NAME', 'MAQ_Lab_Manager'),
+    'user': os.getenv('DB_USER', 'karthi'),
+    'password': os.getenv('DB_PASSWORD', 'maq001')
+}
+
+# Result tables notify this channel on insert (migration 13)
+YIELD_CHANNEL = 'fact_source_changed'
+# Seconds between rollup passes while results are arriving
+YIELD_REFRESH_INTERVAL = float(os.getenv('YIELD_REFRESH_INTERVAL', '5'))
+# Seconds between unconditional passes while the LISTEN connection is down
+YIELD_FALLBACK_REFRESH = float(os.getenv('YIELD_FALLBACK_REFRESH', '300'))
+# Result rows folded in per transaction
+YIELD_BATCH_SIZE = int(os.getenv('YIELD_BATCH_SIZE', '2000'))
+# Ids below the watermark re-read each pass: a transaction that took a lower id can commit after a higher one
+YIELD_LOOKBACK_IDS = int(os.getenv('YIELD_LOOKBACK_IDS', '200'))
+# Session-level advisory lock, held for a whole refresh pass: one rollup writer across API workers
+YIELD_LOCK_KEY = 4917001
+
+UNKNOWN = '(unknown)'
+YIELD_DIMENSIONS = ('all', 'device_type', 'wafer', 'housing_lot', 'operator')
+
+# Station -> result table, with how its rows map onto a pass/fail attempt and a failure mode.
+# S11 runs first and carries the unit's chip (-> wafer via chip_preparation) and housing lot.
+YIELD_SOURCES = {
+    's11': {
+        'table': 's11_test_results', 'serial': 'housing_sno', 'result': 'result', 'timestamp': '"timestamp"',
+        'failure_mode': """
+            CASE WHEN UPPER(s.result) = 'PASS' THEN NULL
+                 WHEN s.failure_details LIKE '[{%%"freq_range"%%'
+                     THEN 'S11 over limit ' || (s.failure_details::jsonb -> 0 ->> 'freq_range')
+                 ELSE 'S11 fail' END
+        """,
+        'materials': """
+            , s.chips_no AS chip_serial_number, cp.wafer_id, s.housing_lno AS housing_lot
+            FROM s11_test_results s
+            LEFT JOIN chip_preparation cp ON cp.chip_serial_number = s.chips_no
+        """
+    },
+    's21': {
+        'table': 's21_test_results', 'serial': 'serial_number', 'result': 'overall_result', 'timestamp': 'test_date',
+        'failure_mode': """
+            CASE WHEN UPPER(s.overall_result) = 'PASS' THEN NULL
+                 ELSE 'S21 ripple ' || LOWER(COALESCE(NULLIF(s.ripple_result, ''), s.overall_result)) END
+        """
+    },
+    'twotone': {
+        'table': 'twotone_test_results', 'serial': 'serial_number', 'result': 'result', 'timestamp': 'test_date',
+        'failure_mode': "CASE WHEN UPPER(s.result) = 'PASS' THEN NULL ELSE 'Two-tone Vpi out of range' END"
+    },
+    'dcvpi': {
+        'table': 'modulator_test_results', 'serial': 'serial_number', 'result': 'result', 'timestamp': 'test_date',
+        'failure_mode': """
+            CASE WHEN UPPER(s.result) = 'PASS' THEN NULL
+                 WHEN s.drift THEN 'DC Vpi drift'
+                 ELSE 'DC Vpi ' || LOWER(s.result) END
+        """
+    },
+}
+
+# Refresh state: set from the listener thread, read by the refresh loop
+_dirty = threading.Event()
+_refresh_task = None
+rollup_state = {'refreshed_at': None, 'last_duration_ms': None, 'rows_processed': 0, 'passes': 0,
+                'last_error': None, 'rebuilding': False}
+
+# Shared connection pool from main.py (set in on_load)
+get_db_connection_func = None
+
+# Database connection
+@contextmanager
+def get_db_connection():
+    """Get PostgreSQL database connection (the API server's pool when available)"""
+    if get_db_connection_func:
+        with get_db_connection_func() as conn:
+            yield conn
+        return
+    conn = None
+    try:
+        conn = psycopg2.connect(**DATABASE_CONFIG)
+        yield conn
+    except psycopg2.Error as e:
+        if conn:
+            conn.rollback()
+        raise HTTPException(status_code=500, detail=f"Database connection failed: {str(e)}")
+    finally:
+        if conn:
+            conn.close()
+
+def set_db_connection(services: dict):
+    """Use the API server's connection pool"""
+    global get_db_connection_func
+    get_db_connection_func = services.get('get_db_connection')
+
+# Authentication functions
+def verify_jwt_token(token: str) -> dict:
+    """Verify JWT token and return user data"""
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
+        return payload
+    except jwt.ExpiredSignatureError:
+        raise HTTPException(status_code=401, detail="Token expired. Please login again.")
+    except jwt.InvalidTokenError:
+        raise HTTPException(status_code=401, detail="Invalid token. Please login again.")
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
+    """Get current user from JWT token"""
+    return verify_jwt_token(credentials.credentials)
+
+def log_action(user_id: int, action: str, module: str, details: str):
+    """Log user action to system logs"""
+    audit(user_id, action, module, details)
+
+# Incremental rollups
+def source_sql(station: str) -> str:
+    """Result rows of a station not yet counted, from the lookback window up (plus material links for S11)"""
+    spec = YIELD_SOURCES[station]
+    return f"""
+        SELECT s.id, s.{spec['serial']} AS serial_number, s.device_type, s.operator,
+               COALESCE(UPPER(s.{spec['result']}) = 'PASS', FALSE) AS passed,
+               {spec['failure_mode']} AS failure_mode,
+               s.{spec['timestamp']} AS tested_at
+               {spec.get('materials') or f"FROM {spec['table']} s"}
+        WHERE s.id > %s AND s.{spec['serial']} IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM yield_attempts a WHERE a.source_table = '{spec['table']}' AND a.source_id = s.id)
+        ORDER BY s.id
+        LIMIT %s
+    """
+
+def apply_attempt(unit: Optional[dict], station: str, row: dict) -> dict:
+    """A unit's station record after one more attempt (the first attempt sets first-pass and operator)"""
+    if unit is None:
+        unit = {'station': station, 'serial_number': row['serial_number'], 'device_type': row['device_type'],
+                'first_operator': row['operator'], 'attempts': 0, 'first_passed': row['passed'],
+                'last_passed': None, 'failure_modes': {}, 'first_at': row['tested_at'], 'last_at': None}
+    else:
+        unit = {**unit, 'failure_modes': dict(unit['failure_modes'])}
+    unit['attempts'] += 1
+    # A late-committed row can predate attempts already counted
+    tested_at = row['tested_at']
+    if unit['first_at'] is not None and tested_at is not None and tested_at < unit['first_at']:
+        unit['first_passed'] = row['passed']
+        unit['first_operator'] = row['operator']
+        unit['first_at'] = tested_at
+    if unit['last_at'] is None or tested_at is None or tested_at >= unit['last_at']:
+        unit['last_passed'] = row['passed']
+        unit['last_at'] = tested_at
+    unit['device_type'] = unit['device_type'] or row['device_type']
+    if not row['passed']:
+        mode = row['failure_mode'] or f"{station} fail"
+        unit['failure_modes'][mode] = unit['failure_modes'].get(mode, 0) + 1
+    return unit
+
+def tally(units, materials: Dict[str, dict]) -> tuple:
+    """Rollup and Pareto contributions of unit records under their current material links"""
+    rollup = defaultdict(lambda: [0, 0, 0, 0])  # (station, dimension, value) -> units, first pass, final pass, attempts
+    pareto = defaultdict(int)                   # (station, dimension, value, mode) -> failures
+    for unit in units:
+        material = materials.get(unit['serial_number']) or {}
+        values = {
+            'all': '',
+            'device_type': unit['device_type'],
+            'wafer': material.get('wafer_id'),
+            'housing_lot': material.get('housing_lot'),
+            'operator': unit['first_operator'],
+        }
+        for dimension, value in values.items():
+            key = (unit['station'], dimension, value if value not in (None, '') or dimension == 'all' else UNKNOWN)
+            counts = rollup[key]
+            counts[0] += 1
+            counts[1] += 1 if unit['first_passed'] else 0
+            counts[2] += 1 if unit['last_passed'] else 0
+            counts[3] += unit['attempts']
+            for mode, failures in unit['failure_modes'].items():
+                pareto[key + (mode,)] += failures
+    return rollup, pareto
+
+def write_deltas(cursor, before: tuple, after: tuple):
+    """Add (after - before) to the rollup and Pareto tables and drop rows that reached zero"""
+    rollup_rows = []
+    for key in set(before[0]) | set(after[0]):
+        delta = [a - b for a, b in zip(after[0].get(key, (0, 0, 0, 0)), before[0].get(key, (0, 0, 0, 0)))]
+        if any(delta):
+            rollup_rows.append(key + tuple(delta))
+    pareto_rows = []
+    for key in set(before[1]) | set(after[1]):
+        delta = after[1].get(key, 0) - before[1].get(key, 0)
+        if delta:
+            pareto_rows.append(key + (delta,))
+
+    psycopg2.extras.execute_values(cursor, """
+        INSERT INTO yield_rollup (station, dimension, dim_value, units, first_pass, final_pass, attempts)
+        VALUES %s
+        ON CONFLICT (station, dimension, dim_value) DO UPDATE
+        SET units = yield_rollup.units + EXCLUDED.units,
+            first_pass = yield_rollup.first_pass + EXCLUDED.first_pass,
+            final_pass = yield_rollup.final_pass + EXCLUDED.final_pass,
+            attempts = yield_rollup.attempts + EXCLUDED.attempts
+    """, sorted(rollup_rows), page_size=1000)
+    psycopg2.extras.execute_values(cursor, """
+        INSERT INTO yield_pareto (station, dimension, dim_value, failure_mode, failures)
+        VALUES %s
+        ON CONFLICT (station, dimension, dim_value, failure_mode) DO UPDATE
+        SET failures = yield_pareto.failures + EXCLUDED.failures
+    """, sorted(pareto_rows), page_size=1000)
+    if rollup_rows:
+        cursor.execute("DELETE FROM yield_rollup WHERE units <= 0")
+    if pareto_rows:
+        cursor.execute("DELETE FROM yield_pareto WHERE failures <= 0")
+
+def process_batch(conn, station: str, batch_size: int = YIELD_BATCH_SIZE, lookback: int = YIELD_LOOKBACK_IDS) -> int:
+    """Fold the next batch of a station's uncounted results into the rollups in one transaction; returns rows read.
+
+    Ids within ``lookback`` of the watermark are re-read and counted once via yield_attempts, so a row that
+    commits after a higher id was processed is still folded in."""
+    table = YIELD_SOURCES[station]['table']
+    cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    cursor.execute("SELECT to_regclass(%s) IS NOT NULL AS present", (f"public.{table}",))
+    if not cursor.fetchone()['present']:
+        conn.rollback()
+        return 0
+    cursor.execute("""
+        INSERT INTO yield_watermarks (source_table) VALUES (%s)
+        ON CONFLICT (source_table) DO NOTHING
+    """, (table,))
+    cursor.execute("SELECT last_id FROM yield_watermarks WHERE source_table = %s", (table,))
+    last_id = cursor.fetchone()['last_id']
+    cursor.execute(source_sql(station), (max(last_id - lookback, 0), batch_size))
+    rows = cursor.fetchall()
+    if not rows:
+        conn.commit()
+        return 0
+
+    serials = sorted({row['serial_number'] for row in rows})
+    new_materials = {row['serial_number']: {'chip_serial_number': row['chip_serial_number'],
+                                            'wafer_id': row['wafer_id'], 'housing_lot': row['housing_lot']}
+                     for row in rows if 'chip_serial_number' in row}
+    # New material links re-attribute the unit at every station, not just this one
+    cursor.execute("""
+        SELECT station, serial_number, device_type, first_operator, attempts, first_passed, last_passed,
+               failure_modes, first_at, last_at
+        FROM yield_units
+        WHERE (station = %s AND serial_number = ANY(%s)) OR serial_number = ANY(%s)
+    """, (station, serials, list(new_materials)))
+    units = {(unit['station'], unit['serial_number']): dict(unit) for unit in cursor.fetchall()}
+    cursor.execute("""
+        SELECT serial_number, chip_serial_number, wafer_id, housing_lot
+        FROM yield_materials
+        WHERE serial_number = ANY(%s)
+    """, (serials,))
+    materials = {row['serial_number']: dict(row) for row in cursor.fetchall()}
+
+    before = tally(units.values(), materials)
+    changed = set()
+    for row in rows:
+        key = (station, row['serial_number'])
+        units[key] = apply_attempt(units.get(key), station, row)
+        changed.add(key)
+    materials.update(new_materials)
+    write_deltas(cursor, before, tally(units.values(), materials))
+
+    psycopg2.extras.execute_values(cursor, """
+        INSERT INTO yield_units (station, serial_number, device_type, first_operator, attempts, first_passed,
+                                 last_passed, failure_modes, first_at, last_at)
+        VALUES %s
+        ON CONFLICT (station, serial_number) DO UPDATE
+        SET device_type = EXCLUDED.device_type, first_operator = EXCLUDED.first_operator,
+            attempts = EXCLUDED.attempts, first_passed = EXCLUDED.first_passed, last_passed = EXCLUDED.last_passed,
+            failure_modes = EXCLUDED.failure_modes, first_at = EXCLUDED.first_at, last_at = EXCLUDED.last_at
+    """, [(unit['station'], unit['serial_number'], unit['device_type'], unit['first_operator'], unit['attempts'],
+           unit['first_passed'], unit['last_passed'], json.dumps(unit['failure_modes']), unit['first_at'],
+           unit['last_at']) for unit in (units[key] for key in sorted(changed))], page_size=1000)
+    if new_materials:
+        psycopg2.extras.execute_values(cursor, """
+            INSERT INTO yield_materials (serial_number, chip_serial_number, wafer_id, housing_lot)
+            VALUES %s
+            ON CONFLICT (serial_number) DO UPDATE
+            SET chip_serial_number = EXCLUDED.chip_serial_number, wafer_id = EXCLUDED.wafer_id,
+                housing_lot = EXCLUDED.housing_lot, updated_at = CURRENT_TIMESTAMP
+        """, [(serial, material['chip_serial_number'], material['wafer_id'], material['housing_lot'])
+              for serial, material in sorted(new_materials.items())])
+    psycopg2.extras.execute_values(cursor, """
+        INSERT INTO yield_attempts (source_table, source_id) VALUES %s ON CONFLICT DO NOTHING
+    """, [(table, row['id']) for row in rows], page_size=1000)
+    watermark = max(last_id, rows[-1]['id'])
+    cursor.execute("""
+        UPDATE yield_watermarks SET last_id = %s, last_run_at = CURRENT_TIMESTAMP WHERE source_table = %s
+    """, (watermark, table))
+    # Only ids inside the lookback window can show up again
+    cursor.execute("DELETE FROM yield_attempts WHERE source_table = %s AND source_id <= %s",
+                   (table, watermark - lookback))
+    conn.commit()
+    return len(rows)
+
+def refresh_rollups(rebuild: bool = False) -> dict:
+    """Fold every new result into the rollups (S11 first, for material links); ``rebuild`` starts from scratch"""
+    started = time.perf_counter()
+    processed = 0
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        if rebuild:
+            rollup_state['rebuilding'] = True
+            cursor.execute("SELECT pg_advisory_lock(%s)", (YIELD_LOCK_KEY,))
+        else:
+            cursor.execute("SELECT pg_try_advisory_lock(%s)", (YIELD_LOCK_KEY,))
+            if not cursor.fetchone()[0]:
+                conn.commit()
+                return {**rollup_state, "skipped": "another worker is updating the rollups"}
+        try:
+            if rebuild:
+                cursor.execute("TRUNCATE yield_units, yield_materials, yield_rollup, yield_pareto, yield_watermarks, "
+                               "yield_attempts")
+            conn.commit()
+            for station in YIELD_SOURCES:
+                while True:
+                    count = process_batch(conn, station)
+                    processed += count
+                    if count < YIELD_BATCH_SIZE:
+                        break
+        finally:
+            conn.rollback()
+            cursor.execute("SELECT pg_advisory_unlock(%s)", (YIELD_LOCK_KEY,))
+            conn.commit()
+            rollup_state['rebuilding'] = False
+
+    rollup_state['refreshed_at'] = datetime.datetime.now()
+    rollup_state['last_duration_ms'] = int((time.perf_counter() - started) * 1000)
+    rollup_state['rows_processed'] += processed
+    rollup_state['passes'] += 1
+    rollup_state['last_error'] = None
+    return {**rollup_state, "processed": processed}
+
+def _on_results_changed(payload: str):
+    _dirty.set()
+
+async def refresh_periodically():
+    """Fold in results after inserts are notified, or on a slow timer while not listening"""
+    last_refresh = time.monotonic()
+    while True:
+        await asyncio.sleep(YIELD_REFRESH_INTERVAL)
+        overdue = not pg_listener.connected and time.monotonic() - last_refresh >= YIELD_FALLBACK_REFRESH
+        if not (_dirty.is_set() or overdue) or not leader.is_leader:
+            continue
+        _dirty.clear()
+        try:
+            await asyncio.to_thread(refresh_rollups)
+        except Exception as e:
+            rollup_state['last_error'] = str(e)
+            _dirty.set()  # try again next interval
+            print(f"Yield rollup error: {e}")
+        last_refresh = time.monotonic()
+
+def start_yield_rollups():
+    """Listen for new results and start the rollup loop (first pass right away)"""
+    global _refresh_task
+    pg_listener.listen(YIELD_CHANNEL, _on_results_changed, on_reconnect=_dirty.set)
+    pg_listener.start()
+    leader.on_elected(_dirty.set)  # take over what the previous leader left queued
+    _dirty.set()
+    _refresh_task = asyncio.create_task(refresh_periodically())
+
+def stop_yield_rollups():
+    if _refresh_task:
+        _refresh_task.cancel()
+
+# Queries
+def _rate(part: int, whole: int) -> Optional[float]:
+    return round(part / whole * 100, 2) if whole else None
+
+def get_yield_summary(dimension: str, station: Optional[str] = None, value: Optional[str] = None,
+                      min_units: int = 1) -> list:
+    """Per value of ``dimension``: each station's first-pass and final yield plus rolled throughput yield"""
+    query = """
+        SELECT station, dim_value, units, first_pass, final_pass, attempts
+        FROM yield_rollup
+        WHERE dimension = %s
+    """
+    params = [dimension]
+    if station:
+        query += " AND station = %s"
+        params.append(station)
+    if value is not None:
+        query += " AND dim_value = %s"
+        params.append(value)
+    with get_db_connection() as conn:
+        cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        cursor.execute(query, params)
+        rows = cursor.fetchall()
+
+    groups = {}
+    for row in rows:
+        group = groups.setdefault(row['dim_value'], {"value": row['dim_value'], "stations": {}})
+        group["stations"][row['station']] = {
+            "units": row['units'],
+            "attempts": row['attempts'],
+            "first_pass_yield": _rate(row['first_pass'], row['units']),
+            "final_yield": _rate(row['final_pass'], row['units']),
+            "retest_rate": _rate(row['attempts'] - row['units'], row['units'])
+        }
+    summary = []
+    for group in groups.values():
+        stations = group["stations"].values()
+        if max(s["units"] for s in stations) < min_units:
+            continue
+        rty = 1.0
+        for s in stations:
+            rty *= (s["first_pass_yield"] or 0) / 100
+        group["units"] = max(s["units"] for s in stations)
+        group["rolled_throughput_yield"] = round(rty * 100, 2)
+        summary.append(group)
+    summary.sort(key=lambda group: group["units"], reverse=True)
+    return summary
+
+def get_pareto(dimension: str, value: Optional[str], station: Optional[str], limit: int) -> list:
+    """Failure modes by count (descending) with cumulative share, for one dimension value or all units"""
+    query = """
+        SELECT station, failure_mode, SUM(failures)::INTEGER AS failures
+        FROM yield_pareto
+        WHERE dimension = %s AND dim_value = %s
+    """
+    params = [dimension, '' if dimension == 'all' else value]
+    if station:
+        query += " AND station = %s"
+        params.append(station)
+    query += " GROUP BY station, failure_mode ORDER BY failures DESC, failure_mode"
+    with get_db_connection() as conn:
+        cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        cursor.execute(query, params)
+        rows = cursor.fetchall()
+
+    total = sum(row['failures'] for row in rows)
+    pareto, cumulative = [], 0
+    for row in rows[:limit]:
+        cumulative += row['failures']
+        pareto.append({**row, "percent": _rate(row['failures'], total),
+                       "cumulative_percent": _rate(cumulative, total)})
+    return pareto
+
+def _check_dimension(dimension: str, station: Optional[str]):
+    if dimension not in YIELD_DIMENSIONS:
+        raise HTTPException(status_code=400, detail=f"Unknown dimension: {dimension} (use {', '.join(YIELD_DIMENSIONS)})")
+    if station and station not in YIELD_SOURCES:
+        raise HTTPException(status_code=400, detail=f"Unknown station: {station}")
+
+def _state() -> dict:
+    return {**rollup_state,
+            'refreshed_at': rollup_state['refreshed_at'].isoformat() if rollup_state['refreshed_at'] else None,
+            'pending_results': _dirty.is_set()}
+
+# API Endpoints
+@yield_router.get("/summary")
+async def yield_summary(
+    dimension: str = 'device_type',
+    station: Optional[str] = None,
+    value: Optional[str] = None,
+    min_units: int = 1,
+    current_user: dict = Depends(get_current_user)
+):
+    """First-pass, final and rolled throughput yield by wafer, housing lot, operator or device type"""
+    _check_dimension(dimension, station)
+    try:
+        groups = await asyncio.to_thread(get_yield_summary, dimension, station, value, max(min_units, 1))
+        return {"dimension": dimension, "groups": groups, "rollups": _state()}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get yield summary: {str(e)}")
+
+@yield_router.get("/pareto")
+async def failure_pareto(
+    dimension: str = 'all',
+    value: Optional[str] = None,
+    station: Optional[str] = None,
+    limit: int = 20,
+    current_user: dict = Depends(get_current_user)
+):
+    """Failure Pareto for all units or one wafer / housing lot / operator / device type"""
+    _check_dimension(dimension, station)
+    if dimension != 'all' and value is None:
+        raise HTTPException(status_code=400, detail=f"value is required for dimension {dimension}")
+    try:
+        pareto = await asyncio.to_thread(get_pareto, dimension, value, station, min(max(limit, 1), 200))
+        return {"dimension": dimension, "value": value, "station": station, "failure_modes": pareto,
+                "rollups": _state()}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get failure Pareto: {str(e)}")
+
+@yield_router.post("/refresh")
+async def refresh_yield_now(rebuild: bool = False, current_user: dict = Depends(get_current_user)):
+    """Fold in new results now; ``rebuild`` recomputes every rollup from the result tables (admin only)"""
+    if current_user.get('role') != 'admin':
+        raise HTTPException(status_code=403, detail="Admin access required")
+    try:
+        state = await asyncio.to_thread(refresh_rollups, rebuild)
+        log_action(current_user['user_id'], 'yield_refresh', 'yield',
+                   f"{'Rebuilt' if rebuild else 'Refreshed'} yield rollups: {state.get('processed', 0)} results "
+                   f"in {state['last_duration_ms']} ms")
+        return {**state, "refreshed_at": state['refreshed_at'].isoformat() if state['refreshed_at'] else None}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Yield refresh failed: {str(e)}")
+
+MODULE_MANIFEST = ModuleManifest(
+    name='yield',
+    router=yield_router,
+    prefix='/api/yield',
+    tags=['Yield Analytics'],
+    on_load=set_db_connection,
+    on_startup=start_yield_rollups,
+    on_shutdown=stop_yield_rollups,
+    health_probe=_state
+)
+
+# Export router and helpers
+__all__ = ['MODULE_MANIFEST', 'yield_router', 'refresh_rollups', 'get_yield_summary', 'get_pareto']
+
+print("✅ Yield analytics module loaded successfully")
@@ -0,0 +1,6 @@
+# tests/conftest.py - Run the suite from the backend directory: python -m pytest tests
+import os
+import sys
+
+# Import modules/ the same way the API server does, and the helpers here as tests.*
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
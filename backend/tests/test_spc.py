@@ -0,0 +1,55 @@
+# tests/test_spc.py - SPC chart rebuild against a chart state lock that is never released
+
+import asyncio
+from contextlib import contextmanager
+
+import psycopg2.errors
+import pytest
+from fastapi import HTTPException
+
+from modules import spc, spc_module
+
+class LockedCursor:
+    """Cursor whose LOCK TABLE times out, as when a long save holds spc_state"""
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, sql, params=None):
+        self.conn.statements.append(sql)
+        if sql.startswith("LOCK TABLE"):
+            raise psycopg2.errors.LockNotAvailable("canceling statement due to lock timeout")
+
+class LockedConnection:
+    def __init__(self):
+        self.statements = []
+        self.rolled_back = False
+
+    def cursor(self, *args, **kwargs):
+        return LockedCursor(self)
+
+    def rollback(self):
+        self.rolled_back = True
+
+@contextmanager
+def wrapping_connection(conn):
+    """Like the API server's get_db_connection: every error leaving the block becomes a 500"""
+    try:
+        yield conn
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Database connection failed: {str(e)}")
+
+def test_rebuild_gives_up_on_lock_timeout():
+    conn = LockedConnection()
+
+    assert spc.rebuild(conn) is None
+    assert conn.rolled_back
+    assert not any(sql.startswith("DELETE") for sql in conn.statements)
+
+def test_rebuild_endpoint_answers_409_on_lock_timeout(monkeypatch):
+    conn = LockedConnection()
+    monkeypatch.setattr(spc_module, 'get_db_connection_func', lambda: wrapping_connection(conn))
+
+    with pytest.raises(HTTPException) as raised:
+        asyncio.run(spc_module.spc_rebuild(None, {'user_id': 1, 'role': 'admin'}))
+
+    assert raised.value.status_code == 409
@@ -0,0 +1,40 @@
+# tests/test_vpi_analysis.py - Accuracy of the DC Vπ extraction engine on synthetic captures
+
+import pytest
+
+from modules.vpi_analysis import extract_vpi
+from tests.vpi_waveforms import synth_capture
+
+ACCURACY_CASES = [
+    # (true Vπ, bias V, noise, min_vpi, max_vpi)
+    (2.5, 0.0, 0.001, 2.0, 8.0),
+    (3.5, 0.4, 0.002, 2.0, 8.0),
+    (3.5, -1.1, 0.005, 2.0, 8.0),
+    (4.2, 0.9, 0.002, 2.0, 8.0),
+    (4.8, 2.0, 0.002, 2.0, 8.0),
+    (3.0, 0.0, 0.010, 2.0, 8.0),
+]
+TOLERANCE = 0.02  # relative
+PHASE_TOLERANCE = 5.0  # degrees
+
+@pytest.mark.parametrize("seed, case", list(enumerate(ACCURACY_CASES)))
+def test_recovers_vpi_and_phase(seed, case):
+    """Recovered Vπ and phase match the known synthetic values"""
+    true_vpi, bias, noise, min_vpi, max_vpi = case
+    t, ramp, power, spp = synth_capture(true_vpi, bias, noise=noise, seed=seed)
+    result = extract_vpi(t, ramp, power, spp, min_vpi, max_vpi)
+
+    assert result['statistics']['in_range'] > 0
+    assert result['vpi'] == pytest.approx(true_vpi, rel=TOLERANCE)
+    # Peak nearest 0 V sits at the bias voltage
+    assert result['phase_angle'] is not None
+    assert result['phase_angle'] == pytest.approx(bias / true_vpi * 180, abs=PHASE_TOLERANCE)
+
+def test_out_of_range_limits_reject_everything():
+    """Limits that exclude the device give no Vπ rather than a wrong one"""
+    t, ramp, power, spp = synth_capture(3.5)
+    result = extract_vpi(t, ramp, power, spp, 6.0, 8.0)
+
+    assert result['vpi'] is None
+    assert result['statistics']['candidates'] > 0
+    assert result['statistics']['in_range'] == 0
@@ -0,0 +1,25 @@
+# tests/vpi_waveforms.py - Synthetic DC Vπ scope captures shared by the accuracy tests and the benchmark
+
+import numpy as np
+from scipy.signal import savgol_filter
+
+SAMPLE_RATE = 500e3      # samples/s
+RAMP_FREQUENCY = 1000.0  # Hz, as set on the function generator
+RAMP_VPP = 10.0          # V, modulator bias amplitude
+
+def synth_capture(vpi, bias_voltage=0.0, n_periods=4, noise=0.002, phase_offset=0.37, seed=0):
+    """Scope capture of a falling sawtooth drive and the modulator's cos² response"""
+    rng = np.random.default_rng(seed)
+    samples_per_period = int(SAMPLE_RATE / RAMP_FREQUENCY)
+    n = samples_per_period * n_periods + samples_per_period // 3
+    t = np.arange(n) / SAMPLE_RATE
+
+    # Symmetry 0 ramp: falls linearly, then resets; capture starts mid-period
+    phase = (t * RAMP_FREQUENCY + phase_offset) % 1.0
+    ramp = RAMP_VPP / 2 - RAMP_VPP * phase
+    power = 0.5 * (1 + np.cos(np.pi * (ramp - bias_voltage) / vpi))
+
+    ramp_noisy = ramp + rng.normal(0, noise * RAMP_VPP, n)
+    power_noisy = power + rng.normal(0, noise, n)
+    smoothed_power = savgol_filter(power_noisy, window_length=31, polyorder=3)
+    return t, ramp_noisy, smoothed_power, samples_per_period
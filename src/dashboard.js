@@ -5,6 +5,12 @@ const COLORS = ['#10b981', '#ef4444', '#f59e0b', '#3b82f6', '#8b5cf6', '#ec4899'
 
 // API Configuration
 const API_BASE_URL = 'http://localhost:8000';
+const WS_URL = 'ws://localhost:8000/ws/notifications';
+
+// Test stations whose results feed the analytics; a finished test triggers a refresh
+const LIVE_MODULES = ['s11', 's21', 'twotone', 'dcvpi'];
+const REFRESH_DELAY = 3000;     // ms; lets the analytics loader pick the new result up first
+const FALLBACK_INTERVAL = 30000; // ms; polling only while the notification socket is down
 
 // API Service Functions
 const apiService = {
@@ -270,11 +276,47 @@ const ConnectedDashboard = () => {
 
   useEffect(() => {
     fetchData();
-    
-    // Set up periodic refresh every 30 seconds
-    const interval = setInterval(fetchData, 30000);
-    
-    return () => clearInterval(interval);
+
+    let fallback = null;
+    let refreshTimer = null;
+    const startPolling = () => {
+      if (!fallback) fallback = setInterval(fetchData, FALLBACK_INTERVAL);
+    };
+    const stopPolling = () => {
+      clearInterval(fallback);
+      fallback = null;
+    };
+
+    const token = localStorage.getItem('authToken');
+    if (!token) {
+      startPolling();
+      return stopPolling;
+    }
+
+    // Refresh when a station reports a finished test instead of polling
+    const ws = new WebSocket(`${WS_URL}?token=${token}`);
+    ws.onopen = () => {
+      stopPolling();
+      LIVE_MODULES.forEach(module => ws.send(JSON.stringify({ type: 'subscribe_module', module })));
+    };
+    ws.onmessage = (event) => {
+      const message = JSON.parse(event.data);
+      if (message.replay || !['test_completed', 'test_error'].includes(message.type)) return;
+      clearTimeout(refreshTimer);
+      refreshTimer = setTimeout(fetchData, REFRESH_DELAY);
+    };
+    ws.onclose = startPolling;
+    ws.onerror = (error) => {
+      console.log('WebSocket connection failed, polling instead:', error);
+      startPolling();
+    };
+
+    return () => {
+      ws.onclose = null;
+      ws.close();
+      stopPolling();
+      clearTimeout(refreshTimer);
+    };
   }, [fetchData]);
 
   const handleRetry = () => {